@@ -19,48 +19,146 @@
 #define PACKET_TYPE_DATA 0x01  // Pacotes contendo dados de arquivo ou status (diferenciados por message_id)
 #define PACKET_TYPE_ACK 0x02   // Pacotes de confirmação (Acknowledgement)
 #define PACKET_TYPE_NACK 0x03  // Pacotes de não confirmação (Negative Acknowledgement)
+#define PACKET_TYPE_LINK 0x04  // Controle do enlace serial com o Python (negociação de taxa). NUNCA vai para o RF
+#define PACKET_TYPE_TELEMETRY 0x05  // Registros de eventos para o Python no modo binário (ver core/telemetry.py). NUNCA vai para o RF
+
+// Comandos LINK (no campo message_id), iguais aos de core/serial_link.py
+#define LINK_BAUD_PROPOSE 0x01  // Python propõe uma taxa (payload: uint32 LE)
+#define LINK_BAUD_ACCEPT 0x02   // Resposta na taxa atual; logo depois trocamos e entramos em teste
+#define LINK_BAUD_REJECT 0x03   // Taxa não suportada
+#define LINK_TEST 0x04          // Quadro de teste: devolvido exatamente como chegou
+#define LINK_BAUD_COMMIT 0x05   // Python confirma a nova taxa (respondido com o mesmo comando)
+#define LINK_KEEPALIVE 0x06     // Mantém a taxa negociada
+#define LINK_RF_BITRATE 0x07    // Python pede outra taxa do rádio (payload: uint16 LE). Ver core/rf_rate.py
+#define LINK_TELEMETRY_MODE 0x08  // Python troca o modo da telemetria (payload: TELEMETRY_TEXT ou TELEMETRY_BINARY)
+
+// --- Taxa da porta serial ---
+// O boot é sempre em SERIAL_DEFAULT_BAUD. Uma taxa negociada só vale depois do COMMIT; sem ele em
+// BAUD_TRIAL_TIMEOUT, voltamos à anterior. Fora da taxa padrão, se nenhum quadro válido do Python chegar
+// em LINK_WATCHDOG_TIMEOUT, voltamos à padrão (o Python faz o mesmo quando vê erros ou silêncio).
+#define SERIAL_DEFAULT_BAUD 9600
+#define BAUD_TRIAL_TIMEOUT 1500
+#define LINK_WATCHDOG_TIMEOUT 4000
+const uint32_t SUPPORTED_BAUD_RATES[] = { 57600, 115200, 250000 };
 
 // NOVO: IDs de Mensagem Específicos para Pacotes de Status (usados com PACKET_TYPE_DATA)
 #define MESSAGE_ID_COMBINED_STATUS 252  // ID para o pacote de status combinado (TX e RX no mesmo pacote)
+#define MESSAGE_ID_BEACON 250           // Beacon de sincronização de relógio (payload: millis() do mestre, 4 bytes)
+#define MESSAGE_ID_RF_BITRATE 249       // Anúncio RF de troca de taxa para o outro Arduino (payload: uint16 LE). Não vai ao Python
+
+// --- Taxa do rádio (VirtualWire) ---
+// Os dois Arduinos precisam da mesma taxa. Quem recebe LINK_RF_BITRATE do seu Python anuncia a taxa nova por
+// RF (RF_BITRATE_ANNOUNCE_REPEATS vezes, sem ARQ) ainda na taxa antiga e só então troca. Fora da taxa padrão,
+// sem nenhum quadro RF válido em RF_LINK_WATCHDOG_TIMEOUT (maior que um ciclo TDMA), volta à padrão.
+#define RF_DEFAULT_BITRATE 2000
+#define RF_BITRATE_ANNOUNCE_REPEATS 3
+#define RF_LINK_WATCHDOG_TIMEOUT 12000
+const uint16_t SUPPORTED_RF_BITRATES[] = { 1000, 2000, 3000, 4000 };
+
+// --- Telemetria ---
+// O boot é no modo texto (legível no Monitor Serial). No modo binário o texto de debug some e cada evento vira
+// um registro de 5 bytes [evento, msg_id, frag_idx, arg, ms desde a base]; até 3 registros por quadro
+// PACKET_TYPE_TELEMETRY (payload: millis() da base + registros). No cabeçalho: message_id = registros
+// descartados (contador de 8 bits), fragment_idx = quantidade de registros, total_fragments = sequência.
+#define TELEMETRY_TEXT 0
+#define TELEMETRY_BINARY 1
+#define TELEMETRY_RECORD_SIZE 5
+#define TELEMETRY_RECORDS_PER_FRAME 3   // 4 + 3 * 5 = 19 bytes de payload
+#define TELEMETRY_FLUSH_DELAY 20        // Quadro incompleto vai para a serial depois deste tempo (ms)
+// Eventos (iguais aos TEL_* de core/telemetry.py)
+#define TEL_DATA_TX 1          // arg: payload_len
+#define TEL_DATA_RETX 2        // arg: payload_len
+#define TEL_ACK_TX 3
+#define TEL_NACK_TX 4
+#define TEL_DATA_RX 5          // arg: payload_len
+#define TEL_ACK_RX 6
+#define TEL_NACK_RX 7
+#define TEL_RF_CRC_FAIL 8      // arg: packet_type
+#define TEL_RF_BAD_FRAME 9     // arg: tamanho do quadro
+#define TEL_ARQ_GIVE_UP 10     // arg: tentativas
+#define TEL_SERIAL_CRC_FAIL 11
+#define TEL_SERIAL_BUSY 12     // arg: unacked_count
+#define TEL_RF_BITRATE 13      // arg: taxa nova / 100
+
+// ID Único deste Arduino (DEVE SER IGUAL AO THIS_DEVICE_ID do core/arduino.py do PC ligado a ele)
+#define THIS_DEVICE_ID 0x01
+// O Arduino mestre de tempo envia beacons via RF; o millis() dele é a referência de tempo dos slots TDMA
+#define TIME_MASTER_DEVICE_ID 0x01
+#define BEACON_INTERVAL 2000  // Intervalo em ms entre beacons de sincronização (apenas no mestre)
 
 // Overhead fixo do pacote (campos antes do payload_data e crc_value)
-// packet_type (1), message_id (1), fragment_idx (1), total_fragments (1), payload_len (1) = 5 bytes
-#define PACKET_FIXED_OVERHEAD_EXCL_CRC 5
+// packet_type (1), device_id (1), message_id (1), fragment_idx (1), total_fragments (2), payload_len (1) = 7 bytes
+#define PACKET_FIXED_OVERHEAD_EXCL_CRC 7
 
-// Tamanho máximo do payload que podemos colocar em nosso Packet: VW_MAX_PAYLOAD (27) - PACKET_FIXED_OVERHEAD_EXCL_CRC (5) - crc_value (1) = 21 bytes
-#define MAX_PACKET_PAYLOAD_SIZE (VW_MAX_PAYLOAD - PACKET_FIXED_OVERHEAD_EXCL_CRC - 1)  // VW_MAX_PAYLOAD é 27. Resulta em 21 bytes
+// Tamanho máximo do payload que podemos colocar em nosso Packet: VW_MAX_PAYLOAD (27) - PACKET_FIXED_OVERHEAD_EXCL_CRC (7) - crc_value (1) = 19 bytes
+#define MAX_PACKET_PAYLOAD_SIZE (VW_MAX_PAYLOAD - PACKET_FIXED_OVERHEAD_EXCL_CRC - 1)  // VW_MAX_PAYLOAD é 27. Resulta em 19 bytes
 
-// Estrutura do Pacote de Protocolo
+// Estrutura do Pacote de Protocolo (layout idêntico ao PACKET_FORMAT "<BBBBHB19sB" do Python)
 struct Packet {
   uint8_t packet_type;                            // Tipo do pacote (DATA, ACK, NACK)
+  uint8_t device_id;                              // ID do conjunto PC + Arduino que originou o pacote
   uint8_t message_id;                             // ID da mensagem (identifica uma sequência de fragmentos de arquivo ou tipo de status)
   uint8_t fragment_idx;                           // Índice do fragmento dentro da mensagem
-  uint8_t total_fragments;                        // Número total de fragmentos para esta mensagem
+  uint16_t total_fragments;                       // Número total de fragmentos para esta mensagem (little-endian)
   uint8_t payload_len;                            // Comprimento do payload_data (0 a MAX_PACKET_PAYLOAD_SIZE)
   uint8_t payload_data[MAX_PACKET_PAYLOAD_SIZE];  // Dados do payload
   uint8_t crc_value;                              // Valor do CRC-4 para este pacote
 };
 
+// Por RF só vão os bytes usados: cabeçalho + payload_len bytes de payload + CRC. Quadros curtos passam
+// menos tempo no ar (e perdem menos com ruído); quem recebe remonta a struct Packet completa.
+#define RF_FRAME_OVERHEAD (PACKET_FIXED_OVERHEAD_EXCL_CRC + 1)
+
 // Uma verificação em tempo de compilação para garantir que o tamanho da struct Packet não exceda o limite da VirtualWire
 char packet_size_check[(sizeof(Packet) <= VW_MAX_PAYLOAD) ? 1 : -1];
 // Se sizeof(Packet) for maior que VW_MAX_PAYLOAD (27), isso causará um erro de compilação,
 // garantindo que nossa estrutura cabe na transmissão RF.
 
 // --- Variáveis para ARQ (Automatic Repeat Request) ---
-#define MAX_UNACKED_FRAGMENTS 4        // Número máximo de fragmentos DATA que podem estar pendentes de ACK
+// A janela (fragmentos DATA pendentes de ACK) é alocada no setup com a RAM que sobra depois de ARQ_RAM_RESERVE
+// (pilha e folga), entre ARQ_WINDOW_MIN e ARQ_WINDOW_MAX; o Python lê o tamanho no status. As entradas são
+// achadas por (message_id, fragment_idx) num índice de baldes encadeados, sem percorrer a janela.
+#define ARQ_WINDOW_MIN 4
+#define ARQ_WINDOW_MAX 16
+#define ARQ_RAM_RESERVE 512
+#define ARQ_INDEX_BUCKETS 16           // Potência de 2
+#define ARQ_NO_SLOT 0xFF
 #define RETRANSMISSION_TIMEOUT 700     // Tempo em ms para esperar por um ACK antes de retransmitir
 #define MAX_RETRANSMISSION_ATTEMPTS 5  // Número máximo de tentativas de retransmissão antes de desistir
 
 // Estrutura para rastrear fragmentos DATA não confirmados
 struct UnackedFragmentInfo {
   Packet packet;                    // Cópia do pacote original
-  unsigned long last_sent_time;     // Timestamp da última tentativa de envio
+  unsigned long last_sent_time;     // Timestamp da última ida ao ar
   uint8_t retransmission_attempts;  // Contador de tentativas de retransmissão
-  bool active;                      // Indica se esta entrada está em uso no buffer
+  bool active;                      // Aguardando ACK (false: entrada livre)
+  bool tx_pending;                  // Na fila do rádio (envio novo ou retransmissão)
+  bool sent;                        // Já foi ao ar: o próximo envio é retransmissão
+  uint8_t next;                     // Próxima entrada do mesmo balde do índice (ou da lista livre)
 };
 
-UnackedFragmentInfo unacked_fragments_buffer[MAX_UNACKED_FRAGMENTS];  // Buffer de fragmentos pendentes
-uint8_t unacked_count = 0;                                            // Contador de fragmentos pendentes de ACK
+UnackedFragmentInfo* unacked_fragments_buffer = NULL;  // arqWindow entradas, alocadas no setup
+uint8_t arqWindow = 0;
+uint8_t unacked_count = 0;                            // Contador de fragmentos pendentes de ACK
+uint8_t arqIndex[ARQ_INDEX_BUCKETS];                  // Primeira entrada de cada balde
+uint8_t arqFreeHead = ARQ_NO_SLOT;                    // Lista de entradas livres (encadeada por next)
+unsigned long arqNextDeadline = 0;                    // Timeout de retransmissão mais próximo
+bool arqDeadlineArmed = false;
+
+// --- Fila do rádio ---
+// O loop nunca espera o rádio: os quadros entram em filas e saem um por vez quando vw_tx_active() libera.
+// ACK/NACK e anúncios de taxa passam na frente dos DATA, que saem das entradas do ARQ na ordem de chegada.
+#define RF_CONTROL_QUEUE_SIZE 6
+#define NACK_LIST_MAX_BYTES 8                                           // NACK do PC receptor com até 4 faixas (primeiro, último) faltando. DEVE SER IDÊNTICO AO PYTHON (gaps.py)
+#define RF_CONTROL_FRAME_MAX (RF_FRAME_OVERHEAD + NACK_LIST_MAX_BYTES)  // ACK/NACK, NACK com lista ou anúncio de taxa (2 bytes)
+uint8_t rfControlFrames[RF_CONTROL_QUEUE_SIZE][RF_CONTROL_FRAME_MAX];
+uint8_t rfControlLens[RF_CONTROL_QUEUE_SIZE];
+uint8_t rfControlHead = 0;
+uint8_t rfControlCount = 0;
+uint8_t arqTxQueue[ARQ_WINDOW_MAX];                   // Entradas do ARQ esperando o rádio (cada uma no máximo uma vez)
+uint8_t arqTxHead = 0;
+uint8_t arqTxCount = 0;
+uint16_t pendingRfBitrate = 0;                        // Taxa a aplicar quando o rádio liberar (0 = nenhuma)
 
 // --- Variáveis para CSMA/CA (Random Backoff) ---
 static unsigned long backoff_end_time = 0;  // Timestamp em que o backoff deve terminar.
@@ -70,6 +168,36 @@ static unsigned long backoff_end_time = 0;  // Timestamp em que o backoff deve t
 // --- Variáveis para Entrada Serial do Python (para receber pacotes para enviar) ---
 #define MAX_SERIAL_INPUT_SIZE sizeof(Packet)  // Espera a estrutura Packet completa do Python
 uint8_t serial_input_buffer[MAX_SERIAL_INPUT_SIZE];
+uint8_t serial_input_len = 0;             // Bytes já acumulados em serial_input_buffer
+bool serial_resyncing = false;            // Procurando o alinhamento depois de um CRC inválido
+uint32_t currentSerialBaud = SERIAL_DEFAULT_BAUD;
+uint32_t previousSerialBaud = SERIAL_DEFAULT_BAUD;
+bool baudTrialActive = false;             // Nova taxa ainda sem COMMIT do Python
+unsigned long baudTrialStartTime = 0;
+unsigned long lastValidSerialFrameTime = 0;
+
+uint16_t currentRfBitrate = RF_DEFAULT_BITRATE;
+unsigned long lastValidRfFrameTime = 0;  // Último quadro RF com CRC OK (watchdog da taxa do rádio)
+uint8_t rfCrcErrors = 0;                 // Quadros RF ruins que passaram pela VirtualWire (contador de 8 bits)
+
+uint8_t telemetryMode = TELEMETRY_TEXT;
+Packet telemetryFrame;                   // Quadro em montagem
+uint8_t telemetryCount = 0;              // Registros já em telemetryFrame
+unsigned long telemetryBase = 0;         // millis() do primeiro registro do quadro
+uint16_t telemetrySeq = 0;
+uint8_t telemetryDropped = 0;            // Registros descartados com o buffer de saída cheio (contador de 8 bits)
+
+// Texto de debug: só vai para a serial no modo texto. No binário, os prints não ocupam a linha
+class DebugTextPrint : public Print {
+public:
+  size_t write(uint8_t b) override {
+    return telemetryMode == TELEMETRY_TEXT ? Serial.write(b) : 1;
+  }
+  size_t write(const uint8_t* buffer, size_t size) override {
+    return telemetryMode == TELEMETRY_TEXT ? Serial.write(buffer, size) : size;
+  }
+};
+DebugTextPrint DebugText;
 // ====================================================================================
 
 // ====================================================================================
@@ -104,8 +232,16 @@ bool isSendingFile = false;            // Flag: O Arduino está atualmente tenta
 bool isReceivingFile = false;          // Flag: O Arduino está atualmente recebendo um arquivo
 unsigned long lastRfReceiveTime = 0;   // Tempo da última recepção de qualquer pacote RF (para status de sinal)
 #define NO_SIGNAL_TIMEOUT_RX 5000      // Tempo em ms sem receber nada para considerar "sinal perdido" no RX
-unsigned long lastStatusSendTime = 0;  // Para controle do envio periódico de status ao Python
-#define STATUS_SEND_INTERVAL 1000      // Intervalo em ms para enviar o status combinado para o Python
+unsigned long lastStatusSendTime = 0;  // Último status enviado ao Python
+unsigned long lastBeaconSendTime = 0;  // Para controle do envio periódico de beacons (mestre de tempo)
+#define STATUS_MIN_INTERVAL 100        // Mudanças em rajada (ex.: ACKs seguidos) viram um status só
+#define STATUS_HEARTBEAT_INTERVAL 3000 // Sem mudanças, o status só confirma que o Arduino está vivo
+// Valores do último status enviado (comparados a cada loop para mandar o status só quando algo muda)
+EmitterState lastSentEmitterState = EmitterState::DESCONECTADO;
+ReceiverState lastSentReceiverState = ReceiverState::DESCONECTADO;
+uint8_t lastSentUnackedCount = 0;
+uint16_t lastSentRfBitrate = RF_DEFAULT_BITRATE;
+uint8_t lastSentTelemetryMode = TELEMETRY_TEXT;
 // ====================================================================================
 
 
@@ -128,6 +264,22 @@ uint8_t calculateCRC4(const uint8_t* data, uint8_t length) {
   }
   return crc;
 }
+
+// Calcula o CRC-4 de um Packet sobre os mesmos bytes usados pelo Python:
+// DATA, LINK, TELEMETRY e NACK com lista de faltantes: os 7 bytes fixos + os payload_len bytes reais do payload.
+// ACK/NACK simples: packet_type, device_id, message_id e fragment_idx (4 bytes).
+// O layout da struct é o mesmo da ordem dos campos, então o CRC é feito direto sobre a memória.
+uint8_t packetCRC(const Packet& pkt) {
+  uint8_t length;
+  if (pkt.packet_type == PACKET_TYPE_DATA || pkt.packet_type == PACKET_TYPE_LINK || pkt.packet_type == PACKET_TYPE_TELEMETRY
+      || (pkt.packet_type == PACKET_TYPE_NACK && pkt.payload_len > 0)) {
+    uint8_t payload_len = pkt.payload_len > MAX_PACKET_PAYLOAD_SIZE ? MAX_PACKET_PAYLOAD_SIZE : pkt.payload_len;
+    length = PACKET_FIXED_OVERHEAD_EXCL_CRC + payload_len;
+  } else {
+    length = 4;
+  }
+  return calculateCRC4((const uint8_t*)&pkt, length);
+}
 // ====================================================================================
 
 
@@ -135,98 +287,272 @@ uint8_t calculateCRC4(const uint8_t* data, uint8_t length) {
 // FUNÇÕES AUXILIARES DE ENVIO DE PACOTES RF
 // Estas funções são APENAS para comunicação RF (VirtualWire)
 // ====================================================================================
-// Função para enviar um pacote via RF
-void sendPacket(Packet& pkt, bool is_retransmission = false) {
-  // NOVO: Atualiza status do Emissor
-  if (pkt.packet_type == PACKET_TYPE_DATA) {
-    // Se estamos enviando dados e não estamos já no estado de "ENVIANDO_DADOS", atualizamos
-    if (currentEmitterState != EmitterState::ENVIANDO_DADOS && currentEmitterState != EmitterState::AGUARDANDO_ACK) {
-      currentEmitterState = EmitterState::ENVIANDO_DADOS;
-    }
-  } else if (pkt.packet_type == PACKET_TYPE_ACK || pkt.packet_type == PACKET_TYPE_NACK) {
-    // ACKs/NACKs são rápidos. O emissor está CONECTADO para poder enviá-los.
-    // Se estiver em DESCONECTADO, muda para CONECTADO_OCIO (o link RF está ativo).
-    if (currentEmitterState == EmitterState::DESCONECTADO) {
-      currentEmitterState = EmitterState::CONECTADO_OCIO;
-    }
-  }
+// Monta o quadro RF compacto (cabeçalho + payload usado + CRC). Retorna o tamanho.
+uint8_t packRfFrame(const Packet& pkt, uint8_t* out) {
+  uint8_t payload_len = pkt.payload_len > MAX_PACKET_PAYLOAD_SIZE ? MAX_PACKET_PAYLOAD_SIZE : pkt.payload_len;
+  memcpy(out, &pkt, PACKET_FIXED_OVERHEAD_EXCL_CRC);
+  memcpy(out + PACKET_FIXED_OVERHEAD_EXCL_CRC, pkt.payload_data, payload_len);
+  out[PACKET_FIXED_OVERHEAD_EXCL_CRC + payload_len] = pkt.crc_value;
+  return RF_FRAME_OVERHEAD + payload_len;
+}
 
-  // Verifica se o tamanho do pacote excede o limite da VirtualWire (VW_MAX_PAYLOAD é 27)
-  if (sizeof(Packet) > VW_MAX_PAYLOAD) {
-    Serial.println(F("ERRO INTERNO: Pacote completo (struct Packet) EXCEDEU VW_MAX_PAYLOAD! Nao sera enviado via RF."));
-    return;
-  }
+// Remonta a struct Packet de um quadro RF compacto. False se o tamanho não bate com o payload_len.
+bool unpackRfFrame(const uint8_t* buf, uint8_t len, Packet& pkt) {
+  if (len < RF_FRAME_OVERHEAD || len - RF_FRAME_OVERHEAD > MAX_PACKET_PAYLOAD_SIZE) return false;
+  memset(&pkt, 0, sizeof(Packet));
+  memcpy(&pkt, buf, PACKET_FIXED_OVERHEAD_EXCL_CRC);
+  if (pkt.payload_len != len - RF_FRAME_OVERHEAD) return false;
+  memcpy(pkt.payload_data, buf + PACKET_FIXED_OVERHEAD_EXCL_CRC, pkt.payload_len);
+  pkt.crc_value = buf[len - 1];
+  return true;
+}
 
-  // Envia o pacote via VirtualWire
-  vw_send((uint8_t*)&pkt, sizeof(Packet));
-  vw_wait_tx();  // Aguarda até que a transmissão seja concluída (parte do Carrier Sense)
-
-  // Mensagens de debug para o Serial
-  Serial.print(F("RF -> "));
-  Serial.print(is_retransmission ? F("RETX") : F("NOVO"));
-  Serial.print(F(" | Tipo: 0x"));
-  Serial.print(pkt.packet_type, HEX);
-  Serial.print(F(", MsgID: "));
-  Serial.print(pkt.message_id);
-  Serial.print(F(", Frag: "));
-  Serial.print(pkt.fragment_idx);
-  Serial.print(F("/"));
-  Serial.print(pkt.total_fragments);
-  Serial.print(F(", P-Len: "));
-  Serial.print(pkt.payload_len);
-  Serial.print(F(", CRC: 0x"));
-  Serial.print(pkt.crc_value, HEX);
-  Serial.println(F(")."));
-
-  // Lógica ARQ: Adiciona ao buffer de não confirmados se for um pacote de DADOS NOVO
-  if (pkt.packet_type == PACKET_TYPE_DATA && !is_retransmission) {
-    isSendingFile = true;  // Definir que um envio de arquivo está em andamento (Python solicitou)
-    if (unacked_count < MAX_UNACKED_FRAGMENTS) {
-      for (uint8_t i = 0; i < MAX_UNACKED_FRAGMENTS; i++) {
-        if (!unacked_fragments_buffer[i].active) {
-          memcpy(&(unacked_fragments_buffer[i].packet), &pkt, sizeof(Packet));
-          unacked_fragments_buffer[i].last_sent_time = millis();
-          unacked_fragments_buffer[i].retransmission_attempts = 0;
-          unacked_fragments_buffer[i].active = true;
-          unacked_count++;
-          currentEmitterState = EmitterState::AGUARDANDO_ACK;  // Emissor agora aguarda ACK
-          break;
-        }
-      }
-    } else {
-      Serial.println(F("AVISO: Buffer de nao confirmados cheio. Nao foi possivel adicionar novo frag para ARQ."));
-      // Em um sistema real, isso deveria pausar o envio de novos pacotes do Python.
-    }
-  } else if (pkt.packet_type == PACKET_TYPE_DATA && is_retransmission) {
-    // Se for uma retransmissão, atualiza o tempo e a contagem de tentativas no buffer
-    for (uint8_t i = 0; i < MAX_UNACKED_FRAGMENTS; i++) {
-      if (unacked_fragments_buffer[i].active && unacked_fragments_buffer[i].packet.message_id == pkt.message_id && unacked_fragments_buffer[i].packet.fragment_idx == pkt.fragment_idx) {
-        unacked_fragments_buffer[i].last_sent_time = millis();
-        unacked_fragments_buffer[i].retransmission_attempts++;
-        currentEmitterState = EmitterState::AGUARDANDO_ACK;  // Emissor continua aguardando ACK
-        break;
-      }
-    }
+// Espera por ACK proporcional ao tempo no ar: abaixo da taxa padrão, cada quadro leva mais
+unsigned long retransmissionTimeout() {
+  if (currentRfBitrate >= RF_DEFAULT_BITRATE) return RETRANSMISSION_TIMEOUT;
+  return (unsigned long)RETRANSMISSION_TIMEOUT * RF_DEFAULT_BITRATE / currentRfBitrate;
+}
+
+// Texto de debug de um quadro que acabou de ir ao ar
+void debugRfTx(const Packet& pkt, bool is_retransmission) {
+  DebugText.print(F("RF -> "));
+  DebugText.print(is_retransmission ? F("RETX") : F("NOVO"));
+  DebugText.print(F(" | Tipo: 0x"));
+  DebugText.print(pkt.packet_type, HEX);
+  DebugText.print(F(", MsgID: "));
+  DebugText.print(pkt.message_id);
+  DebugText.print(F(", Frag: "));
+  DebugText.print(pkt.fragment_idx);
+  DebugText.print(F("/"));
+  DebugText.print(pkt.total_fragments);
+  DebugText.print(F(", P-Len: "));
+  DebugText.print(pkt.payload_len);
+  DebugText.print(F(", CRC: 0x"));
+  DebugText.print(pkt.crc_value, HEX);
+  DebugText.println(F(")."));
+}
+
+// Coloca um quadro de controle (ACK/NACK, anúncio de taxa) na fila do rádio. False com a fila cheia
+bool queueControlFrame(const Packet& pkt) {
+  if (rfControlCount == RF_CONTROL_QUEUE_SIZE || pkt.payload_len > RF_CONTROL_FRAME_MAX - RF_FRAME_OVERHEAD) return false;
+  uint8_t i = (rfControlHead + rfControlCount) % RF_CONTROL_QUEUE_SIZE;
+  rfControlLens[i] = packRfFrame(pkt, rfControlFrames[i]);
+  rfControlCount++;
+  if (currentEmitterState == EmitterState::DESCONECTADO) {
+    currentEmitterState = EmitterState::CONECTADO_OCIO;  // O link RF está ativo
   }
+  return true;
 }
 
 // Função para enviar um pacote ACK ou NACK via RF
 void sendAckNack(uint8_t type, uint8_t msg_id, uint8_t frag_idx) {
   Packet ack_nack_pkt;
+  memset(&ack_nack_pkt, 0, sizeof(Packet));
   ack_nack_pkt.packet_type = type;
+  ack_nack_pkt.device_id = THIS_DEVICE_ID;
   ack_nack_pkt.message_id = msg_id;
   ack_nack_pkt.fragment_idx = frag_idx;
   ack_nack_pkt.total_fragments = 0;  // Não relevante para ACK/NACK
   ack_nack_pkt.payload_len = 0;      // Não relevante para ACK/NACK
 
-  // Calcula o CRC4 para o ACK/NACK (apenas os 3 primeiros bytes são usados para CRC)
-  uint8_t data_for_crc[3];
-  data_for_crc[0] = ack_nack_pkt.packet_type;
-  data_for_crc[1] = ack_nack_pkt.message_id;
-  data_for_crc[2] = ack_nack_pkt.fragment_idx;
-  ack_nack_pkt.crc_value = calculateCRC4(data_for_crc, 3);
+  // Calcula o CRC4 para o ACK/NACK (apenas os 4 primeiros bytes são usados para CRC)
+  ack_nack_pkt.crc_value = packetCRC(ack_nack_pkt);
+
+  if (!queueControlFrame(ack_nack_pkt)) {
+    DebugText.println(F("AVISO: Fila do radio cheia. ACK/NACK descartado (o emissor retransmite)."));
+  }
+}
+
+// --- Janela ARQ ---
+uint8_t arqBucket(uint8_t msg_id, uint8_t frag_idx) {
+  return (frag_idx ^ (uint8_t)(msg_id * 7)) & (ARQ_INDEX_BUCKETS - 1);
+}
+
+uint8_t arqFind(uint8_t msg_id, uint8_t frag_idx) {
+  for (uint8_t i = arqIndex[arqBucket(msg_id, frag_idx)]; i != ARQ_NO_SLOT; i = unacked_fragments_buffer[i].next) {
+    if (unacked_fragments_buffer[i].packet.message_id == msg_id && unacked_fragments_buffer[i].packet.fragment_idx == frag_idx) {
+      return i;
+    }
+  }
+  return ARQ_NO_SLOT;
+}
+
+void arqQueueTx(uint8_t slot) {
+  if (unacked_fragments_buffer[slot].tx_pending) return;
+  unacked_fragments_buffer[slot].tx_pending = true;
+  arqTxQueue[(arqTxHead + arqTxCount) % ARQ_WINDOW_MAX] = slot;
+  arqTxCount++;
+}
+
+void arqRelease(uint8_t slot) {
+  unacked_fragments_buffer[slot].next = arqFreeHead;
+  arqFreeHead = slot;
+}
+
+// Fragmento DATA do Python: nova entrada na janela, já na fila do rádio. False com a janela cheia
+bool arqAdd(const Packet& pkt) {
+  uint8_t slot = arqFind(pkt.message_id, pkt.fragment_idx);
+  if (slot != ARQ_NO_SLOT) {  // O Python reenviou um fragmento que ainda está na janela
+    arqQueueTx(slot);
+    return true;
+  }
+  if (arqFreeHead == ARQ_NO_SLOT) return false;
+  slot = arqFreeHead;
+  UnackedFragmentInfo& entry = unacked_fragments_buffer[slot];
+  arqFreeHead = entry.next;
+  memcpy(&entry.packet, &pkt, sizeof(Packet));
+  entry.retransmission_attempts = 0;
+  entry.active = true;
+  entry.sent = false;
+  uint8_t bucket = arqBucket(pkt.message_id, pkt.fragment_idx);
+  entry.next = arqIndex[bucket];
+  arqIndex[bucket] = slot;
+  unacked_count++;
+  arqQueueTx(slot);
+  return true;
+}
 
-  sendPacket(ack_nack_pkt);  // Envia o pacote ACK/NACK via RF
+// Tira a entrada do índice (ACK ou desistência). Se ainda estiver na fila do rádio, volta à lista livre quando sair dela
+void arqRemove(uint8_t slot) {
+  UnackedFragmentInfo& entry = unacked_fragments_buffer[slot];
+  uint8_t* link = &arqIndex[arqBucket(entry.packet.message_id, entry.packet.fragment_idx)];
+  while (*link != slot) link = &unacked_fragments_buffer[*link].next;
+  *link = entry.next;
+  entry.active = false;
+  unacked_count--;
+  if (!entry.tx_pending) arqRelease(slot);
+}
+
+// Sem ACK depois de MAX_RETRANSMISSION_ATTEMPTS: desiste do fragmento, aplica backoff e sinaliza erro do emissor
+void arqGiveUp(uint8_t slot) {
+  UnackedFragmentInfo& entry = unacked_fragments_buffer[slot];
+  DebugText.print(F("ERRO FATAL: Frag "));
+  DebugText.print(entry.packet.fragment_idx);
+  DebugText.print(F(" da MsgID "));
+  DebugText.print(entry.packet.message_id);
+  DebugText.println(F(" atingiu limite de retransmissoes. Desistindo deste fragmento."));
+  telemetryEvent(TEL_ARQ_GIVE_UP, entry.packet.message_id, entry.packet.fragment_idx, entry.retransmission_attempts);
+  arqRemove(slot);
+  backoff_end_time = millis() + random(MIN_BACKOFF_TIME, MAX_BACKOFF_TIME);
+  DebugText.print(F("Aplicando backoff de "));
+  DebugText.print(backoff_end_time - millis());
+  DebugText.println(F("ms devido a falha de retransmissao."));
+  // NOVO: Se o envio falhou completamente para um fragmento, sinaliza erro de comunicação do emissor
+  currentEmitterState = EmitterState::ERRO_COMUNICACAO;
+  isSendingFile = false;  // Parar de considerar que estamos enviando
+}
+
+// NACK para um fragmento: retransmite assim que o rádio estiver livre (se ainda estiver na janela)
+void arqNack(uint8_t msg_id, uint8_t frag_idx) {
+  uint8_t slot = arqFind(msg_id, frag_idx);
+  if (slot == ARQ_NO_SLOT) return;
+  if (unacked_fragments_buffer[slot].retransmission_attempts < MAX_RETRANSMISSION_ATTEMPTS) {
+    arqQueueTx(slot);
+  } else {
+    arqGiveUp(slot);
+  }
+}
+
+void armArqDeadline(unsigned long deadline) {
+  if (!arqDeadlineArmed || (long)(deadline - arqNextDeadline) < 0) {
+    arqNextDeadline = deadline;
+    arqDeadlineArmed = true;
+  }
+}
+
+// Retransmissões por timeout. A janela só é percorrida quando o timeout mais próximo vence
+void checkArqTimeouts() {
+  if (!arqDeadlineArmed || (long)(millis() - arqNextDeadline) < 0) return;
+  arqDeadlineArmed = false;
+  unsigned long timeout = retransmissionTimeout();
+  for (uint8_t i = 0; i < arqWindow; i++) {
+    UnackedFragmentInfo& entry = unacked_fragments_buffer[i];
+    if (!entry.active || entry.tx_pending || !entry.sent) continue;
+    if (millis() - entry.last_sent_time <= timeout) {
+      armArqDeadline(entry.last_sent_time + timeout);
+    } else if (entry.retransmission_attempts < MAX_RETRANSMISSION_ATTEMPTS) {
+      DebugText.print(F("TIMEOUT! Retransmitindo Frag "));
+      DebugText.print(entry.packet.fragment_idx);
+      DebugText.print(F(" (Tentativa: "));
+      DebugText.print(entry.retransmission_attempts + 1);
+      DebugText.println(F(")."));
+      arqQueueTx(i);
+    } else {
+      arqGiveUp(i);
+    }
+  }
+}
+
+// Coloca no ar o próximo quadro das filas se o rádio estiver livre. Nunca espera a transmissão terminar
+void serviceRfTx() {
+  if (vw_tx_active()) return;
+
+  if (rfControlCount > 0) {
+    Packet pkt;
+    uint8_t* frame = rfControlFrames[rfControlHead];
+    uint8_t len = rfControlLens[rfControlHead];
+    rfControlHead = (rfControlHead + 1) % RF_CONTROL_QUEUE_SIZE;
+    rfControlCount--;
+    vw_send(frame, len);  // Copia o quadro e retorna; a VirtualWire transmite por interrupção
+    unpackRfFrame(frame, len, pkt);
+    if (pkt.packet_type == PACKET_TYPE_ACK || pkt.packet_type == PACKET_TYPE_NACK) {
+      telemetryEvent(pkt.packet_type == PACKET_TYPE_ACK ? TEL_ACK_TX : TEL_NACK_TX, pkt.message_id, pkt.fragment_idx, 0);
+    }
+    debugRfTx(pkt, false);
+    return;
+  }
+
+  if (pendingRfBitrate != 0) {  // Anúncios (ou a transmissão em curso) já saíram: troca agora
+    setRfBitrate(pendingRfBitrate);
+    pendingRfBitrate = 0;
+    return;
+  }
+
+  while (arqTxCount > 0) {
+    uint8_t slot = arqTxQueue[arqTxHead];
+    arqTxHead = (arqTxHead + 1) % ARQ_WINDOW_MAX;
+    arqTxCount--;
+    UnackedFragmentInfo& entry = unacked_fragments_buffer[slot];
+    entry.tx_pending = false;
+    if (!entry.active) {  // Confirmado ou abandonado enquanto esperava o rádio
+      arqRelease(slot);
+      continue;
+    }
+    bool is_retransmission = entry.sent;
+    if (is_retransmission) entry.retransmission_attempts++;
+    uint8_t rf_frame[sizeof(Packet)];
+    vw_send(rf_frame, packRfFrame(entry.packet, rf_frame));
+    entry.sent = true;
+    entry.last_sent_time = millis();
+    armArqDeadline(entry.last_sent_time + retransmissionTimeout());
+    telemetryEvent(is_retransmission ? TEL_DATA_RETX : TEL_DATA_TX, entry.packet.message_id, entry.packet.fragment_idx, entry.packet.payload_len);
+    debugRfTx(entry.packet, is_retransmission);
+    currentEmitterState = EmitterState::AGUARDANDO_ACK;  // Emissor aguarda ACK
+    return;
+  }
+}
+
+// RAM livre entre o topo do heap e a pilha (AVR)
+int freeRam() {
+  extern int __heap_start, *__brkval;
+  int top;
+  return (int)&top - (__brkval == 0 ? (int)&__heap_start : (int)__brkval);
+}
+
+// Aloca a janela ARQ com a RAM disponível e monta a lista livre e o índice vazio
+void setupArq() {
+  int window = (freeRam() - ARQ_RAM_RESERVE) / (int)sizeof(UnackedFragmentInfo);
+  window = constrain(window, ARQ_WINDOW_MIN, ARQ_WINDOW_MAX);
+  while ((unacked_fragments_buffer = (UnackedFragmentInfo*)malloc(window * sizeof(UnackedFragmentInfo))) == NULL && window > 1) {
+    window--;
+  }
+  arqWindow = window;
+  memset(unacked_fragments_buffer, 0, arqWindow * sizeof(UnackedFragmentInfo));
+  for (uint8_t i = 0; i < arqWindow; i++) {
+    unacked_fragments_buffer[i].next = (i + 1 < arqWindow) ? i + 1 : ARQ_NO_SLOT;
+  }
+  arqFreeHead = 0;
+  memset(arqIndex, ARQ_NO_SLOT, sizeof(arqIndex));
 }
 // ====================================================================================
 
@@ -234,43 +560,277 @@ void sendAckNack(uint8_t type, uint8_t msg_id, uint8_t frag_idx) {
 // ====================================================================================
 // FUNÇÃO PARA ENVIAR O STATUS ATUAL DO EMISSOR E RECEPTOR PARA O PYTHON (VIA SERIAL)
 // ====================================================================================
+// Escreve um uint32_t em little-endian (mesma ordem do struct "<I" do Python)
+void writeUint32LE(uint8_t* dest, uint32_t value) {
+  dest[0] = value & 0xFF;
+  dest[1] = (value >> 8) & 0xFF;
+  dest[2] = (value >> 16) & 0xFF;
+  dest[3] = (value >> 24) & 0xFF;
+}
+
 void sendCurrentStatusToPython() {
   Packet status_pkt;
+  memset(&status_pkt, 0, sizeof(Packet));
   status_pkt.packet_type = PACKET_TYPE_DATA;           // Usamos DATA type, mas diferenciamos pelo message_id
+  status_pkt.device_id = THIS_DEVICE_ID;
   status_pkt.message_id = MESSAGE_ID_COMBINED_STATUS;  // ID específico para o pacote de status combinado
   status_pkt.fragment_idx = 0;                         // Não relevante para status
   status_pkt.total_fragments = 0;                      // Não relevante para status
-  status_pkt.payload_len = 2;                          // O payload são 2 bytes: [emitter_status, receiver_status]
+  status_pkt.payload_len = 12;                         // [emitter_status, receiver_status, unacked_count, millis (4 bytes), quadros RF ruins, taxa RF (2 bytes), modo da telemetria, janela ARQ]
 
   // Convertemos os enums para seus valores uint8_t subjacentes
   status_pkt.payload_data[0] = static_cast<uint8_t>(currentEmitterState);   // Primeiro byte: status do Emissor
   status_pkt.payload_data[1] = static_cast<uint8_t>(currentReceiverState);  // Segundo byte: status do Receptor
+  status_pkt.payload_data[2] = unacked_count;                               // Ocupação do buffer ARQ
+  // millis() no momento do envio: o Python usa para estimar offset/deriva do relógio deste Arduino
+  writeUint32LE(&status_pkt.payload_data[3], millis());
+  // Estatísticas do rádio para a adaptação de taxa no Python (core/rf_rate.py)
+  status_pkt.payload_data[7] = rfCrcErrors + vw_get_rx_bad();  // Contadores de 8 bits: o Python usa a diferença
+  status_pkt.payload_data[8] = currentRfBitrate & 0xFF;
+  status_pkt.payload_data[9] = currentRfBitrate >> 8;
+  status_pkt.payload_data[10] = telemetryMode;
+  status_pkt.payload_data[11] = arqWindow;  // Fragmentos que o Python pode ter pendentes de ACK ao mesmo tempo
 
   // O CRC deve ser calculado APENAS sobre os bytes relevantes do pacote, conforme definido pelo Python.
-  // Para este pacote de status (que é um PACKET_TYPE_DATA com MESSAGE_ID_COMBINED_STATUS),
-  // o CRC inclui: type, id, frag_idx, total_frags, payload_len, e os 'payload_len' bytes do payload_data.
-  // Como payload_len é 2, teremos 5 + 2 = 7 bytes para o CRC.
-  uint8_t data_for_crc_status[PACKET_FIXED_OVERHEAD_EXCL_CRC + status_pkt.payload_len];
-  data_for_crc_status[0] = status_pkt.packet_type;
-  data_for_crc_status[1] = status_pkt.message_id;
-  data_for_crc_status[2] = status_pkt.fragment_idx;
-  data_for_crc_status[3] = status_pkt.total_fragments;
-  data_for_crc_status[4] = status_pkt.payload_len;
-  data_for_crc_status[5] = status_pkt.payload_data[0];
-  data_for_crc_status[6] = status_pkt.payload_data[1];
-
-  status_pkt.crc_value = calculateCRC4(data_for_crc_status, sizeof(data_for_crc_status));
+  status_pkt.crc_value = packetCRC(status_pkt);
 
   // Envia o pacote de status via Serial para o Python (NÃO VIA RF)
   Serial.write((uint8_t*)&status_pkt, sizeof(Packet));
 
+  lastStatusSendTime = millis();
+  lastSentEmitterState = currentEmitterState;
+  lastSentReceiverState = currentReceiverState;
+  lastSentUnackedCount = unacked_count;
+  lastSentRfBitrate = currentRfBitrate;
+  lastSentTelemetryMode = telemetryMode;
+
   // Para debug no monitor serial (opcional)
-  // Serial.print("SERIAL -> Status Binario: TX="); Serial.print(status_pkt.payload_data[0]);
-  // Serial.print(" ("); Serial.print(static_cast<uint8_t>(currentEmitterState)); Serial.print(")");
-  // Serial.print(", RX="); Serial.print(status_pkt.payload_data[1]);
-  // Serial.print(" ("); Serial.print(static_cast<uint8_t>(currentReceiverState)); Serial.print(")");
-  // Serial.print(", CRC=0x"); Serial.print(status_pkt.crc_value, HEX);
-  // Serial.println(".");
+  // DebugText.print("SERIAL -> Status Binario: TX="); DebugText.print(status_pkt.payload_data[0]);
+  // DebugText.print(" ("); DebugText.print(static_cast<uint8_t>(currentEmitterState)); DebugText.print(")");
+  // DebugText.print(", RX="); DebugText.print(status_pkt.payload_data[1]);
+  // DebugText.print(" ("); DebugText.print(static_cast<uint8_t>(currentReceiverState)); DebugText.print(")");
+  // DebugText.print(", CRC=0x"); DebugText.print(status_pkt.crc_value, HEX);
+  // DebugText.println(".");
+}
+
+// Status ao mudar algo que o Python acompanha (respeitando STATUS_MIN_INTERVAL) e, parado, a cada STATUS_HEARTBEAT_INTERVAL
+void updateStatusToPython() {
+  unsigned long elapsed = millis() - lastStatusSendTime;
+  bool changed = currentEmitterState != lastSentEmitterState || currentReceiverState != lastSentReceiverState
+                 || unacked_count != lastSentUnackedCount || currentRfBitrate != lastSentRfBitrate
+                 || telemetryMode != lastSentTelemetryMode;
+  if ((changed && elapsed >= STATUS_MIN_INTERVAL) || elapsed >= STATUS_HEARTBEAT_INTERVAL) {
+    sendCurrentStatusToPython();
+  }
+}
+
+// Envia via RF um beacon com o millis() deste Arduino (mestre de tempo). Sem ARQ: um beacon perdido
+// é simplesmente substituído pelo próximo. O timestamp é gravado imediatamente antes do vw_send (chamado só com o rádio livre).
+void sendBeacon() {
+  Packet beacon_pkt;
+  memset(&beacon_pkt, 0, sizeof(Packet));
+  beacon_pkt.packet_type = PACKET_TYPE_DATA;
+  beacon_pkt.device_id = THIS_DEVICE_ID;
+  beacon_pkt.message_id = MESSAGE_ID_BEACON;
+  beacon_pkt.fragment_idx = 0;
+  beacon_pkt.total_fragments = 1;
+  beacon_pkt.payload_len = 4;
+  writeUint32LE(beacon_pkt.payload_data, millis());
+  beacon_pkt.crc_value = packetCRC(beacon_pkt);
+
+  uint8_t rf_frame[sizeof(Packet)];
+  vw_send(rf_frame, packRfFrame(beacon_pkt, rf_frame));
+
+  // O próprio PC do mestre também recebe o beacon (mesma referência de tempo dos dois lados)
+  Serial.write((uint8_t*)&beacon_pkt, sizeof(Packet));
+}
+// ====================================================================================
+
+
+// ====================================================================================
+// ENLACE SERIAL COM O PYTHON (NEGOCIAÇÃO DE TAXA)
+// ====================================================================================
+uint32_t readUint32LE(const uint8_t* src) {
+  return (uint32_t)src[0] | ((uint32_t)src[1] << 8) | ((uint32_t)src[2] << 16) | ((uint32_t)src[3] << 24);
+}
+
+bool isSupportedBaud(uint32_t baud) {
+  for (uint8_t i = 0; i < sizeof(SUPPORTED_BAUD_RATES) / sizeof(SUPPORTED_BAUD_RATES[0]); i++) {
+    if (SUPPORTED_BAUD_RATES[i] == baud) return true;
+  }
+  return baud == SERIAL_DEFAULT_BAUD;
+}
+
+void switchSerialBaud(uint32_t baud) {
+  Serial.flush();  // Termina de transmitir o que já estava no buffer na taxa antiga
+  Serial.end();
+  Serial.begin(baud);
+  while (Serial.available() > 0) Serial.read();  // Bytes recebidos durante a troca são lixo
+  serial_input_len = 0;
+  currentSerialBaud = baud;
+  lastValidSerialFrameTime = millis();
+}
+
+void sendLinkFrame(uint8_t command, uint8_t idx, const uint8_t* payload, uint8_t len) {
+  Packet link_pkt;
+  memset(&link_pkt, 0, sizeof(Packet));
+  link_pkt.packet_type = PACKET_TYPE_LINK;
+  link_pkt.device_id = THIS_DEVICE_ID;
+  link_pkt.message_id = command;
+  link_pkt.fragment_idx = idx;
+  link_pkt.payload_len = len;
+  if (len > 0) memcpy(link_pkt.payload_data, payload, len);
+  link_pkt.crc_value = packetCRC(link_pkt);
+  Serial.write((uint8_t*)&link_pkt, sizeof(Packet));
+}
+
+void handleLinkFrame(Packet& pkt) {
+  switch (pkt.message_id) {
+    case LINK_BAUD_PROPOSE: {
+      uint32_t baud = pkt.payload_len >= 4 ? readUint32LE(pkt.payload_data) : 0;
+      if (!isSupportedBaud(baud)) {
+        sendLinkFrame(LINK_BAUD_REJECT, 0, pkt.payload_data, 4);
+        break;
+      }
+      sendLinkFrame(LINK_BAUD_ACCEPT, 0, pkt.payload_data, 4);
+      previousSerialBaud = currentSerialBaud;
+      switchSerialBaud(baud);
+      baudTrialActive = true;
+      baudTrialStartTime = millis();
+      break;
+    }
+    case LINK_TEST:
+      Serial.write((uint8_t*)&pkt, sizeof(Packet));  // Eco: o Python confere payload e CRC
+      break;
+    case LINK_BAUD_COMMIT:
+      baudTrialActive = false;
+      sendLinkFrame(LINK_BAUD_COMMIT, 0, NULL, 0);
+      break;
+    case LINK_RF_BITRATE: {
+      uint16_t bitrate = pkt.payload_data[0] | ((uint16_t)pkt.payload_data[1] << 8);
+      if (pkt.payload_len >= 2 && isSupportedRfBitrate(bitrate) && bitrate != currentRfBitrate) {
+        announceRfBitrate(bitrate);
+      }
+      break;
+    }
+    case LINK_TELEMETRY_MODE:
+      if (pkt.payload_len >= 1 && pkt.payload_data[0] <= TELEMETRY_BINARY) {
+        flushTelemetry();  // Registros pendentes saem antes do texto voltar
+        telemetryMode = pkt.payload_data[0];
+      }
+      break;
+    default:  // LINK_KEEPALIVE: basta ter chegado um quadro válido
+      break;
+  }
+}
+
+// Volta de taxa quando o teste expira sem COMMIT ou quando o Python some numa taxa negociada
+void checkSerialBaudFallback() {
+  if (baudTrialActive && millis() - baudTrialStartTime > BAUD_TRIAL_TIMEOUT) {
+    baudTrialActive = false;
+    switchSerialBaud(previousSerialBaud);
+    DebugText.println(F("LINK: nova taxa sem confirmacao; voltando a anterior."));
+  } else if (!baudTrialActive && currentSerialBaud != SERIAL_DEFAULT_BAUD && millis() - lastValidSerialFrameTime > LINK_WATCHDOG_TIMEOUT) {
+    switchSerialBaud(SERIAL_DEFAULT_BAUD);
+    DebugText.println(F("LINK: sem quadros validos do Python; voltando a taxa padrao."));
+  }
+}
+// ====================================================================================
+
+
+// ====================================================================================
+// TAXA DO RÁDIO (VIRTUALWIRE)
+// ====================================================================================
+bool isSupportedRfBitrate(uint16_t bitrate) {
+  for (uint8_t i = 0; i < sizeof(SUPPORTED_RF_BITRATES) / sizeof(SUPPORTED_RF_BITRATES[0]); i++) {
+    if (SUPPORTED_RF_BITRATES[i] == bitrate) return true;
+  }
+  return false;
+}
+
+void setRfBitrate(uint16_t bitrate) {
+  vw_setup(bitrate);  // Reconfigura o timer da VirtualWire; a recepção continua habilitada
+  vw_rx_start();
+  currentRfBitrate = bitrate;
+  lastValidRfFrameTime = millis();
+  telemetryEvent(TEL_RF_BITRATE, 0, 0, bitrate / 100);
+  DebugText.print(F("RF: taxa agora em "));
+  DebugText.print(bitrate);
+  DebugText.println(F(" bps."));
+}
+
+// Avisa o outro Arduino (na taxa atual) e então troca a nossa, quando os anúncios tiverem saído (serviceRfTx)
+void announceRfBitrate(uint16_t bitrate) {
+  if (pendingRfBitrate != 0 || RF_CONTROL_QUEUE_SIZE - rfControlCount < RF_BITRATE_ANNOUNCE_REPEATS) {
+    return;  // Troca em andamento ou fila cheia: o Python pede de novo se o status não confirmar
+  }
+  Packet announce_pkt;
+  memset(&announce_pkt, 0, sizeof(Packet));
+  announce_pkt.packet_type = PACKET_TYPE_DATA;
+  announce_pkt.device_id = THIS_DEVICE_ID;
+  announce_pkt.message_id = MESSAGE_ID_RF_BITRATE;
+  announce_pkt.total_fragments = 1;
+  announce_pkt.payload_len = 2;
+  announce_pkt.payload_data[0] = bitrate & 0xFF;
+  announce_pkt.payload_data[1] = bitrate >> 8;
+  announce_pkt.crc_value = packetCRC(announce_pkt);
+
+  for (uint8_t i = 0; i < RF_BITRATE_ANNOUNCE_REPEATS; i++) {
+    queueControlFrame(announce_pkt);
+  }
+  pendingRfBitrate = bitrate;
+}
+
+// Sem ouvir o outro lado por muito tempo numa taxa negociada, volta à padrão (o outro lado faz o mesmo)
+void checkRfBitrateFallback() {
+  if (currentRfBitrate != RF_DEFAULT_BITRATE && pendingRfBitrate == 0 && !vw_tx_active()
+      && millis() - lastValidRfFrameTime > RF_LINK_WATCHDOG_TIMEOUT) {
+    DebugText.println(F("RF: sem quadros validos; voltando a taxa padrao."));
+    setRfBitrate(RF_DEFAULT_BITRATE);
+  }
+}
+// ====================================================================================
+
+
+// ====================================================================================
+// TELEMETRIA BINÁRIA
+// ====================================================================================
+// Envia o quadro em montagem. Com o buffer de saída cheio, descarta os registros em vez de travar o loop
+// esperando a serial (o Python vê quantos foram descartados pelo contador no cabeçalho).
+void flushTelemetry() {
+  if (telemetryCount == 0) return;
+  if (Serial.availableForWrite() < (int)sizeof(Packet)) {
+    telemetryDropped += telemetryCount;
+    telemetryCount = 0;
+    return;
+  }
+  telemetryFrame.packet_type = PACKET_TYPE_TELEMETRY;
+  telemetryFrame.device_id = THIS_DEVICE_ID;
+  telemetryFrame.message_id = telemetryDropped;
+  telemetryFrame.fragment_idx = telemetryCount;
+  telemetryFrame.total_fragments = telemetrySeq++;
+  telemetryFrame.payload_len = 4 + telemetryCount * TELEMETRY_RECORD_SIZE;
+  telemetryFrame.crc_value = packetCRC(telemetryFrame);
+  Serial.write((uint8_t*)&telemetryFrame, sizeof(Packet));
+  telemetryCount = 0;
+}
+
+void telemetryEvent(uint8_t event, uint8_t msg_id, uint8_t frag_idx, uint8_t arg) {
+  if (telemetryMode != TELEMETRY_BINARY) return;
+  unsigned long now = millis();
+  if (telemetryCount > 0 && now - telemetryBase > 255) flushTelemetry();  // O deslocamento do registro é de 8 bits
+  if (telemetryCount == 0) {
+    memset(&telemetryFrame, 0, sizeof(Packet));
+    telemetryBase = now;
+    writeUint32LE(telemetryFrame.payload_data, now);
+  }
+  uint8_t* record = &telemetryFrame.payload_data[4 + telemetryCount * TELEMETRY_RECORD_SIZE];
+  record[0] = event;
+  record[1] = msg_id;
+  record[2] = frag_idx;
+  record[3] = arg;
+  record[4] = now - telemetryBase;
+  if (++telemetryCount == TELEMETRY_RECORDS_PER_FRAME) flushTelemetry();
 }
 // ====================================================================================
 
@@ -279,50 +839,51 @@ void sendCurrentStatusToPython() {
 // FUNÇÕES DE SETUP
 // ====================================================================================
 void setup() {
-  Serial.begin(9600);  // Inicia a comunicação serial para debug e interface com Python
-  Serial.println(F("--- Arduino TRANSCEPTOR BRIDGE: Inicializando com VirtualWire, ARQ e CSMA/CA ---"));
+  Serial.begin(SERIAL_DEFAULT_BAUD);  // Inicia a comunicação serial para debug e interface com Python (taxa negociada depois)
+  DebugText.println(F("--- Arduino TRANSCEPTOR BRIDGE: Inicializando com VirtualWire, ARQ e CSMA/CA ---"));
 
   vw_set_rx_pin(RX_DATA_PIN);  // Configura o pino de recepção
-  vw_setup(2000);              // Configura a velocidade de comunicação em bps (bits por segundo)
+  vw_setup(RF_DEFAULT_BITRATE);  // Configura a velocidade de comunicação em bps (ajustada depois pelo Python)
   vw_rx_start();               // Inicia o modo de recepção da VirtualWire
 
   vw_set_tx_pin(TX_DATA_PIN);  // Configura o pino de transmissão
 
   randomSeed(analogRead(A0));  // Inicializa o gerador de números aleatórios para o CSMA/CA
 
-  Serial.println(F("VirtualWire configurado (RX no pino 2, TX no pino 12)."));
-  Serial.println(F("Pronto para receber pacotes RF E pacotes SERIAL do Python para envio."));
-  Serial.print(F("Tamanho da estrutura Packet: "));
-  Serial.print(sizeof(Packet));
-  Serial.println(F(" bytes (Max RF Payload: 27)."));
-  Serial.print(F("MAX_PACKET_PAYLOAD_SIZE (nosso payload): "));
-  Serial.print(MAX_PACKET_PAYLOAD_SIZE);
-  Serial.println(F(" bytes."));
-  Serial.print(F("ARQ: Max fragmentos nao confirmados: "));
-  Serial.print(MAX_UNACKED_FRAGMENTS);
-  Serial.println(F("."));
-  Serial.print(F("ARQ: Timeout de retransmissao: "));
-  Serial.print(RETRANSMISSION_TIMEOUT);
-  Serial.println(F(" ms."));
-  Serial.print(F("ARQ: Max tentativas: "));
-  Serial.print(MAX_RETRANSMISSION_ATTEMPTS);
-  Serial.println(F(" tentativas."));
-  Serial.print(F("CSMA/CA: Min Backoff: "));
-  Serial.print(MIN_BACKOFF_TIME);
-  Serial.println(F(" ms."));
-  Serial.print(F("CSMA/CA: Max Backoff: "));
-  Serial.print(MAX_BACKOFF_TIME);
-  Serial.println(F(" ms."));
+  DebugText.println(F("VirtualWire configurado (RX no pino 2, TX no pino 12)."));
+  DebugText.println(F("Pronto para receber pacotes RF E pacotes SERIAL do Python para envio."));
+  DebugText.print(F("Tamanho da estrutura Packet: "));
+  DebugText.print(sizeof(Packet));
+  DebugText.println(F(" bytes (Max RF Payload: 27)."));
+  DebugText.print(F("MAX_PACKET_PAYLOAD_SIZE (nosso payload): "));
+  DebugText.print(MAX_PACKET_PAYLOAD_SIZE);
+  DebugText.println(F(" bytes."));
+  DebugText.print(F("ARQ: Timeout de retransmissao: "));
+  DebugText.print(RETRANSMISSION_TIMEOUT);
+  DebugText.println(F(" ms."));
+  DebugText.print(F("ARQ: Max tentativas: "));
+  DebugText.print(MAX_RETRANSMISSION_ATTEMPTS);
+  DebugText.println(F(" tentativas."));
+  DebugText.print(F("CSMA/CA: Min Backoff: "));
+  DebugText.print(MIN_BACKOFF_TIME);
+  DebugText.println(F(" ms."));
+  DebugText.print(F("CSMA/CA: Max Backoff: "));
+  DebugText.print(MAX_BACKOFF_TIME);
+  DebugText.println(F(" ms."));
 
   // Limpa o buffer de fragmentos não confirmados
-  for (uint8_t i = 0; i < MAX_UNACKED_FRAGMENTS; i++) {
-    unacked_fragments_buffer[i].active = false;
-  }
+  setupArq();  // Janela ARQ do tamanho da RAM que sobrou
+  DebugText.print(F("ARQ: Max fragmentos nao confirmados: "));
+  DebugText.print(arqWindow);
+  DebugText.println(F("."));
 
   // NOVO: Define o status inicial após a inicialização.
   // Se chegou aqui, o hardware está inicializado.
   currentEmitterState = EmitterState::CONECTADO_OCIO;
   currentReceiverState = ReceiverState::CONECTADO_AGUARDANDO;
+
+  // Primeiro status imediatamente: o Python espera por ele para saber que o Arduino terminou de reiniciar
+  sendCurrentStatusToPython();
 }
 // ====================================================================================
 
@@ -331,6 +892,9 @@ void setup() {
 // FUNÇÕES DE LOOP (EXECUÇÃO CONTÍNUA)
 // ====================================================================================
 void loop() {
+  // --- Rádio: próximo quadro das filas, se a transmissão anterior terminou ---
+  serviceRfTx();
+
   // --- Atualização do status "sinal perdido" para o Receptor ---
   // Se o receptor está CONECTADO_AGUARDANDO e não recebeu nada por um tempo definido.
   if (currentReceiverState == ReceiverState::CONECTADO_AGUARDANDO && (millis() - lastRfReceiveTime > NO_SIGNAL_TIMEOUT_RX)) {
@@ -356,73 +920,63 @@ void loop() {
     }
 
 
-    Serial.print(F("RF <- Pacote RF Recebido ("));
-    Serial.print(received_buffer_rf_len);
-    Serial.print(F(" bytes)... "));
-
-    // Verifica se o tamanho do pacote recebido é o esperado para a nossa estrutura Packet
-    if (received_buffer_rf_len == sizeof(Packet)) {
-      Packet received_packet;
-      memcpy(&received_packet, received_buffer_rf, sizeof(Packet));  // Copia os bytes para a estrutura Packet
+    DebugText.print(F("RF <- Pacote RF Recebido ("));
+    DebugText.print(received_buffer_rf_len);
+    DebugText.print(F(" bytes)... "));
 
-      // Determina o comprimento dos dados para o cálculo do CRC (varia se é DATA ou ACK/NACK)
-      // Este cálculo deve ser idêntico ao que o EMISSOR usou para gerar o CRC.
-      uint8_t data_to_crc_len;
-      if (received_packet.packet_type == PACKET_TYPE_DATA) {
-        // Para pacotes DATA, o CRC é sobre: type, id, frag_idx, total_frags, payload_len, e o payload
-        data_to_crc_len = PACKET_FIXED_OVERHEAD_EXCL_CRC + received_packet.payload_len;
-      } else {
-        // Para ACK/NACK, o CRC é sobre: type, message_id, fragment_idx
-        data_to_crc_len = 3;
-      }
+    // Remonta a estrutura Packet a partir do quadro compacto (o tamanho precisa bater com o payload_len)
+    Packet received_packet;
+    if (unpackRfFrame(received_buffer_rf, received_buffer_rf_len, received_packet)) {
 
-      uint8_t data_to_crc[data_to_crc_len];
-      data_to_crc[0] = received_packet.packet_type;
-      data_to_crc[1] = received_packet.message_id;
-      data_to_crc[2] = received_packet.fragment_idx;
-      if (received_packet.packet_type == PACKET_TYPE_DATA) {
-        data_to_crc[3] = received_packet.total_fragments;
-        data_to_crc[4] = received_packet.payload_len;
-        if (received_packet.payload_len > 0) {
-          memcpy(&data_to_crc[5], received_packet.payload_data, received_packet.payload_len);
-        }
-      }
-      uint8_t calculated_crc = calculateCRC4(data_to_crc, data_to_crc_len);  // Calcula o CRC
+      // Calcula o CRC sobre os mesmos bytes que o EMISSOR usou (varia se é DATA ou ACK/NACK)
+      uint8_t calculated_crc = packetCRC(received_packet);
 
       // Exibe informações do pacote recebido (debug)
-      Serial.print(F("Tipo: 0x"));
-      Serial.print(received_packet.packet_type, HEX);
-      Serial.print(F(", MsgID: "));
-      Serial.print(received_packet.message_id);
-      Serial.print(F(", Frag: "));
-      Serial.print(received_packet.fragment_idx);
-      Serial.print(F("/"));
-      Serial.print(received_packet.total_fragments);
-      Serial.print(F(", P-Len: "));
-      Serial.print(received_packet.payload_len);
-      Serial.print(F(", CRC R: 0x"));
-      Serial.print(received_packet.crc_value, HEX);
-      Serial.print(F(", CRC C: 0x"));
-      Serial.print(calculated_crc, HEX);
-      Serial.print(F(" -> "));
+      DebugText.print(F("Tipo: 0x"));
+      DebugText.print(received_packet.packet_type, HEX);
+      DebugText.print(F(", MsgID: "));
+      DebugText.print(received_packet.message_id);
+      DebugText.print(F(", Frag: "));
+      DebugText.print(received_packet.fragment_idx);
+      DebugText.print(F("/"));
+      DebugText.print(received_packet.total_fragments);
+      DebugText.print(F(", P-Len: "));
+      DebugText.print(received_packet.payload_len);
+      DebugText.print(F(", CRC R: 0x"));
+      DebugText.print(received_packet.crc_value, HEX);
+      DebugText.print(F(", CRC C: 0x"));
+      DebugText.print(calculated_crc, HEX);
+      DebugText.print(F(" -> "));
 
       // Verifica o CRC (da transmissão RF)
       if (calculated_crc == received_packet.crc_value) {
-        Serial.println(F("CRC OK!"));
-
-        if (received_packet.packet_type == PACKET_TYPE_DATA) {
+        DebugText.println(F("CRC OK!"));
+        lastValidRfFrameTime = millis();
+
+        if (received_packet.packet_type == PACKET_TYPE_DATA && received_packet.message_id == MESSAGE_ID_RF_BITRATE) {
+          // O outro Arduino vai trocar de taxa (anúncio repetido: só a primeira cópia muda algo)
+          uint16_t bitrate = received_packet.payload_data[0] | ((uint16_t)received_packet.payload_data[1] << 8);
+          if (received_packet.device_id != THIS_DEVICE_ID && isSupportedRfBitrate(bitrate) && bitrate != currentRfBitrate
+              && bitrate != pendingRfBitrate) {
+            pendingRfBitrate = bitrate;  // Troca assim que o rádio estiver livre
+          }
+        } else if (received_packet.packet_type == PACKET_TYPE_DATA && received_packet.message_id == MESSAGE_ID_BEACON) {
+          // Beacon de sincronização do mestre: não gera ACK, apenas repassa ao Python
+          Serial.write((uint8_t*)&received_packet, sizeof(Packet));
+        } else if (received_packet.packet_type == PACKET_TYPE_DATA) {
           // Se for um pacote de DADOS e o CRC estiver OK, envia ACK de volta via RF
+          telemetryEvent(TEL_DATA_RX, received_packet.message_id, received_packet.fragment_idx, received_packet.payload_len);
           sendAckNack(PACKET_TYPE_ACK, received_packet.message_id, received_packet.fragment_idx);
 
           // Envia a estrutura Packet COMPLETA para o Python via Serial
           Serial.write((uint8_t*)&received_packet, sizeof(Packet));
-          Serial.print(F("SERIAL -> Pacote DATA (MsgID: "));
-          Serial.print(received_packet.message_id);
-          Serial.print(F(", Frag: "));
-          Serial.print(received_packet.fragment_idx);
-          Serial.print(F(") enviado ao Python (Tamanho: "));
-          Serial.print(sizeof(Packet));
-          Serial.println(F(" bytes)."));
+          DebugText.print(F("SERIAL -> Pacote DATA (MsgID: "));
+          DebugText.print(received_packet.message_id);
+          DebugText.print(F(", Frag: "));
+          DebugText.print(received_packet.fragment_idx);
+          DebugText.print(F(") enviado ao Python (Tamanho: "));
+          DebugText.print(sizeof(Packet));
+          DebugText.println(F(" bytes)."));
 
           // NOVO: Se o último fragmento de um arquivo foi recebido com sucesso
           if (received_packet.fragment_idx == received_packet.total_fragments - 1 && received_packet.total_fragments > 0) {
@@ -432,23 +986,24 @@ void loop() {
 
         } else if (received_packet.packet_type == PACKET_TYPE_ACK) {
           // Se for um ACK, procura no buffer de não confirmados e remove
-          Serial.print(F("ACK Recebido para MsgID "));
-          Serial.print(received_packet.message_id);
-          Serial.print(F(", Frag "));
-          Serial.print(received_packet.fragment_idx);
-          Serial.println(F("."));
-          for (uint8_t i = 0; i < MAX_UNACKED_FRAGMENTS; i++) {
-            if (unacked_fragments_buffer[i].active && unacked_fragments_buffer[i].packet.message_id == received_packet.message_id && unacked_fragments_buffer[i].packet.fragment_idx == received_packet.fragment_idx) {
-              unacked_fragments_buffer[i].active = false;
-              unacked_count--;
-              Serial.print(F("Fragmento MsgID "));
-              Serial.print(received_packet.message_id);
-              Serial.print(F(", Frag "));
-              Serial.print(received_packet.fragment_idx);
-              Serial.println(F(" confirmado."));
-              break;
-            }
+          telemetryEvent(TEL_ACK_RX, received_packet.message_id, received_packet.fragment_idx, 0);
+          DebugText.print(F("ACK Recebido para MsgID "));
+          DebugText.print(received_packet.message_id);
+          DebugText.print(F(", Frag "));
+          DebugText.print(received_packet.fragment_idx);
+          DebugText.println(F("."));
+          uint8_t slot = arqFind(received_packet.message_id, received_packet.fragment_idx);
+          if (slot != ARQ_NO_SLOT) {
+            arqRemove(slot);
+            DebugText.print(F("Fragmento MsgID "));
+            DebugText.print(received_packet.message_id);
+            DebugText.print(F(", Frag "));
+            DebugText.print(received_packet.fragment_idx);
+            DebugText.println(F(" confirmado."));
           }
+          // Repassa ao Python: o ARQ dele (send_fragment_with_arq) só termina com este ACK.
+          // Chegam dois por fragmento (o do outro Arduino e o do outro PC); o segundo não acha espera e é ignorado
+          Serial.write((uint8_t*)&received_packet, sizeof(Packet));
           // NOVO: Se todos os fragmentos foram confirmados (buffer vazio) E estava enviando um arquivo
           if (unacked_count == 0 && isSendingFile) {
             currentEmitterState = EmitterState::ENVIADO_COMPLETO;
@@ -461,152 +1016,158 @@ void loop() {
 
         } else if (received_packet.packet_type == PACKET_TYPE_NACK) {
           // Se for um NACK, força a retransmissão do fragmento correspondente
-          Serial.print(F("NACK Recebido para MsgID "));
-          Serial.print(received_packet.message_id);
-          Serial.print(F(", Frag "));
-          Serial.print(received_packet.fragment_idx);
-          Serial.println(F(". Forcando retransmissao."));
-          for (uint8_t i = 0; i < MAX_UNACKED_FRAGMENTS; i++) {
-            if (unacked_fragments_buffer[i].active && unacked_fragments_buffer[i].packet.message_id == received_packet.message_id && unacked_fragments_buffer[i].packet.fragment_idx == received_packet.fragment_idx) {
-              if (unacked_fragments_buffer[i].retransmission_attempts < MAX_RETRANSMISSION_ATTEMPTS) {
-                sendPacket(unacked_fragments_buffer[i].packet, true);  // Retransmite o pacote
-              } else {
-                Serial.print(F("AVISO: Frag "));
-                Serial.print(unacked_fragments_buffer[i].packet.fragment_idx);
-                Serial.println(F(" atingiu limite de retransmissoes. Falha no envio."));
-                unacked_fragments_buffer[i].active = false;
-                unacked_count--;
-                // Se um fragmento falha persistentemente, aplica backoff para qualquer próxima tentativa de envio
-                backoff_end_time = millis() + random(MIN_BACKOFF_TIME, MAX_BACKOFF_TIME);
-                Serial.print(F("Aplicando backoff de "));
-                Serial.print(backoff_end_time - millis());
-                Serial.println(F("ms devido a falha de TX."));
-                // NOVO: Se o envio falhou, o emissor volta para CONECTADO_OCIO e sinaliza erro de comunicação
-                currentEmitterState = EmitterState::ERRO_COMUNICACAO;  // Estado de erro
-                isSendingFile = false;                                 // Parar de considerar que estamos enviando
+          telemetryEvent(TEL_NACK_RX, received_packet.message_id, received_packet.fragment_idx, 0);
+          DebugText.print(F("NACK Recebido para MsgID "));
+          DebugText.print(received_packet.message_id);
+          DebugText.print(F(", Frag "));
+          DebugText.print(received_packet.fragment_idx);
+          DebugText.println(F(". Forcando retransmissao."));
+          if (received_packet.payload_len > 0) {
+            // Lista de faltantes do PC receptor: reenvia aqui os fragmentos que ainda estão na janela e repassa
+            // ao Python só as faixas dos que já saíram dela, que ele reenvia na hora (sem esperar o timeout).
+            // Repassar a lista inteira faria o mesmo fragmento ir ao ar duas vezes: por aqui e pelo Python.
+            Packet forward_packet = received_packet;
+            memset(forward_packet.payload_data, 0, sizeof(forward_packet.payload_data));
+            uint8_t forward_len = 0;
+            for (uint8_t r = 0; r + 1 < received_packet.payload_len; r += 2) {
+              for (uint16_t frag = received_packet.payload_data[r]; frag <= received_packet.payload_data[r + 1]; frag++) {
+                if (arqFind(received_packet.message_id, (uint8_t)frag) != ARQ_NO_SLOT) {
+                  arqNack(received_packet.message_id, (uint8_t)frag);
+                } else if (forward_len > 0 && forward_packet.payload_data[forward_len - 1] + 1 == frag) {
+                  forward_packet.payload_data[forward_len - 1] = (uint8_t)frag;  // Continua a faixa anterior
+                } else if (forward_len + 2 <= MAX_PACKET_PAYLOAD_SIZE) {
+                  forward_packet.payload_data[forward_len++] = (uint8_t)frag;
+                  forward_packet.payload_data[forward_len++] = (uint8_t)frag;
+                }
               }
-              break;
             }
+            if (forward_len > 0) {
+              forward_packet.payload_len = forward_len;
+              forward_packet.fragment_idx = forward_packet.payload_data[0];
+              forward_packet.crc_value = packetCRC(forward_packet);
+              Serial.write((uint8_t*)&forward_packet, sizeof(Packet));
+            }
+          } else {
+            arqNack(received_packet.message_id, received_packet.fragment_idx);
           }
         }
       } else {
-        Serial.print(F("ERRO DE CRC! (Dados Corrompidos via RF). MsgID: "));
-        Serial.print(received_packet.message_id);
+        telemetryEvent(TEL_RF_CRC_FAIL, received_packet.message_id, received_packet.fragment_idx, received_packet.packet_type);
+        DebugText.print(F("ERRO DE CRC! (Dados Corrompidos via RF). MsgID: "));
+        DebugText.print(received_packet.message_id);
         if (received_packet.packet_type == PACKET_TYPE_DATA) {
-          Serial.print(F(", Frag: "));
-          Serial.print(received_packet.fragment_idx);
+          DebugText.print(F(", Frag: "));
+          DebugText.print(received_packet.fragment_idx);
           sendAckNack(PACKET_TYPE_NACK, received_packet.message_id, received_packet.fragment_idx);  // Envia NACK se for um pacote de dados corrompido
         }
-        Serial.println(F("."));
+        DebugText.println(F("."));
+        rfCrcErrors++;
         // NOVO: Se houve erro de CRC no recebimento, o receptor pode indicar erro de comunicação
         currentReceiverState = ReceiverState::ERRO_COMUNICACAO;
       }
     } else {
-      Serial.println(F("Tamanho do pacote RF recebido incompativel. Descartando."));
+      DebugText.println(F("Tamanho do pacote RF recebido incompativel. Descartando."));
+      telemetryEvent(TEL_RF_BAD_FRAME, 0, 0, received_buffer_rf_len);
+      rfCrcErrors++;
       currentReceiverState = ReceiverState::ERRO_COMUNICACAO;  // Pacote malformado = erro
     }
   }
 
   // --- Lógica de Leitura Serial (Recebe a 'Packet' já montada do Python para ENVIAR via RF) ---
-  // Só tenta ler se houver bytes suficientes para uma Packet completa E se o buffer ARQ não estiver cheio
-  if (Serial.available() >= sizeof(Packet)) {  // Mudamos a condição para que o backoff não bloqueie a leitura.
-    // Lemos o pacote da serial primeiro para não perder dados.
-    Serial.readBytes(serial_input_buffer, sizeof(Packet));
-
+  // Os bytes se acumulam até formar uma Packet completa. Com CRC inválido, descartamos só o primeiro byte
+  // e tentamos de novo no próximo: depois de lixo na linha (ex.: troca de taxa) a leitura se realinha sozinha.
+  while (serial_input_len < sizeof(Packet) && Serial.available() > 0) {
+    serial_input_buffer[serial_input_len++] = Serial.read();
+  }
+  if (serial_input_len == sizeof(Packet)) {
     Packet pkt_from_python;
     memcpy(&pkt_from_python, serial_input_buffer, sizeof(Packet));  // Copia para a estrutura Packet
 
-    // 1. Determina o comprimento dos dados para o CÁLCULO/VERIFICAÇÃO do CRC (da camada SERIAL)
-    uint8_t data_for_crc_len_serial;
-    // O pacote de status (MESSAGE_ID_COMBINED_STATUS) é do tipo PACKET_TYPE_DATA,
-    // então a lógica do CRC é a mesma dos dados.
-    data_for_crc_len_serial = PACKET_FIXED_OVERHEAD_EXCL_CRC + pkt_from_python.payload_len;
-
-    // 2. Prepara os dados para o CÁLCULO do CRC da camada SERIAL
-    uint8_t data_to_verify_serial[data_for_crc_len_serial];
-    data_to_verify_serial[0] = pkt_from_python.packet_type;
-    data_to_verify_serial[1] = pkt_from_python.message_id;
-    data_to_verify_serial[2] = pkt_from_python.fragment_idx;
-    data_to_verify_serial[3] = pkt_from_python.total_fragments;
-    data_to_verify_serial[4] = pkt_from_python.payload_len;
-    if (pkt_from_python.payload_len > 0) {
-      memcpy(&data_to_verify_serial[5], pkt_from_python.payload_data, pkt_from_python.payload_len);
-    }
-    uint8_t calculated_crc_serial = calculateCRC4(data_to_verify_serial, data_for_crc_len_serial);
+    // 1. Calcula o CRC da camada SERIAL sobre os mesmos bytes que o Python usou (DATA ou ACK/NACK)
+    uint8_t calculated_crc_serial = packetCRC(pkt_from_python);
 
-    // 3. VERIFICAÇÃO DO CRC-4 RECEBIDO DO PYTHON (PARA GARANTIR INTEGRIDADE DO PACOTE DO PYTHON)
+    // 2. VERIFICAÇÃO DO CRC-4 RECEBIDO DO PYTHON (PARA GARANTIR INTEGRIDADE DO PACOTE DO PYTHON)
     if (calculated_crc_serial != pkt_from_python.crc_value) {
-      Serial.print(F("ERRO CRC SERIAL: Pacote corrompido do Python! (MsgID: "));
-      Serial.print(pkt_from_python.message_id);
-      Serial.print(F(", Frag: "));
-      Serial.print(pkt_from_python.fragment_idx);
-      Serial.print(F(", CRC Python: 0x"));
-      Serial.print(pkt_from_python.crc_value, HEX);
-      Serial.print(F(", CRC Calc: 0x"));
-      Serial.print(calculated_crc_serial, HEX);
-      Serial.println(F("). Descartando."));
-      return;  // Sai do loop e espera o próximo pacote
+      if (!serial_resyncing) {
+        DebugText.print(F("ERRO CRC SERIAL: Pacote corrompido do Python! (MsgID: "));
+        DebugText.print(pkt_from_python.message_id);
+        DebugText.print(F(", Frag: "));
+        DebugText.print(pkt_from_python.fragment_idx);
+        DebugText.print(F(", CRC Python: 0x"));
+        DebugText.print(pkt_from_python.crc_value, HEX);
+        DebugText.print(F(", CRC Calc: 0x"));
+        DebugText.print(calculated_crc_serial, HEX);
+        DebugText.println(F("). Realinhando."));
+        telemetryEvent(TEL_SERIAL_CRC_FAIL, pkt_from_python.message_id, pkt_from_python.fragment_idx, 0);
+        serial_resyncing = true;
+      }
+      memmove(serial_input_buffer, serial_input_buffer + 1, sizeof(Packet) - 1);
+      serial_input_len = sizeof(Packet) - 1;
+      return;  // Sai do loop e tenta de novo com o próximo byte
+    }
+    serial_input_len = 0;
+    serial_resyncing = false;
+    lastValidSerialFrameTime = millis();
+
+    if (pkt_from_python.packet_type == PACKET_TYPE_LINK) {
+      handleLinkFrame(pkt_from_python);  // Só diz respeito à serial; nada vai para o RF
+      return;
     }
 
     // Se o CRC do Python está OK e não estamos em backoff RF e o buffer ARQ não está cheio.
-    if (millis() < backoff_end_time || unacked_count >= MAX_UNACKED_FRAGMENTS) {
-      Serial.println(F("AVISO: Recebido do Python, mas canal RF ocupado ou buffer cheio. Pacote aguardando..."));
+    bool is_data = pkt_from_python.packet_type == PACKET_TYPE_DATA;
+    if (millis() < backoff_end_time || (is_data && arqFreeHead == ARQ_NO_SLOT && arqFind(pkt_from_python.message_id, pkt_from_python.fragment_idx) == ARQ_NO_SLOT)) {
+      DebugText.println(F("AVISO: Recebido do Python, mas canal RF ocupado ou buffer cheio. Pacote aguardando..."));
+      telemetryEvent(TEL_SERIAL_BUSY, pkt_from_python.message_id, pkt_from_python.fragment_idx, unacked_count);
       // Em um sistema real, você não descartaria, mas enfileiraria ou sinalizaria ao Python para pausar.
       // Por enquanto, apenas avisamos e o Python precisaria retransmitir ou tentar novamente.
       return;
     }
 
     // Se chegamos até aqui, o CRC do Python está OK e podemos tentar enviar via RF.
-    Serial.print(F("SERIAL -> Recebido do Python (CRC OK) para enviar RF: Tipo: 0x"));
-    Serial.print(pkt_from_python.packet_type, HEX);
-    Serial.print(F(", MsgID: "));
-    Serial.print(pkt_from_python.message_id);
-    Serial.print(F(", Frag: "));
-    Serial.print(pkt_from_python.fragment_idx);
-    Serial.print(F("/"));
-    Serial.print(pkt_from_python.total_fragments);
-    Serial.print(F(", P-Len: "));
-    Serial.print(pkt_from_python.payload_len);
-    Serial.print(F(", CRC (do Python/Para RF): 0x"));
-    Serial.print(pkt_from_python.crc_value, HEX);
-    Serial.println(F("... Enviando via RF."));
-
-    sendPacket(pkt_from_python);  // Envia o pacote RF com ARQ e CSMA/CA
+    DebugText.print(F("SERIAL -> Recebido do Python (CRC OK) para enviar RF: Tipo: 0x"));
+    DebugText.print(pkt_from_python.packet_type, HEX);
+    DebugText.print(F(", MsgID: "));
+    DebugText.print(pkt_from_python.message_id);
+    DebugText.print(F(", Frag: "));
+    DebugText.print(pkt_from_python.fragment_idx);
+    DebugText.print(F("/"));
+    DebugText.print(pkt_from_python.total_fragments);
+    DebugText.print(F(", P-Len: "));
+    DebugText.print(pkt_from_python.payload_len);
+    DebugText.print(F(", CRC (do Python/Para RF): 0x"));
+    DebugText.print(pkt_from_python.crc_value, HEX);
+    DebugText.println(F("... Enviando via RF."));
+
+    // Só entra na fila: o rádio transmite enquanto o loop continua lendo a serial e o RF
+    if (is_data) {
+      arqAdd(pkt_from_python);
+      isSendingFile = true;  // Definir que um envio de arquivo está em andamento (Python solicitou)
+      if (currentEmitterState != EmitterState::ENVIANDO_DADOS && currentEmitterState != EmitterState::AGUARDANDO_ACK) {
+        currentEmitterState = EmitterState::ENVIANDO_DADOS;
+      }
+    } else if (!queueControlFrame(pkt_from_python)) {
+      DebugText.println(F("AVISO: Fila do radio cheia. Pacote descartado."));
+    }
   }
 
   // --- Lógica de Retransmissão ARQ (Gerencia timeouts de pacotes já enviados via RF) ---
-  for (uint8_t i = 0; i < MAX_UNACKED_FRAGMENTS; i++) {
-    if (unacked_fragments_buffer[i].active && (millis() - unacked_fragments_buffer[i].last_sent_time > RETRANSMISSION_TIMEOUT)) {
-      if (unacked_fragments_buffer[i].retransmission_attempts < MAX_RETRANSMISSION_ATTEMPTS) {
-        Serial.print(F("TIMEOUT! Retransmitindo Frag "));
-        Serial.print(unacked_fragments_buffer[i].packet.fragment_idx);
-        Serial.print(F(" (Tentativa: "));
-        Serial.print(unacked_fragments_buffer[i].retransmission_attempts + 1);
-        Serial.println(F(")."));
-        sendPacket(unacked_fragments_buffer[i].packet, true);  // Retransmite o pacote
-      } else {
-        Serial.print(F("ERRO FATAL: Frag "));
-        Serial.print(unacked_fragments_buffer[i].packet.fragment_idx);
-        Serial.print(F(" da MsgID "));
-        Serial.print(unacked_fragments_buffer[i].packet.message_id);
-        Serial.println(F(" atingiu limite de retransmissoes. Desistindo deste fragmento."));
-        unacked_fragments_buffer[i].active = false;
-        unacked_count--;
-        backoff_end_time = millis() + random(MIN_BACKOFF_TIME, MAX_BACKOFF_TIME);
-        Serial.print(F("Aplicando backoff de "));
-        Serial.print(backoff_end_time - millis());
-        Serial.println(F("ms devido a falha de retransmissao."));
-        // NOVO: Se o envio falhou completamente para um fragmento, sinaliza erro de comunicação do emissor
-        currentEmitterState = EmitterState::ERRO_COMUNICACAO;
-        isSendingFile = false;  // Parar de considerar que estamos enviando
-      }
-    }
+  checkArqTimeouts();
+
+  // --- Beacon de sincronização de relógio (apenas no Arduino mestre, via RF) ---
+  // Carrega o millis() do mestre; os PCs estimam offset e deriva para alinhar os slots TDMA.
+  if (THIS_DEVICE_ID == TIME_MASTER_DEVICE_ID && millis() - lastBeaconSendTime >= BEACON_INTERVAL && !vw_tx_active()) {
+    sendBeacon();
+    lastBeaconSendTime = millis();
   }
 
-  // --- Envio periódico de status para o Python (VIA SERIAL APENAS) ---
-  if (millis() - lastStatusSendTime >= STATUS_SEND_INTERVAL) {
-    sendCurrentStatusToPython();
-    lastStatusSendTime = millis();
+  checkSerialBaudFallback();
+  checkRfBitrateFallback();
+
+  // --- Status e telemetria para o Python (VIA SERIAL APENAS) ---
+  updateStatusToPython();
+  if (telemetryCount > 0 && millis() - telemetryBase >= TELEMETRY_FLUSH_DELAY) {
+    flushTelemetry();
   }
 
   // --- Lógica para transições de status (refinada) ---
@@ -647,6 +1208,5 @@ void loop() {
   // ou o Python envie um comando de reset. Por enquanto, a lógica acima pode sobrescrevê-lo se
   // o sistema voltar a operar. Considere adicionar um reset explícito via comando serial do Python.
 
-
-  delay(10);  // Pequeno delay para estabilidade
+  // Sem delay no fim: o loop volta logo para o rádio e a serial (nada aqui espera a transmissão)
 }
\ No newline at end of file
@@ -6,6 +6,26 @@ import threading
 import os
 import queue
 import struct  # <<-- Importar struct para trabalhar com os pacotes binários
+from collections import deque
+from functools import partial
+
+from tx_scheduler import SerialTxScheduler, CHANNEL_CONTROL, CHANNEL_INTERACTIVE, CHANNEL_BULK, CHANNEL_TELEMETRY
+from tdma import TdmaSlotScheduler
+from timesync import ClockSync
+from journal import TransferJournal, ROLE_RECV, END_STATUS_SUCCESS, END_STATUS_DISCARDED
+from delta import SignatureIndex, apply_delta, sanitize_file_name
+import envelope
+from writer import DiskWriter, FSYNC_ON_COMPLETE, preallocate
+from merkle import MerkleStreamVerifier, merkle_root, unpack_leaves, leaf_hash
+from capture import TraceWriter, CapturingSerial, TRACE_FILE_EXTENSION
+from serial_link import SerialLinkManager
+from rf_rate import RfRateController, frame_air_bits
+from telemetry import FirmwareTelemetry, LINK_TELEMETRY_MODE, TELEMETRY_EVENT_NAMES
+from profiling import RuntimeProfiler, PROFILE_MODE_SAMPLING, DEFAULT_SAMPLE_INTERVAL_S
+from metrics import MetricsRegistry, RESOLUTION_RAW
+from pipeline import SendPipeline, CallbackRelay
+from latency import ReceiveLatencyTracer, STAGE_ENCODE
+from gaps import ReceptionGaps, encode_nack_list, decode_nack_list, format_ranges
 
 # Variável global para reter o caminho do arquivo selecionado.
 selectedFilePathGlobalHack = ""
@@ -14,9 +34,20 @@ selectedFilePathGlobalHack = ""
 PACKET_TYPE_DATA = 0x01
 PACKET_TYPE_ACK = 0x02
 PACKET_TYPE_NACK = 0x03
+PACKET_TYPE_LINK = 0x04 # Controle do enlace serial PC <-> Arduino (negociação de taxa); nunca vai para o RF
+PACKET_TYPE_TELEMETRY = 0x05 # Eventos do rádio em binário, do Arduino para o Python (ver telemetry.py)
 
 # IDs de Mensagem Específicos para Pacotes de Status (usados com PACKET_TYPE_DATA)
 MESSAGE_ID_COMBINED_STATUS = 252 # ID para o pacote de status combinado
+MESSAGE_ID_PEER_STATUS = 251     # Status PC->PC via RF: profundidade de fila anunciada para o TDMA adaptativo
+PEER_STATUS_UNKNOWN_DEPTH = 0xFFFF # No status: ainda não ouvimos a fila do outro lado
+MESSAGE_ID_BEACON = 250          # Beacon do Arduino mestre com seu millis() (sincronização de relógio)
+BEACON_PAYLOAD_SIZE = 4          # millis() do mestre (uint32)
+MESSAGE_ID_RF_BITRATE = 249      # Anúncio de troca de taxa RF entre os Arduinos (não chega ao Python)
+
+# IDs a partir deste valor são reservados para pacotes especiais (status, etc.).
+# Mensagens de arquivo/texto usam apenas IDs de 0 até MAX_FILE_MESSAGE_ID - 1.
+MAX_FILE_MESSAGE_ID = 249
 
 # ID Único para ESTE lado do Python/Arduino
 # IMPORTANTE: Use 0x01 para o primeiro conjunto (PC A + Arduino A)
@@ -31,6 +62,9 @@ PACKET_FIXED_OVERHEAD = 7
 # Tamanho máximo do payload que podemos colocar em nosso Packet: VW_MAX_PAYLOAD (27) - PACKET_FIXED_OVERHEAD (7) - crc_value (1) = 19 bytes
 MAX_PACKET_PAYLOAD_SIZE = (27 - PACKET_FIXED_OVERHEAD - 1)
 TOTAL_PACKET_SIZE = 27  # Tamanho total da struct Packet em bytes
+# fragment_idx tem 1 byte: uma mensagem (envelope + metadados + corpo + trailer) cabe em até 256 fragmentos
+MAX_MESSAGE_FRAGMENTS = 256
+MAX_MESSAGE_SIZE = MAX_MESSAGE_FRAGMENTS * MAX_PACKET_PAYLOAD_SIZE
 
 # Formato de empacotamento/desempacotamento para a struct Packet
 # <   : little-endian
@@ -45,14 +79,29 @@ TOTAL_PACKET_SIZE = 27  # Tamanho total da struct Packet em bytes
 PACKET_FORMAT = "<BBBBHB{}sB".format(MAX_PACKET_PAYLOAD_SIZE)
 
 # --- Constantes para ARQ (DEVE SER IDÊNTICO AO ARDUINO) ---
-RETRANSMISSION_TIMEOUT = 0.7  # Em segundos, deve corresponder ao Arduino (700ms)
+RETRANSMISSION_TIMEOUT = 0.7  # Em segundos, deve corresponder ao Arduino (700ms). Vale para a taxa RF padrão (ver rf_rate)
 MAX_RETRANSMISSION_ATTEMPTS = 5 # Deve corresponder ao Arduino
-MAX_UNACKED_FRAGMENTS = 4     # Máximo de fragmentos não reconhecidos que podemos ter no buffer ARQ
+MAX_UNACKED_FRAGMENTS = 4     # Janela ARQ mínima do firmware; a real (dimensionada pela RAM livre) vem no status
+TX_WRITE_TIMEOUT = 2.0        # Em segundos: tempo máximo esperando o escalonador de TX escrever um pacote DATA
 
 # --- Variáveis para controle de sincronização TDMA no Python (DEVE SER IDÊNTICO AO ARDUINO) ---
 TRANSMISSION_SLOT_DURATION_MS = 5000  # Em milissegundos
 CYCLE_DURATION_MS = TRANSMISSION_SLOT_DURATION_MS * 2
 THIS_DEVICE_ARDUINO_ID = THIS_DEVICE_ID # Usar o mesmo ID definido acima
+PEER_DEVICE_ID = 0x02 if THIS_DEVICE_ID == 0x01 else 0x01 # O outro conjunto PC + Arduino
+TIME_MASTER_DEVICE_ID = 0x01 # O millis() do Arduino deste conjunto é a referência de tempo dos slots (DEVE SER IDÊNTICO AO ARDUINO)
+SYNC_ALIGN_TOLERANCE_MS = 20 # Realinha os slots se a fase local diferir da referência mais que isso (< intervalo de guarda)
+
+# --- Retomada de transferências (diário em disco) ---
+TRANSFERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transfers")
+TRANSFER_JOURNAL_PATH = os.path.join(TRANSFERS_DIR, "transfers.journal")
+RECEIVED_FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "received_files")
+RECENT_COMPLETED_MESSAGE_IDS = 64 # Quantos MsgIDs concluídos lembrar para reenviar ACK de duplicatas
+RECEIVED_FILES_FSYNC_POLICY = FSYNC_ON_COMPLETE # 'never', 'on_complete' ou 'always' (ver writer.py)
+MAX_REPAIR_ATTEMPTS = 3 # Pedidos de reparo de blocos (Merkle) antes de desistir do arquivo
+FIRST_STATUS_TIMEOUT_S = 5.0 # Espera máxima pelo primeiro status do firmware após conectar (reset + setup do Arduino)
+CAPTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "captures") # Traces da serial (capture.py)
+PROFILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles") # Perfis de execução (profiling.py)
 
 # ===================================================================================
 
@@ -71,11 +120,62 @@ def calculate_crc4(data_bytes):
         crc = CRC4_TABLE[crc ^ (byte & 0x0F)]
     return crc
 
+def fragment_size_for(message_size, preferred_size):
+    """Tamanho de fragmento preferido, aumentado se preciso para a mensagem caber em MAX_MESSAGE_FRAGMENTS."""
+    return min(MAX_PACKET_PAYLOAD_SIZE, max(preferred_size, -(-message_size // MAX_MESSAGE_FRAGMENTS)))
+
+
+def encode_packet(packet_type, device_id, message_id, fragment_idx, total_fragments, payload_data):
+    """
+    Monta os 27 bytes de um Packet (com CRC-4). Levanta ValueError se o pacote for inválido.
+    O CRC cobre apenas os payload_len bytes reais do payload (igual ao Arduino e à leitura no Python).
+    """
+    payload_len = len(payload_data)
+    if payload_len > MAX_PACKET_PAYLOAD_SIZE:
+        raise ValueError(f"Payload excede o tamanho máximo permitido ({MAX_PACKET_PAYLOAD_SIZE} bytes).")
+
+    # Monta os bytes para o cálculo do CRC
+    # ATENÇÃO: A ordem e o número de bytes DEVE ser idêntico ao que o Arduino usa para CRC
+    # Para DATA packets: type (1), dev_id (1), msg_id (1), frag_idx (1), total_frags (2), payload_len (1) + payload_data
+    # LINK, TELEMETRY e NACK com lista de faltantes (payload, ver gaps.py) usam a mesma cobertura de DATA
+    if packet_type in (PACKET_TYPE_DATA, PACKET_TYPE_LINK, PACKET_TYPE_TELEMETRY) \
+            or (packet_type == PACKET_TYPE_NACK and payload_len):
+        crc_data = struct.pack("<BBBBHB",
+                               packet_type,
+                               device_id,
+                               message_id,
+                               fragment_idx,
+                               total_fragments,
+                               payload_len) + payload_data
+    # Para ACK/NACK packets: type (1), dev_id (1), msg_id (1), frag_idx (1)
+    elif packet_type in (PACKET_TYPE_ACK, PACKET_TYPE_NACK):
+        crc_data = struct.pack("<BBBB",
+                               packet_type,
+                               device_id,
+                               message_id,
+                               fragment_idx)
+    else:
+        raise ValueError(f"Tipo de pacote desconhecido para CRC: 0x{packet_type:02X}")
+
+    # Monta o pacote binário final (struct.pack completa o payload com bytes nulos até 19 bytes)
+    # Formato: <BBBBHB{}sB
+    #          packet_type, device_id, message_id, fragment_idx, total_fragments, payload_len, payload_data, crc_value
+    return struct.pack(PACKET_FORMAT,
+                       packet_type,
+                       device_id,
+                       message_id,
+                       fragment_idx,
+                       total_fragments,
+                       payload_len,
+                       payload_data,
+                       calculate_crc4(crc_data))
+
 class ArduinoController:
     def __init__(self, serial_port, baud_rate, log_callback=None, update_status_callback=None):
         self.serial_port = serial_port
         self.baud_rate = baud_rate
         self.serial_connection = None
+        self.tx_scheduler = None # Única thread que escreve na porta serial (criada em connect)
         self.running = False
         self.read_thread = None
         self.log_callback = log_callback if log_callback else print
@@ -88,20 +188,72 @@ class ArduinoController:
 
 
         
-        self.ack_queue = queue.Queue() # Fila para ACKs recebidos
-        self.nack_queue = queue.Queue() # Fila para NACKs recebidos
+        # Esperas por ACK/NACK por fragmento: {(message_id, fragment_idx): {'event': Event, 'result': None}}
+        # Permite que várias threads de envio aguardem confirmações ao mesmo tempo sem "roubar" ACKs umas das outras
+        self._ack_waiters = {}
+        self._ack_waiters_lock = threading.Lock()
+        self._message_id_lock = threading.Lock()
+        self._next_message_id = int(time.time()) % MAX_FILE_MESSAGE_ID
+        self._message_ids_in_use = set()
         self.received_fragments = {} # {message_id: {fragment_idx: payload_data}}
         self.expected_total_fragments = {} # {message_id: total_fragments}
+        self.received_fragment_sizes = {} # {message_id: tamanho de fragmento usado pelo emissor}
+        self._reception_gaps = {} # {message_id: ReceptionGaps} fragmentos faltando, pedidos por NACK com lista
         self.received_message_ids = set() # Para rastrear Message IDs já recebidos e "completos"
+        self._completed_message_order = deque() # Ordem de conclusão, para esquecer IDs antigos (o emissor os reutiliza)
         self._is_sending_file_flag = False # Flag para indicar se o envio de arquivo está ativo
 
         # Variáveis de estado do Arduino reportadas
         self.arduino_emitter_state = None
         self.arduino_receiver_state = None
-
-        # Variáveis para o controle de turno TDMA no Python
-        self.current_cycle_start_time = time.time() # Usa time.time() para Python
-        self.current_transmitter_id = 0x01 # Começa sempre com o 0x01 transmitindo (exemplo)
+        self.arduino_buffer_arq_count = 0 # Ocupação do buffer ARQ do Arduino (terceiro byte do status)
+        self.arduino_arq_window = MAX_UNACKED_FRAGMENTS # Tamanho da janela ARQ do Arduino (byte 11 do status)
+        self.arduino_millis = None # Último millis() reportado pelo nosso Arduino no status
+        self._first_status_event = threading.Event() # Primeiro status do firmware: Arduino reiniciado e respondendo
+        self._hunting_first_status = False # Após abrir a porta: descarta o texto de boot até alinhar no 1º status
+        self._boot_text = b''
+
+        # Controle de turno TDMA no Python: fronteiras exatas e slots adaptados à fila de cada lado
+        self.tdma = TdmaSlotScheduler(THIS_DEVICE_ARDUINO_ID, PEER_DEVICE_ID, TRANSMISSION_SLOT_DURATION_MS)
+        self._stop_event = threading.Event()
+        self._status_advertiser_thread = None
+        # Relógio de referência comum aos dois lados: millis() do Arduino mestre, recebido por beacons
+        self.clock_sync = ClockSync()
+
+        # Diário de transferências: fragmentos já recebidos ficam num arquivo .part e são
+        # registrados no diário, para que uma recepção incompleta sobreviva a um reinício
+        self.journal = TransferJournal(TRANSFER_JOURNAL_PATH, log_callback=lambda m: self.log_callback(m))
+        self._recv_journal_entries = {} # {message_id: JournalEntry}
+        self._recv_part_files = {} # {message_id: arquivo .part aberto} (usado só pela thread de escrita)
+        self._restore_partial_receptions()
+        # Toda E/S de disco da recepção roda nesta thread; a thread de leitura apenas enfileira
+        self.disk_writer = DiskWriter(RECEIVED_FILES_FSYNC_POLICY, log_callback=lambda m: self.log_callback(m))
+
+        # Arquivos recebidos com nome (envelope) ficam em received_files/, que também serve de base
+        # para transferências delta: o outro lado pede a assinatura da versão que temos aqui
+        self.signature_index = SignatureIndex(RECEIVED_FILES_DIR)
+        self.on_file_received_callback = None # (status, nome do arquivo, mensagem)
+        self.control_message_handler = None # (tipo do envelope, corpo, device_id): assinaturas e pedidos de reparo
+        self.control_message_sender = None # (mensagem): envia uma mensagem de controle ao outro lado
+        # Verificação de Merkle (usados só pela thread de escrita)
+        self._merkle_verifiers = {} # {message_id: MerkleStreamVerifier}, folhas calculadas durante a recepção
+        self._pending_repairs = {} # {raiz de Merkle: estado da mensagem aguardando blocos de reparo}
+        # Captura binária do tráfego serial (start_capture/stop_capture), para reproduzir sessões depois
+        self._capture_writer = None
+        self._capture_lock = threading.Lock()
+        # Taxa da porta serial: abre em baud_rate (a do boot do firmware) e negocia uma maior depois
+        self.serial_link = SerialLinkManager(self, baud_rate, log_callback=lambda m: self.log_callback(m))
+        # Taxa do rádio e tamanho de fragmento adaptados à perda observada no enlace RF
+        self.rf_rate = RfRateController(self, RETRANSMISSION_TIMEOUT, log_callback=lambda m: self.log_callback(m))
+        # Eventos do rádio enviados pelo firmware em binário (no lugar do texto de debug)
+        self.telemetry = FirmwareTelemetry(log_callback=lambda m: self.log_callback(m))
+        # Perfil das threads de leitura/escrita/envio sob demanda (desligado: nenhum custo)
+        self.profiler = RuntimeProfiler(log_callback=lambda m: self.log_callback(m))
+        # Contadores/gauges/histogramas com histórico (metrics.py), amostrados enquanto a serial está aberta
+        self.metrics = MetricsRegistry(log_callback=lambda m: self.log_callback(m))
+        self._register_metrics()
+        # Tempo de cada etapa entre um DATA lido da serial e o ACK escrito (latency.py)
+        self.rx_latency = ReceiveLatencyTracer()
 
 
     def _default_log_callback(self, message):
@@ -113,29 +265,213 @@ class ArduinoController:
 
 
     def connect(self):
+        self.serial_link.reset()
+        self.rf_rate.reset()
+        self.telemetry.reset()
+        self.arduino_arq_window = MAX_UNACKED_FRAGMENTS
+        self._first_status_event.clear()
+        self._hunting_first_status = True
+        self._boot_text = b''
         try:
-            self.serial_connection = serial.Serial(self.serial_port, self.baud_rate, timeout=0.1)
-            self.running = True
-            self.read_thread = threading.Thread(target=self._serial_read_thread)
-            self.read_thread.start()
+            self.attach_serial(serial.Serial(self.serial_port, self.baud_rate, timeout=0.1))
             self.log_callback(f"Conectado à porta serial {self.serial_port} com {self.baud_rate} bps.")
             return True
         except serial.SerialException as e:
             self.log_callback(f"Erro ao conectar à porta serial {self.serial_port}: {e}")
             return False
 
+    def wait_for_first_status(self, timeout=FIRST_STATUS_TIMEOUT_S):
+        """
+        Espera o primeiro pacote de status do firmware depois de abrir a porta (o Arduino reinicia ao abrir a
+        serial). Substitui a espera fixa de antes: retorna assim que o firmware responde. True se chegou a tempo.
+        """
+        if self._first_status_event.wait(timeout):
+            return True
+        self._hunting_first_status = False # Firmware mudo: para de descartar bytes e lê como antes
+        return False
+
+    def negotiate_baud_rate(self):
+        """Depois do primeiro status: sobe a taxa da serial para a maior que passar no teste. Retorna a taxa em uso."""
+        return self.serial_link.negotiate()
+
+    def set_port_baud_rate(self, baud_rate):
+        """Troca a taxa da porta aberta. Os bytes em trânsito na troca viram lixo: a leitura realinha no próximo quadro."""
+        port = self.serial_connection
+        while isinstance(port, CapturingSerial):
+            port = port.wrapped
+        port.baudrate = baud_rate
+        self._hunting_first_status = True
+
+    def set_telemetry_mode(self, mode):
+        """Troca o firmware entre texto de debug e telemetria binária (o status seguinte confirma o modo)."""
+        return self.send_link_frame(LINK_TELEMETRY_MODE, 0, bytes([mode]))
+
+    def get_telemetry_stats(self):
+        return self.telemetry.get_stats()
+
+    def send_link_frame(self, command, index, payload, wait=True):
+        """Quadro de controle do enlace serial para o NOSSO Arduino (não é repassado por RF)."""
+        return self._send_packet_to_arduino(PACKET_TYPE_LINK, command, index, 0, payload, CHANNEL_CONTROL, wait)
+
+    def attach_serial(self, serial_connection, start_reader=True):
+        """
+        Usa um objeto com a interface do pyserial (porta real, ReplaySerial/NullSerial de capture.py)
+        e inicia o escalonador de transmissão, a thread de escrita e, se start_reader, a leitura.
+        """
+        if self._capture_writer:
+            serial_connection = CapturingSerial(serial_connection, self._capture_writer)
+        self.serial_connection = serial_connection
+        self.tx_scheduler = SerialTxScheduler(self.serial_connection, log_callback=self.log_callback,
+                                              profiler=self.profiler, latency_tracer=self.rx_latency)
+        self.tx_scheduler.start()
+        self.running = True
+        self._stop_event.clear()
+        self.disk_writer.start()
+        self.metrics.start()
+        if start_reader:
+            self.read_thread = threading.Thread(target=self._serial_read_thread, name="SerialReader")
+            self.read_thread.start()
+            self._status_advertiser_thread = threading.Thread(target=self._peer_status_advertiser_loop,
+                                                              name="TdmaStatusAdvertiser", daemon=True)
+            self._status_advertiser_thread.start()
+
+    # --- Captura do tráfego serial (ver capture.py) ---
+
+    def start_capture(self, path=None):
+        """Começa a gravar todos os bytes lidos/escritos na serial. Retorna o caminho do trace."""
+        with self._capture_lock:
+            if self._capture_writer:
+                return self._capture_writer.path
+            if path is None:
+                path = os.path.join(CAPTURES_DIR, time.strftime("trace_%Y%m%d_%H%M%S") + TRACE_FILE_EXTENSION)
+            self._capture_writer = TraceWriter(path)
+            if self.serial_connection is not None:
+                self._swap_serial(CapturingSerial(self.serial_connection, self._capture_writer))
+        self.log_callback(f"Captura do tráfego serial iniciada em '{path}'.")
+        return path
+
+    def stop_capture(self):
+        """Para a captura e retorna estatísticas do trace (ou None se não havia captura)."""
+        with self._capture_lock:
+            writer = self._capture_writer
+            if writer is None:
+                return None
+            self._capture_writer = None
+            if isinstance(self.serial_connection, CapturingSerial):
+                self._swap_serial(self.serial_connection.wrapped)
+            writer.close()
+        stats = writer.stats()
+        self.log_callback(f"Captura encerrada: {stats['records']} registros, {stats['bytes']} bytes em '{writer.path}'.")
+        return stats
+
+    # --- Perfil de execução (ver profiling.py) ---
+
+    def start_profiling(self, mode=PROFILE_MODE_SAMPLING, interval_s=DEFAULT_SAMPLE_INTERVAL_S, threads=None,
+                        trace_memory=False):
+        """Liga o perfil das threads (modo 'sampling' ou 'cprofile'). False se já havia um perfil ativo."""
+        return self.profiler.start(mode, interval_s, threads, trace_memory)
+
+    def stop_profiling(self, directory=None):
+        """Para o perfil e grava os arquivos (padrão: core/profiles). Retorna o resumo com os caminhos, ou None."""
+        summary = self.profiler.stop()
+        if summary is None:
+            return None
+        summary["files"] = self.profiler.export(directory or PROFILES_DIR)
+        return summary
+
+    def _swap_serial(self, serial_connection):
+        self.serial_connection = serial_connection
+        if self.tx_scheduler:
+            self.tx_scheduler.serial_connection = serial_connection
+
     def disconnect(self):
         self.running = False
+        self._stop_event.set()
+        self.serial_link.stop()
+        self.metrics.stop()
         if self.read_thread and self.read_thread.is_alive():
             self.read_thread.join()
+        if self.tx_scheduler:
+            self.tx_scheduler.stop()
+            self.tx_scheduler = None
         if self.serial_connection and self.serial_connection.is_open:
             self.serial_connection.close()
             self.log_callback("Desconectado da porta serial.")
-
+        self.disk_writer.stop() # Termina as escritas pendentes antes de fechar os .part
+        for part_file in self._recv_part_files.values():
+            os.fsync(part_file.fileno())
+            part_file.close()
+        self._recv_part_files.clear()
+        self._recv_journal_entries.clear()
+        self.journal.sync()
+        if self._capture_writer:
+            self._capture_writer.flush()
+
+
+    # --- Métricas (ver metrics.py) ---
+
+    def _register_metrics(self):
+        """Métricas do caminho quente (contadas aqui) e lidas sob demanda dos outros módulos."""
+        m = self.metrics
+        self._m_rx_bytes = m.counter("tcd_serial_rx_bytes_total", "Bytes lidos da porta serial.")
+        self._m_rx_frames = {packet_type: m.counter("tcd_serial_rx_frames_total", "Quadros válidos recebidos do Arduino.",
+                                                    type=name)
+                             for packet_type, name in ((PACKET_TYPE_DATA, "data"), (PACKET_TYPE_ACK, "ack"),
+                                                       (PACKET_TYPE_NACK, "nack"), (PACKET_TYPE_LINK, "link"),
+                                                       (PACKET_TYPE_TELEMETRY, "telemetry"))}
+        self._m_crc_errors = m.counter("tcd_serial_crc_errors_total", "Quadros da serial descartados por CRC ou tipo inválido.")
+        self._m_retransmissions = m.counter("tcd_arq_retransmissions_total", "Fragmentos DATA reenviados (NACK, timeout ou erro de escrita).")
+        self._m_arq_results = {result: m.counter("tcd_arq_attempts_total", "Tentativas de envio de fragmento por resultado.",
+                                                 result=result)
+                               for result in ("ack", "nack", "timeout")}
+        self._m_arq_give_ups = m.counter("tcd_arq_give_ups_total", "Fragmentos abandonados após o máximo de tentativas.")
+        self._m_fast_retransmits = m.counter("tcd_arq_fast_retransmits_total",
+                                             "Fragmentos em voo pedidos num NACK com lista (reenviados sem esperar o timeout).")
+        self._m_nack_lists_sent = m.counter("tcd_nack_lists_sent_total", "NACKs com lista de faltantes enviados pelo receptor.")
+        self._m_rtt = m.histogram("tcd_arq_rtt_seconds", "Da escrita do fragmento na serial até o ACK.")
+
+        # O escalonador de TX é recriado a cada conexão: os contadores dele recomeçam do zero ao reconectar
+        for channel in (CHANNEL_CONTROL, CHANNEL_INTERACTIVE, CHANNEL_BULK, CHANNEL_TELEMETRY):
+            m.counter("tcd_serial_tx_frames_total", "Quadros escritos na porta serial por canal.",
+                      fn=lambda c=channel: self._tx_stat("frames_written")[c], channel=channel)
+            m.gauge("tcd_tx_queue_depth", "Quadros aguardando o escalonador de TX por canal.",
+                    fn=lambda c=channel: self._tx_stat("queue_depths")[c], channel=channel)
+        m.counter("tcd_serial_tx_bytes_total", "Bytes escritos na porta serial.", fn=lambda: self._tx_stat("bytes_written"))
+        m.gauge("tcd_serial_out_waiting_bytes", "Bytes no buffer de saída do sistema operacional.",
+                fn=lambda: self._tx_stat("out_waiting"))
+        m.gauge("tcd_transfer_queue_depth", "Fragmentos à espera de envio nas transferências.",
+                fn=lambda: self.tdma.get_state()["local_queue_depth"])
+        m.gauge("tcd_ack_waiters", "Fragmentos enviados aguardando ACK/NACK.", fn=lambda: len(self._ack_waiters))
+        m.gauge("tcd_arduino_arq_unacked", "Ocupação do buffer ARQ do Arduino (status).", fn=lambda: self.arduino_buffer_arq_count)
+        m.gauge("tcd_arduino_arq_window", "Janela ARQ alocada pelo firmware.", fn=lambda: self.arduino_arq_window)
+        m.gauge("tcd_arduino_active", "1 se o Arduino respondeu recentemente.", fn=lambda: int(self._is_connected_to_arduino_logic))
+        m.gauge("tcd_serial_baud_rate", "Taxa da porta serial em uso (bps).", fn=lambda: self.serial_link.current_baud_rate)
+        m.gauge("tcd_rf_bitrate", "Taxa do rádio em uso (bps).", fn=lambda: self.rf_rate.current_bitrate)
+        m.gauge("tcd_rf_fragment_size", "Tamanho de fragmento para novas mensagens (bytes).", fn=self.rf_rate.fragment_size)
+        for name in TELEMETRY_EVENT_NAMES.values():
+            m.counter("tcd_firmware_events_total", "Eventos do rádio informados pela telemetria binária do firmware.",
+                      fn=lambda n=name: self.telemetry.get_stats()["events"][n], event=name)
+
+    def _tx_stat(self, key):
+        tx_scheduler = self.tx_scheduler
+        if tx_scheduler is None:
+            raise LookupError("Escalonador de TX parado.") # Amostra pulada
+        return tx_scheduler.get_stats()[key]
+
+    def get_metrics(self):
+        return self.metrics.snapshot()
+
+    def get_metrics_history(self, name, resolution=RESOLUTION_RAW, **labels):
+        return self.metrics.get_history(name, resolution, **labels)
 
     def get_overall_arduino_status(self):
         return {
             "serial_connected": self.serial_connection and self.serial_connection.is_open,
+            "serial_baud_rate": self.serial_link.current_baud_rate,
+            "rf_bitrate": self.rf_rate.current_bitrate,
+            "rf_fragment_size": self.rf_rate.fragment_size(),
+            "telemetry_mode": self.telemetry.get_stats()["mode"],
+            "arq_window": self.arduino_arq_window,
             "arduino_active": self._is_connected_to_arduino_logic,
             "last_communication_secs": round(time.time() - self._last_arduino_communication_time, 2),
             "emitter_status": self.get_emitter_status(),
@@ -319,152 +655,22 @@ class ArduinoController:
     def _serial_read_thread(self):
         buffer = b''
         while self.running:
+            if self.profiler.hooked:
+                self.profiler.checkpoint()
             try:
                 if self.serial_connection.in_waiting > 0:
                     data = self.serial_connection.read(self.serial_connection.in_waiting)
+                    read_time = time.monotonic() # Instante da leitura (usado na sincronização por beacons)
+                    read_ns = time.perf_counter_ns() # Início da latência de recepção (rx_latency)
+                    self._m_rx_bytes.inc(len(data))
                     buffer += data
 
-                    while len(buffer) >= TOTAL_PACKET_SIZE:
-                        raw_packet_bytes = buffer[:TOTAL_PACKET_SIZE]
-                        buffer = buffer[TOTAL_PACKET_SIZE:] # Remove o pacote lido do buffer
-
-                        # Desempacota os bytes para obter os campos do pacote
-                        (packet_type, device_id, message_id, fragment_idx, total_fragments, payload_len, payload_data, crc_value) = \
-                            struct.unpack(PACKET_FORMAT, raw_packet_bytes)
-
-                        # Limpar bytes nulos extras no payload_data
-                        payload_data = payload_data[:payload_len]
-
-                        # Lógica de Verificação de CRC no lado do Python
-                        calculated_crc = 0
-                        crc_data = b'' # Inicializa como bytes vazios
-
-                        # Monta os bytes para o cálculo do CRC (DEVE SER IDÊNTICO ao ARDUINO)
-                        # type (1), dev_id (1), msg_id (1), frag_idx (1), total_frags (2), payload_len (1) + payload_data
-                        if packet_type == PACKET_TYPE_DATA:
-                            crc_data = struct.pack("<BBBBHB",
-                                                   packet_type,
-                                                   device_id,
-                                                   message_id,
-                                                   fragment_idx,
-                                                   total_fragments,
-                                                   payload_len) + payload_data
-                        # Para ACK/NACK packets: type (1), dev_id (1), msg_id (1), frag_idx (1)
-                        elif packet_type in [PACKET_TYPE_ACK, PACKET_TYPE_NACK]:
-                            crc_data = struct.pack("<BBBB",
-                                                   packet_type,
-                                                   device_id,
-                                                   message_id,
-                                                   fragment_idx)
-                        else:
-                            self.log_callback(f"AVISO: Pacote recebido com tipo desconhecido para CRC: 0x{packet_type:02X}")
-                            continue # Pular pacote desconhecido
-
-                        calculated_crc = calculate_crc4(crc_data)
-
-                        if calculated_crc != crc_value:
-                            # Removido o debug temporário para não poluir o código final
-                            self.log_callback(f"ERRO: CRC INVALIDO para pacote (Tipo: 0x{packet_type:02X}, DevID: 0x{device_id:02X}, MsgID: {message_id}, Frag: {fragment_idx})! Recebido: 0x{crc_value:02X}, Calculado: 0x{calculated_crc:02X}")
-                            # Envia um NACK de volta para o Arduino se for um pacote de dados inválido e não for um pacote de status
-                            if packet_type == PACKET_TYPE_DATA and message_id != MESSAGE_ID_COMBINED_STATUS:
-                                self.send_nack(message_id, fragment_idx) # Envia NACK para o Arduino
-                            continue # Pula o processamento do pacote inválido
-                        
-                        # Filtra pacotes do próprio ID para evitar loopbacks
-                        if device_id == THIS_DEVICE_ID:
-                            # self.log_callback(f"DEBUG: Ignorando pacote recebido do próprio dispositivo ID: 0x{device_id:02X}")
-                            continue # Ignorar pacotes originados pelo nosso próprio sistema
-
-
-                        self.log_callback(f"Pacote RF recebido -> Tipo: 0x{packet_type:02X}, DevID: 0x{device_id:02X}, MsgID: {message_id}, Frag: {fragment_idx}/{total_fragments}, P-Len: {payload_len}, CRC: 0x{crc_value:02X}")
-
-                        # Processamento de Pacotes de Status Combinados
-                        if packet_type == PACKET_TYPE_DATA and message_id == MESSAGE_ID_COMBINED_STATUS:
-                            if payload_len >= 2:
-                                self.arduino_emitter_state = payload_data[0]
-                                self.arduino_receiver_state = payload_data[1]
-
-                                # Se houver terceiro byte, atualiza o ARQ também
-                                if payload_len >= 3:
-                                    self.arduino_buffer_arq_count = payload_data[2]
-                                else:
-                                    self.arduino_buffer_arq_count = 0  # Valor padrão se não enviado
-
-                                self.update_status_callback(self.arduino_emitter_state, self.arduino_receiver_state)
-                            else:
-                                self.log_callback("AVISO: Pacote de status combinado com payload_len muito curto.")
-
-                            continue # Pacote de status processado, nada mais a fazer para ele
-
-                        # Processamento normal de pacotes ACK/NACK/DATA
-                        if packet_type == PACKET_TYPE_ACK:
-                            self.ack_queue.put({'message_id': message_id, 'fragment_idx': fragment_idx})
-                            self.log_callback(f"ACK recebido para MsgID: {message_id}, Frag: {fragment_idx}")
-                        elif packet_type == PACKET_TYPE_NACK:
-                            self.nack_queue.put({'message_id': message_id, 'fragment_idx': fragment_idx})
-                            self.log_callback(f"NACK recebido para MsgID: {message_id}, Frag: {fragment_idx}")
-                        elif packet_type == PACKET_TYPE_DATA:
-                            if message_id in self.received_message_ids:
-                                # self.log_callback(f"DEBUG: Fragmento de MsgID já concluída {message_id}, ignorando.")
-                                self.send_ack(message_id, fragment_idx) # Re-envia ACK para garantir
-                                continue
-
-                            if message_id not in self.received_fragments:
-                                self.received_fragments[message_id] = {}
-                                self.expected_total_fragments[message_id] = total_fragments
-
-                            self.received_fragments[message_id][fragment_idx] = payload_data
-
-                            # Verifica se todos os fragmentos foram recebidos
-                            if len(self.received_fragments[message_id]) == self.expected_total_fragments[message_id]:
-                                # Reconstruir o arquivo
-                                full_file_data = b''
-                                for i in range(self.expected_total_fragments[message_id]):
-                                    if i in self.received_fragments[message_id]:
-                                        full_file_data += self.received_fragments[message_id][i]
-                                    else:
-                                        self.log_callback(f"ERRO: Fragmento {i} faltando para MsgID {message_id}!")
-                                        break # Sai do loop se um fragmento estiver faltando
-
-                                # Se todos os fragmentos foram coletados com sucesso
-                                if len(self.received_fragments[message_id]) == self.expected_total_fragments[message_id]:
-                                    self.log_callback(f"ARQUIVO COMPLETO RECEBIDO (MsgID: {message_id})! Tamanho: {len(full_file_data)} bytes.")
-                                    
-                                    # Gera um nome de arquivo único
-                                    output_filename = f"received_file_msgid_{message_id}_{int(time.time())}.txt"
-                                    script_dir = os.path.dirname(os.path.abspath(__file__))
-                                    output_filepath = os.path.join(script_dir, output_filename)
-
-                                    try:
-                                        with open(output_filepath, "wb") as f:
-                                            f.write(full_file_data)
-                                        self.log_callback(f"Arquivo salvo em: {output_filepath}")
-                                    except Exception as file_e:
-                                        self.log_callback(f"ERRO ao salvar arquivo: {file_e}")
-
-                                    # Limpa o estado para esta mensagem
-                                    del self.received_fragments[message_id]
-                                    del self.expected_total_fragments[message_id]
-                                    self.received_message_ids.add(message_id) # Marca como mensagem completa
-
-                                    # Envia ACK para o último fragmento também para confirmar o recebimento completo
-                                    self.send_ack(message_id, fragment_idx)
-                                else:
-                                    self.log_callback(f"AVISO: Fragmentos faltando para MsgID {message_id}, aguardando retransmissao.")
-                                    # Não envia ACK se houver fragmentos faltando, espera por eles ou NACK do outro lado
-                                    self.send_nack(message_id, fragment_idx) # Opcional: envia NACK para o último fragmento recebido se algo estiver faltando
-
-                            else:
-                                self.log_callback(f"Fragmento {fragment_idx} de {total_fragments} para MsgID {message_id} recebido.")
-                                # Envia ACK para o fragmento individual recebido
-                                self.send_ack(message_id, fragment_idx)
-
-
+                    buffer = self._process_incoming_bytes(buffer, read_time, read_ns)
             except serial.SerialException as e:
                 self.log_callback(f"Erro serial: {e}")
                 break
             except struct.error as e:
-                self.log_callback(f"Erro de desempacotamento (struct): {e}. Buffer: {raw_packet_bytes}")
+                self.log_callback(f"Erro de desempacotamento (struct): {e}. Buffer: {buffer[:TOTAL_PACKET_SIZE].hex()}")
                 # Pode haver um pacote incompleto ou corrompido no buffer, tentar limpar
                 buffer = b'' # Limpar buffer para tentar se recuperar
             except Exception as e:
@@ -473,73 +679,338 @@ class ArduinoController:
                 buffer = b''
             time.sleep(0.001) # Pequeno atraso para não sobrecarregar a CPU
 
-    def _send_packet_to_arduino(self, packet_type, message_id, fragment_idx, total_fragments, payload_data):
-        payload_len = len(payload_data)
-
+    def _process_incoming_bytes(self, buffer, read_time, read_ns=0):
+        """
+        Processa todos os pacotes completos do buffer e retorna os bytes que sobraram (pacote incompleto).
+        Usado pela thread de leitura e pelo replay de traces capturados (capture.py).
+        read_ns: perf_counter_ns() da leitura; 0 (replay) não registra latência de recepção.
+        """
+        if self._hunting_first_status:
+            buffer = self._align_to_first_status(buffer)
+        while len(buffer) >= TOTAL_PACKET_SIZE:
+            raw_packet_bytes = buffer[:TOTAL_PACKET_SIZE]
+            buffer = buffer[TOTAL_PACKET_SIZE:] # Remove o pacote lido do buffer
+            self._process_packet(raw_packet_bytes, read_time, read_ns)
+        return buffer
+
+    def _align_to_first_status(self, buffer):
+        """
+        Ao reiniciar, o firmware imprime um texto de boot na serial antes dos pacotes binários, o que
+        desalinharia a leitura em blocos de 27 bytes. Procura o primeiro pacote de status válido e descarta
+        o que vem antes dele (registrado no log como texto do firmware).
+        Depois de uma troca de taxa (set_port_baud_rate), uma resposta LINK válida também serve de âncora.
+        """
+        start = 0
+        while True:
+            found = [i for i in (buffer.find(bytes([PACKET_TYPE_DATA]), start), buffer.find(bytes([PACKET_TYPE_LINK]), start)) if i >= 0]
+            start = min(found) if found else -1
+            if start < 0 or len(buffer) - start < TOTAL_PACKET_SIZE:
+                keep_from = max(0, len(buffer) - TOTAL_PACKET_SIZE + 1) if start < 0 else start
+                self._log_boot_text(buffer[:keep_from])
+                return buffer[keep_from:]
+            is_anchor = buffer[start] == PACKET_TYPE_LINK or buffer[start + 2] == MESSAGE_ID_COMBINED_STATUS
+            if is_anchor and self._is_valid_packet(buffer[start:start + TOTAL_PACKET_SIZE]):
+                self._log_boot_text(buffer[:start], flush=True)
+                self._hunting_first_status = False
+                return buffer[start:]
+            start += 1
+
+    def _log_boot_text(self, data, flush=False):
+        """Registra o texto de boot linha a linha (as leituras da serial cortam as linhas em qualquer ponto)."""
+        self._boot_text += data
+        lines = self._boot_text.split(b'\n')
+        self._boot_text = b'' if flush else lines.pop()
+        for line in lines:
+            line = line.decode('utf-8', errors='ignore').strip()
+            if line:
+                self.log_callback(f"Firmware: {line}")
+
+    @staticmethod
+    def _is_valid_packet(raw_packet_bytes):
+        (packet_type, device_id, message_id, fragment_idx, total_fragments, payload_len, payload_data, crc_value) = \
+            struct.unpack(PACKET_FORMAT, raw_packet_bytes)
         if payload_len > MAX_PACKET_PAYLOAD_SIZE:
-            self.log_callback(f"ERRO: Payload excede o tamanho máximo permitido ({MAX_PACKET_PAYLOAD_SIZE} bytes).")
-            return {"status": "error", "message": "Payload muito grande."}
-        
-        # Preenche o payload com bytes nulos se for menor que MAX_PACKET_PAYLOAD_SIZE
-        # Isso garante que a struct.pack sempre tenha o tamanho esperado
-        padded_payload_data = payload_data + b'\0' * (MAX_PACKET_PAYLOAD_SIZE - payload_len)
+            return False
+        try:
+            expected = encode_packet(packet_type, device_id, message_id, fragment_idx, total_fragments,
+                                     payload_data[:payload_len])
+        except ValueError:
+            return False
+        return expected[-1] == crc_value
 
-        # Monta os bytes para o cálculo do CRC
-        # ATENÇÃO: A ordem e o número de bytes DEVE ser idêntico ao que o Arduino usa para CRC
-        # packet_type, device_id, message_id, fragment_idx, total_fragments (2 bytes), payload_len, payload_data
-        
-        # Para DATA packets: type (1), dev_id (1), msg_id (1), frag_idx (1), total_frags (2), payload_len (1) + payload_data
-        if packet_type == PACKET_TYPE_DATA:
+    def _process_packet(self, raw_packet_bytes, read_time, read_ns=0):
+        # Desempacota os bytes para obter os campos do pacote
+        (packet_type, device_id, message_id, fragment_idx, total_fragments, payload_len, payload_data, crc_value) = \
+            struct.unpack(PACKET_FORMAT, raw_packet_bytes)
+
+        # Limpar bytes nulos extras no payload_data
+        payload_data = payload_data[:payload_len]
+
+        # Lógica de Verificação de CRC no lado do Python
+        calculated_crc = 0
+        crc_data = b'' # Inicializa como bytes vazios
+
+        # Monta os bytes para o cálculo do CRC (DEVE SER IDÊNTICO ao ARDUINO)
+        # type (1), dev_id (1), msg_id (1), frag_idx (1), total_frags (2), payload_len (1) + payload_data
+        if packet_type in (PACKET_TYPE_DATA, PACKET_TYPE_LINK, PACKET_TYPE_TELEMETRY) \
+                or (packet_type == PACKET_TYPE_NACK and payload_len):
             crc_data = struct.pack("<BBBBHB",
                                    packet_type,
-                                   THIS_DEVICE_ID,
+                                   device_id,
                                    message_id,
                                    fragment_idx,
                                    total_fragments,
-                                   payload_len) + padded_payload_data
+                                   payload_len) + payload_data
         # Para ACK/NACK packets: type (1), dev_id (1), msg_id (1), frag_idx (1)
         elif packet_type in [PACKET_TYPE_ACK, PACKET_TYPE_NACK]:
             crc_data = struct.pack("<BBBB",
                                    packet_type,
-                                   THIS_DEVICE_ID,
+                                   device_id,
                                    message_id,
                                    fragment_idx)
         else:
-            self.log_callback(f"ERRO: Tipo de pacote desconhecido para CRC: 0x{packet_type:02X}")
-            return {"status": "error", "message": "Tipo de pacote desconhecido."}
-
-        crc_value = calculate_crc4(crc_data)
-
-        # Monta o pacote binário final
-        # Formato: <BBBBHB{}sB
-        #          packet_type, device_id, message_id, fragment_idx, total_fragments, payload_len, payload_data, crc_value
-        full_packet_bytes = struct.pack(PACKET_FORMAT,
-                                        packet_type,
-                                        THIS_DEVICE_ID,
-                                        message_id,
-                                        fragment_idx,
-                                        total_fragments,
-                                        payload_len,
-                                        padded_payload_data,
-                                        crc_value)
-
+            self.log_callback(f"AVISO: Pacote recebido com tipo desconhecido para CRC: 0x{packet_type:02X}")
+            self.serial_link.on_crc_error() # Quadro fora de alinhamento ou taxa errada: conta como erro do enlace
+            self._m_crc_errors.inc()
+            return # Pular pacote desconhecido
+
+        calculated_crc = calculate_crc4(crc_data)
+
+        if calculated_crc != crc_value:
+            # Removido o debug temporário para não poluir o código final
+            self.log_callback(f"ERRO: CRC INVALIDO para pacote (Tipo: 0x{packet_type:02X}, DevID: 0x{device_id:02X}, MsgID: {message_id}, Frag: {fragment_idx})! Recebido: 0x{crc_value:02X}, Calculado: 0x{calculated_crc:02X}")
+            self.serial_link.on_crc_error()
+            self._m_crc_errors.inc()
+            # Envia um NACK de volta para o Arduino se for um pacote de dados inválido e não for um pacote de status
+            if packet_type == PACKET_TYPE_DATA and message_id < MAX_FILE_MESSAGE_ID:
+                self.send_nack(message_id, fragment_idx) # Envia NACK para o Arduino
+            return # Pula o processamento do pacote inválido
+        crc_ns = time.perf_counter_ns()
+        self.serial_link.on_valid_frame()
+        self._m_rx_frames[packet_type].inc()
+
+        # Controle do enlace serial (respostas do NOSSO Arduino à negociação de taxa)
+        if packet_type == PACKET_TYPE_LINK:
+            self.serial_link.on_link_frame(message_id, fragment_idx, payload_data)
+            return
+
+        # Telemetria binária do NOSSO Arduino (substitui o texto de debug)
+        if packet_type == PACKET_TYPE_TELEMETRY:
+            self.telemetry.on_frame(message_id, fragment_idx, total_fragments, payload_data)
+            return
+
+        # Processamento de Pacotes de Status Combinados (gerados pelo NOSSO Arduino, via serial)
+        if packet_type == PACKET_TYPE_DATA and message_id == MESSAGE_ID_COMBINED_STATUS:
+            if payload_len >= 2:
+                self.arduino_emitter_state = payload_data[0]
+                self.arduino_receiver_state = payload_data[1]
+
+                # Se houver terceiro byte, atualiza o ARQ também
+                if payload_len >= 3:
+                    self.arduino_buffer_arq_count = payload_data[2]
+                else:
+                    self.arduino_buffer_arq_count = 0  # Valor padrão se não enviado
+
+                # Bytes 3..6: millis() do Arduino no envio do status
+                if payload_len >= 7:
+                    self.arduino_millis = struct.unpack("<I", payload_data[3:7])[0]
+
+                # Byte 7: quadros RF ruins (contador de 8 bits); bytes 8..9: taxa RF em uso
+                if payload_len >= 10:
+                    self.rf_rate.on_firmware_status(struct.unpack("<H", payload_data[8:10])[0], payload_data[7])
+
+                # Byte 10: modo de telemetria (texto ou binário)
+                if payload_len >= 11:
+                    self.telemetry.on_status(payload_data[10])
+
+                # Byte 11: janela ARQ alocada pelo firmware (firmwares antigos: MAX_UNACKED_FRAGMENTS)
+                if payload_len >= 12 and payload_data[11] > 0:
+                    self.arduino_arq_window = payload_data[11]
+
+                self.update_status_callback(self.arduino_emitter_state, self.arduino_receiver_state)
+                self._first_status_event.set()
+            else:
+                self.log_callback("AVISO: Pacote de status combinado com payload_len muito curto.")
+
+            return # Pacote de status processado, nada mais a fazer para ele
+
+        # Beacon de sincronização do Arduino mestre de tempo (chega nos DOIS PCs, inclusive no do mestre)
+        if packet_type == PACKET_TYPE_DATA and message_id == MESSAGE_ID_BEACON:
+            if payload_len >= BEACON_PAYLOAD_SIZE and device_id == TIME_MASTER_DEVICE_ID:
+                self._on_beacon(struct.unpack("<I", payload_data[:4])[0], read_time)
+            return
+
+        # Filtra pacotes do próprio ID para evitar loopbacks
+        if device_id == THIS_DEVICE_ID:
+            # self.log_callback(f"DEBUG: Ignorando pacote recebido do próprio dispositivo ID: 0x{device_id:02X}")
+            return # Ignorar pacotes originados pelo nosso próprio sistema
+
+
+        self.log_callback(f"Pacote RF recebido -> Tipo: 0x{packet_type:02X}, DevID: 0x{device_id:02X}, MsgID: {message_id}, Frag: {fragment_idx}/{total_fragments}, P-Len: {payload_len}, CRC: 0x{crc_value:02X}")
+        log_rx_ns = time.perf_counter_ns()
+
+        # Status do outro PC (via RF): profundidade de fila para o TDMA adaptativo. Não gera ACK.
+        if packet_type == PACKET_TYPE_DATA and message_id == MESSAGE_ID_PEER_STATUS:
+            if payload_len >= 4 and device_id == PEER_DEVICE_ID:
+                queue_depth, echoed_depth = struct.unpack("<HH", payload_data[:4])
+                self.tdma.update_peer_status(queue_depth,
+                                             None if echoed_depth == PEER_STATUS_UNKNOWN_DEPTH else echoed_depth)
+            return
+
+        # Processamento normal de pacotes ACK/NACK/DATA
+        if packet_type == PACKET_TYPE_ACK:
+            self._resolve_ack_waiter(message_id, fragment_idx, 'ack')
+            self.log_callback(f"ACK recebido para MsgID: {message_id}, Frag: {fragment_idx}")
+        elif packet_type == PACKET_TYPE_NACK and payload_len:
+            # Lista de faltantes do receptor. O firmware já reenviou os que estavam na janela ARQ dele e só
+            # repassa os que saíram dela: estes, se ainda aguardam ACK aqui, são reenviados já
+            ranges = decode_nack_list(payload_data)
+            resolved = sum(1 for first, last in ranges for idx in range(first, last + 1)
+                           if self._resolve_ack_waiter(message_id, idx, 'nack'))
+            self._m_fast_retransmits.inc(resolved)
+            self.log_callback(f"NACK com lista recebido para MsgID: {message_id}, Frags: {format_ranges(ranges)} "
+                              f"({resolved} em voo, reenviando).")
+        elif packet_type == PACKET_TYPE_NACK:
+            self._resolve_ack_waiter(message_id, fragment_idx, 'nack')
+            self.log_callback(f"NACK recebido para MsgID: {message_id}, Frag: {fragment_idx}")
+        elif packet_type == PACKET_TYPE_DATA:
+            if message_id in self.received_message_ids:
+                # self.log_callback(f"DEBUG: Fragmento de MsgID já concluída {message_id}, ignorando.")
+                self.send_ack(message_id, fragment_idx) # Re-envia ACK para garantir
+                return
+
+            if fragment_idx >= total_fragments:
+                self.log_callback(f"AVISO: Fragmento {fragment_idx} fora da mensagem MsgID {message_id} ({total_fragments} fragmentos). Descartado.")
+                return
+
+            # O emissor escolhe o tamanho de fragmento (rf_rate); todo fragmento que não é o último tem esse tamanho
+            is_last = fragment_idx == total_fragments - 1
+            known_size = self.received_fragment_sizes.get(message_id)
+            if message_id in self.received_fragments and \
+                    (self.expected_total_fragments[message_id] != total_fragments
+                     or (known_size is not None and not is_last and payload_len != known_size)):
+                # Mesmo MsgID com outra fragmentação: é outra mensagem, a recepção parcial antiga é descartada
+                self._discard_partial_reception(message_id)
+                known_size = None
+
+            if message_id not in self.received_fragments:
+                self.received_fragments[message_id] = {}
+                self.expected_total_fragments[message_id] = total_fragments
+
+            self.received_fragments[message_id][fragment_idx] = payload_data
+            gaps = self._reception_gaps.get(message_id)
+            if gaps is None:
+                gaps = self._reception_gaps[message_id] = ReceptionGaps(self.received_fragments[message_id], total_fragments)
+            gaps.on_fragment(fragment_idx)
+            if known_size is None and (not is_last or total_fragments == 1):
+                known_size = payload_len if not is_last else MAX_PACKET_PAYLOAD_SIZE
+                self.received_fragment_sizes[message_id] = known_size
+                last_idx = total_fragments - 1
+                if not is_last and last_idx in self.received_fragments[message_id]:
+                    # O último fragmento chegou antes de sabermos o tamanho: só agora dá para gravá-lo no lugar certo
+                    self.disk_writer.submit(self._persist_received_fragment, device_id, message_id, last_idx,
+                                            total_fragments, known_size, self.received_fragments[message_id][last_idx])
+            if known_size is not None:
+                self.disk_writer.submit(self._persist_received_fragment, device_id, message_id, fragment_idx,
+                                        total_fragments, known_size, payload_data)
+            state_ns = time.perf_counter_ns()
+
+            # Verifica se todos os fragmentos foram recebidos (índices fora da mensagem são descartados acima)
+            if len(self.received_fragments[message_id]) == self.expected_total_fragments[message_id]:
+                fragments = self.received_fragments[message_id]
+                full_file_data = b''.join(fragments[i] for i in range(total_fragments))
+                self.log_callback(f"ARQUIVO COMPLETO RECEBIDO (MsgID: {message_id})! Tamanho: {len(full_file_data)} bytes.")
+                # Decodificar, aplicar delta e gravar ficam com a thread de escrita
+                self.disk_writer.submit(self._handle_completed_message, device_id, message_id, full_file_data)
+
+                # Limpa o estado para esta mensagem
+                self.disk_writer.submit(self._close_partial_reception, message_id, END_STATUS_SUCCESS)
+                del self.received_fragments[message_id]
+                del self.expected_total_fragments[message_id]
+                self.received_fragment_sizes.pop(message_id, None)
+                self._reception_gaps.pop(message_id, None)
+                self._mark_message_completed(message_id)
+
+                # Envia ACK para o último fragmento também para confirmar o recebimento completo
+                self.send_ack(message_id, fragment_idx,
+                              self._begin_rx_latency(read_ns, crc_ns, log_rx_ns, state_ns))
+
+            else:
+                self.log_callback(f"Fragmento {fragment_idx} de {total_fragments} para MsgID {message_id} recebido.")
+                # Envia ACK para o fragmento individual recebido
+                self.send_ack(message_id, fragment_idx, self._begin_rx_latency(read_ns, crc_ns, log_rx_ns, state_ns))
+                # Depois do ACK (fora da latência medida): pede os fragmentos que ficaram para trás
+                self._request_missing_fragments(message_id, gaps)
+
+    def _begin_rx_latency(self, read_ns, crc_ns, log_rx_ns, state_ns):
+        """Registro de latência do fragmento cujo ACK vai sair agora (None no replay de traces)."""
+        if not read_ns:
+            return None
+        return self.rx_latency.begin(read_ns, crc_ns, log_rx_ns, state_ns, time.perf_counter_ns())
+
+    def get_rx_latency(self):
+        """Percentis por etapa do DATA lido até o ACK escrito na serial (ver latency.py)."""
+        return self.rx_latency.get_summary()
+
+    def reset_rx_latency(self):
+        self.rx_latency.reset()
+
+    def _send_packet_to_arduino(self, packet_type, message_id, fragment_idx, total_fragments, payload_data,
+                                channel=None, wait=True, trace=None):
+        """
+        Codifica o pacote e o entrega ao escalonador de TX (única thread que escreve na porta).
+        ACK/NACK vão pelo canal de controle (prioridade estrita); DATA pelo canal informado (padrão: bulk).
+        Com wait=False retorna logo após enfileirar (usado pela thread de leitura para não bloquear).
+        trace: registro de rx_latency do ACK, completado aqui e pelo escalonador.
+        """
         try:
-            self.serial_connection.write(full_packet_bytes)
-            # self.log_callback(f"SERIAL -> Pacote enviado (Tipo: 0x{packet_type:02X}, MsgID: {message_id}, Frag: {fragment_idx}, CRC: 0x{crc_value:02X})")
-            return {"status": "success", "message": "Pacote enviado."}
-        except Exception as e:
-            self.log_callback(f"ERRO ao enviar pacote serial: {e}")
+            full_packet_bytes = encode_packet(packet_type, THIS_DEVICE_ID, message_id, fragment_idx,
+                                              total_fragments, payload_data)
+        except ValueError as e:
+            self.log_callback(f"ERRO: {e}")
             return {"status": "error", "message": str(e)}
+        if trace is not None:
+            self.rx_latency.mark(trace, STAGE_ENCODE, time.perf_counter_ns())
+
+        return self._submit_encoded_packet(full_packet_bytes, packet_type, channel, wait, trace)
+
+    def _submit_encoded_packet(self, full_packet_bytes, packet_type, channel=None, wait=True, trace=None):
+        if channel is None:
+            channel = CHANNEL_CONTROL if packet_type in (PACKET_TYPE_ACK, PACKET_TYPE_NACK) else CHANNEL_BULK
+
+        tx_scheduler = self.tx_scheduler
+        if tx_scheduler is None or not tx_scheduler.running:
+            self.log_callback("ERRO ao enviar pacote serial: porta serial não conectada.")
+            return {"status": "error", "message": "Serial não conectada."}
+
+        request = tx_scheduler.submit(full_packet_bytes, channel, trace)
+        if not wait:
+            return {"status": "success", "message": "Pacote enfileirado."}
+        return request.wait(timeout=TX_WRITE_TIMEOUT)
 
-    def send_data_packet(self, message_id, fragment_idx, total_fragments, payload_data):
-        return self._send_packet_to_arduino(PACKET_TYPE_DATA, message_id, fragment_idx, total_fragments, payload_data)
+    def send_data_packet(self, message_id, fragment_idx, total_fragments, payload_data, channel=CHANNEL_BULK):
+        return self._send_packet_to_arduino(PACKET_TYPE_DATA, message_id, fragment_idx, total_fragments, payload_data, channel)
 
-    def send_ack(self, message_id, fragment_idx):
-        # ACK/NACK não precisam de total_fragments ou payload_data
-        return self._send_packet_to_arduino(PACKET_TYPE_ACK, message_id, fragment_idx, 0, b'')
+    def send_ack(self, message_id, fragment_idx, trace=None):
+        # ACK/NACK não precisam de total_fragments ou payload_data.
+        # Não espera a escrita: normalmente é chamado pela thread de leitura.
+        return self._send_packet_to_arduino(PACKET_TYPE_ACK, message_id, fragment_idx, 0, b'', wait=False, trace=trace)
 
     def send_nack(self, message_id, fragment_idx):
-        return self._send_packet_to_arduino(PACKET_TYPE_NACK, message_id, fragment_idx, 0, b'')
+        return self._send_packet_to_arduino(PACKET_TYPE_NACK, message_id, fragment_idx, 0, b'', wait=False)
+
+    def send_nack_list(self, message_id, ranges):
+        """NACK com as faixas (primeiro, último) de fragmentos faltando; fragment_idx leva o primeiro deles."""
+        self._m_nack_lists_sent.inc()
+        return self._send_packet_to_arduino(PACKET_TYPE_NACK, message_id, ranges[0][0], 0,
+                                            encode_nack_list(ranges), wait=False)
+
+    def _request_missing_fragments(self, message_id, gaps):
+        """Pede num NACK com lista os fragmentos dados como perdidos (um RTT em vez de um timeout por perda)."""
+        ranges = gaps.due_ranges(time.monotonic(), self.rf_rate.ack_timeout())
+        if ranges:
+            self.log_callback(f"Fragmentos faltando para MsgID {message_id}: {format_ranges(ranges)}. Pedindo retransmissão.")
+            self.send_nack_list(message_id, ranges)
 
     def is_sending_file(self):
         return self._is_sending_file_flag
@@ -550,148 +1021,486 @@ class ArduinoController:
     
     # Método para verificar se é o turno de transmissão deste dispositivo
     def is_my_turn_to_transmit(self):
-        current_time_ms = int(time.time() * 1000) # Converte para ms para compatibilidade com Arduino
-        
-        # Calcula o tempo dentro do ciclo atual
-        time_in_cycle = (current_time_ms - int(self.current_cycle_start_time * 1000)) % CYCLE_DURATION_MS
+        return self.tdma.is_my_turn()
 
-        # Determina o ID do transmissor atual com base no tempo no ciclo
-        # (DEVE CORRESPONDER À LÓGICA DO ARDUINO)
-        if time_in_cycle < TRANSMISSION_SLOT_DURATION_MS:
-            transmitter_in_slot = 0x01
-        else:
-            transmitter_in_slot = 0x02
+    def _on_beacon(self, master_millis, read_time):
+        """
+        Beacon do mestre: alimenta a estimativa de offset/deriva e, quando sincronizado, realinha
+        a grade de ciclos TDMA para que comece em múltiplos exatos do ciclo no tempo de referência.
+        """
+        if THIS_DEVICE_ID != TIME_MASTER_DEVICE_ID:
+            # O PC do mestre recebe o beacon logo no vw_send; aqui ele só chega depois do quadro inteiro passar
+            # pelo ar. Esse atraso é fixo (o envelope inferior do ClockSync não o remove) e passa da guarda
+            # dos slots: desconta o tempo de ar na taxa atual do rádio.
+            read_time -= frame_air_bits(BEACON_PAYLOAD_SIZE) / self.rf_rate.current_bitrate
+        self.clock_sync.add_sample(master_millis, read_time)
+        if not self.clock_sync.is_synchronized():
+            return
+        cycle_ms = CYCLE_DURATION_MS
+        reference_now_ms = self.clock_sync.to_remote_ms(read_time)
+        cycle_start_ms = (reference_now_ms // cycle_ms) * cycle_ms
+        if self.tdma.align(self.clock_sync.to_local_s(cycle_start_ms), SYNC_ALIGN_TOLERANCE_MS / 1000.0):
+            self.log_callback(f"TDMA realinhado ao relógio do mestre: {self.clock_sync.get_state()}")
+
+    def get_clock_sync_status(self):
+        return self.clock_sync.get_state()
+
+    def set_local_queue_depth(self, depth):
+        """Informa quantos fragmentos ainda esperam envio (usado para dimensionar os slots TDMA)."""
+        self.tdma.set_local_queue_depth(depth)
+
+    def _peer_status_advertiser_loop(self):
+        """
+        No início de cada slot nosso, anuncia ao outro lado (via RF) a profundidade da nossa fila e a
+        dele que ouvimos. Um único pacote por ciclo; os dois lados redimensionam os slots a partir dele.
+        """
+        while self.running:
+            if not self.tdma.wait_for_my_slot(self._stop_event):
+                return
+            depth, peer_depth = self.tdma.advertise_local_depth()
+            echoed = PEER_STATUS_UNKNOWN_DEPTH if peer_depth is None else min(peer_depth, PEER_STATUS_UNKNOWN_DEPTH - 1)
+            self._send_packet_to_arduino(PACKET_TYPE_DATA, MESSAGE_ID_PEER_STATUS, 0, 1,
+                                         struct.pack("<HH", min(depth, PEER_STATUS_UNKNOWN_DEPTH - 1), echoed),
+                                         CHANNEL_TELEMETRY, wait=False)
+            # Dorme até o fim do slot atual para não anunciar de novo no mesmo slot
+            self._stop_event.wait(self.tdma.remaining_in_my_slot() + self.tdma.guard_s)
+
+    # --- Alocação de Message IDs e espera por ACK/NACK (usados pelo gerenciador de transferências) ---
+
+    def allocate_message_id(self):
+        """
+        Reserva um message_id livre (0 a MAX_FILE_MESSAGE_ID - 1) para uma nova mensagem.
+        IDs em uso por outras transferências simultâneas são pulados.
+        """
+        with self._message_id_lock:
+            for _ in range(MAX_FILE_MESSAGE_ID):
+                candidate = self._next_message_id
+                self._next_message_id = (self._next_message_id + 1) % MAX_FILE_MESSAGE_ID
+                if candidate not in self._message_ids_in_use:
+                    self._message_ids_in_use.add(candidate)
+                    return candidate
+        raise RuntimeError("Nenhum message_id livre para uma nova transferência.")
+
+    def reserve_message_id(self, message_id):
+        """Reserva um message_id específico (retomada de transferência). Retorna False se já estiver em uso."""
+        with self._message_id_lock:
+            if message_id in self._message_ids_in_use or not 0 <= message_id < MAX_FILE_MESSAGE_ID:
+                return False
+            self._message_ids_in_use.add(message_id)
+            return True
+
+    def release_message_id(self, message_id):
+        """Libera um message_id reservado por allocate_message_id."""
+        with self._message_id_lock:
+            self._message_ids_in_use.discard(message_id)
 
-        # Atualiza o tempo de início do ciclo se um novo ciclo começou
-        # Para evitar que o tempo_in_cycle se torne muito grande
-        if current_time_ms - int(self.current_cycle_start_time * 1000) >= CYCLE_DURATION_MS:
-            self.current_cycle_start_time = time.time() # Reinicia o tempo para o próximo ciclo
+    # --- Mensagens completas ---
 
-        return transmitter_in_slot == THIS_DEVICE_ARDUINO_ID
+    def _mark_message_completed(self, message_id):
+        self.received_message_ids.add(message_id) # Marca como mensagem completa
+        self._completed_message_order.append(message_id)
+        while len(self._completed_message_order) > RECENT_COMPLETED_MESSAGE_IDS:
+            self.received_message_ids.discard(self._completed_message_order.popleft())
 
+    def _handle_completed_message(self, device_id, message_id, message):
+        """
+        Interpreta o envelope da mensagem montada: arquivo, delta ou troca de assinaturas.
+        Executado na thread de escrita (lê/grava disco).
+        """
+        try:
+            kind, body = envelope.unwrap(message)
+            if kind is None:
+                # Sem envelope (texto da GUI ou emissor antigo): nome gerado, como antes
+                output_filename = f"received_file_msgid_{message_id}_{int(time.time())}.txt"
+                self._save_received_file(os.path.join(RECEIVED_FILES_DIR, output_filename), body, output_filename)
+            elif kind in envelope.MERKLE_KINDS:
+                verifier = self._merkle_verifiers.pop(message_id, None)
+                leaves = verifier.finish(message) if verifier else None
+                self._verify_file_message(kind, bytearray(message), leaves, attempts=0)
+            elif kind == envelope.KIND_REPAIR_DATA:
+                self._apply_repair_data(body)
+            elif kind in envelope.CONTROL_KINDS:
+                if self.control_message_handler:
+                    self.control_message_handler(kind, body, device_id)
+            else:
+                self.log_callback(f"AVISO: Tipo de envelope desconhecido (0x{kind:02X}) na MsgID {message_id}.")
+        except (ValueError, OSError, struct.error) as e:
+            self.log_callback(f"ERRO ao processar mensagem MsgID {message_id}: {e}")
+            if self.on_file_received_callback:
+                self.on_file_received_callback('error', f"MsgID {message_id}", str(e))
+
+    # --- Verificação de Merkle e reparo de blocos ---
+
+    def _verify_file_message(self, kind, message, leaves, attempts):
+        """Confere os blocos do corpo contra a árvore de Merkle; pede de novo só os que falharem."""
+        metadata, offset, encoded_body, trailer = envelope.split_file_message(bytes(message[envelope.ENVELOPE_HEADER_SIZE:]))
+        body_start = envelope.ENVELOPE_HEADER_SIZE + offset
+        if leaves is None:
+            leaves = [leaf_hash(encoded_body[i * metadata.block_size:(i + 1) * metadata.block_size])
+                      for i in range(metadata.leaf_count())]
+
+        bad_blocks = []
+        if merkle_root(leaves) != metadata.merkle_root:
+            expected = unpack_leaves(trailer, metadata.leaf_count())
+            if expected is None or merkle_root(expected) != metadata.merkle_root:
+                bad_blocks = list(range(metadata.leaf_count())) # Trailer também corrompido: não dá para localizar
+            else:
+                bad_blocks = [i for i, (got, want) in enumerate(zip(leaves, expected)) if got != want]
+
+        if not bad_blocks:
+            self._finalize_file_message(kind, bytes(message[envelope.ENVELOPE_HEADER_SIZE:]))
+            return
+
+        if attempts >= MAX_REPAIR_ATTEMPTS or not self.control_message_sender:
+            raise ValueError(f"'{metadata.name}': {len(bad_blocks)} bloco(s) corrompido(s) e reparo esgotado.")
+        self._pending_repairs[metadata.merkle_root] = {
+            'kind': kind, 'message': message, 'metadata': metadata, 'body_start': body_start,
+            'leaves': leaves, 'attempts': attempts + 1,
+        }
+        self.log_callback(f"Verificação de Merkle de '{metadata.name}': {len(bad_blocks)} de {metadata.leaf_count()} "
+                          f"bloco(s) corrompido(s). Pedindo reparo (tentativa {attempts + 1}/{MAX_REPAIR_ATTEMPTS}).")
+        self.control_message_sender(envelope.encode_repair_request(metadata.merkle_root, bad_blocks))
+
+    def _apply_repair_data(self, body):
+        root, blocks = envelope.decode_repair_data(body)
+        state = self._pending_repairs.pop(root, None)
+        if state is None:
+            self.log_callback("AVISO: Blocos de reparo recebidos para uma transferência desconhecida; ignorando.")
+            return
+        metadata, message, leaves = state['metadata'], state['message'], state['leaves']
+        body_end = state['body_start'] + metadata.body_len
+        for idx, data in blocks:
+            start = state['body_start'] + idx * metadata.block_size
+            if idx >= len(leaves) or len(data) != min(metadata.block_size, body_end - start):
+                continue
+            message[start:start + len(data)] = data
+            leaves[idx] = leaf_hash(data)
+        self.log_callback(f"'{metadata.name}': {len(blocks)} bloco(s) de reparo recebidos.")
+        self._verify_file_message(state['kind'], message, leaves, state['attempts'])
+
+    def _finalize_file_message(self, kind, body):
+        if kind == envelope.KIND_FILE:
+            metadata, data = envelope.decode_file(body)
+            self.log_callback(f"Arquivo '{metadata.name}': {metadata.size} bytes, codec "
+                              f"{envelope.CODEC_NAMES.get(metadata.codec)}, {len(body)} bytes pelo link.")
+            self._save_received_file(self.signature_index.path_for(metadata.name), data,
+                                     sanitize_file_name(metadata.name), metadata.mtime_ns)
+        elif kind == envelope.KIND_ARCHIVE:
+            metadata, content = envelope.decode_archive(body)
+            entries = list(envelope.unpack_archive(content))
+            self.log_callback(f"Pacote '{metadata.name}': {len(entries)} arquivo(s), {metadata.size} bytes, codec "
+                              f"{envelope.CODEC_NAMES.get(metadata.codec)}, {len(body)} bytes pelo link.")
+            for name, mtime_ns, data in entries:
+                self._save_received_file(self.signature_index.path_for(name), data, sanitize_file_name(name), mtime_ns)
+        else:
+            metadata, delta = envelope.decode_delta(body)
+            path = self.signature_index.path_for(metadata.name)
+            with open(path, "rb") as f:
+                base_data = f.read()
+            data = apply_delta(base_data, delta)
+            self.log_callback(f"Delta aplicado em '{sanitize_file_name(metadata.name)}': {len(body)} bytes recebidos para {len(data)} bytes.")
+            self._save_received_file(path, data, sanitize_file_name(metadata.name), metadata.mtime_ns)
+
+    def _save_received_file(self, output_filepath, data, display_name, mtime_ns=None):
+        try:
+            # Pré-alocado, gravado num .tmp e renomeado: substitui a versão anterior de uma vez (base de deltas futuros)
+            self.disk_writer.write_file(output_filepath, data, mtime_ns)
+            self.log_callback(f"Arquivo salvo em: {output_filepath}")
+            if self.on_file_received_callback:
+                self.on_file_received_callback('success', display_name, f"Arquivo salvo em: {output_filepath}")
+        except Exception as file_e:
+            self.log_callback(f"ERRO ao salvar arquivo: {file_e}")
+            if self.on_file_received_callback:
+                self.on_file_received_callback('error', display_name, f"Erro ao salvar: {file_e}")
+
+    # --- Recepções parciais persistidas (arquivo .part + diário) ---
+
+    @staticmethod
+    def _part_file_path(entry):
+        return os.path.join(TRANSFERS_DIR, f"recv_{entry.transfer_id.hex()}.part")
+
+    def _restore_partial_receptions(self):
+        """Recarrega as recepções incompletas registradas no diário (após reinício do aplicativo)."""
+        for entry in self.journal.active_entries(ROLE_RECV):
+            part_path = self._part_file_path(entry)
+            try:
+                with open(part_path, "rb") as f:
+                    fragments = {}
+                    for idx in entry.acked_fragments():
+                        f.seek(idx * entry.fragment_size)
+                        fragments[idx] = f.read(entry.fragment_length(idx))
+            except OSError:
+                self.journal.finish(entry, END_STATUS_DISCARDED)
+                continue
+            self.received_fragments[entry.message_id] = fragments
+            self.expected_total_fragments[entry.message_id] = entry.total_fragments
+            self.received_fragment_sizes[entry.message_id] = entry.fragment_size
+            self._recv_journal_entries[entry.message_id] = entry
+            self.log_callback(f"Recepção retomada do disco: MsgID {entry.message_id}, "
+                              f"{len(fragments)}/{entry.total_fragments} fragmentos já recebidos.")
+
+    def _persist_received_fragment(self, device_id, message_id, fragment_idx, total_fragments, fragment_size, payload_data):
+        """Grava o fragmento no .part (no deslocamento dele) e o marca no diário. Roda na thread de escrita."""
+        verifier = self._merkle_verifiers.get(message_id)
+        if verifier is None or verifier.total_fragments != total_fragments or verifier.fragment_size != fragment_size:
+            verifier = MerkleStreamVerifier(total_fragments, fragment_size, envelope.parse_merkle_layout)
+            self._merkle_verifiers[message_id] = verifier
+        verifier.add_fragment(fragment_idx, payload_data) # Folhas de Merkle calculadas durante a recepção
+        try:
+            entry = self._recv_journal_entries.get(message_id)
+            if entry is None:
+                entry = self.journal.find_recv(device_id, message_id, total_fragments, fragment_size)
+                if entry is None:
+                    entry = self.journal.begin(ROLE_RECV, message_id, device_id, total_fragments,
+                                               fragment_size, b'', '')
+                self._recv_journal_entries[message_id] = entry
+            if entry.is_acked(fragment_idx):
+                return
+
+            part_file = self._recv_part_files.get(message_id)
+            if part_file is None:
+                part_path = self._part_file_path(entry)
+                if os.path.exists(part_path):
+                    part_file = open(part_path, "r+b")
+                else:
+                    part_file = open(part_path, "w+b")
+                    preallocate(part_file, total_fragments * entry.fragment_size) # Limite superior do tamanho da mensagem
+                self._recv_part_files[message_id] = part_file
+            part_file.seek(fragment_idx * entry.fragment_size)
+            part_file.write(payload_data)
+            part_file.flush()
+            self.disk_writer.sync_fragment(part_file)
+            self.journal.mark_fragment(entry, fragment_idx, len(payload_data),
+                                       before_sync=lambda: os.fsync(part_file.fileno()))
+        except OSError as e:
+            # Falha no disco não impede a recepção em memória; só perde a capacidade de retomar
+            self.log_callback(f"AVISO: Não foi possível persistir fragmento {fragment_idx} da MsgID {message_id}: {e}")
+
+    def _close_partial_reception(self, message_id, status):
+        self._merkle_verifiers.pop(message_id, None)
+        part_file = self._recv_part_files.pop(message_id, None)
+        if part_file:
+            part_file.close()
+        entry = self._recv_journal_entries.pop(message_id, None)
+        if entry:
+            self.journal.finish(entry, status)
+            try:
+                os.remove(self._part_file_path(entry))
+            except OSError:
+                pass
+
+    def _discard_partial_reception(self, message_id):
+        self.disk_writer.submit(self._close_partial_reception, message_id, END_STATUS_DISCARDED)
+        self.received_fragments.pop(message_id, None)
+        self.expected_total_fragments.pop(message_id, None)
+        self.received_fragment_sizes.pop(message_id, None)
+        self._reception_gaps.pop(message_id, None)
+
+    def _register_ack_waiter(self, message_id, fragment_idx):
+        waiter = {'event': threading.Event(), 'result': None}
+        with self._ack_waiters_lock:
+            self._ack_waiters[(message_id, fragment_idx)] = waiter
+        return waiter
+
+    def _unregister_ack_waiter(self, message_id, fragment_idx):
+        with self._ack_waiters_lock:
+            self._ack_waiters.pop((message_id, fragment_idx), None)
+
+    def _resolve_ack_waiter(self, message_id, fragment_idx, result):
+        """Chamado pela thread de leitura: acorda quem estiver esperando por este fragmento. True se havia alguém."""
+        with self._ack_waiters_lock:
+            waiter = self._ack_waiters.get((message_id, fragment_idx))
+        if waiter:
+            waiter['result'] = result
+            waiter['event'].set()
+        return waiter is not None
+
+    def _wait_for_transmit_window(self, cancel_flag):
+        """Aguarda espaço no buffer ARQ do Arduino e o turno TDMA deste dispositivo."""
+        # VERIFICA SE O ARDUINO TEM ESPAÇO NO BUFFER ARQ
+        while self.arduino_buffer_arq_count >= self.arduino_arq_window:
+            if cancel_flag is not None and cancel_flag.is_set():
+                return False
+            time.sleep(0.05)
+
+        # Dorme até a fronteira exata do nosso próximo slot (sem busy loop)
+        return self.tdma.wait_for_my_slot(cancel_flag)
+
+    def send_fragment_with_arq(self, message_id, fragment_idx, total_fragments, segment_bytes, cancel_flag=None,
+                               channel=CHANNEL_BULK, encoded_frame=None):
+        """
+        Envia UM fragmento DATA e aguarda o ACK correspondente, retransmitindo em caso de NACK/timeout.
+        Pode ser chamado por várias threads ao mesmo tempo (cada uma com um fragmento diferente).
+        encoded_frame: o quadro já codificado (pipeline.py); sem ele, é codificado aqui, uma vez para todas as tentativas.
+        Retorna {"status": "success"|"error"|"cancelled", "message": ..., "attempts": n}.
+        """
+        retransmission_attempts = 0
+        last_message = "Sem resposta do receptor."
+        if encoded_frame is None:
+            try:
+                encoded_frame = encode_packet(PACKET_TYPE_DATA, THIS_DEVICE_ID, message_id, fragment_idx,
+                                              total_fragments, segment_bytes)
+            except ValueError as e:
+                self.log_callback(f"ERRO: {e}")
+                return {"status": "error", "message": str(e), "attempts": 0}
+
+        while retransmission_attempts < MAX_RETRANSMISSION_ATTEMPTS:
+            if cancel_flag is not None and cancel_flag.is_set():
+                return {"status": "cancelled", "message": "Envio cancelado.", "attempts": retransmission_attempts}
+
+            if not self._wait_for_transmit_window(cancel_flag):
+                return {"status": "cancelled", "message": "Envio cancelado.", "attempts": retransmission_attempts}
+
+            if retransmission_attempts:
+                self._m_retransmissions.inc()
+            # Registra a espera ANTES de enviar para não perder um ACK muito rápido
+            waiter = self._register_ack_waiter(message_id, fragment_idx)
+            try:
+                result = self._submit_encoded_packet(encoded_frame, PACKET_TYPE_DATA, channel)
+                sent_at = time.monotonic()
+                if result["status"] == "error":
+                    self.log_callback(f"Erro ao enviar pacote para o Arduino: {result['message']}")
+                    last_message = result["message"]
+                    retransmission_attempts += 1 # Conta como uma retransmissão
+                    time.sleep(0.1) # Pequena pausa em caso de erro de envio para a serial
+                    continue
+
+                # Aguarda por ACK ou NACK (o tempo no ar cresce quando a taxa RF desce)
+                ack_timeout = self.rf_rate.ack_timeout()
+                turn_expired = False
+                start_wait_time = time.time()
+                while time.time() - start_wait_time < ack_timeout:
+                    if waiter['event'].wait(timeout=0.01):
+                        break
+                    # Durante a espera por ACK/NACK, verificar se ainda é nosso turno.
+                    # Se não for mais, e o ACK/NACK não veio, pode significar que o outro lado não teve slot para responder.
+                    if not self.is_my_turn_to_transmit():
+                        self.log_callback("AVISO: Turno de TX expirou esperando ACK/NACK. Retransmitindo no proximo turno.")
+                        turn_expired = True
+                        break
+            finally:
+                self._unregister_ack_waiter(message_id, fragment_idx)
+
+            if waiter['result'] is not None or not turn_expired:
+                # Fim de turno sem resposta não diz nada sobre a qualidade do enlace
+                self.rf_rate.on_fragment_result(len(segment_bytes), waiter['result'] == 'ack')
+            self._m_arq_results[waiter['result'] or 'timeout'].inc()
+            if waiter['result'] == 'ack':
+                self._m_rtt.observe(time.monotonic() - sent_at)
+                return {"status": "success", "message": "Fragmento confirmado.", "attempts": retransmission_attempts + 1}
+            elif waiter['result'] == 'nack':
+                self.log_callback(f"NACK recebido para MsgID: {message_id}, Frag: {fragment_idx}. Retransmitindo.")
+                last_message = "NACK recebido."
+            else: # Timeout
+                self.log_callback(f"Timeout para MsgID: {message_id}, Frag: {fragment_idx}. Tentativa {retransmission_attempts + 1}/{MAX_RETRANSMISSION_ATTEMPTS}.")
+                last_message = "Timeout aguardando ACK."
+            retransmission_attempts += 1
+
+        self.log_callback(f"ERRO: Max. tentativas de retransmissao atingidas para MsgID: {message_id}, Frag: {fragment_idx}. ({last_message})")
+        self._m_arq_give_ups.inc()
+        return {"status": "error", "message": last_message, "attempts": retransmission_attempts}
+
+    def send_text_message(self, message):
+        """
+        Envia uma mensagem de texto curta de forma síncrona (com ARQ por fragmento).
+        A GUI usa o TransferJobManager (prioridade interativa); este método serve para uso direto.
+        """
+        message_bytes = message.encode('utf-8')
+        fragment_size = fragment_size_for(len(message_bytes), self.rf_rate.fragment_size())
+        segments = [message_bytes[i:i + fragment_size]
+                    for i in range(0, len(message_bytes), fragment_size)] or [b'']
+        message_id = self.allocate_message_id()
+        try:
+            for i, segment_bytes in enumerate(segments):
+                result = self.send_fragment_with_arq(message_id, i, len(segments), segment_bytes,
+                                                     channel=CHANNEL_INTERACTIVE)
+                if result["status"] != "success":
+                    return {"status": result["status"], "message": f"Erro ao enviar mensagem de texto: {result['message']}"}
+        finally:
+            self.release_message_id(message_id)
+        return {"status": "success", "message": "Mensagem de texto enviada."}
 
-    def send_file(self, file_path, cancel_flag, update_progress_callback=None, on_sending_finished_callback=None, update_frames_summary_callback=None):
+    def send_file(self, file_path, cancel_flag, update_progress_callback=None, on_sending_finished_callback=None,
+                  update_frames_summary_callback=None, transforms=()):
+        """
+        Envia um arquivo de forma síncrona, fragmento a fragmento com ARQ. Leitura, transformações
+        (funções bytes -> bytes, ex.: envelope.encode_file) e codificação dos quadros rodam à frente
+        no SendPipeline; este laço só entrega quadros prontos e espera os ACKs. O progresso vai para
+        a GUI por outra thread.
+        """
         self._is_sending_file_flag = True
         final_status = 'success'
         final_message = 'Envio de arquivo concluído.'
         num_segments = 0
         total_bytes_sent_original = 0 # Conta apenas os bytes de dados originais, não o padding
+        message_id = None
+        pipeline = None
+        relay = CallbackRelay("SendFileProgress", self.log_callback)
 
         try:
-            with open(file_path, "rb") as f:
-                file_bytes = f.read()
-            total_file_size = len(file_bytes)
-            
-            message_id = int(time.time() % 256) # ID único para esta mensagem
+            message_id = self.allocate_message_id() # ID único para esta mensagem
 
-            # Divide o arquivo em segmentos
-            segments = [file_bytes[i:i + MAX_PACKET_PAYLOAD_SIZE]
-                        for i in range(0, total_file_size, MAX_PACKET_PAYLOAD_SIZE)]
-            total_fragments = len(segments)
+            # O tamanho de fragmento é o escolhido pela adaptação do enlace RF
+            pipeline = SendPipeline(file_path, partial(encode_packet, PACKET_TYPE_DATA, THIS_DEVICE_ID, message_id),
+                                    lambda total_size: fragment_size_for(total_size, self.rf_rate.fragment_size()),
+                                    transforms, name=f"SendFile-{message_id}").start()
+            pipeline.wait_sized()
+            total_file_size = pipeline.total_bytes
+            total_fragments = pipeline.total_fragments
 
             self.log_callback(f"Iniciando envio do arquivo '{os.path.basename(file_path)}' com {total_fragments} fragmentos. MsgID: {message_id}")
 
-            for i, segment_bytes in enumerate(segments):
+            while True:
                 if cancel_flag.is_set():
-                    self.log_callback("Envio de arquivo cancelado pelo usuário.")
-                    final_status = 'cancelled'
-                    final_message = 'Envio cancelado.'
                     break
-
-                # VERIFICA SE O ARDUINO TEM ESPAÇO NO BUFFER ARQ
-                while self.arduino_buffer_arq_count >= MAX_UNACKED_FRAGMENTS:
-                    self.log_callback("Esperando o Arduino liberar espaço no buffer ARQ...")
-                    time.sleep(0.05)
-
-                # Aguarda pelo turno de transmissão deste dispositivo
-                while not self.is_my_turn_to_transmit():
-                    # self.log_callback("AGUARDANDO MEU TURNO DE TRANSMISSÃO...") # Debug opcional
-                    time.sleep(0.01) # Espera um pouco antes de verificar novamente
+                frame = pipeline.next_frame()
+                if frame is None:
+                    break
 
                 # Tenta enviar o pacote com ARQ
-                retransmission_attempts = 0
-                ack_received = False
-                nack_received = False
-
-                while retransmission_attempts < MAX_RETRANSMISSION_ATTEMPTS:
-                    result = self.send_data_packet(message_id, i, total_fragments, segment_bytes)
-                    if result["status"] == "error":
-                        self.log_callback(f"Erro ao enviar pacote para o Arduino: {result['message']}")
-                        time.sleep(0.1) # Pequena pausa em caso de erro de envio para a serial
-                        continue # Tenta novamente (conta como uma retransmissão)
-
-                    # Aguarda por ACK ou NACK
-                    start_wait_time = time.time()
-                    while time.time() - start_wait_time < RETRANSMISSION_TIMEOUT:
-                        try:
-                            # Tenta pegar um ACK
-                            ack = self.ack_queue.get(timeout=0.01) # Curto timeout para não bloquear
-                            if ack['message_id'] == message_id and ack['fragment_idx'] == i:
-                                ack_received = True
-                                break
-                        except queue.Empty:
-                            pass # Nenhuma ACK, continua esperando ou verifica NACK
-
-                        try:
-                            # Tenta pegar um NACK
-                            nack = self.nack_queue.get(timeout=0.01)
-                            if nack['message_id'] == message_id and nack['fragment_idx'] == i:
-                                nack_received = True
-                                break
-                        except queue.Empty:
-                            pass # Nenhuma NACK
-                        
-                        # Durante a espera por ACK/NACK, verificar se ainda é nosso turno.
-                        # Se não for mais, e o ACK/NACK não veio, pode significar que o outro lado não teve slot para responder.
-                        # Isso é uma simplificação para o TDMA básico. Em sistemas reais, ACK/NACK podem ter slots dedicados.
-                        if not self.is_my_turn_to_transmit():
-                            self.log_callback("AVISO: Turno de TX expirou esperando ACK/NACK. Retransmitindo no proximo turno.")
-                            break # Sai da espera, força retransmissão no próximo ciclo
-
-                    if ack_received:
-                        break # Sai do loop de retransmissão, vai para o próximo segmento
-                    elif nack_received:
-                        self.log_callback(f"NACK recebido para MsgID: {message_id}, Frag: {i}. Retransmitindo.")
-                        retransmission_attempts += 1
-                        ack_received = False # Reseta para próxima tentativa
-                        nack_received = False # Reseta para próxima tentativa
-                    else: # Timeout
-                        self.log_callback(f"Timeout para MsgID: {message_id}, Frag: {i}. Tentativa {retransmission_attempts + 1}/{MAX_RETRANSMISSION_ATTEMPTS}.")
-                        retransmission_attempts += 1
-                
-                if not ack_received:
-                    self.log_callback(f"ERRO: Max. tentativas de retransmissao atingidas para MsgID: {message_id}, Frag: {i}. ({result['message']})")
+                result = self.send_fragment_with_arq(message_id, frame.fragment_idx, total_fragments, frame.segment,
+                                                     cancel_flag, encoded_frame=frame.data)
+                if result["status"] == "cancelled":
+                    break
+                if result["status"] != "success":
                     final_status = 'error'
-                    final_message = f"Erro ao enviar segmento {i}: {result['message']}"
+                    final_message = f"Erro ao enviar segmento {frame.fragment_idx}: {result['message']}"
                     break
 
-                total_bytes_sent_original += len(segment_bytes)
+                total_bytes_sent_original += len(frame.segment)
                 num_segments += 1
 
-                if update_progress_callback:
-                    percentage = int((total_bytes_sent_original / total_file_size) * 100)
-                    update_progress_callback(percentage)
-
-                if update_frames_summary_callback:
-                    update_frames_summary_callback(num_segments, total_bytes_sent_original)
+                if total_file_size:
+                    relay.call(update_progress_callback, int((total_bytes_sent_original / total_file_size) * 100))
+                relay.call(update_frames_summary_callback, num_segments, total_bytes_sent_original)
 
-                time.sleep(0.05)  # Pequeno atraso entre envios de pacotes para o Arduino processar
-
-            if not cancel_flag.is_set() and final_status == 'success':
+            if cancel_flag.is_set():
+                self.log_callback("Envio de arquivo cancelado pelo usuário.")
+                final_status = 'cancelled'
+                final_message = 'Envio cancelado.'
+            elif final_status == 'success':
+                stats = pipeline.get_stats()
                 self.log_callback(
-                    f"Envio de arquivo concluído: {num_segments} segmentos ({total_bytes_sent_original} bytes de dados originais).")
-                if update_progress_callback:
-                    update_progress_callback(100)
+                    f"Envio de arquivo concluído: {num_segments} segmentos ({total_bytes_sent_original} bytes de dados originais). "
+                    f"Enlace esperou a preparação de quadros {stats['link_stalls']} vez(es).")
+                relay.call(update_progress_callback, 100)
 
         except Exception as e:
             self.log_callback(f"Erro inesperado durante o envio do arquivo: {e}")
             final_status = 'error'
             final_message = f'Erro inesperado durante o envio: {e}'
         finally:
+            if pipeline is not None:
+                pipeline.close()
+            if message_id is not None:
+                self.release_message_id(message_id)
+            relay.close()
             self._is_sending_file_flag = False  # Finaliza o estado de envio
             if on_sending_finished_callback:
                 on_sending_finished_callback(final_status, final_message)
 
+        return {"status": final_status, "message": final_message}
+
     def get_serial_port_status(self):
         """Retorna 'Disponível' ou 'Indisponível' para o frontend."""
         available = self.test_serial_port_availability()
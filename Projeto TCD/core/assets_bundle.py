@@ -0,0 +1,112 @@
+# core/assets_bundle.py
+
+import base64
+import mimetypes
+import os
+import re
+
+# --- Pacote único da interface ---
+# O index.html referencia o CSS, o JS e vários SVGs separados; cada um é uma leitura de arquivo a mais
+# antes da janela ficar utilizável. Aqui tudo é embutido num único HTML (CSS/JS inline, imagens e fontes
+# como data URI), regerado só quando algum arquivo da pasta gui/ for mais novo que o pacote.
+GUI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gui')
+BUNDLE_DIR_NAME = 'build'
+BUNDLE_FILE_NAME = 'index.html'
+
+_STYLESHEET_RE = re.compile(r'<link\s+rel="stylesheet"\s+href="([^"]+)"\s*/?>', re.IGNORECASE)
+_SCRIPT_RE = re.compile(r'<script\s+src="([^"]+)"\s*>\s*</script>', re.IGNORECASE)
+_IMG_SRC_RE = re.compile(r'(<img\b[^>]*?\bsrc=")([^"]+)(")', re.IGNORECASE)
+_CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+_MIME_OVERRIDES = {'.svg': 'image/svg+xml', '.ttf': 'font/ttf', '.woff': 'font/woff', '.woff2': 'font/woff2'}
+
+
+def _is_local(ref):
+    return not re.match(r'^[a-z][a-z0-9+.-]*:', ref, re.IGNORECASE) and not ref.startswith('//')
+
+
+def _data_uri(path):
+    ext = os.path.splitext(path)[1].lower()
+    mime = _MIME_OVERRIDES.get(ext) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    with open(path, 'rb') as f:
+        return f'data:{mime};base64,{base64.b64encode(f.read()).decode("ascii")}'
+
+
+def _read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _inline_css(css, base_dir):
+    def replace(match):
+        ref = match.group(2)
+        path = os.path.join(base_dir, ref)
+        if _is_local(ref) and os.path.isfile(path):
+            return f'url("{_data_uri(path)}")'
+        return match.group(0)
+    return _CSS_URL_RE.sub(replace, css)
+
+
+def build_bundle(gui_dir=GUI_DIR, output_path=None):
+    """Gera o HTML único a partir de gui/index.html. Retorna o caminho do pacote."""
+    gui_dir = os.path.abspath(gui_dir)
+    output_path = output_path or os.path.join(gui_dir, BUNDLE_DIR_NAME, BUNDLE_FILE_NAME)
+    html = _read_text(os.path.join(gui_dir, 'index.html'))
+
+    def inline_stylesheet(match):
+        path = os.path.join(gui_dir, match.group(1))
+        if not (_is_local(match.group(1)) and os.path.isfile(path)):
+            return match.group(0)
+        return f'<style>\n{_inline_css(_read_text(path), os.path.dirname(path))}\n</style>'
+
+    def inline_script(match):
+        path = os.path.join(gui_dir, match.group(1))
+        if not (_is_local(match.group(1)) and os.path.isfile(path)):
+            return match.group(0)
+        script = _read_text(path).replace('</script', '<\\/script') # Não pode fechar a tag inline antes da hora
+        return f'<script>\n{script}\n</script>'
+
+    def inline_image(match):
+        path = os.path.join(gui_dir, match.group(2))
+        if not (_is_local(match.group(2)) and os.path.isfile(path)):
+            return match.group(0)
+        return match.group(1) + _data_uri(path) + match.group(3)
+
+    html = _STYLESHEET_RE.sub(inline_stylesheet, html)
+    html = _SCRIPT_RE.sub(inline_script, html)
+    html = _IMG_SRC_RE.sub(inline_image, html)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _newest_source_mtime(gui_dir):
+    newest = 0
+    bundle_dir = os.path.join(gui_dir, BUNDLE_DIR_NAME)
+    for root, dirs, files in os.walk(gui_dir):
+        if os.path.abspath(root) == os.path.abspath(bundle_dir):
+            dirs[:] = []
+            continue
+        for name in files:
+            newest = max(newest, os.stat(os.path.join(root, name)).st_mtime_ns)
+    return newest
+
+
+def ensure_bundle(gui_dir=GUI_DIR):
+    """Caminho do pacote, regerado se algum arquivo de gui/ mudou desde a última geração."""
+    gui_dir = os.path.abspath(gui_dir)
+    output_path = os.path.join(gui_dir, BUNDLE_DIR_NAME, BUNDLE_FILE_NAME)
+    try:
+        if os.stat(output_path).st_mtime_ns >= _newest_source_mtime(gui_dir):
+            return output_path
+    except OSError:
+        pass
+    return build_bundle(gui_dir, output_path)
+
+
+if __name__ == '__main__':
+    print(build_bundle())
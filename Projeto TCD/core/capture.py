@@ -0,0 +1,218 @@
+# core/capture.py
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+# --- Trace binário do tráfego serial ---
+# Arquivo append-only: [cabeçalho do arquivo][registro][registro]...
+# Cada registro: [t_ns u64][tamanho u32][direção u8][3B reservados][dados, completados até múltiplo de 8]
+# t_ns é relativo ao início da captura (relógio monotônico). Registros alinhados em 8 bytes permitem ler
+# o arquivo inteiro com mmap sem cópias; um registro incompleto no fim (app fechado no meio) é ignorado.
+TRACE_MAGIC = b'TCDTRACE'
+TRACE_VERSION = 1
+TRACE_FILE_EXTENSION = ".tcdtrace"
+FILE_HEADER_FORMAT = "<8sHHdQ4x"  # magic, versão, tamanho do cabeçalho de registro, início (epoch s), início (monotônico ns)
+FILE_HEADER_SIZE = struct.calcsize(FILE_HEADER_FORMAT)
+RECORD_HEADER_FORMAT = "<QIB3x"
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+RECORD_ALIGNMENT = 8
+
+DIRECTION_RX = 0  # Bytes lidos da porta (Arduino -> PC)
+DIRECTION_TX = 1  # Bytes escritos na porta (PC -> Arduino)
+DIRECTION_NAMES = {DIRECTION_RX: 'rx', DIRECTION_TX: 'tx'}
+
+WRITE_BUFFER_SIZE = 64 * 1024   # Registros são acumulados em memória e gravados em blocos
+FLUSH_INTERVAL_S = 1.0          # ... mas nunca ficam mais que isso sem ir para o arquivo
+
+
+def _padding(length):
+    return (-length) % RECORD_ALIGNMENT
+
+
+class TraceWriter:
+    """Grava registros (instante, direção, bytes) no trace. Thread-safe: leitura e escrita serial gravam juntas."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._start_ns = time.monotonic_ns()
+        self._file = open(path, "wb", buffering=WRITE_BUFFER_SIZE)
+        self._file.write(struct.pack(FILE_HEADER_FORMAT, TRACE_MAGIC, TRACE_VERSION, RECORD_HEADER_SIZE,
+                                     time.time(), self._start_ns))
+        self._last_flush = time.monotonic()
+        self.records = 0
+        self.bytes = {DIRECTION_RX: 0, DIRECTION_TX: 0}
+
+    def record(self, direction, data, t_ns=None):
+        if not data:
+            return
+        if t_ns is None:
+            t_ns = time.monotonic_ns()
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(struct.pack(RECORD_HEADER_FORMAT, max(0, t_ns - self._start_ns), len(data), direction))
+            self._file.write(data)
+            self._file.write(b'\0' * _padding(len(data)))
+            self.records += 1
+            self.bytes[direction] += len(data)
+            now = time.monotonic()
+            if now - self._last_flush >= FLUSH_INTERVAL_S:
+                self._file.flush()
+                self._last_flush = now
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                self._file.close()
+
+    def stats(self):
+        return {"path": self.path, "records": self.records, "bytes": sum(self.bytes.values()),
+                "rx_bytes": self.bytes[DIRECTION_RX], "tx_bytes": self.bytes[DIRECTION_TX]}
+
+
+class TraceReader:
+    """Lê um trace via mmap. records() produz (t_ns, direção, memoryview dos dados) sem copiar o arquivo."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < FILE_HEADER_SIZE:
+            self._file.close()
+            raise ValueError(f"Trace '{path}' curto demais.")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_header_size, self.start_wall_time, self.start_monotonic_ns = \
+            struct.unpack_from(FILE_HEADER_FORMAT, self._mmap)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION or record_header_size != RECORD_HEADER_SIZE:
+            self.close()
+            raise ValueError(f"'{path}' não é um trace suportado.")
+
+    def records(self, direction=None):
+        view = memoryview(self._mmap)
+        size = len(view)
+        pos = FILE_HEADER_SIZE
+        try:
+            while pos + RECORD_HEADER_SIZE <= size:
+                t_ns, length, record_direction = struct.unpack_from(RECORD_HEADER_FORMAT, view, pos)
+                start = pos + RECORD_HEADER_SIZE
+                if start + length > size:
+                    break # Registro incompleto no fim do arquivo
+                if direction is None or record_direction == direction:
+                    yield t_ns, record_direction, view[start:start + length]
+                pos = start + length + _padding(length)
+        finally:
+            view.release()
+
+    def close(self):
+        if not self._mmap.closed:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass # Ainda há memoryviews de registros em uso; o mmap é liberado quando elas forem coletadas
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CapturingSerial:
+    """
+    Envolve a porta serial (ou qualquer objeto com a mesma interface) e grava no trace tudo o que
+    passa por read()/write(). Os demais atributos (in_waiting, is_open, close...) vão direto para a porta.
+    """
+
+    def __init__(self, wrapped, writer):
+        self.wrapped = wrapped
+        self.writer = writer
+
+    def read(self, size=1):
+        data = self.wrapped.read(size)
+        self.writer.record(DIRECTION_RX, data)
+        return data
+
+    def write(self, data):
+        written = self.wrapped.write(data)
+        self.writer.record(DIRECTION_TX, bytes(data))
+        return written
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+class NullSerial:
+    """Porta sem hardware: descarta o que é escrito (ACKs gerados durante um replay) e nunca tem bytes para ler."""
+
+    is_open = True
+    in_waiting = 0
+
+    def __init__(self):
+        self.bytes_written = 0
+
+    def read(self, size=1):
+        return b''
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def replay_trace(path, controller, speed=None, progress_callback=None):
+    """
+    Alimenta o parser do ArduinoController com os bytes RX de um trace, como se viessem da porta.
+
+    speed: 1.0 = tempo real, N = N vezes mais rápido, None ou 0 = sem espera (o mais rápido possível,
+    útil para medir o custo do parser). O instante de leitura entregue ao parser segue a linha do tempo
+    do trace, então a sincronização por beacons se comporta como na sessão original.
+    Sem conexão, o controller recebe uma NullSerial para que os ACKs gerados não virem erros.
+    Retorna estatísticas do replay.
+    """
+    if controller.tx_scheduler is None:
+        controller.attach_serial(NullSerial(), start_reader=False)
+
+    records = 0
+    total_bytes = 0
+    buffer = b''
+    base_monotonic = time.monotonic()
+    started = time.perf_counter()
+    first_t_ns = None
+    with TraceReader(path) as reader:
+        for t_ns, _, data in reader.records(DIRECTION_RX):
+            if first_t_ns is None:
+                first_t_ns = t_ns
+            offset_s = (t_ns - first_t_ns) / 1e9
+            if speed:
+                delay = offset_s / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            buffer = controller._process_incoming_bytes(buffer + bytes(data), base_monotonic + offset_s)
+            records += 1
+            total_bytes += len(data)
+            if progress_callback:
+                progress_callback(records, total_bytes)
+
+    elapsed = time.perf_counter() - started
+    trace_duration = (t_ns - first_t_ns) / 1e9 if first_t_ns is not None else 0.0
+    return {"records": records, "bytes": total_bytes, "leftover_bytes": len(buffer),
+            "elapsed_s": round(elapsed, 6), "trace_duration_s": round(trace_duration, 6),
+            "bytes_per_s": round(total_bytes / elapsed, 1) if elapsed > 0 else None}
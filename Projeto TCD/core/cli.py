@@ -0,0 +1,357 @@
+# core/cli.py
+
+import argparse
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from arduino import ArduinoController
+from jobs import TransferJobManager, PRIORITY_BULK, JOB_SUCCESS, JOB_FINAL_STATES
+from main import SERIAL_PORT, BAUD_RATE, NEGOTIATE_BAUD_RATE, ADAPT_RF_BITRATE, BINARY_TELEMETRY, METRICS_HTTP_PORT
+from spool import OutboxSpool
+from telemetry import TELEMETRY_BINARY
+from profiling import PROFILE_MODES
+
+# --- Linha de comando sem interface gráfica ---
+# Mesma pilha do app (ArduinoController + TransferJobManager), sem importar o webview.
+# A saída em stdout é uma linha JSON por evento, para scripts e cron; os logs do controller vão para stderr
+# (com --verbose) ou para um arquivo (--log-file).
+EXIT_OK = 0
+EXIT_FAILED = 1        # Transferência/ping falhou ou o Arduino não respondeu
+EXIT_NO_CONNECTION = 3 # Não foi possível abrir a porta serial
+
+DEFAULT_BENCH_SIZE = 2048
+PROGRESS_STEP_PERCENT = 5 # Evento de progresso a cada N% (evita uma linha por fragmento)
+
+
+class EventOutput:
+    """Escreve eventos como linhas JSON em stdout (thread-safe, com flush a cada linha)."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps(dict(event=event, ts=round(time.time(), 3), **fields), ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+class CliSession:
+    """Controller e gerenciador de transferências para um comando; close() sempre desconecta."""
+
+    def __init__(self, args, output):
+        self.args = args
+        self.output = output
+        self._log_lock = threading.Lock()
+        self._log_file = open(args.log_file, "a", encoding="utf-8") if args.log_file else None
+        self.controller = ArduinoController(args.port, args.baud, log_callback=self.log)
+        self.controller.rf_rate.enabled = not args.no_rf_adaptation
+        if args.profile:
+            self.controller.start_profiling(mode=args.profile, trace_memory=args.profile_memory)
+        if args.metrics_port:
+            try:
+                self.controller.metrics.start_http(port=args.metrics_port)
+            except (RuntimeError, OSError) as e:
+                output.emit("error", message=f"Endpoint de métricas não iniciado: {e}")
+        self.manager = None
+        self.spool = None
+
+    def log(self, message):
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}"
+        with self._log_lock:
+            if self._log_file:
+                self._log_file.write(line + "\n")
+                self._log_file.flush()
+            if self.args.verbose:
+                print(line, file=sys.stderr, flush=True)
+
+    def connect(self):
+        """Abre a serial e espera o primeiro status do firmware. Retorna o código de saída em caso de falha."""
+        start = time.monotonic()
+        if not self.controller.connect():
+            self.output.emit("error", message=f"Não foi possível abrir a porta serial {self.args.port}.")
+            return EXIT_NO_CONNECTION
+        ready = self.controller.wait_for_first_status(self.args.status_timeout)
+        baud = self.args.baud
+        if ready and not self.args.text_telemetry:
+            self.controller.set_telemetry_mode(TELEMETRY_BINARY)
+        if ready and not self.args.no_baud_negotiation:
+            baud = self.controller.negotiate_baud_rate()
+        self.output.emit("connected", port=self.args.port, baud=baud, arduino_ready=ready,
+                         handshake_ms=round((time.monotonic() - start) * 1000, 1))
+        return None
+
+    def start_jobs(self):
+        self.manager = TransferJobManager(self.controller, log_callback=self.log)
+        self.manager.start()
+        return self.manager
+
+    def close(self):
+        if self.spool:
+            self.spool.stop()
+        if self.manager:
+            self.manager.stop()
+        summary = self.controller.stop_profiling(self.args.profile_dir)
+        if summary:
+            self.output.emit("profile", **summary)
+        self.controller.disconnect()
+        self.controller.metrics.stop_http()
+        if self._log_file:
+            self._log_file.close()
+
+
+# --- Comandos ---
+
+def _track_job(output, finished, job_ref):
+    """Callbacks de progresso/término que emitem eventos com o job_id (preenchido após o submit)."""
+    last_step = {"value": -1}
+
+    def on_progress(percentage):
+        step = int(percentage) // PROGRESS_STEP_PERCENT
+        if step != last_step["value"]:
+            last_step["value"] = step
+            output.emit("progress", job_id=job_ref["job_id"], percent=round(percentage, 1))
+
+    def on_finished(status, message):
+        finished[job_ref["job_id"]] = status
+        output.emit("finished", job_id=job_ref["job_id"], status=status, message=message)
+
+    return on_progress, on_finished
+
+
+def _wait_jobs(manager, job_ids, finished, timeout):
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        pending = [job_id for job_id in job_ids if job_id not in finished
+                   and (manager.get_status(job_id) or {}).get("status", JOB_SUCCESS) not in JOB_FINAL_STATES]
+        if not pending:
+            return True
+        if deadline and time.monotonic() >= deadline:
+            for job_id in pending:
+                manager.cancel(job_id)
+            return False
+        time.sleep(0.2)
+
+
+def cmd_send(session, args):
+    manager = session.start_jobs()
+    finished = {}
+    job_ids = []
+    for path in args.files:
+        job_ref = {"job_id": None}
+        on_progress, on_finished = _track_job(session.output, finished, job_ref)
+        try:
+            job_ref["job_id"] = manager.submit_file(path, PRIORITY_BULK, on_progress, on_finished,
+                                                    use_delta=not args.no_delta)
+        except (OSError, ValueError) as e: # Ilegível ou grande demais para uma mensagem
+            session.output.emit("error", file=path, message=str(e))
+            return EXIT_FAILED
+        job_ids.append(job_ref["job_id"])
+        session.output.emit("queued", job_id=job_ref["job_id"], file=os.path.abspath(path),
+                            bytes=os.path.getsize(path))
+    for text in args.text or []:
+        job_ref = {"job_id": None}
+        _, on_finished = _track_job(session.output, finished, job_ref)
+        try:
+            job_ref["job_id"] = manager.submit_text(text, on_finished_callback=on_finished)
+        except ValueError as e:
+            session.output.emit("error", text_bytes=len(text.encode('utf-8')), message=str(e))
+            return EXIT_FAILED
+        job_ids.append(job_ref["job_id"])
+        session.output.emit("queued", job_id=job_ref["job_id"], text_bytes=len(text.encode('utf-8')))
+
+    if not _wait_jobs(manager, job_ids, finished, args.timeout):
+        session.output.emit("timeout", job_ids=job_ids, timeout_s=args.timeout)
+        return EXIT_FAILED
+    statuses = [(manager.get_status(job_id) or {}).get("status", finished.get(job_id)) for job_id in job_ids]
+    return EXIT_OK if all(status == JOB_SUCCESS for status in statuses) else EXIT_FAILED
+
+
+def cmd_receive(session, args):
+    """
+    Daemon de recepção: fica conectado, responde assinaturas/reparos/pings e emite um evento por arquivo.
+    Com --outbox, também envia o que for colocado na pasta (spool.OutboxSpool).
+    """
+    manager = session.start_jobs()
+    session.controller.on_file_received_callback = \
+        lambda status, name, message: session.output.emit("received", status=status, name=name, message=message)
+    if args.outbox:
+        def on_spool_sent(status, path, names, message):
+            session.output.emit("spool_sent", status=status, path=path, files=names, message=message)
+        session.spool = OutboxSpool(manager, args.outbox, log_callback=session.log, on_sent_callback=on_spool_sent)
+        session.spool.start()
+    resumed = manager.resume_interrupted()
+    if resumed:
+        session.output.emit("resumed", job_ids=resumed)
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            signal.signal(sig, lambda *_: stop.set())
+        except (ValueError, OSError):
+            pass # Sinal não disponível nesta plataforma
+    deadline = time.monotonic() + args.duration if args.duration else None
+    next_status = time.monotonic() + args.status_interval if args.status_interval else None
+    while not stop.is_set():
+        if deadline and time.monotonic() >= deadline:
+            break
+        if next_status and time.monotonic() >= next_status:
+            session.output.emit("status", **_status_fields(session))
+            next_status += args.status_interval
+        stop.wait(0.5)
+    session.output.emit("stopped")
+    return EXIT_OK
+
+
+def _status_fields(session):
+    controller = session.controller
+    fields = {"port": session.args.port, "arduino": controller.get_overall_arduino_status(),
+              "clock_sync": controller.get_clock_sync_status(), "telemetry": controller.get_telemetry_stats()}
+    if controller.tx_scheduler:
+        fields["tx"] = controller.tx_scheduler.get_stats()
+    rx_latency = controller.get_rx_latency()
+    if rx_latency["samples"]:
+        fields["rx_latency"] = rx_latency
+    if session.spool:
+        fields["outbox"] = session.spool.get_status()
+    if session.manager:
+        fields["jobs"] = [job for job in session.manager.list_jobs() if job["kind"] != 'control']
+    return fields
+
+
+def cmd_status(session, args):
+    fields = _status_fields(session)
+    session.output.emit("status", **fields)
+    return EXIT_OK if session.controller.wait_for_first_status(0) else EXIT_FAILED
+
+
+def cmd_ping(session, args):
+    """Ida e volta até o OUTRO PC (PING/PONG pelo link RF), como o ping de rede."""
+    manager = session.start_jobs()
+    padding = os.urandom(max(0, args.size))
+    rtts = []
+    for seq in range(args.count):
+        rtt = manager.ping(timeout=args.timeout, padding=padding)
+        if rtt is None:
+            session.output.emit("ping_timeout", seq=seq, timeout_s=args.timeout)
+        else:
+            rtts.append(rtt * 1000)
+            session.output.emit("pong", seq=seq, rtt_ms=round(rtt * 1000, 1))
+        if seq < args.count - 1:
+            time.sleep(args.interval)
+    summary = {"sent": args.count, "received": len(rtts),
+               "loss": round(1 - len(rtts) / args.count, 3) if args.count else None}
+    if rtts:
+        summary.update(min_ms=round(min(rtts), 1), avg_ms=round(sum(rtts) / len(rtts), 1), max_ms=round(max(rtts), 1))
+    session.output.emit("ping_summary", **summary)
+    return EXIT_OK if rtts else EXIT_FAILED
+
+
+def cmd_bench(session, args):
+    """Envia um arquivo aleatório de --size bytes (sem delta) e mede o goodput de ponta a ponta."""
+    manager = session.start_jobs()
+    fd, path = tempfile.mkstemp(prefix=f"bench_{int(time.time())}_", suffix=".bin")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(args.size))
+        finished = {}
+        job_ref = {"job_id": None}
+        on_progress, on_finished = _track_job(session.output, finished, job_ref)
+        start = time.monotonic()
+        try:
+            job_ref["job_id"] = manager.submit_file(path, PRIORITY_BULK, on_progress, on_finished, use_delta=False)
+        except ValueError as e:
+            session.output.emit("error", bytes=args.size, message=str(e))
+            return EXIT_FAILED
+        session.output.emit("queued", job_id=job_ref["job_id"], bytes=args.size)
+        completed = _wait_jobs(manager, [job_ref["job_id"]], finished, args.timeout)
+        elapsed = time.monotonic() - start
+    finally:
+        os.remove(path)
+
+    job = manager.get_status(job_ref["job_id"]) or {}
+    ok = completed and job.get("status") == JOB_SUCCESS
+    session.output.emit("bench", status=job.get("status", 'timeout'), file_bytes=args.size,
+                        wire_bytes=job.get("total_bytes"), fragments=job.get("total_fragments"),
+                        retransmissions=job.get("retransmissions"), elapsed_s=round(elapsed, 3),
+                        goodput_bps=round(args.size * 8 / elapsed, 1) if ok and elapsed > 0 else None,
+                        tx=session.controller.tx_scheduler.get_stats() if session.controller.tx_scheduler else None)
+    return EXIT_OK if ok else EXIT_FAILED
+
+
+COMMANDS = {"send": cmd_send, "receive": cmd_receive, "status": cmd_status, "ping": cmd_ping, "bench": cmd_bench}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Transferências pelo link RF sem interface gráfica (saída em linhas JSON).")
+    parser.add_argument("--port", default=os.environ.get("TCD_SERIAL_PORT", SERIAL_PORT), help="porta serial do Arduino")
+    parser.add_argument("--baud", type=int, default=int(os.environ.get("TCD_BAUD_RATE", BAUD_RATE)),
+                        help="taxa inicial (a do boot do firmware)")
+    parser.add_argument("--no-baud-negotiation", action="store_true", default=not NEGOTIATE_BAUD_RATE,
+                        help="fica na taxa inicial em vez de negociar uma maior com o firmware")
+    parser.add_argument("--no-rf-adaptation", action="store_true", default=not ADAPT_RF_BITRATE,
+                        help="mantém a taxa do rádio e fragmentos de tamanho máximo")
+    parser.add_argument("--text-telemetry", action="store_true", default=not BINARY_TELEMETRY,
+                        help="deixa o firmware no texto de debug em vez da telemetria binária")
+    parser.add_argument("--status-timeout", type=float, default=5.0,
+                        help="espera pelo primeiro status do firmware após conectar (s)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="logs do controller em stderr")
+    parser.add_argument("--log-file", help="grava os logs do controller neste arquivo")
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="perfil das threads do controller (sampling: baixo custo; cprofile: contagem exata por função)")
+    parser.add_argument("--profile-memory", action="store_true", help="com --profile, fotos do tracemalloc por transferência")
+    parser.add_argument("--profile-dir", help="pasta dos arquivos do perfil (padrão: core/profiles)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_HTTP_PORT,
+                        help="serve as métricas (formato Prometheus) em http://127.0.0.1:PORTA/metrics")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    send = sub.add_parser("send", help="envia arquivos e/ou textos e espera terminarem")
+    send.add_argument("files", nargs="*")
+    send.add_argument("--text", action="append", help="mensagem de texto (pode repetir)")
+    send.add_argument("--no-delta", action="store_true", help="não negocia envio delta")
+    send.add_argument("--timeout", type=float, default=0, help="cancela o que não terminar em N s (0 = sem limite)")
+
+    receive = sub.add_parser("receive", help="fica recebendo até SIGINT/SIGTERM ou --duration")
+    receive.add_argument("--duration", type=float, default=0, help="encerra após N s (0 = até receber um sinal)")
+    receive.add_argument("--status-interval", type=float, default=0, help="evento de status a cada N s (0 = nunca)")
+    receive.add_argument("--outbox", help="pasta vigiada: arquivos colocados nela são enviados (pequenos vão em pacotes)")
+
+    sub.add_parser("status", help="conecta, espera o firmware e mostra o estado do Arduino")
+
+    ping = sub.add_parser("ping", help="ida e volta até o outro PC")
+    ping.add_argument("--count", "-c", type=int, default=4)
+    ping.add_argument("--interval", type=float, default=1.0)
+    ping.add_argument("--timeout", type=float, default=30.0)
+    ping.add_argument("--size", type=int, default=0, help="bytes extras no PING")
+
+    bench = sub.add_parser("bench", help="mede o goodput enviando um arquivo aleatório")
+    bench.add_argument("--size", type=int, default=DEFAULT_BENCH_SIZE)
+    bench.add_argument("--timeout", type=float, default=0)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "send" and not args.files and not args.text:
+        build_parser().error("send: informe arquivos e/ou --text")
+    output = EventOutput()
+    session = CliSession(args, output)
+    try:
+        exit_code = session.connect()
+        if exit_code is None:
+            exit_code = COMMANDS[args.command](session, args)
+    finally:
+        session.close()
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
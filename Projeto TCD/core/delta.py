@@ -0,0 +1,253 @@
+# core/delta.py
+
+import hashlib
+import math
+import os
+import struct
+import threading
+
+# --- Transferência delta (estilo rsync) ---
+# 1. O emissor pede ao receptor a assinatura da versão que ele já tem do arquivo (mesmo nome).
+# 2. O receptor responde com (checksum rolante, hash forte) de cada bloco do arquivo dele.
+# 3. O emissor procura esses blocos no arquivo novo (em qualquer deslocamento, graças ao checksum
+#    rolante) e envia apenas instruções "copie os blocos X..Y" e os bytes que mudaram.
+
+STRONG_HASH_SIZE = 8   # blake2b truncado; só precisa distinguir blocos com o mesmo checksum fraco
+SIGNATURE_ENTRY_FORMAT = "<I{}s".format(STRONG_HASH_SIZE)
+SIGNATURE_ENTRY_SIZE = struct.calcsize(SIGNATURE_ENTRY_FORMAT)
+SIGNATURE_HEADER_FORMAT = "<IHI32s"  # tamanho do arquivo base, tamanho do bloco, quantidade de blocos, sha256 do arquivo base
+SIGNATURE_HEADER_SIZE = struct.calcsize(SIGNATURE_HEADER_FORMAT)
+
+DELTA_HEADER_FORMAT = "<32s32sIH"  # sha256 do arquivo base, sha256 do resultante, tamanho resultante, tamanho do bloco
+DELTA_HEADER_SIZE = struct.calcsize(DELTA_HEADER_FORMAT)
+OP_COPY = ord('C')     # + <IH: primeiro bloco, quantidade de blocos consecutivos
+OP_LITERAL = ord('L')  # + <H: tamanho, seguido dos bytes
+OP_COPY_FORMAT = "<IH"
+OP_LITERAL_FORMAT = "<H"
+MAX_COPY_RUN = 0xFFFF
+MAX_LITERAL_RUN = 0xFFFF
+
+MIN_BLOCK_SIZE = 64
+MAX_BLOCK_SIZE = 4096
+
+SIGNATURE_INDEX_DIR_NAME = ".sigindex" # Subpasta de received_files onde as assinaturas ficam em cache
+SIGNATURE_INDEX_HEADER_FORMAT = "<QQ"  # tamanho e mtime_ns do arquivo quando a assinatura foi calculada
+
+
+def choose_block_size(file_size):
+    """
+    Tamanho de bloco que equilibra o custo da assinatura (SIGNATURE_ENTRY_SIZE bytes por bloco, pelo link)
+    com o custo de cada alteração (um bloco inteiro vira literal). ~sqrt(tamanho * bytes por entrada).
+    """
+    block_size = int(math.sqrt(max(file_size, 1) * SIGNATURE_ENTRY_SIZE))
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, block_size))
+
+
+def weak_checksum(block):
+    """Checksum fraco do rsync: a = soma dos bytes, b = soma ponderada; ambos mod 2^16."""
+    a = 0
+    b = 0
+    length = len(block)
+    for i, byte in enumerate(block):
+        a += byte
+        b += (length - i) * byte
+    return ((b & 0xFFFF) << 16) | (a & 0xFFFF)
+
+
+def strong_hash(block):
+    return hashlib.blake2b(block, digest_size=STRONG_HASH_SIZE).digest()
+
+
+# --- Assinatura (lado receptor) ---
+
+def compute_signature(data, block_size):
+    entries = []
+    for offset in range(0, len(data), block_size):
+        block = data[offset:offset + block_size]
+        entries.append(struct.pack(SIGNATURE_ENTRY_FORMAT, weak_checksum(block), strong_hash(block)))
+    header = struct.pack(SIGNATURE_HEADER_FORMAT, len(data), block_size, len(entries), hashlib.sha256(data).digest())
+    return header + b''.join(entries)
+
+
+def parse_signature(signature):
+    """Retorna (tamanho do base, tamanho do bloco, sha256 do base, lista de (weak, strong))."""
+    if len(signature) < SIGNATURE_HEADER_SIZE:
+        raise ValueError("Assinatura curta demais.")
+    base_size, block_size, count, base_hash = struct.unpack_from(SIGNATURE_HEADER_FORMAT, signature)
+    if block_size == 0 or len(signature) < SIGNATURE_HEADER_SIZE + count * SIGNATURE_ENTRY_SIZE:
+        raise ValueError("Assinatura inválida.")
+    blocks = [struct.unpack_from(SIGNATURE_ENTRY_FORMAT, signature, SIGNATURE_HEADER_SIZE + i * SIGNATURE_ENTRY_SIZE)
+              for i in range(count)]
+    return base_size, block_size, base_hash, blocks
+
+
+# --- Delta (lado emissor) ---
+
+def compute_delta(signature, data):
+    """Gera as instruções de cópia/literal que transformam o arquivo base (da assinatura) em 'data'."""
+    base_size, block_size, base_hash, blocks = parse_signature(signature)
+    last_block_len = base_size - (len(blocks) - 1) * block_size if blocks else 0
+
+    lookup = {} # {weak: [(strong, índice do bloco)]}
+    for idx, (weak, strong) in enumerate(blocks):
+        lookup.setdefault(weak, []).append((strong, idx))
+
+    ops = []
+    literal = bytearray()
+
+    def flush_literal():
+        for start in range(0, len(literal), MAX_LITERAL_RUN):
+            chunk = literal[start:start + MAX_LITERAL_RUN]
+            ops.append(bytes([OP_LITERAL]) + struct.pack(OP_LITERAL_FORMAT, len(chunk)) + bytes(chunk))
+        literal.clear()
+
+    copy_start = None
+    copy_count = 0
+
+    def flush_copy():
+        nonlocal copy_start, copy_count
+        if copy_count:
+            ops.append(bytes([OP_COPY]) + struct.pack(OP_COPY_FORMAT, copy_start, copy_count))
+        copy_start, copy_count = None, 0
+
+    def match(weak, window):
+        candidates = lookup.get(weak)
+        if not candidates:
+            return None
+        digest = strong_hash(window)
+        for strong, idx in candidates:
+            if strong == digest and (idx < len(blocks) - 1 or len(window) == last_block_len):
+                return idx
+        return None
+
+    n = len(data)
+    pos = 0
+    window_len = min(block_size, n)
+    a = b = 0
+    rolling_valid = False
+    while pos < n:
+        if n - pos < block_size:
+            # Cauda menor que um bloco: só pode casar com o último bloco (curto) do arquivo base
+            window_len = n - pos
+            rolling_valid = False
+        if not rolling_valid:
+            weak = weak_checksum(data[pos:pos + window_len])
+            a, b = weak & 0xFFFF, weak >> 16
+            rolling_valid = True
+        idx = match(((b & 0xFFFF) << 16) | (a & 0xFFFF), data[pos:pos + window_len])
+
+        if idx is not None:
+            flush_literal()
+            if copy_count and idx == copy_start + copy_count and copy_count < MAX_COPY_RUN:
+                copy_count += 1
+            else:
+                flush_copy()
+                copy_start, copy_count = idx, 1
+            pos += window_len
+            rolling_valid = False
+            continue
+
+        flush_copy()
+        out_byte = data[pos]
+        literal.append(out_byte)
+        pos += 1
+        if pos + window_len <= n and window_len == block_size:
+            # Desliza a janela um byte: atualização O(1) do checksum rolante
+            in_byte = data[pos + window_len - 1]
+            a = (a - out_byte + in_byte) & 0xFFFF
+            b = (b - window_len * out_byte + a) & 0xFFFF
+        else:
+            rolling_valid = False
+
+    flush_copy()
+    flush_literal()
+    header = struct.pack(DELTA_HEADER_FORMAT, base_hash, hashlib.sha256(data).digest(), n, block_size)
+    return header + b''.join(ops)
+
+
+def apply_delta(base_data, delta):
+    """Reconstrói o arquivo a partir do base local e do delta. Levanta ValueError se algo não bater."""
+    if len(delta) < DELTA_HEADER_SIZE:
+        raise ValueError("Delta curto demais.")
+    base_hash, target_hash, target_size, block_size = struct.unpack_from(DELTA_HEADER_FORMAT, delta)
+    if hashlib.sha256(base_data).digest() != base_hash:
+        raise ValueError("Arquivo base do receptor mudou desde a assinatura.")
+
+    out = bytearray()
+    pos = DELTA_HEADER_SIZE
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op == OP_COPY:
+            first, count = struct.unpack_from(OP_COPY_FORMAT, delta, pos)
+            pos += struct.calcsize(OP_COPY_FORMAT)
+            out += base_data[first * block_size:(first + count) * block_size]
+        elif op == OP_LITERAL:
+            (length,) = struct.unpack_from(OP_LITERAL_FORMAT, delta, pos)
+            pos += struct.calcsize(OP_LITERAL_FORMAT)
+            out += delta[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError(f"Operação de delta desconhecida: 0x{op:02X}")
+
+    result = bytes(out)
+    if len(result) != target_size or hashlib.sha256(result).digest() != target_hash:
+        raise ValueError("Arquivo reconstruído pelo delta não confere com o hash do emissor.")
+    return result
+
+
+# --- Nomes e índice de assinaturas da pasta received_files ---
+
+def sanitize_file_name(name):
+    """Só o nome do arquivo, sem caminho e sem caracteres problemáticos."""
+    name = os.path.basename(name.replace('\\', '/')).strip()
+    name = ''.join(c for c in name if c.isprintable() and c not in '<>:"/\\|?*')
+    if name in ('', '.', '..') or name.startswith('.'):
+        name = 'arquivo' + name
+    return name[:200]
+
+
+class SignatureIndex:
+    """
+    Índice de assinaturas dos arquivos de uma pasta (received_files), em cache na subpasta .sigindex.
+    A assinatura é recalculada apenas quando o tamanho ou o mtime do arquivo mudam.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_dir = os.path.join(directory, SIGNATURE_INDEX_DIR_NAME)
+        self._lock = threading.Lock()
+
+    def path_for(self, name):
+        return os.path.join(self.directory, sanitize_file_name(name))
+
+    def get_signature(self, name):
+        """Assinatura do arquivo 'name' (com tamanho de bloco padrão), ou None se não existir."""
+        path = self.path_for(name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        index_path = os.path.join(self.index_dir, sanitize_file_name(name) + ".sig")
+        header_size = struct.calcsize(SIGNATURE_INDEX_HEADER_FORMAT)
+
+        with self._lock:
+            try:
+                with open(index_path, "rb") as f:
+                    cached = f.read()
+                size, mtime_ns = struct.unpack_from(SIGNATURE_INDEX_HEADER_FORMAT, cached)
+                if size == st.st_size and mtime_ns == st.st_mtime_ns:
+                    return cached[header_size:]
+            except (OSError, struct.error):
+                pass
+
+            with open(path, "rb") as f:
+                data = f.read()
+            signature = compute_signature(data, choose_block_size(len(data)))
+            try:
+                os.makedirs(self.index_dir, exist_ok=True)
+                with open(index_path, "wb") as f:
+                    f.write(struct.pack(SIGNATURE_INDEX_HEADER_FORMAT, st.st_size, st.st_mtime_ns) + signature)
+            except OSError:
+                pass # Sem cache, apenas recalcula na próxima vez
+            return signature
@@ -0,0 +1,289 @@
+# core/envelope.py
+
+import hashlib
+import struct
+import zlib
+
+from merkle import MERKLE_BLOCK_SIZE, HASH_SIZE, compute_leaves, merkle_root, pack_leaves, block_count
+
+# --- Envelope de mensagem (nível de mensagem, acima da fragmentação) ---
+# Toda mensagem montada pelo receptor começa com [MAGIC 3B][tipo 1B][corpo].
+# Mensagens sem o MAGIC (texto digitado na GUI, versões antigas) são tratadas como antes: dados brutos.
+ENVELOPE_MAGIC = b'\xabTC'
+ENVELOPE_HEADER_SIZE = len(ENVELOPE_MAGIC) + 1
+
+KIND_FILE = 0x01          # Arquivo completo: cabeçalho de metadados + conteúdo
+KIND_SIG_REQUEST = 0x02   # Emissor pede a assinatura da versão que o receptor tem do arquivo
+KIND_SIG_RESPONSE = 0x03  # Receptor responde com a assinatura (ou vazio se não tem o arquivo)
+KIND_DELTA = 0x04         # Arquivo enviado como delta sobre a versão do receptor (mesmo cabeçalho de metadados)
+KIND_REPAIR_REQUEST = 0x05 # Receptor pede de novo só os blocos que falharam na verificação de Merkle
+KIND_REPAIR_DATA = 0x06    # Emissor responde com os blocos pedidos
+KIND_PING = 0x07          # Teste de ida e volta PC->PC (cli.py ping); o outro lado responde com PONG
+KIND_PONG = 0x08
+KIND_ARCHIVE = 0x09       # Vários arquivos pequenos do spool numa só mensagem (mesmo cabeçalho de metadados)
+MERKLE_KINDS = (KIND_FILE, KIND_DELTA, KIND_ARCHIVE)
+CONTROL_KINDS = (KIND_SIG_REQUEST, KIND_SIG_RESPONSE, KIND_REPAIR_REQUEST, KIND_PING, KIND_PONG) # Tratados pelo TransferJobManager
+
+NAME_FORMAT = "<B"          # tamanho do nome (+ nome em UTF-8)
+REQUEST_TOKEN_FORMAT = "<H" # Associa SIG_RESPONSE ao SIG_REQUEST correspondente
+
+# --- Cabeçalho de metadados de arquivo (começa no fragmento 0, logo após o envelope) ---
+# nome (NAME_FORMAT) + tamanho original, mtime (ns), codec do corpo, sha256 do conteúdo original,
+# tamanho do corpo codificado, raiz de Merkle e tamanho de bloco da árvore.
+# Layout da mensagem: [envelope][metadados][corpo][folhas de Merkle (trailer)]
+METADATA_FORMAT = "<QQB32sI{}sH".format(HASH_SIZE)
+METADATA_SIZE = struct.calcsize(METADATA_FORMAT)
+
+CODEC_RAW = 0x00
+CODEC_ZLIB = 0x01
+CODEC_NAMES = {CODEC_RAW: 'raw', CODEC_ZLIB: 'zlib'}
+
+
+class FileMetadata:
+    """Metadados de um arquivo transferido (nome original, tamanho, mtime, codec e hash)."""
+
+    __slots__ = ('name', 'size', 'mtime_ns', 'codec', 'sha256', 'body_len', 'merkle_root', 'block_size')
+
+    def __init__(self, name, size, mtime_ns, codec, sha256, body_len=0, merkle_root=b'', block_size=MERKLE_BLOCK_SIZE):
+        self.name = name
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.codec = codec
+        self.sha256 = sha256
+        self.body_len = body_len
+        self.merkle_root = merkle_root
+        self.block_size = block_size
+
+    def pack(self):
+        return pack_name(self.name) + struct.pack(METADATA_FORMAT, self.size, self.mtime_ns, self.codec, self.sha256,
+                                                  self.body_len, self.merkle_root, self.block_size)
+
+    @classmethod
+    def unpack(cls, body):
+        """Retorna (FileMetadata, deslocamento do corpo)."""
+        name, offset = unpack_name(body)
+        if offset + METADATA_SIZE > len(body):
+            raise ValueError("Cabeçalho de metadados truncado.")
+        size, mtime_ns, codec, sha256, body_len, root, block_size = struct.unpack_from(METADATA_FORMAT, body, offset)
+        if block_size == 0:
+            raise ValueError("Tamanho de bloco de Merkle inválido.")
+        return cls(name, size, mtime_ns, codec, sha256, body_len, root, block_size), offset + METADATA_SIZE
+
+    def leaf_count(self):
+        return block_count(self.body_len, self.block_size)
+
+    def to_dict(self):
+        return {"name": self.name, "size": self.size, "mtime_ns": self.mtime_ns,
+                "codec": CODEC_NAMES.get(self.codec, self.codec), "sha256": self.sha256.hex()}
+
+
+def encode_body(data):
+    """Comprime com zlib apenas se isso diminuir o corpo. Retorna (codec, corpo)."""
+    compressed = zlib.compress(data, 9)
+    if len(compressed) < len(data):
+        return CODEC_ZLIB, compressed
+    return CODEC_RAW, data
+
+
+def decode_body(codec, body):
+    if codec == CODEC_RAW:
+        return body
+    if codec == CODEC_ZLIB:
+        try:
+            return zlib.decompress(body)
+        except zlib.error as e:
+            raise ValueError(f"Corpo zlib inválido: {e}")
+    raise ValueError(f"Codec desconhecido: 0x{codec:02X}")
+
+
+def wrap(kind, body):
+    return ENVELOPE_MAGIC + bytes([kind]) + body
+
+
+def unwrap(message):
+    """Retorna (tipo, corpo) ou (None, message) se a mensagem não tiver envelope."""
+    if len(message) >= ENVELOPE_HEADER_SIZE and message.startswith(ENVELOPE_MAGIC):
+        return message[len(ENVELOPE_MAGIC)], message[ENVELOPE_HEADER_SIZE:]
+    return None, message
+
+
+def pack_name(name):
+    name_bytes = name.encode('utf-8')[:255]
+    return struct.pack(NAME_FORMAT, len(name_bytes)) + name_bytes
+
+
+def unpack_name(body, offset=0):
+    """Retorna (nome, próximo deslocamento)."""
+    (length,) = struct.unpack_from(NAME_FORMAT, body, offset)
+    start = offset + struct.calcsize(NAME_FORMAT)
+    if start + length > len(body):
+        raise ValueError("Nome truncado no envelope.")
+    return body[start:start + length].decode('utf-8', errors='replace'), start + length
+
+
+# --- Corpos de cada tipo ---
+
+def _encode_with_metadata(kind, name, content, encoded_body, codec, mtime_ns):
+    leaves = compute_leaves(encoded_body, MERKLE_BLOCK_SIZE)
+    metadata = FileMetadata(name, len(content), mtime_ns, codec, hashlib.sha256(content).digest(),
+                            len(encoded_body), merkle_root(leaves), MERKLE_BLOCK_SIZE)
+    return wrap(kind, metadata.pack() + encoded_body + pack_leaves(leaves))
+
+
+def split_file_message(body):
+    """Separa (FileMetadata, deslocamento do corpo, corpo codificado, trailer de folhas) de uma mensagem FILE/DELTA/ARCHIVE."""
+    metadata, offset = FileMetadata.unpack(body)
+    return metadata, offset, body[offset:offset + metadata.body_len], body[offset + metadata.body_len:]
+
+
+def parse_merkle_layout(message_prefix):
+    """
+    Para o MerkleStreamVerifier: a partir do começo da mensagem, retorna (início do corpo, tamanho do corpo,
+    tamanho do bloco), None se o cabeçalho ainda não chegou inteiro, ou ValueError se não tem árvore de Merkle.
+    """
+    if len(message_prefix) < ENVELOPE_HEADER_SIZE:
+        return None
+    kind, body = unwrap(message_prefix)
+    if kind not in MERKLE_KINDS:
+        raise ValueError("Mensagem sem árvore de Merkle.")
+    try:
+        metadata, offset = FileMetadata.unpack(body)
+    except (ValueError, struct.error):
+        if len(body) >= 1 + 255 + METADATA_SIZE:
+            raise ValueError("Cabeçalho de metadados inválido.")
+        return None # Ainda faltam bytes do cabeçalho
+    return ENVELOPE_HEADER_SIZE + offset, metadata.body_len, metadata.block_size
+
+
+def encode_file(name, data, mtime_ns=0):
+    codec, encoded = encode_body(data)
+    return _encode_with_metadata(KIND_FILE, name, data, encoded, codec, mtime_ns)
+
+
+def decode_file(body):
+    """Retorna (FileMetadata, conteúdo original). Levanta ValueError se tamanho ou hash não conferirem."""
+    metadata, _, encoded_body, _ = split_file_message(body)
+    data = decode_body(metadata.codec, encoded_body)
+    if len(data) != metadata.size or hashlib.sha256(data).digest() != metadata.sha256:
+        raise ValueError(f"Conteúdo de '{metadata.name}' não confere com o cabeçalho (tamanho/hash).")
+    return metadata, data
+
+
+# --- Pacote de arquivos pequenos (spool) ---
+# Conteúdo: sequência de [nome (NAME_FORMAT)][mtime ns u64][tamanho u32][dados]. O pacote inteiro passa
+# por encode_body, então CSVs/logs parecidos comprimem juntos. No emissor ele fica gravado num arquivo
+# ARCHIVE_FILE_EXTENSION, o que permite retomá-lo pelo diário como qualquer outro arquivo.
+ARCHIVE_ENTRY_FORMAT = "<QI"
+ARCHIVE_ENTRY_SIZE = struct.calcsize(ARCHIVE_ENTRY_FORMAT)
+ARCHIVE_FILE_EXTENSION = ".tcdpack"
+
+
+def pack_archive_entry(name, data, mtime_ns=0):
+    return pack_name(name) + struct.pack(ARCHIVE_ENTRY_FORMAT, mtime_ns, len(data)) + data
+
+
+def unpack_archive(content):
+    """Gera (nome, mtime_ns, dados) para cada arquivo do pacote."""
+    pos = 0
+    while pos < len(content):
+        name, pos = unpack_name(content, pos)
+        if pos + ARCHIVE_ENTRY_SIZE > len(content):
+            raise ValueError("Entrada do pacote truncada.")
+        mtime_ns, size = struct.unpack_from(ARCHIVE_ENTRY_FORMAT, content, pos)
+        pos += ARCHIVE_ENTRY_SIZE
+        if pos + size > len(content):
+            raise ValueError(f"Dados de '{name}' truncados no pacote.")
+        yield name, mtime_ns, content[pos:pos + size]
+        pos += size
+
+
+def encode_archive(name, content, mtime_ns=0):
+    codec, encoded = encode_body(content)
+    return _encode_with_metadata(KIND_ARCHIVE, name, content, encoded, codec, mtime_ns)
+
+
+def decode_archive(body):
+    """Retorna (FileMetadata do pacote, conteúdo do pacote). Mesmas verificações de decode_file."""
+    return decode_file(body)
+
+
+def encode_sig_request(token, name):
+    return wrap(KIND_SIG_REQUEST, struct.pack(REQUEST_TOKEN_FORMAT, token) + pack_name(name))
+
+
+def decode_sig_request(body):
+    (token,) = struct.unpack_from(REQUEST_TOKEN_FORMAT, body)
+    name, _ = unpack_name(body, struct.calcsize(REQUEST_TOKEN_FORMAT))
+    return token, name
+
+
+def encode_sig_response(token, signature):
+    return wrap(KIND_SIG_RESPONSE, struct.pack(REQUEST_TOKEN_FORMAT, token) + (signature or b''))
+
+
+def decode_sig_response(body):
+    (token,) = struct.unpack_from(REQUEST_TOKEN_FORMAT, body)
+    signature = body[struct.calcsize(REQUEST_TOKEN_FORMAT):]
+    return token, signature or None
+
+
+def encode_delta(name, delta, target_data, mtime_ns=0):
+    """O cabeçalho descreve o arquivo resultante; o codec se aplica aos bytes do delta."""
+    codec, encoded = encode_body(delta)
+    return _encode_with_metadata(KIND_DELTA, name, target_data, encoded, codec, mtime_ns)
+
+
+def decode_delta(body):
+    """Retorna (FileMetadata do arquivo resultante, bytes do delta)."""
+    metadata, _, encoded_body, _ = split_file_message(body)
+    return metadata, decode_body(metadata.codec, encoded_body)
+
+
+def encode_ping(token, padding=b''):
+    return wrap(KIND_PING, struct.pack(REQUEST_TOKEN_FORMAT, token) + padding)
+
+
+def encode_pong(token):
+    return wrap(KIND_PONG, struct.pack(REQUEST_TOKEN_FORMAT, token))
+
+
+def decode_ping_token(body):
+    """Token de um PING ou PONG."""
+    return struct.unpack_from(REQUEST_TOKEN_FORMAT, body)[0]
+
+
+# --- Reparo de blocos (Merkle) ---
+# A transferência é identificada pela raiz de Merkle, que os dois lados conhecem.
+REPAIR_INDEX_FORMAT = "<H"
+REPAIR_BLOCK_FORMAT = "<HH" # índice do bloco, tamanho
+
+
+def encode_repair_request(root, block_indices):
+    return wrap(KIND_REPAIR_REQUEST, root + struct.pack(REPAIR_INDEX_FORMAT, len(block_indices))
+                + b''.join(struct.pack(REPAIR_INDEX_FORMAT, idx) for idx in block_indices))
+
+
+def decode_repair_request(body):
+    root = body[:HASH_SIZE]
+    (count,) = struct.unpack_from(REPAIR_INDEX_FORMAT, body, HASH_SIZE)
+    start = HASH_SIZE + struct.calcsize(REPAIR_INDEX_FORMAT)
+    return root, [struct.unpack_from(REPAIR_INDEX_FORMAT, body, start + 2 * i)[0] for i in range(count)]
+
+
+def encode_repair_data(root, blocks):
+    """blocks: lista de (índice, bytes do bloco)."""
+    return wrap(KIND_REPAIR_DATA, root + b''.join(struct.pack(REPAIR_BLOCK_FORMAT, idx, len(data)) + data
+                                                  for idx, data in blocks))
+
+
+def decode_repair_data(body):
+    root = body[:HASH_SIZE]
+    blocks = []
+    pos = HASH_SIZE
+    header_size = struct.calcsize(REPAIR_BLOCK_FORMAT)
+    while pos + header_size <= len(body):
+        idx, length = struct.unpack_from(REPAIR_BLOCK_FORMAT, body, pos)
+        pos += header_size
+        blocks.append((idx, body[pos:pos + length]))
+        pos += length
+    return root, blocks
@@ -0,0 +1,70 @@
+# core/gaps.py
+
+# --- Lacunas na recepção e NACK com a lista dos fragmentos faltando ---
+# O receptor acompanha os fragmentos de cada mensagem conforme chegam. Um fragmento que falta enquanto
+# outros NACK_REORDER_TOLERANCE mais novos já chegaram (ou o último da mensagem já chegou) é dado como
+# perdido e pedido num NACK cujo payload lista as faixas faltantes, (primeiro, último) em um byte cada.
+# O emissor retransmite esses fragmentos na hora, sem esperar o timeout: a perda custa um RTT. O Arduino
+# emissor reenvia os que ainda estão na janela ARQ dele e repassa ao Python só as faixas dos demais.
+# NACK com payload tem CRC sobre o cabeçalho completo + payload (como DATA); o NACK simples continua com 4 bytes.
+NACK_REORDER_TOLERANCE = 2   # Fragmentos da mesma mensagem em voo ao mesmo tempo podem chegar trocados
+NACK_LIST_MAX_RANGES = 4     # Faixas por NACK: 8 bytes de payload (DEVE SER IDÊNTICO ao NACK_LIST_MAX_BYTES do Arduino)
+
+
+def to_ranges(indices):
+    """Índices em ordem crescente -> faixas contíguas [(primeiro, último), ...]."""
+    ranges = []
+    for idx in indices:
+        if ranges and idx == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], idx)
+        else:
+            ranges.append((idx, idx))
+    return ranges
+
+
+def encode_nack_list(ranges):
+    return bytes(value for first_last in ranges for value in first_last)
+
+
+def decode_nack_list(payload):
+    """Payload de um NACK com lista -> faixas pedidas. Faixas invertidas e um byte sobrando são ignorados."""
+    return [(payload[pos], payload[pos + 1]) for pos in range(0, len(payload) - 1, 2) if payload[pos] <= payload[pos + 1]]
+
+
+def format_ranges(ranges):
+    return ", ".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+class ReceptionGaps:
+    """Fragmentos faltando de UMA mensagem em recepção e quando cada um foi pedido pela última vez."""
+
+    def __init__(self, received, total_fragments):
+        self._received = received # {fragment_idx: payload} da recepção (o mesmo dicionário, atualizado por quem recebe)
+        self.total_fragments = total_fragments
+        self.highest = -1         # Maior índice recebido AO VIVO (lacunas de uma recepção retomada não contam)
+        self.missing = set()
+        self._requested_at = {}   # {fragment_idx: time.monotonic() do último NACK}
+
+    def on_fragment(self, fragment_idx):
+        if fragment_idx in self.missing:
+            self.missing.discard(fragment_idx)
+            self._requested_at.pop(fragment_idx, None)
+        elif fragment_idx > self.highest:
+            self.missing.update(idx for idx in range(self.highest + 1, fragment_idx) if idx not in self._received)
+            self.highest = fragment_idx
+
+    def due_ranges(self, now, repeat_interval):
+        """
+        Faixas a pedir agora (no máximo NACK_LIST_MAX_RANGES, as mais antigas primeiro) e as marca como pedidas.
+        Um fragmento já pedido só volta a ser pedido depois de repeat_interval sem chegar.
+        """
+        if not self.missing:
+            return []
+        limit = self.highest if self.highest == self.total_fragments - 1 else self.highest - NACK_REORDER_TOLERANCE
+        due = sorted(idx for idx in self.missing
+                     if idx <= limit and (idx not in self._requested_at or now - self._requested_at[idx] >= repeat_interval))
+        ranges = to_ranges(due)[:NACK_LIST_MAX_RANGES]
+        for first, last in ranges:
+            for idx in range(first, last + 1):
+                self._requested_at[idx] = now
+        return ranges
@@ -1,9 +1,10 @@
 # core/gui.py
 
-print("Carregando gui.py do caminho:", __file__) # <<< Adicione esta linha
-import webview
 import os
 import json # Importar json para update_full_arduino_status_in_js
+import threading
+
+from assets_bundle import ensure_bundle
 
 class GUIController:
     def __init__(self, main_app_api_instance, log_callback=None):
@@ -15,11 +16,24 @@ class GUIController:
         self.update_frames_summary_callback = None
         self.on_sending_finished_callback = None
         self.on_file_received_callback = None
+        self.on_window_loaded_callback = None # Chamado quando a janela termina de carregar (tempo de inicialização)
+        # Logs que chegam antes da janela carregar (ex.: conexão serial em paralelo) ficam aqui até o evento 'loaded':
+        # evaluate_js antes disso bloquearia a thread que está logando
+        self._window_loaded = False
+        self._pending_logs = []
+        self._pending_logs_lock = threading.Lock()
 
     def _default_log_callback(self, message):
         print(f"[GUIController] {message}")
 
     def _on_window_ready(self):
+        with self._pending_logs_lock:
+            self._window_loaded = True
+            pending, self._pending_logs = self._pending_logs, []
+        for message in pending:
+            self.update_log_in_js(message)
+        if self.on_window_loaded_callback:
+            self.on_window_loaded_callback()
         self.log_callback("Interface carregada e pronta para comunicação JS-Python.")
         # Define os status iniciais na GUI
         if self.update_card_status_callback:
@@ -37,7 +51,13 @@ class GUIController:
             self.window.evaluate_js('requestAndUpdateAllArduinoStatus();') # Você precisará criar esta função no seu JS
 
     def create_window(self):
-        html_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gui', 'index.html')
+        import webview # Importado só aqui: carrega o backend gráfico (pythonnet/clr no Windows), que é lento
+
+        try:
+            html_file_path = ensure_bundle() # HTML único com CSS, JS e ícones embutidos
+        except OSError as e:
+            self.log_callback(f"AVISO: não foi possível gerar o pacote da interface ({e}); usando gui/index.html.")
+            html_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gui', 'index.html')
         html_url = f'file://{html_file_path}'
 
         self.window = webview.create_window(
@@ -53,6 +73,10 @@ class GUIController:
 
     def update_log_in_js(self, message):
         """Executa uma função JavaScript na interface para exibir a mensagem de log."""
+        with self._pending_logs_lock:
+            if self.window and not self._window_loaded:
+                self._pending_logs.append(message)
+                return
         if self.window:
             clean_message = message.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '')
             self.window.evaluate_js(f'logMessage("{clean_message}");')
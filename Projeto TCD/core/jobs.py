@@ -0,0 +1,730 @@
+# core/jobs.py
+
+import os
+import hashlib
+import threading
+import time
+import itertools
+from collections import deque, OrderedDict
+from functools import partial
+
+from arduino import (MAX_PACKET_PAYLOAD_SIZE, MAX_MESSAGE_SIZE, PEER_DEVICE_ID, THIS_DEVICE_ID, PACKET_TYPE_DATA,
+                     fragment_size_for, encode_packet)
+from tx_scheduler import CHANNEL_INTERACTIVE, CHANNEL_BULK
+from journal import ROLE_SEND, END_STATUS_SUCCESS, END_STATUS_DISCARDED
+from delta import compute_delta
+from pipeline import SendPipeline
+import envelope
+
+# --- Classes de prioridade das transferências ---
+# Quanto MENOR o número, MAIOR a prioridade. Mensagens de texto curtas passam na frente
+# dos fragmentos de arquivos grandes.
+PRIORITY_INTERACTIVE = 0 # Mensagens de texto digitadas na GUI
+PRIORITY_BULK = 1        # Arquivos
+PRIORITY_CLASSES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+# Canal virtual do escalonador de TX usado por cada classe de prioridade
+PRIORITY_TX_CHANNELS = {
+    PRIORITY_INTERACTIVE: CHANNEL_INTERACTIVE,
+    PRIORITY_BULK: CHANNEL_BULK,
+}
+
+# --- Estados de uma transferência ---
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_PAUSED = 'paused'
+JOB_SUCCESS = 'success'
+JOB_ERROR = 'error'
+JOB_CANCELLED = 'cancelled'
+JOB_FINAL_STATES = (JOB_SUCCESS, JOB_ERROR, JOB_CANCELLED)
+
+DEFAULT_NUM_WORKERS = 3          # Threads de envio (cada uma cuida de um fragmento por vez)
+MAX_IN_FLIGHT_PER_JOB = 2        # Fragmentos da MESMA transferência aguardando ACK ao mesmo tempo
+PIPELINE_MIN_FRAGMENTS = 4       # A partir disto os quadros são codificados à frente (SendPipeline); abaixo, na própria worker
+FINISHED_JOBS_HISTORY = 50       # Quantas transferências finalizadas manter para consulta de status
+
+# --- Transferência delta ---
+DELTA_MIN_FILE_SIZE = 512        # Abaixo disso, a troca de assinaturas custa mais do que economiza
+SIGNATURE_TIMEOUT_S = 120.0      # Sem resposta de assinatura neste tempo: envia o arquivo completo
+
+PING_TIMEOUT_S = 30.0            # Espera máxima pelo PONG do outro lado
+
+REPAIR_CACHE_SIZE = 8            # Mensagens de arquivo recentes guardadas para atender pedidos de reparo de blocos
+
+
+class TransferJob:
+    """Uma transferência (arquivo ou texto) dividida em fragmentos."""
+
+    def __init__(self, job_id, kind, name, data, priority,
+                 update_progress_callback=None, on_finished_callback=None, update_frames_summary_callback=None,
+                 fragment_size=MAX_PACKET_PAYLOAD_SIZE):
+        self.job_id = job_id
+        self.kind = kind # 'file' ou 'text'
+        self.name = name
+        self.priority = priority
+        self.set_payload(data, fragment_size)
+        self.message_id = None
+        self.negotiating = False  # True enquanto a transferência delta aguarda a assinatura do receptor
+        self.journal_pending = False # True enquanto o registro no diário é gravado (nenhum fragmento sai antes)
+        self.stale_journal_entry = None # Registro interrompido que esta transferência pode substituir
+        self.source_path = None   # Caminho absoluto do arquivo (para retomar após reinício)
+        self.file_hash = None
+        self.journal_entry = None # Registro no diário de transferências (apenas arquivos)
+        self.pipeline = None      # SendPipeline com os quadros já codificados, criado no primeiro fragmento
+        self.resumed_fragments = 0
+
+        self.status = JOB_QUEUED
+        self.message = 'Aguardando na fila.'
+        self.next_fragment = 0    # Próximo fragmento ainda não entregue a uma worker
+        self.in_flight = set()    # Fragmentos sendo enviados agora
+        self.acked_fragments = 0
+        self.acked_bytes = 0
+        self.retransmissions = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+        self.cancel_flag = threading.Event()
+        self.update_progress_callback = update_progress_callback
+        self.on_finished_callback = on_finished_callback
+        self.update_frames_summary_callback = update_frames_summary_callback
+
+    def set_payload(self, data, fragment_size=None):
+        if fragment_size is not None:
+            self.fragment_size = fragment_size
+        self.fragment_size = fragment_size_for(len(data), self.fragment_size)
+        self.payload = data
+        self.total_bytes = len(data)
+        self.segments = [data[i:i + self.fragment_size]
+                         for i in range(0, len(data), self.fragment_size)] or [b'']
+        self.total_fragments = len(self.segments)
+
+    def resegment(self, fragment_size):
+        """Refaz a fragmentação com outro tamanho. Só antes de qualquer fragmento ser confirmado."""
+        data = b''.join(self.segments)
+        if fragment_size_for(len(data), fragment_size) != self.fragment_size:
+            self.set_payload(data, fragment_size)
+
+    def has_pending_fragment(self):
+        return self.next_fragment < self.total_fragments
+
+    def is_runnable(self):
+        return (self.status in (JOB_QUEUED, JOB_RUNNING)
+                and not self.negotiating
+                and not self.journal_pending
+                and self.has_pending_fragment()
+                and len(self.in_flight) < MAX_IN_FLIGHT_PER_JOB)
+
+    def take_fragment(self):
+        idx = self.next_fragment
+        self.next_fragment += 1
+        self._skip_acked_fragments()
+        self.in_flight.add(idx)
+        return idx
+
+    def _skip_acked_fragments(self):
+        while self.journal_entry and self.next_fragment < self.total_fragments \
+                and self.journal_entry.is_acked(self.next_fragment):
+            self.next_fragment += 1
+
+    def apply_journal(self, entry):
+        """Retoma a partir do diário: fragmentos já confirmados não são reenviados."""
+        self.journal_entry = entry
+        self.message_id = entry.message_id
+        self.resegment(entry.fragment_size) # O receptor já tem fragmentos nesse tamanho
+        for idx in entry.acked_fragments():
+            self.acked_fragments += 1
+            self.acked_bytes += len(self.segments[idx])
+        self.resumed_fragments = self.acked_fragments
+        self._skip_acked_fragments()
+
+    def progress_percentage(self):
+        if self.total_bytes == 0:
+            return 100 if self.status == JOB_SUCCESS else 0
+        return int((self.acked_bytes / self.total_bytes) * 100)
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "name": self.name,
+            "priority": self.priority,
+            "status": self.status,
+            "message": self.message,
+            "message_id": self.message_id,
+            "total_fragments": self.total_fragments,
+            "fragment_size": self.fragment_size,
+            "acked_fragments": self.acked_fragments,
+            "total_bytes": self.total_bytes,
+            "acked_bytes": self.acked_bytes,
+            "retransmissions": self.retransmissions,
+            "resumed_fragments": self.resumed_fragments,
+            "progress": self.progress_percentage(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class TransferJobManager:
+    """
+    Gerencia transferências em segundo plano com um pool de threads de envio.
+
+    - Cada transferência recebe um job_id e pode ser consultada, pausada, retomada ou cancelada.
+    - O escalonamento é feito POR FRAGMENTO: a cada fragmento livre, a worker pega a transferência
+      de maior prioridade; dentro da mesma prioridade, as transferências se revezam (round-robin),
+      então vários arquivos são intercalados no link de forma justa.
+    - Uma worker fica reservada para a classe interativa, para que um texto não espere atrás
+      de todos os fragmentos de arquivo em voo.
+    """
+
+    def __init__(self, arduino_controller, num_workers=DEFAULT_NUM_WORKERS, log_callback=None):
+        self._arduino_controller = arduino_controller
+        self._journal = arduino_controller.journal
+        arduino_controller.control_message_handler = self._on_control_message
+        arduino_controller.control_message_sender = self.submit_control
+        self.num_workers = max(1, num_workers)
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+
+        self._jobs = {} # {job_id: TransferJob}
+        self._queues = {priority: deque() for priority in PRIORITY_CLASSES} # Jobs ativos por classe
+        self._finished_order = deque()
+        self._job_ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._bulk_workers_busy = 0
+        self._signature_tokens = itertools.count(int.from_bytes(os.urandom(2), 'little'))
+        self._signature_waiters = {} # {token: {'event': Event, 'signature': bytes ou None}}
+        self._ping_waiters = {} # {token: Event}
+        self._repair_cache = OrderedDict() # {raiz de Merkle: mensagem enviada}
+        self._workers = []
+        self.running = False
+
+    def _default_log_callback(self, message):
+        print(f"[TransferJobManager] {message}")
+
+    # --- Ciclo de vida do pool ---
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+        for n in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"TransferWorker-{n}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            for job in self._jobs.values():
+                job.cancel_flag.set()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=2)
+        self._workers = []
+
+    # --- Submissão ---
+
+    def submit_file(self, file_path, priority=PRIORITY_BULK, update_progress_callback=None,
+                    on_finished_callback=None, update_frames_summary_callback=None, use_delta=True):
+        """
+        Enfileira um arquivo. Se o diário tiver uma transferência incompleta do MESMO conteúdo,
+        ela é retomada com o mesmo message_id e apenas os fragmentos não confirmados são enviados.
+        Com use_delta, antes de enviar pede a assinatura da versão que o receptor já tem e,
+        se compensar, envia só o delta. Arquivos ARCHIVE_FILE_EXTENSION (pacotes do spool) vão como KIND_ARCHIVE.
+        Levanta ValueError se a mensagem codificada não couber em MAX_MESSAGE_SIZE.
+        """
+        with open(file_path, "rb") as f:
+            data = f.read()
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        name = os.path.basename(file_path)
+        is_archive = name.endswith(envelope.ARCHIVE_FILE_EXTENSION) # Pacote do spool: desempacotado no receptor
+        if is_archive:
+            payload = envelope.encode_archive(name, data, mtime_ns)
+        else:
+            payload = envelope.encode_file(name, data, mtime_ns)
+        negotiate = (use_delta and not is_archive and len(data) >= DELTA_MIN_FILE_SIZE
+                     and self._journal.find_send(hashlib.sha256(payload).digest()) is None)
+        job = self._add_job('file', name, payload, priority,
+                            update_progress_callback, on_finished_callback, update_frames_summary_callback,
+                            source_path=os.path.abspath(file_path), negotiating=negotiate)
+        if negotiate:
+            self.log_callback(f"Transferência #{job.job_id} enfileirada: arquivo '{job.name}' ({len(data)} bytes), "
+                              f"pedindo assinatura ao receptor para envio delta.")
+            threading.Thread(target=self._negotiate_delta, args=(job, data, mtime_ns), name=f"DeltaNegotiation-{job.job_id}",
+                             daemon=True).start()
+        elif job.resumed_fragments:
+            self.log_callback(f"Transferência #{job.job_id} retomada do diário: arquivo '{job.name}' "
+                              f"({job.resumed_fragments}/{job.total_fragments} fragmentos já confirmados, MsgID: {job.message_id}).")
+        else:
+            self.log_callback(f"Transferência #{job.job_id} enfileirada: arquivo '{job.name}' ({job.total_bytes} bytes, {job.total_fragments} fragmentos).")
+        return job.job_id
+
+    def resume_interrupted(self, priority=PRIORITY_BULK, update_progress_callback=None,
+                           on_finished_callback=None, update_frames_summary_callback=None):
+        """Reenfileira os envios de arquivo que ficaram incompletos no diário (ex.: app fechado no meio). Retorna os job_ids."""
+        job_ids = []
+        for entry in self._journal.active_entries(ROLE_SEND):
+            if self.has_active_source(entry.path):
+                continue # Já reenfileirado (ex.: pelo spool)
+            if not os.path.isfile(entry.path):
+                self.log_callback(f"Envio interrompido descartado: '{entry.path}' não existe mais.")
+                self._journal.finish(entry, END_STATUS_DISCARDED)
+                continue
+            try:
+                job_id = self.submit_file(entry.path, priority, update_progress_callback,
+                                          on_finished_callback, update_frames_summary_callback)
+            except OSError as e:
+                self.log_callback(f"Não foi possível retomar '{entry.path}': {e}")
+                continue
+            except ValueError as e:
+                self.log_callback(f"Envio interrompido descartado: {e}")
+                self._journal.finish(entry, END_STATUS_DISCARDED) # Nunca vai caber; não tenta a cada partida
+                continue
+            with self._cond:
+                job = self._jobs.get(job_id)
+                if job and job.negotiating:
+                    job.stale_journal_entry = entry # Decidido quando o payload (delta ou completo) for definido
+                elif job and job.journal_entry is not entry:
+                    self._journal.finish(entry, END_STATUS_DISCARDED) # Arquivo mudou: envio recomeça do zero
+            job_ids.append(job_id)
+        return job_ids
+
+    def submit_control(self, message):
+        """Envia uma mensagem de controle (assinaturas, reparo de blocos) na classe interativa."""
+        job = self._add_job('control', 'controle', message, PRIORITY_INTERACTIVE, None, None, None)
+        return job.job_id
+
+    def submit_text(self, text, priority=PRIORITY_INTERACTIVE, on_finished_callback=None):
+        job = self._add_job('text', 'texto', text.encode('utf-8'), priority, None, on_finished_callback, None)
+        self.log_callback(f"Transferência #{job.job_id} enfileirada: mensagem de texto ({job.total_bytes} bytes).")
+        return job.job_id
+
+    def _add_job(self, kind, name, data, priority, update_progress_callback, on_finished_callback,
+                 update_frames_summary_callback, source_path=None, negotiating=False):
+        if priority not in self._queues:
+            raise ValueError(f"Prioridade desconhecida: {priority}")
+        if len(data) > MAX_MESSAGE_SIZE:
+            # O índice do fragmento tem 8 bits: o envio falharia no fragmento 256, depois de ocupar o RF à toa
+            raise ValueError(f"'{name}' não cabe numa mensagem ({len(data)} bytes codificados, "
+                             f"máximo {MAX_MESSAGE_SIZE}).")
+        file_hash = hashlib.sha256(data).digest() if kind == 'file' else None
+        with self._cond:
+            job = TransferJob(next(self._job_ids), kind, name, data, priority,
+                              update_progress_callback, on_finished_callback, update_frames_summary_callback,
+                              self._arduino_controller.rf_rate.fragment_size())
+            job.source_path = source_path
+            job.file_hash = file_hash
+            job.negotiating = negotiating
+            if kind == 'file':
+                self._remember_for_repair_locked(data)
+            if negotiating:
+                job.message = 'Negociando envio delta com o receptor.'
+            elif kind == 'file':
+                self._attach_journal_entry_locked(job)
+            self._jobs[job.job_id] = job
+            self._queues[priority].append(job)
+            if job.acked_fragments == job.total_fragments:
+                # Tudo já havia sido confirmado antes da interrupção; só faltava registrar o fim
+                self._finish_job_locked(job, JOB_SUCCESS, f"Envio concluído: {job.acked_fragments} segmentos ({job.acked_bytes} bytes).")
+            self._update_queue_depth_locked()
+            self._cond.notify_all()
+        return job
+
+    def _attach_journal_entry_locked(self, job):
+        entry = self._journal.find_send(job.file_hash)
+        if entry is None:
+            return
+        if any(other.journal_entry is entry and other.status not in JOB_FINAL_STATES for other in self._jobs.values()):
+            return # Já está sendo retomada por outra transferência; esta começa do zero
+        if not self._arduino_controller.reserve_message_id(entry.message_id):
+            # O receptor associa os fragmentos ao message_id; sem ele não há como retomar
+            self._journal.finish(entry, END_STATUS_DISCARDED)
+            return
+        job.apply_journal(entry)
+
+    # --- Transferência delta ---
+
+    def _negotiate_delta(self, job, data, mtime_ns):
+        """Pede a assinatura ao receptor, calcula o delta e libera o job com o payload escolhido."""
+        token = next(self._signature_tokens) & 0xFFFF
+        waiter = {'event': threading.Event(), 'signature': None}
+        with self._cond:
+            self._signature_waiters[token] = waiter
+        self.submit_control(envelope.encode_sig_request(token, job.name))
+
+        deadline = time.monotonic() + SIGNATURE_TIMEOUT_S
+        while not waiter['event'].is_set() and not job.cancel_flag.is_set() and time.monotonic() < deadline:
+            waiter['event'].wait(timeout=0.5)
+        with self._cond:
+            self._signature_waiters.pop(token, None)
+
+        full_payload = envelope.encode_file(job.name, data, mtime_ns)
+        payload = full_payload
+        signature = waiter['signature']
+        if signature:
+            try:
+                delta_payload = envelope.encode_delta(job.name, compute_delta(signature, data), data, mtime_ns)
+                if len(delta_payload) < len(full_payload):
+                    payload = delta_payload
+            except ValueError as e:
+                self.log_callback(f"Assinatura inválida recebida para '{job.name}': {e}. Enviando arquivo completo.")
+
+        if payload is full_payload:
+            reason = "receptor sem versão anterior" if signature is None else "delta não compensa"
+            self.log_callback(f"Transferência #{job.job_id}: enviando arquivo completo ({reason}).")
+        else:
+            self.log_callback(f"Transferência #{job.job_id}: enviando delta de {len(payload)} bytes "
+                              f"em vez de {len(full_payload)} ({100 * len(payload) // len(full_payload)}%).")
+
+        with self._cond:
+            if job.status in JOB_FINAL_STATES:
+                return
+            job.set_payload(payload)
+            job.file_hash = hashlib.sha256(payload).digest()
+            self._remember_for_repair_locked(payload)
+            job.negotiating = False
+            job.message = 'Aguardando na fila.'
+            self._attach_journal_entry_locked(job)
+            if job.stale_journal_entry is not None and job.stale_journal_entry is not job.journal_entry:
+                self._journal.finish(job.stale_journal_entry, END_STATUS_DISCARDED)
+            job.stale_journal_entry = None
+            self._update_queue_depth_locked()
+            self._cond.notify_all()
+
+    def _on_control_message(self, kind, body, device_id):
+        """Chamado pela thread de escrita quando chega uma mensagem de controle (assinatura, pedido de reparo, ping)."""
+        if kind == envelope.KIND_SIG_REQUEST:
+            token, name = envelope.decode_sig_request(body)
+            # Calcular a assinatura lê o arquivo do disco: fora da thread de leitura
+            threading.Thread(target=self._answer_signature_request, args=(token, name), daemon=True).start()
+        elif kind == envelope.KIND_SIG_RESPONSE:
+            token, signature = envelope.decode_sig_response(body)
+            with self._cond:
+                waiter = self._signature_waiters.get(token)
+            if waiter:
+                waiter['signature'] = signature
+                waiter['event'].set()
+        elif kind == envelope.KIND_REPAIR_REQUEST:
+            self._answer_repair_request(body)
+        elif kind == envelope.KIND_PING:
+            self.submit_control(envelope.encode_pong(envelope.decode_ping_token(body)))
+        elif kind == envelope.KIND_PONG:
+            with self._cond:
+                event = self._ping_waiters.get(envelope.decode_ping_token(body))
+            if event:
+                event.set()
+
+    def ping(self, timeout=PING_TIMEOUT_S, padding=b''):
+        """Envia um PING ao outro PC e espera o PONG. Retorna o tempo de ida e volta em segundos ou None."""
+        token = next(self._signature_tokens) & 0xFFFF
+        event = threading.Event()
+        with self._cond:
+            self._ping_waiters[token] = event
+        start = time.monotonic()
+        try:
+            self.submit_control(envelope.encode_ping(token, padding))
+            if not event.wait(timeout):
+                return None
+            return time.monotonic() - start
+        finally:
+            with self._cond:
+                self._ping_waiters.pop(token, None)
+
+    def _answer_signature_request(self, token, name):
+        try:
+            signature = self._arduino_controller.signature_index.get_signature(name)
+        except OSError as e:
+            self.log_callback(f"Erro ao calcular assinatura de '{name}': {e}")
+            signature = None
+        self.submit_control(envelope.encode_sig_response(token, signature))
+
+    # --- Reparo de blocos (Merkle) ---
+
+    def _remember_for_repair_locked(self, payload):
+        kind, body = envelope.unwrap(payload)
+        if kind not in envelope.MERKLE_KINDS:
+            return
+        metadata, _, _, _ = envelope.split_file_message(body)
+        self._repair_cache[metadata.merkle_root] = payload
+        self._repair_cache.move_to_end(metadata.merkle_root)
+        while len(self._repair_cache) > REPAIR_CACHE_SIZE:
+            self._repair_cache.popitem(last=False)
+
+    def _answer_repair_request(self, body):
+        root, block_indices = envelope.decode_repair_request(body)
+        with self._cond:
+            payload = self._repair_cache.get(root)
+        if payload is None:
+            self.log_callback("Pedido de reparo para uma transferência que não está mais em cache; ignorado.")
+            return
+        metadata, _, encoded_body, _ = envelope.split_file_message(envelope.unwrap(payload)[1])
+        blocks = [(idx, encoded_body[idx * metadata.block_size:(idx + 1) * metadata.block_size])
+                  for idx in block_indices if idx < metadata.leaf_count()]
+        self.log_callback(f"Reparo de '{metadata.name}': reenviando {len(blocks)} bloco(s) "
+                          f"({sum(len(data) for _, data in blocks)} bytes) em vez do arquivo inteiro.")
+        self.submit_control(envelope.encode_repair_data(root, blocks))
+
+    def _update_queue_depth_locked(self):
+        """Informa ao controlador quantos fragmentos ainda faltam confirmar (dimensiona os slots TDMA)."""
+        pending = sum(job.total_fragments - job.acked_fragments
+                      for job_queue in self._queues.values() for job in job_queue)
+        self._arduino_controller.set_local_queue_depth(pending)
+
+    # --- Consulta e controle ---
+
+    def get_status(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list_jobs(self):
+        with self._cond:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def has_active_jobs(self, kind=None):
+        with self._cond:
+            return any(job.status not in JOB_FINAL_STATES and (kind is None or job.kind == kind)
+                       for job in self._jobs.values())
+
+    def has_active_source(self, file_path):
+        """Se há uma transferência não finalizada do arquivo em file_path."""
+        file_path = os.path.abspath(file_path)
+        with self._cond:
+            return any(job.status not in JOB_FINAL_STATES and job.source_path == file_path
+                       for job in self._jobs.values())
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.status in JOB_FINAL_STATES:
+                return False
+            job.cancel_flag.set()
+            if not job.in_flight:
+                # Nenhum fragmento em voo: finaliza já. Caso contrário, a worker finaliza ao retornar.
+                self._finish_job_locked(job, JOB_CANCELLED, 'Envio cancelado.')
+                self._update_queue_depth_locked()
+            self._cond.notify_all()
+        return True
+
+    def cancel_all(self, kind=None):
+        with self._cond:
+            job_ids = [job.job_id for job in self._jobs.values()
+                       if job.status not in JOB_FINAL_STATES and (kind is None or job.kind == kind)]
+        for job_id in job_ids:
+            self.cancel(job_id)
+        return len(job_ids)
+
+    def pause(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.status not in (JOB_QUEUED, JOB_RUNNING):
+                return False
+            # Fragmentos já em voo terminam normalmente; nenhum novo é entregue até resume().
+            job.status = JOB_PAUSED
+            job.message = 'Pausado.'
+        self.log_callback(f"Transferência #{job_id} pausada.")
+        return True
+
+    def resume(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.status != JOB_PAUSED:
+                return False
+            job.status = JOB_RUNNING if job.started_at else JOB_QUEUED
+            job.message = 'Retomado.'
+            self._cond.notify_all()
+        self.log_callback(f"Transferência #{job_id} retomada.")
+        return True
+
+    def retry(self, job_id):
+        """Reenvia uma transferência de arquivo que terminou com erro, a partir do último fragmento confirmado."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.kind != 'file' or job.status != JOB_ERROR or not job.source_path:
+                return None
+        return self.submit_file(job.source_path, job.priority, job.update_progress_callback,
+                                job.on_finished_callback, job.update_frames_summary_callback)
+
+    # --- Escalonamento ---
+
+    def _pick_work_locked(self):
+        """
+        Escolhe o próximo (job, fragment_idx) a enviar. Deve ser chamado com self._cond adquirido.
+        Classes de maior prioridade primeiro; round-robin entre os jobs da mesma classe.
+        """
+        for priority in PRIORITY_CLASSES:
+            if priority != PRIORITY_INTERACTIVE and self.num_workers > 1 \
+                    and self._bulk_workers_busy >= self.num_workers - 1:
+                continue # Mantém uma worker livre para mensagens interativas
+            job_queue = self._queues[priority]
+            for _ in range(len(job_queue)):
+                job = job_queue[0]
+                job_queue.rotate(-1) # O próximo pedido começa pelo job seguinte (revezamento justo)
+                if job.is_runnable():
+                    return job, job.take_fragment()
+        return None, None
+
+    def _worker_loop(self):
+        profiler = self._arduino_controller.profiler
+        while True:
+            if profiler.hooked:
+                profiler.checkpoint()
+            started = False
+            begin_journal = False
+            with self._cond:
+                job, fragment_idx = None, None
+                while self.running:
+                    job, fragment_idx = self._pick_work_locked()
+                    if job:
+                        break
+                    self._cond.wait(timeout=0.5)
+                if not self.running:
+                    return
+                if job.message_id is None:
+                    # Primeiro fragmento desta transferência: adota o tamanho de fragmento atual do enlace RF
+                    job.resegment(self._arduino_controller.rf_rate.fragment_size())
+                    job.message_id = self._arduino_controller.allocate_message_id()
+                    if job.kind == 'file':
+                        job.journal_pending = True
+                        begin_journal = True
+                if job.priority != PRIORITY_INTERACTIVE:
+                    self._bulk_workers_busy += 1
+
+            if begin_journal and not self._begin_journal(job):
+                self._on_fragment_done(job, fragment_idx, {"status": "cancelled", "message": "Envio cancelado.",
+                                                           "attempts": 0})
+                continue
+
+            with self._cond:
+                if job.started_at is None:
+                    job.started_at = time.time()
+                    job.status = JOB_RUNNING
+                    job.message = 'Enviando.'
+                    self.log_callback(f"Transferência #{job.job_id} iniciada. MsgID: {job.message_id}")
+                    started = True
+                if job.pipeline is None and job.total_fragments >= PIPELINE_MIN_FRAGMENTS:
+                    self._start_pipeline_locked(job, fragment_idx)
+            if started and profiler.trace_memory:
+                profiler.mark(f"transfer_{job.job_id}_start") # Fora do lock: a foto do tracemalloc é lenta
+
+            try:
+                frame = job.pipeline.get_frame(fragment_idx) if job.pipeline else None
+                result = self._arduino_controller.send_fragment_with_arq(
+                    job.message_id, fragment_idx, job.total_fragments, job.segments[fragment_idx], job.cancel_flag,
+                    PRIORITY_TX_CHANNELS[job.priority], frame.data if frame else None
+                )
+            except Exception as e:
+                result = {"status": "error", "message": f"Erro inesperado: {e}", "attempts": 0}
+
+            self._on_fragment_done(job, fragment_idx, result)
+
+    def _begin_journal(self, job):
+        """
+        Grava o início do envio no diário (com fsync) fora do lock: submissões, consultas e as outras
+        workers não esperam o disco. Retorna False se a transferência terminou (cancelada) nesse meio-tempo.
+        """
+        try:
+            entry = self._journal.begin(ROLE_SEND, job.message_id, PEER_DEVICE_ID, job.total_fragments,
+                                        job.fragment_size, job.file_hash, job.source_path or job.name)
+        except OSError as e:
+            entry, error = None, e
+        with self._cond:
+            job.journal_pending = False
+            self._cond.notify_all()
+            if entry is None:
+                if job.status not in JOB_FINAL_STATES:
+                    job.cancel_flag.set()
+                    self._finish_job_locked(job, JOB_ERROR, f"Erro ao gravar o diário de transferências: {error}")
+                return False
+            if job.status not in JOB_FINAL_STATES:
+                job.journal_entry = entry
+                return True
+        if job.status == JOB_CANCELLED and self.running:
+            self._journal.finish(entry, END_STATUS_DISCARDED)
+        return False
+
+    def _start_pipeline_locked(self, job, first_fragment):
+        """Codifica os quadros dos fragmentos ainda não confirmados à frente das workers."""
+        pending = [idx for idx in range(first_fragment, job.total_fragments)
+                   if not (job.journal_entry and job.journal_entry.is_acked(idx))]
+        fragment_size = job.fragment_size
+        job.pipeline = SendPipeline(job.payload, partial(encode_packet, PACKET_TYPE_DATA, THIS_DEVICE_ID, job.message_id),
+                                    lambda total_bytes: fragment_size, fragment_indices=pending,
+                                    name=f"Transfer-{job.job_id}").start()
+
+    def _on_fragment_done(self, job, fragment_idx, result):
+        callbacks = []
+        was_final = job.status in JOB_FINAL_STATES
+        with self._cond:
+            if job.priority != PRIORITY_INTERACTIVE:
+                self._bulk_workers_busy -= 1
+            job.in_flight.discard(fragment_idx)
+            job.retransmissions += max(0, result.get("attempts", 1) - 1)
+
+            if job.status in JOB_FINAL_STATES:
+                pass # Já finalizado por outra worker (erro) ou por cancelamento
+            elif result["status"] == "success":
+                if job.journal_entry:
+                    self._journal.mark_fragment(job.journal_entry, fragment_idx, len(job.segments[fragment_idx]))
+                job.acked_fragments += 1
+                job.acked_bytes += len(job.segments[fragment_idx])
+                if job.update_progress_callback:
+                    callbacks.append((job.update_progress_callback, (job.progress_percentage(),)))
+                if job.update_frames_summary_callback:
+                    callbacks.append((job.update_frames_summary_callback, (job.acked_fragments, job.acked_bytes)))
+                if job.acked_fragments == job.total_fragments:
+                    self._finish_job_locked(job, JOB_SUCCESS,
+                                            f"Envio concluído: {job.acked_fragments} segmentos ({job.acked_bytes} bytes).")
+            elif result["status"] == "cancelled" or job.cancel_flag.is_set():
+                if not job.in_flight:
+                    self._finish_job_locked(job, JOB_CANCELLED, 'Envio cancelado.')
+            else:
+                job.cancel_flag.set() # Interrompe os outros fragmentos em voo desta transferência
+                self._finish_job_locked(job, JOB_ERROR, f"Erro ao enviar segmento {fragment_idx}: {result['message']}")
+            self._update_queue_depth_locked()
+            self._cond.notify_all()
+
+        profiler = self._arduino_controller.profiler
+        if profiler.trace_memory and not was_final and job.status in JOB_FINAL_STATES:
+            profiler.mark(f"transfer_{job.job_id}_{job.status}")
+
+        for callback, args in callbacks:
+            try:
+                callback(*args)
+            except Exception as e:
+                self.log_callback(f"Erro no callback de progresso da transferência #{job.job_id}: {e}")
+
+    def _finish_job_locked(self, job, status, message):
+        job.status = status
+        job.message = message
+        job.finished_at = time.time()
+        if job in self._queues[job.priority]:
+            self._queues[job.priority].remove(job)
+        if job.pipeline is not None:
+            job.pipeline.close()
+        if job.message_id is not None:
+            self._arduino_controller.release_message_id(job.message_id)
+        if job.journal_entry:
+            # Erro (ex.: limite de retransmissões) ou encerramento do app mantêm o registro para retomar depois;
+            # só o cancelamento explícito pelo usuário descarta o progresso
+            if status == JOB_SUCCESS:
+                self._journal.finish(job.journal_entry, END_STATUS_SUCCESS)
+            elif status == JOB_CANCELLED and self.running:
+                self._journal.finish(job.journal_entry, END_STATUS_DISCARDED)
+
+        self._finished_order.append(job.job_id)
+        while len(self._finished_order) > FINISHED_JOBS_HISTORY:
+            self._jobs.pop(self._finished_order.popleft(), None)
+
+        self.log_callback(f"Transferência #{job.job_id} finalizada ({status}): {message}")
+        if job.on_finished_callback:
+            # Executa fora da thread atual para não segurar o lock durante chamadas à GUI
+            threading.Thread(target=self._run_finished_callback, args=(job, status, message), daemon=True).start()
+
+    def _run_finished_callback(self, job, status, message):
+        try:
+            job.on_finished_callback(status, message)
+        except Exception as e:
+            self.log_callback(f"Erro no callback de término da transferência #{job.job_id}: {e}")
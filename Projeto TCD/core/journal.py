@@ -0,0 +1,244 @@
+# core/journal.py
+
+import os
+import struct
+import threading
+import zlib
+
+# --- Formato do diário (journal) de transferências ---
+# Arquivo append-only. Cada registro é: [tamanho u16][crc32 u32][corpo]
+# Um registro incompleto ou corrompido no fim (queda de energia, app fechado no meio da escrita)
+# é descartado na leitura e o arquivo é truncado nesse ponto.
+RECORD_HEADER_FORMAT = "<HI"
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+
+REC_BEGIN = 0x01     # Nova transferência (metadados)
+REC_FRAGMENT = 0x02  # Um fragmento confirmado (envio: ACK recebido; recepção: fragmento gravado no .part)
+REC_END = 0x03       # Transferência finalizada (sucesso ou descartada)
+REC_BITMAP = 0x04    # Bitmap completo de fragmentos (usado na compactação)
+
+ROLE_SEND = 0x01
+ROLE_RECV = 0x02
+
+TRANSFER_ID_SIZE = 16
+FILE_HASH_SIZE = 32 # sha256
+
+# corpo do BEGIN: tipo, transfer_id, papel, message_id, device_id do outro lado, total_fragments,
+# tamanho do fragmento, hash do arquivo, tamanho do caminho (+ caminho em UTF-8)
+BEGIN_FORMAT = "<B16sBBBHB32sH"
+FRAGMENT_FORMAT = "<B16sHB"  # tipo, transfer_id, fragment_idx, tamanho do payload desse fragmento
+END_FORMAT = "<B16sB"        # tipo, transfer_id, status (0 = sucesso, 1 = descartada)
+BITMAP_HEADER_FORMAT = "<B16sB"  # tipo, transfer_id, tamanho do último fragmento (+ bitmap)
+
+END_STATUS_SUCCESS = 0
+END_STATUS_DISCARDED = 1
+
+DEFAULT_FSYNC_EVERY = 32 # fsync a cada N registros de fragmento (BEGIN/END sempre fazem fsync)
+
+
+class JournalEntry:
+    """Estado reconstruído de uma transferência a partir do diário."""
+
+    def __init__(self, transfer_id, role, message_id, peer_device_id, total_fragments, fragment_size, file_hash, path):
+        self.transfer_id = transfer_id
+        self.role = role
+        self.message_id = message_id
+        self.peer_device_id = peer_device_id
+        self.total_fragments = total_fragments
+        self.fragment_size = fragment_size
+        self.file_hash = file_hash
+        self.path = path
+        self.bitmap = bytearray((total_fragments + 7) // 8)
+        self.acked_count = 0
+        self.last_fragment_len = None # Tamanho do último fragmento (o único que pode ser menor)
+        self.finished = False
+
+    def is_acked(self, fragment_idx):
+        return bool(self.bitmap[fragment_idx >> 3] & (1 << (fragment_idx & 7)))
+
+    def _set_acked(self, fragment_idx, length):
+        if fragment_idx >= self.total_fragments:
+            return
+        if not self.is_acked(fragment_idx):
+            self.bitmap[fragment_idx >> 3] |= 1 << (fragment_idx & 7)
+            self.acked_count += 1
+        if fragment_idx == self.total_fragments - 1:
+            self.last_fragment_len = length
+
+    def fragment_length(self, fragment_idx):
+        if fragment_idx == self.total_fragments - 1 and self.last_fragment_len is not None:
+            return self.last_fragment_len
+        return self.fragment_size
+
+    def acked_fragments(self):
+        return [i for i in range(self.total_fragments) if self.is_acked(i)]
+
+
+class TransferJournal:
+    """
+    Diário append-only das transferências (envio e recepção) para retomar após queda do link ou reinício.
+
+    Guarda por transferência: transfer_id, hash do arquivo e o bitmap dos fragmentos já confirmados.
+    Na abertura, o diário é relido, a cauda corrompida descartada e o arquivo compactado
+    (apenas transferências não finalizadas, cada uma com um único registro de bitmap).
+    """
+
+    def __init__(self, path, fsync_every=DEFAULT_FSYNC_EVERY, log_callback=None):
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self._lock = threading.Lock()
+        self._entries = {} # {transfer_id: JournalEntry} (apenas não finalizadas)
+        self._unsynced_records = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._compact()
+        self._file = open(self.path, "ab")
+
+    def _default_log_callback(self, message):
+        print(f"[TransferJournal] {message}")
+
+    # --- Leitura / compactação ---
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        pos = 0
+        while pos + RECORD_HEADER_SIZE <= len(data):
+            length, crc = struct.unpack_from(RECORD_HEADER_FORMAT, data, pos)
+            body = data[pos + RECORD_HEADER_SIZE:pos + RECORD_HEADER_SIZE + length]
+            if len(body) < length or zlib.crc32(body) != crc:
+                break
+            self._apply(body)
+            pos += RECORD_HEADER_SIZE + length
+
+        if pos < len(data):
+            self.log_callback(f"Diário de transferências: {len(data) - pos} bytes finais inválidos descartados.")
+
+    def _apply(self, body):
+        record_type = body[0]
+        if record_type == REC_BEGIN:
+            (_, transfer_id, role, message_id, peer_device_id, total_fragments, fragment_size,
+             file_hash, path_len) = struct.unpack_from(BEGIN_FORMAT, body)
+            path_start = struct.calcsize(BEGIN_FORMAT)
+            path = body[path_start:path_start + path_len].decode('utf-8', errors='replace')
+            self._entries[transfer_id] = JournalEntry(transfer_id, role, message_id, peer_device_id,
+                                                      total_fragments, fragment_size, file_hash, path)
+        elif record_type == REC_FRAGMENT:
+            _, transfer_id, fragment_idx, length = struct.unpack_from(FRAGMENT_FORMAT, body)
+            entry = self._entries.get(transfer_id)
+            if entry:
+                entry._set_acked(fragment_idx, length)
+        elif record_type == REC_BITMAP:
+            _, transfer_id, last_len = struct.unpack_from(BITMAP_HEADER_FORMAT, body)
+            entry = self._entries.get(transfer_id)
+            if entry:
+                bitmap = body[struct.calcsize(BITMAP_HEADER_FORMAT):]
+                entry.bitmap = bytearray(bitmap[:len(entry.bitmap)].ljust(len(entry.bitmap), b'\0'))
+                entry.acked_count = sum(bin(b).count('1') for b in entry.bitmap)
+                entry.last_fragment_len = last_len if entry.is_acked(entry.total_fragments - 1) else None
+        elif record_type == REC_END:
+            _, transfer_id, _status = struct.unpack_from(END_FORMAT, body)
+            self._entries.pop(transfer_id, None)
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for entry in self._entries.values():
+                f.write(self._frame(self._begin_body(entry)))
+                last_len = entry.last_fragment_len if entry.last_fragment_len is not None else 0
+                f.write(self._frame(struct.pack(BITMAP_HEADER_FORMAT, REC_BITMAP, entry.transfer_id, last_len)
+                                    + bytes(entry.bitmap)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    # --- Escrita ---
+
+    @staticmethod
+    def _frame(body):
+        return struct.pack(RECORD_HEADER_FORMAT, len(body), zlib.crc32(body)) + body
+
+    @staticmethod
+    def _begin_body(entry):
+        path_bytes = entry.path.encode('utf-8')[:0xFFFF]
+        return struct.pack(BEGIN_FORMAT, REC_BEGIN, entry.transfer_id, entry.role, entry.message_id,
+                           entry.peer_device_id, entry.total_fragments, entry.fragment_size,
+                           entry.file_hash, len(path_bytes)) + path_bytes
+
+    def _append_locked(self, body, force_sync, before_sync=None):
+        self._file.write(self._frame(body))
+        self._file.flush()
+        self._unsynced_records += 1
+        if force_sync or self._unsynced_records >= self.fsync_every:
+            if before_sync:
+                before_sync() # Ex.: fsync do arquivo .part, para o diário nunca apontar dados que não estão no disco
+            os.fsync(self._file.fileno())
+            self._unsynced_records = 0
+
+    def begin(self, role, message_id, peer_device_id, total_fragments, fragment_size, file_hash, path):
+        entry = JournalEntry(os.urandom(TRANSFER_ID_SIZE), role, message_id, peer_device_id,
+                             total_fragments, fragment_size, file_hash.ljust(FILE_HASH_SIZE, b'\0')[:FILE_HASH_SIZE], path)
+        with self._lock:
+            self._entries[entry.transfer_id] = entry
+            self._append_locked(self._begin_body(entry), force_sync=True)
+        return entry
+
+    def mark_fragment(self, entry, fragment_idx, length, before_sync=None):
+        with self._lock:
+            if entry.finished or entry.is_acked(fragment_idx):
+                return
+            entry._set_acked(fragment_idx, length)
+            self._append_locked(struct.pack(FRAGMENT_FORMAT, REC_FRAGMENT, entry.transfer_id, fragment_idx, length),
+                                force_sync=False, before_sync=before_sync)
+
+    def finish(self, entry, status=END_STATUS_SUCCESS):
+        with self._lock:
+            if entry.finished:
+                return
+            entry.finished = True
+            self._entries.pop(entry.transfer_id, None)
+            self._append_locked(struct.pack(END_FORMAT, REC_END, entry.transfer_id, status), force_sync=True)
+
+    def sync(self):
+        """Força a gravação em disco dos registros pendentes (ex.: ao desconectar)."""
+        with self._lock:
+            if self._file and not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._unsynced_records = 0
+
+    def close(self):
+        with self._lock:
+            if self._file and not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    # --- Consultas ---
+
+    def find_send(self, file_hash):
+        """Transferência de envio não finalizada do mesmo arquivo (mesmo hash). A retomada usa a fragmentação dela."""
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.role == ROLE_SEND and entry.file_hash == file_hash:
+                    return entry
+        return None
+
+    def find_recv(self, peer_device_id, message_id, total_fragments, fragment_size):
+        with self._lock:
+            for entry in self._entries.values():
+                if (entry.role == ROLE_RECV and entry.peer_device_id == peer_device_id
+                        and entry.message_id == message_id and entry.total_fragments == total_fragments
+                        and entry.fragment_size == fragment_size):
+                    return entry
+        return None
+
+    def active_entries(self, role=None):
+        with self._lock:
+            return [entry for entry in self._entries.values() if role is None or entry.role == role]
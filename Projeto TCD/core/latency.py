@@ -0,0 +1,101 @@
+# core/latency.py
+
+from array import array
+
+# --- Latência do caminho de recepção (DATA recebido -> ACK escrito na serial) ---
+# O RTT do outro lado inclui o tempo que ESTE PC leva para transformar um DATA em ACK. Cada fragmento que
+# gera ACK ganha um registro com o instante (time.perf_counter_ns) em que terminou cada etapa:
+#   read      leitura da porta devolveu os bytes do quadro (_serial_read_thread)
+#   crc       quadro desempacotado e CRC conferido
+#   log_rx    log "Pacote RF recebido"
+#   state     dicionários de recepção atualizados e gravação entregue à thread de disco
+#   log_frag  log do fragmento recebido (no último fragmento: remontagem e log do arquivo completo)
+#   encode    ACK codificado (send_ack -> _send_packet_to_arduino)
+#   queue     ACK entregue ao escalonador de TX
+#   write     serial.write do lote com o ACK retornou (thread do escalonador)
+# Os registros ficam num array('q') pré-alocado usado como anel: a thread de leitura é a única que cria
+# registros e a do escalonador só preenche o "write" do registro que lhe foi entregue. Nenhum lock no
+# caminho quente; quem lê o resumo copia o array e descarta registros incompletos ou inconsistentes.
+RX_LATENCY_STAGES = ("read", "crc", "log_rx", "state", "log_frag", "encode", "queue", "write")
+STAGE_ENCODE = RX_LATENCY_STAGES.index("encode")
+STAGE_QUEUE = RX_LATENCY_STAGES.index("queue")
+STAGE_WRITE = RX_LATENCY_STAGES.index("write")
+
+DEFAULT_CAPACITY = 4096          # Registros mantidos (os mais antigos são sobrescritos)
+ACK_TURNAROUND_TARGET_US = 1000  # Meta: do quadro lido até o ACK escrito em menos de 1 ms
+PERCENTILES = (50, 90, 99)
+
+_RECORD_WIDTH = 1 + len(RX_LATENCY_STAGES) # Número de sequência + um instante por etapa
+
+
+def _percentile(sorted_values, percentile):
+    """Percentil pelo posto mais próximo (sorted_values não vazio)."""
+    rank = max(1, -(-len(sorted_values) * percentile // 100))
+    return sorted_values[rank - 1]
+
+
+def _describe(values_ns):
+    values_ns.sort()
+    summary = {f"p{p}_us": round(_percentile(values_ns, p) / 1000, 1) for p in PERCENTILES}
+    summary["max_us"] = round(values_ns[-1] / 1000, 1)
+    return summary
+
+
+class ReceiveLatencyTracer:
+    """Anel de registros de latência por etapa, do DATA lido da serial ao ACK escrito."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = max(1, capacity)
+        self._records = array('q', bytes(8 * _RECORD_WIDTH * self.capacity))
+        self._next_seq = 1 # Só a thread de leitura avança
+
+    def begin(self, *timestamps_ns):
+        """
+        Abre um registro com os instantes das primeiras etapas (na ordem de RX_LATENCY_STAGES).
+        Chamado apenas pela thread de leitura. Retorna o número de sequência usado nas etapas seguintes.
+        """
+        seq = self._next_seq
+        self._next_seq = seq + 1
+        base = (seq % self.capacity) * _RECORD_WIDTH
+        records = self._records
+        records[base] = 0 # Inválido enquanto é preenchido
+        for stage in range(len(RX_LATENCY_STAGES)):
+            records[base + 1 + stage] = timestamps_ns[stage] if stage < len(timestamps_ns) else 0
+        records[base] = seq
+        return seq
+
+    def mark(self, seq, stage, timestamp_ns):
+        """Instante de uma etapa posterior. Ignorado se o registro já foi reaproveitado pelo anel."""
+        base = (seq % self.capacity) * _RECORD_WIDTH
+        if self._records[base] == seq:
+            self._records[base + 1 + stage] = timestamp_ns
+
+    def reset(self):
+        self._records = array('q', bytes(8 * _RECORD_WIDTH * self.capacity))
+
+    def get_summary(self):
+        """
+        Percentis (em µs) do tempo gasto em cada etapa (desde a anterior) e do total leitura -> escrita,
+        e a fração de ACKs escritos dentro de ACK_TURNAROUND_TARGET_US.
+        """
+        records = array('q', self._records) # Cópia: as threads continuam escrevendo no original
+        per_stage = [[] for _ in RX_LATENCY_STAGES[1:]]
+        totals = []
+        for base in range(0, len(records), _RECORD_WIDTH):
+            if records[base] == 0:
+                continue
+            timestamps = records[base + 1:base + _RECORD_WIDTH]
+            if 0 in timestamps or any(later < earlier for earlier, later in zip(timestamps, timestamps[1:])):
+                continue # Ainda sem ACK escrito, ou sobrescrito no meio da leitura
+            for stage in range(1, len(timestamps)):
+                per_stage[stage - 1].append(timestamps[stage] - timestamps[stage - 1])
+            totals.append(timestamps[-1] - timestamps[0])
+
+        summary = {"samples": len(totals), "target_us": ACK_TURNAROUND_TARGET_US}
+        if not totals:
+            return summary
+        within_target = sum(1 for total in totals if total <= ACK_TURNAROUND_TARGET_US * 1000)
+        summary["stages"] = {name: _describe(values) for name, values in zip(RX_LATENCY_STAGES[1:], per_stage)}
+        summary["total"] = _describe(totals)
+        summary["within_target"] = round(within_target / len(totals), 4)
+        return summary
@@ -5,16 +5,74 @@ import os
 import threading
 import time
 
+_STARTUP_T0 = time.perf_counter() # Referência para medir o tempo até a janela ficar utilizável
+
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-import webview
+# O webview (e o pythonnet/clr no Windows) é importado só no ponto de criar a janela, em paralelo com a conexão serial
 from arduino import ArduinoController
 from gui import GUIController
+from jobs import TransferJobManager, PRIORITY_BULK
+from spool import OutboxSpool
+from telemetry import TELEMETRY_BINARY
+from metrics import DEFAULT_HTTP_PORT
 
 # --- Configurações Gerais da Aplicação ---
 SERIAL_PORT = 'COM3' # Substitua pelo seu porta serial
 # No Linux, pode ser algo como '/dev/ttyUSB0' ou '/dev/ttyACM0'
-BAUD_RATE = 9600
+BAUD_RATE = 9600 # Taxa do boot do firmware; depois do primeiro status é negociada uma maior (serial_link.py)
+SERIAL_RETRY_DELAY_S = 5.0 # Porta indisponível na partida (Arduino desconectado, porta ocupada): tenta de novo
+NEGOTIATE_BAUD_RATE = True
+ADAPT_RF_BITRATE = True # Taxa do rádio e tamanho de fragmento ajustados à perda do enlace (rf_rate.py)
+BINARY_TELEMETRY = True # Firmware troca o texto de debug por quadros de telemetria binários (telemetry.py)
+METRICS_HTTP_PORT = None # Ex.: 9464 para servir as métricas em http://127.0.0.1:9464/metrics (metrics.py)
+
+
+class StartupTimer:
+    """Instantes da inicialização (ms desde o início do main.py), para medir o tempo até a janela utilizável."""
+
+    def __init__(self, t0):
+        self.t0 = t0
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        elapsed_ms = round((time.perf_counter() - self.t0) * 1000, 1)
+        with self._lock:
+            self._marks.setdefault(name, elapsed_ms)
+        return elapsed_ms
+
+    def report(self):
+        with self._lock:
+            return dict(sorted(self._marks.items(), key=lambda item: item[1]))
+
+
+def connect_in_background(arduino_controller, startup_timer, log_callback, on_connected=None,
+                          retry_delay_s=SERIAL_RETRY_DELAY_S):
+    """
+    Abre a serial e espera o primeiro status do firmware enquanto a janela é criada na thread principal.
+    Se a porta não abrir, avisa e tenta de novo a cada retry_delay_s até conseguir.
+    on_connected é chamado depois do handshake (ex.: retomar envios interrompidos, que precisam da serial).
+    """
+    while not arduino_controller.connect():
+        startup_timer.mark("serial_failed")
+        log_callback(f"ERRO: não foi possível abrir a porta serial {arduino_controller.serial_port}; "
+                     f"nova tentativa em {retry_delay_s:.0f} s.")
+        time.sleep(retry_delay_s)
+    startup_timer.mark("serial_open")
+    if arduino_controller.wait_for_first_status():
+        log_callback(f"Arduino pronto (primeiro status) em {startup_timer.mark('arduino_ready')} ms desde o início.")
+        if BINARY_TELEMETRY:
+            # Antes da negociação: texto de debug no meio dos quadros atrapalha o teste da taxa nova
+            arduino_controller.set_telemetry_mode(TELEMETRY_BINARY)
+        if NEGOTIATE_BAUD_RATE:
+            arduino_controller.negotiate_baud_rate()
+            startup_timer.mark("baud_negotiated")
+    else:
+        startup_timer.mark("arduino_status_timeout")
+        log_callback("AVISO: o Arduino não enviou status após a conexão; seguindo mesmo assim.")
+    if on_connected:
+        on_connected()
 
 
 class MainApplicationAPI:
@@ -27,9 +85,14 @@ class MainApplicationAPI:
         self._update_frames_summary_to_gui = None
         self._on_sending_finished_to_gui = None
 
-        self.cancel_flag = threading.Event()
-
         self._backend_start_time = time.time()
+        self.startup_timer = None
+
+        # Transferências rodam em segundo plano: a thread da ponte JS nunca fica presa no envio
+        self._job_manager = TransferJobManager(self._arduino_controller, log_callback=self.log_message)
+        self._job_manager.start()
+        # Pasta outbox/ vigiada: o que for colocado lá é enviado sem passar pela GUI
+        self._outbox_spool = OutboxSpool(self._job_manager, log_callback=self.log_message)
 
     def log_message(self, message):
         # Imprime no console para depuração, independentemente de ser filtrado na GUI
@@ -63,7 +126,12 @@ class MainApplicationAPI:
 
     def send_text_message(self, message):
         self.log_message(f"GUI solicitou envio de texto: '{message}'")
-        return self._arduino_controller.send_text_message(message)
+        try:
+            job_id = self._job_manager.submit_text(message)
+        except ValueError as e:
+            self.log_message(f"Erro: {e}")
+            return {"status": "error", "message": str(e)}
+        return {"status": "success", "message": "Mensagem de texto enfileirada.", "job_id": job_id}
 
     def open_file_dialog(self):
         webview_window = self._get_webview_window()
@@ -79,16 +147,152 @@ class MainApplicationAPI:
             self.log_message("Erro: ArduinoController não inicializado.")
             return {"status": "error", "message": "ArduinoController não inicializado."}
 
-        self.cancel_flag.clear()
+        try:
+            job_id = self._job_manager.submit_file(
+                file_path, PRIORITY_BULK, self._update_progress_to_gui, self._on_sending_finished_to_gui, self._update_frames_summary_to_gui
+            )
+        except OSError as e:
+            self.log_message(f"Erro ao ler arquivo: {e}")
+            return {"status": "error", "message": f"Erro ao ler arquivo: {e}"}
+        except ValueError as e:
+            self.log_message(f"Erro: {e}")
+            return {"status": "error", "message": str(e)}
 
-        return self._arduino_controller.send_file(
-            file_path, self.cancel_flag, self._update_progress_to_gui, self._on_sending_finished_to_gui, self._update_frames_summary_to_gui
-        )
+        return {"status": "success", "message": "Envio de arquivo iniciado em segundo plano.", "job_id": job_id}
 
     def cancel_file_send(self):
         self.log_message("Solicitação de cancelamento de envio recebida do GUI.")
-        self.cancel_flag.set()
-        return {"status": "success", "message": "Sinal de cancelamento enviado."}
+        cancelled = self._job_manager.cancel_all(kind='file')
+        return {"status": "success", "message": f"Sinal de cancelamento enviado ({cancelled} transferência(s))."}
+
+    # --- API de transferências em segundo plano ---
+
+    def get_transfer_status(self, job_id):
+        status = self._job_manager.get_status(job_id)
+        if status is None:
+            return {"status": "error", "message": f"Transferência #{job_id} não encontrada."}
+        return status
+
+    def list_transfers(self):
+        return self._job_manager.list_jobs()
+
+    def cancel_transfer(self, job_id):
+        if self._job_manager.cancel(job_id):
+            return {"status": "success", "message": f"Transferência #{job_id} cancelada."}
+        return {"status": "error", "message": f"Transferência #{job_id} não pode ser cancelada."}
+
+    def pause_transfer(self, job_id):
+        if self._job_manager.pause(job_id):
+            return {"status": "success", "message": f"Transferência #{job_id} pausada."}
+        return {"status": "error", "message": f"Transferência #{job_id} não pode ser pausada."}
+
+    def resume_transfer(self, job_id):
+        if self._job_manager.resume(job_id):
+            return {"status": "success", "message": f"Transferência #{job_id} retomada."}
+        return {"status": "error", "message": f"Transferência #{job_id} não pode ser retomada."}
+
+    def retry_transfer(self, job_id):
+        try:
+            new_job_id = self._job_manager.retry(job_id)
+        except (OSError, ValueError) as e: # Arquivo sumiu ou cresceu além de uma mensagem desde o envio
+            return {"status": "error", "message": f"Transferência #{job_id} não pode ser reenviada: {e}"}
+        if new_job_id is None:
+            return {"status": "error", "message": f"Transferência #{job_id} não pode ser reenviada."}
+        return {"status": "success", "message": f"Transferência #{job_id} reenviada como #{new_job_id}.", "job_id": new_job_id}
+
+    def resume_interrupted_transfers(self):
+        """Retoma os envios de arquivo que ficaram incompletos na última execução (diário em disco)."""
+        job_ids = self._job_manager.resume_interrupted(
+            PRIORITY_BULK, self._update_progress_to_gui, self._on_sending_finished_to_gui, self._update_frames_summary_to_gui
+        )
+        if job_ids:
+            self.log_message(f"{len(job_ids)} envio(s) interrompido(s) retomado(s) do diário.")
+        return job_ids
+
+    def start_background_transfers(self):
+        """Depois da conexão: spool de saída primeiro (ele retoma os próprios envios), depois o diário."""
+        self._outbox_spool.start()
+        self.resume_interrupted_transfers()
+
+    def get_outbox_status(self):
+        return self._outbox_spool.get_status()
+
+    def start_serial_capture(self, path=None):
+        """Grava todo o tráfego da porta serial num trace binário (reproduzível com capture.replay_trace)."""
+        path = self._arduino_controller.start_capture(path)
+        return {"status": "success", "message": f"Capturando tráfego serial em '{path}'.", "path": path}
+
+    def stop_serial_capture(self):
+        stats = self._arduino_controller.stop_capture()
+        if stats is None:
+            return {"status": "error", "message": "Nenhuma captura em andamento."}
+        return {"status": "success", "message": f"Captura salva em '{stats['path']}'.", "stats": stats}
+
+    def start_profiling(self, mode="sampling", trace_memory=False):
+        """Liga o perfil das threads do controller ('sampling' ou 'cprofile'); trace_memory marca o tracemalloc por transferência."""
+        try:
+            started = self._arduino_controller.start_profiling(mode=mode, trace_memory=trace_memory)
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+        if not started:
+            return {"status": "error", "message": "Já existe um perfil em andamento."}
+        return {"status": "success", "message": f"Perfil de execução ({mode}) iniciado."}
+
+    def stop_profiling(self):
+        summary = self._arduino_controller.stop_profiling()
+        if summary is None:
+            return {"status": "error", "message": "Nenhum perfil em andamento."}
+        return {"status": "success", "message": f"Perfil salvo em {len(summary['files'])} arquivo(s).", "summary": summary}
+
+    def get_metrics(self):
+        """Valores atuais das métricas do controller (quadros, bytes, retransmissões, CRC, RTT, filas)."""
+        return self._arduino_controller.get_metrics()
+
+    def get_metrics_history(self, name, resolution="raw", labels=None):
+        """Histórico de uma métrica: 'raw' (últimos 5 min), '1m' (24 h) ou '1h' (7 dias)."""
+        try:
+            points = self._arduino_controller.get_metrics_history(name, resolution, **(labels or {}))
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+        return {"status": "success", "name": name, "resolution": resolution, "points": points}
+
+    def start_metrics_endpoint(self, port=None):
+        """Serve as métricas no formato do Prometheus (só em 127.0.0.1)."""
+        try:
+            url = self._arduino_controller.metrics.start_http(port=port or METRICS_HTTP_PORT or DEFAULT_HTTP_PORT)
+        except (RuntimeError, OSError) as e:
+            return {"status": "error", "message": f"Endpoint de métricas não iniciado: {e}"}
+        return {"status": "success", "message": f"Métricas em {url}", "url": url}
+
+    def stop_metrics_endpoint(self):
+        self._arduino_controller.metrics.stop_http()
+        return {"status": "success", "message": "Endpoint de métricas encerrado."}
+
+    def get_rx_latency(self, reset=False):
+        """
+        Percentis (µs) de cada etapa entre um DATA lido da serial e o ACK escrito, e a fração de ACKs
+        escritos em menos de 1 ms. reset=True zera os registros depois de ler.
+        """
+        summary = self._arduino_controller.get_rx_latency()
+        if reset:
+            self._arduino_controller.reset_rx_latency()
+        return summary
+
+    def get_serial_tx_stats(self):
+        """Filas de TX, buffer de saída da porta (out_waiting) e escritas coalescidas."""
+        tx_scheduler = self._arduino_controller.tx_scheduler
+        return tx_scheduler.get_stats() if tx_scheduler else {}
+
+    def get_startup_timings(self):
+        """Tempos da inicialização em ms (importações, controller, janela, serial, primeiro status do Arduino)."""
+        return self.startup_timer.report() if self.startup_timer else {}
+
+    def shutdown(self):
+        self._outbox_spool.stop()
+        self._job_manager.stop()
+        self._arduino_controller.stop_capture()
+        self._arduino_controller.stop_profiling()
+        self._arduino_controller.metrics.stop_http()
 
     def test_ping(self):
         self.log_message("Função 'test_ping' chamada do JavaScript!")
@@ -148,12 +352,16 @@ class MainApplicationAPI:
 
 # --- Início da Aplicação ---
 if __name__ == '__main__':
+    startup_timer = StartupTimer(_STARTUP_T0)
+    startup_timer.mark("imports")
+
     # 1. Instancie o ArduinoController primeiro
     arduino_controller = ArduinoController(
         serial_port=SERIAL_PORT,
         baud_rate=BAUD_RATE,
         log_callback=None,  # Será atualizado depois
     )
+    arduino_controller.rf_rate.enabled = ADAPT_RF_BITRATE
 
     # 2. Instancie o GUIController primeiro, com callbacks temporários
     gui_controller = GUIController(
@@ -181,13 +389,31 @@ if __name__ == '__main__':
     main_app_api.set_frames_summary_callback(gui_controller.update_frames_summary_in_js)
     main_app_api.set_sending_finished_callback(gui_controller.on_sending_finished_in_js)
     main_app_api.set_file_received_callback(gui_controller.on_file_received_in_js)
-
-    # 5. Criar a janela PyWebView
+    main_app_api.startup_timer = startup_timer
+    if METRICS_HTTP_PORT:
+        main_app_api.start_metrics_endpoint(METRICS_HTTP_PORT)
+    startup_timer.mark("controllers")
+
+    # 5. Conexão serial e handshake com o Arduino em paralelo com a criação da janela
+    threading.Thread(target=connect_in_background,
+                     args=(arduino_controller, startup_timer, main_app_api.log_message,
+                           main_app_api.start_background_transfers),
+                     name="StartupSerial", daemon=True).start()
+
+    def on_window_loaded():
+        window_ms = startup_timer.mark("window_ready")
+        main_app_api.log_message(f"Janela utilizável em {window_ms} ms. Tempos da inicialização: {startup_timer.report()}")
+    gui_controller.on_window_loaded_callback = on_window_loaded
+
+    # 6. Criar a janela PyWebView
+    import webview
+    startup_timer.mark("webview_import")
     main_window = gui_controller.create_window()
 
-    # 6. Iniciar o webview
+    # 7. Iniciar o webview
     webview.start()
 
     # --- Encerramento da Aplicação ---
+    main_app_api.shutdown()
     arduino_controller.disconnect()
     print("Aplicação encerrada.")
\ No newline at end of file
@@ -0,0 +1,137 @@
+# core/merkle.py
+
+import hashlib
+
+# --- Árvore de Merkle dos blocos de uma mensagem ---
+# O corpo da mensagem (após o cabeçalho de metadados) é dividido em blocos de MERKLE_BLOCK_SIZE bytes.
+# A raiz vai no cabeçalho; a lista de folhas vai no fim da mensagem (trailer), autenticada pela raiz.
+# Com as folhas, o receptor sabe exatamente quais blocos chegaram corrompidos (o CRC-4 por quadro
+# deixa passar ~1 em 16) e pede só esses de novo, em vez do arquivo inteiro.
+HASH_SIZE = 16                    # sha256 truncado (folhas, nós internos e raiz)
+MERKLE_BLOCK_SIZE = 512           # ~27 fragmentos; trailer de folhas custa ~3% do corpo
+LEAF_PREFIX = b'\x00'             # Prefixos distintos para folhas e nós internos (evita colisão entre níveis)
+NODE_PREFIX = b'\x01'
+
+
+def leaf_hash(block):
+    return hashlib.sha256(LEAF_PREFIX + block).digest()[:HASH_SIZE]
+
+
+def block_count(body_len, block_size):
+    return max(1, (body_len + block_size - 1) // block_size)
+
+
+def compute_leaves(body, block_size):
+    return [leaf_hash(body[i * block_size:(i + 1) * block_size]) for i in range(block_count(len(body), block_size))]
+
+
+def merkle_root(leaves):
+    level = list(leaves)
+    if not level:
+        return leaf_hash(b'')
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1]) # Nível ímpar: duplica o último nó
+        level = [hashlib.sha256(NODE_PREFIX + level[i] + level[i + 1]).digest()[:HASH_SIZE]
+                 for i in range(0, len(level), 2)]
+    return level[0]
+
+
+def pack_leaves(leaves):
+    return b''.join(leaves)
+
+
+def unpack_leaves(trailer, count):
+    if len(trailer) < count * HASH_SIZE:
+        return None
+    return [trailer[i * HASH_SIZE:(i + 1) * HASH_SIZE] for i in range(count)]
+
+
+class MerkleStreamVerifier:
+    """
+    Calcula as folhas de uma mensagem ENQUANTO os fragmentos chegam: cada bloco é hasheado assim
+    que todos os fragmentos que o cobrem estão presentes, sem uma segunda passada no fim.
+
+    header_parser(prefixo) deve retornar (início do corpo, tamanho do corpo, tamanho do bloco)
+    quando o prefixo contíguo já contém o cabeçalho, None se ainda faltam bytes, ou levantar
+    ValueError se a mensagem não tem árvore de Merkle (o verificador então se desativa).
+    """
+
+    def __init__(self, total_fragments, fragment_size, header_parser):
+        self.total_fragments = total_fragments
+        self.fragment_size = fragment_size
+        self._header_parser = header_parser
+        self._buffer = bytearray(total_fragments * fragment_size)
+        self._have = bytearray(total_fragments)
+        self._contiguous = 0     # Quantidade de fragmentos contíguos a partir do 0
+        self.active = True
+        self.body_start = None
+        self.body_len = None
+        self.block_size = None
+        self.leaves = None       # Folhas calculadas (None = bloco ainda incompleto)
+
+    def add_fragment(self, fragment_idx, payload):
+        if not self.active or fragment_idx >= self.total_fragments:
+            return
+        offset = fragment_idx * self.fragment_size
+        self._buffer[offset:offset + len(payload)] = payload
+        self._have[fragment_idx] = 1
+        while self._contiguous < self.total_fragments and self._have[self._contiguous]:
+            self._contiguous += 1
+
+        if self.body_start is None:
+            if not self._try_parse_header():
+                return
+            self._hash_ready_blocks(range(len(self.leaves)))
+        else:
+            touched = self._blocks_touching(offset, offset + len(payload))
+            for idx in touched:
+                self.leaves[idx] = None # Fragmento repetido pode ter conteúdo diferente: recalcula
+            self._hash_ready_blocks(touched)
+
+    def _try_parse_header(self):
+        try:
+            parsed = self._header_parser(bytes(self._buffer[:self._contiguous * self.fragment_size]))
+        except ValueError:
+            self.active = False
+            self._buffer = bytearray()
+            return False
+        if parsed is None:
+            return False
+        self.body_start, self.body_len, self.block_size = parsed
+        self.leaves = [None] * block_count(self.body_len, self.block_size)
+        return True
+
+    def _blocks_touching(self, start, end):
+        first = max(0, (start - self.body_start) // self.block_size)
+        last = min(len(self.leaves) - 1, (end - 1 - self.body_start) // self.block_size)
+        return range(first, last + 1)
+
+    def _block_range(self, idx):
+        start = self.body_start + idx * self.block_size
+        return start, min(start + self.block_size, self.body_start + self.body_len)
+
+    def _hash_ready_blocks(self, indices):
+        for idx in indices:
+            if self.leaves[idx] is not None:
+                continue
+            start, end = self._block_range(idx)
+            first_frag = start // self.fragment_size
+            last_frag = (max(end, start + 1) - 1) // self.fragment_size
+            if all(self._have[f] for f in range(first_frag, min(last_frag, self.total_fragments - 1) + 1)):
+                self.leaves[idx] = leaf_hash(bytes(self._buffer[start:end]))
+
+    def finish(self, message):
+        """Completa as folhas que faltarem a partir da mensagem montada e as retorna (ou None se inativo)."""
+        if not self.active:
+            return None
+        if self.body_start is None:
+            self._buffer[:len(message)] = message
+            self._contiguous = self.total_fragments
+            if not self._try_parse_header():
+                return None
+        for idx, leaf in enumerate(self.leaves):
+            if leaf is None:
+                start, end = self._block_range(idx)
+                self.leaves[idx] = leaf_hash(message[start:end])
+        return self.leaves
@@ -0,0 +1,373 @@
+# core/metrics.py
+
+import bisect
+import threading
+import time
+from collections import deque
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+try:
+    import bottle # Já vem com o pywebview; sem ele só o endpoint HTTP fica indisponível
+except ImportError:
+    bottle = None
+
+# --- Métricas do controller com histórico ---
+# Contadores, gauges e histogramas num registro em memória. Uma thread amostra todos os valores a cada
+# SAMPLE_INTERVAL_S: as amostras recentes ficam num buffer circular e, em paralelo, são resumidas em
+# janelas maiores (min/máx/média/último por minuto e por hora), também de tamanho fixo. Nada cresce
+# com o tempo de execução.
+# Métricas com fn são lidas só na amostragem/raspagem (filas, taxas, contadores de outros módulos);
+# as demais são atualizadas no caminho quente com um lock e uma soma.
+# O endpoint HTTP opcional serve o formato de texto do Prometheus em /metrics e o histórico em JSON.
+METRIC_COUNTER = "counter"
+METRIC_GAUGE = "gauge"
+METRIC_HISTOGRAM = "histogram"
+
+SAMPLE_INTERVAL_S = 1.0
+RAW_SAMPLES = 300                                # 5 min com amostras de 1 s
+ROLLUPS = (("1m", 60, 1440), ("1h", 3600, 168))  # (resolução, segundos por ponto, pontos): 24 h e 7 dias
+RESOLUTION_RAW = "raw"
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.2, 0.35, 0.5, 0.7, 1.0, 1.5, 2.5, 5.0) # Segundos (RTT de um fragmento)
+DEFAULT_HTTP_HOST = "127.0.0.1"
+DEFAULT_HTTP_PORT = 9464
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value):
+    value = float(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in pairs) + "}"
+
+
+class _Rollup:
+    """Pontos (início, mín, máx, média, último) de janelas de step segundos, mais a janela em andamento."""
+
+    __slots__ = ('step', 'points', '_start', '_min', '_max', '_sum', '_count', '_last')
+
+    def __init__(self, step, size):
+        self.step = step
+        self.points = deque(maxlen=size)
+        self._count = 0
+
+    def add(self, ts, value):
+        start = ts - ts % self.step
+        if self._count and start != self._start:
+            self.points.append(self._current())
+            self._count = 0
+        if not self._count:
+            self._start, self._min, self._max, self._sum = start, value, value, 0.0
+        self._min = min(self._min, value)
+        self._max = max(self._max, value)
+        self._sum += value
+        self._count += 1
+        self._last = value
+
+    def _current(self):
+        return (self._start, self._min, self._max, self._sum / self._count, self._last)
+
+    def snapshot(self):
+        points = list(self.points)
+        if self._count:
+            points.append(self._current())
+        return points
+
+
+class TimeSeries:
+    """Histórico de um valor: amostras recentes e resumos por janela, todos em buffers de tamanho fixo."""
+
+    def __init__(self, raw_samples=RAW_SAMPLES, rollups=ROLLUPS):
+        self._raw = deque(maxlen=raw_samples)
+        self._rollups = {name: _Rollup(step, size) for name, step, size in rollups}
+
+    def add(self, ts, value):
+        self._raw.append((ts, value))
+        for rollup in self._rollups.values():
+            rollup.add(ts, value)
+
+    def get(self, resolution=RESOLUTION_RAW):
+        if resolution == RESOLUTION_RAW:
+            return [{"ts": round(ts, 3), "value": value} for ts, value in self._raw]
+        rollup = self._rollups.get(resolution)
+        if rollup is None:
+            raise ValueError(f"Resolução desconhecida: {resolution}")
+        return [{"ts": start, "min": low, "max": high, "avg": round(avg, 6), "last": last}
+                for start, low, high, avg, last in rollup.snapshot()]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, labels, fn=None):
+        self.name = name
+        self.labels = labels # Tupla de (nome, valor), ordenada
+        self._fn = fn
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def value(self):
+        if self._fn is None:
+            return self._value
+        try:
+            return self._fn()
+        except Exception:
+            return None # Fonte indisponível agora (ex.: porta fechada): a amostra é pulada
+
+    def samples(self):
+        """[(sufixo, labels extras, valor)] no formato de exposição."""
+        value = self.value()
+        return [] if value is None else [("", (), value)]
+
+
+class Counter(_Metric):
+    kind = METRIC_COUNTER
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+
+class Gauge(_Metric):
+    kind = METRIC_GAUGE
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class Histogram(_Metric):
+    kind = METRIC_HISTOGRAM
+
+    def __init__(self, name, labels, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1) # Último: acima do maior limite (+Inf)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+    def value(self):
+        return self.snapshot()[2]
+
+    def samples(self):
+        counts, total, count = self.snapshot()
+        result = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            result.append(("_bucket", (("le", _format_value(bound)),), cumulative))
+        result.append(("_bucket", (("le", "+Inf"),), count))
+        result.append(("_sum", (), total))
+        result.append(("_count", (), count))
+        return result
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas com histórico. counter/gauge/histogram devolvem sempre o mesmo objeto para o
+    mesmo nome + labels; start() liga a amostragem periódica que alimenta get_history().
+    """
+
+    def __init__(self, sample_interval_s=SAMPLE_INTERVAL_S, raw_samples=RAW_SAMPLES, rollups=ROLLUPS,
+                 log_callback=None):
+        self.sample_interval_s = sample_interval_s
+        self.raw_samples = raw_samples
+        self.rollups = rollups
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self._lock = threading.Lock()
+        self._families = {} # {nome: (tipo, ajuda)}, na ordem de registro
+        self._metrics = {}  # {(nome, labels): métrica}
+        self._series = {}   # {(nome da série, labels): TimeSeries}
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._http_server = None
+        self._http_thread = None
+
+    def _default_log_callback(self, message):
+        print(f"[MetricsRegistry] {message}")
+
+    # --- Registro ---
+
+    def counter(self, name, help_text, fn=None, **labels):
+        return self._get_or_create(Counter, name, help_text, labels, fn=fn)
+
+    def gauge(self, name, help_text, fn=None, **labels):
+        return self._get_or_create(Gauge, name, help_text, labels, fn=fn)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get_or_create(Histogram, name, help_text, labels, buckets=buckets)
+
+    def _get_or_create(self, cls, name, help_text, labels, **kwargs):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            family = self._families.get(name)
+            if family and family[0] != cls.kind:
+                raise ValueError(f"Métrica '{name}' já registrada como {family[0]}.")
+            metric = self._metrics.get(key)
+            if metric is None:
+                self._families.setdefault(name, (cls.kind, help_text))
+                metric = self._metrics[key] = cls(name, key[1], **kwargs)
+            return metric
+
+    # --- Amostragem e histórico ---
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="MetricsSampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def _sample_loop(self):
+        while not self._stop_event.wait(self.sample_interval_s):
+            self.sample()
+
+    def sample(self, now=None):
+        """Guarda o valor atual de cada métrica (histogramas: contagem e soma) no histórico."""
+        now = time.time() if now is None else now
+        with self._lock:
+            metrics = list(self._metrics.values())
+        points = []
+        for metric in metrics:
+            if metric.kind == METRIC_HISTOGRAM:
+                _, total, count = metric.snapshot()
+                points.append((metric.name + "_count", metric.labels, count))
+                points.append((metric.name + "_sum", metric.labels, total))
+            else:
+                value = metric.value()
+                if value is not None:
+                    points.append((metric.name, metric.labels, value))
+        with self._lock:
+            for name, labels, value in points:
+                series = self._series.get((name, labels))
+                if series is None:
+                    series = self._series[(name, labels)] = TimeSeries(self.raw_samples, self.rollups)
+                series.add(now, value)
+
+    def get_history(self, name, resolution=RESOLUTION_RAW, **labels):
+        """Pontos de uma série (histogramas: nome_count / nome_sum). Lista vazia se ainda não houve amostra."""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            series = self._series.get(key)
+            return series.get(resolution) if series else []
+
+    def list_series(self):
+        with self._lock:
+            return [{"name": name, "labels": dict(labels)} for name, labels in self._series]
+
+    def snapshot(self):
+        """Valores atuais: {nome: valor} ou {nome: {labels: valor}} para famílias com labels."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        result = {}
+        for metric in metrics:
+            value = metric.value()
+            if not metric.labels:
+                result[metric.name] = value
+            else:
+                label_text = ",".join(f"{k}={v}" for k, v in metric.labels)
+                result.setdefault(metric.name, {})[label_text] = value
+        return result
+
+    def render_prometheus(self):
+        """Todas as métricas no formato de texto de exposição do Prometheus (0.0.4)."""
+        with self._lock:
+            families = list(self._families.items())
+            by_name = {}
+            for metric in self._metrics.values():
+                by_name.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name, (kind, help_text) in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in by_name.get(name, ()):
+                for suffix, extra_labels, value in metric.samples():
+                    lines.append(f"{name}{suffix}{_format_labels(metric.labels, extra_labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    # --- Endpoint HTTP (opcional, precisa do bottle) ---
+
+    def start_http(self, host=DEFAULT_HTTP_HOST, port=DEFAULT_HTTP_PORT):
+        """Serve /metrics (Prometheus) e /metrics/history (JSON). Retorna a URL; RuntimeError sem o bottle."""
+        if bottle is None:
+            raise RuntimeError("o pacote 'bottle' não está instalado.")
+        if self._http_server:
+            return self._http_url()
+        app = bottle.Bottle()
+
+        @app.get("/metrics")
+        def metrics():
+            bottle.response.content_type = PROMETHEUS_CONTENT_TYPE
+            return self.render_prometheus()
+
+        @app.get("/metrics/history")
+        def history():
+            query = dict(bottle.request.query.decode())
+            name = query.pop("name", None)
+            resolution = query.pop("resolution", RESOLUTION_RAW)
+            if not name:
+                return {"series": self.list_series()}
+            try:
+                return {"name": name, "resolution": resolution, "points": self.get_history(name, resolution, **query)}
+            except ValueError as e:
+                bottle.response.status = 400
+                return {"error": str(e)}
+
+        self._http_server = make_server(host, port, app, handler_class=_QuietRequestHandler)
+        self._http_thread = threading.Thread(target=self._http_server.serve_forever, name="MetricsHttp", daemon=True)
+        self._http_thread.start()
+        self.log_callback(f"Métricas disponíveis em {self._http_url()}")
+        return self._http_url()
+
+    def stop_http(self):
+        server, self._http_server = self._http_server, None
+        if server:
+            server.shutdown()
+            server.server_close()
+            self._http_thread.join(timeout=2)
+            self._http_thread = None
+
+    def _http_url(self):
+        host, port = self._http_server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    """Sem uma linha no stderr por raspagem."""
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,287 @@
+# core/pipeline.py
+
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+# --- Pipeline de envio ---
+# Leitura do arquivo, transformações opcionais (ex.: envelope com compressão), fragmentação e codificação
+# dos quadros DATA rodam em threads próprias, à frente do enlace. Entre as etapas há filas limitadas:
+# a preparação nunca se adianta mais do que isso sobre o que o enlace já consumiu.
+READ_BLOCK_SIZE = 16 * 1024  # Bytes lidos do disco por vez
+BLOCK_QUEUE_SIZE = 4         # Blocos lidos aguardando a etapa seguinte
+FRAME_QUEUE_SIZE = 32        # Quadros prontos aguardando o enlace (várias janelas ARQ de folga)
+POLL_INTERVAL_S = 0.1        # Etapas bloqueadas numa fila conferem o encerramento neste intervalo
+
+EncodedFrame = namedtuple('EncodedFrame', 'fragment_idx segment data')
+
+_END = object() # Fim do fluxo entre duas etapas
+
+
+class SendPipeline:
+    """
+    Prepara os quadros DATA de UMA mensagem em etapas encadeadas por filas limitadas:
+    leitura (se a origem for um caminho) -> transformações (se houver) -> fragmentação + codificação.
+    A etapa do enlace só consome quadros prontos (next_frame / get_frame); um erro em qualquer etapa
+    é relançado para ela.
+    """
+
+    def __init__(self, source, encode_frame, fragment_size_for_size, transforms=(), fragment_indices=None,
+                 queue_size=FRAME_QUEUE_SIZE, name="SendPipeline"):
+        """
+        source: caminho do arquivo (lido em blocos) ou os bytes da mensagem.
+        encode_frame(fragment_idx, total_fragments, segment): bytes do quadro pronto para a serial.
+        fragment_size_for_size(total_bytes): tamanho de fragmento; só é chamado quando o tamanho final é conhecido.
+        transforms: funções bytes -> bytes aplicadas ao conteúdo inteiro, em ordem, antes de fragmentar.
+        fragment_indices: só estes fragmentos são codificados (ex.: os ainda não confirmados de um envio retomado).
+        """
+        self.source = source
+        self.name = name
+        self._encode_frame = encode_frame
+        self._fragment_size_for_size = fragment_size_for_size
+        self._transforms = list(transforms)
+        self._fragment_indices = set(fragment_indices) if fragment_indices is not None else None
+
+        self.total_bytes = None      # Conhecidos quando a etapa de transformação (ou a leitura) termina
+        self.fragment_size = None
+        self.total_fragments = None
+        self._sized = threading.Event()
+
+        self._frames = queue.Queue(maxsize=max(1, queue_size))
+        self._lookahead = {}         # {fragment_idx: EncodedFrame} retirados da fila antes de serem pedidos
+        self._lookahead_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._error = None
+        self._finished = False
+        self._frames_taken = 0
+        self._threads = []
+
+        self.frames_encoded = 0
+        self.link_stalls = 0         # Vezes em que o enlace pediu um quadro e nenhum estava pronto
+        self.link_stall_time = 0.0
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        if isinstance(self.source, (str, os.PathLike)):
+            blocks = queue.Queue(maxsize=BLOCK_QUEUE_SIZE)
+            self._start_stage("read", self._read_stage, blocks)
+        else:
+            blocks = queue.Queue()
+            if not self._transforms:
+                self._set_size(len(self.source))
+            blocks.put(self.source)
+            blocks.put(_END)
+        if self._transforms:
+            transformed = queue.Queue(maxsize=1)
+            self._start_stage("transform", self._transform_stage, blocks, transformed)
+            blocks = transformed
+        self._start_stage("encode", self._encode_stage, blocks)
+        return self
+
+    def close(self):
+        """Interrompe as etapas (cancelamento ou fim do envio). Não espera as threads."""
+        self._stop.set()
+
+    def wait_sized(self, timeout=None):
+        """Espera o tamanho final da mensagem (total_bytes/total_fragments). Relança o erro de uma etapa."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._sized.wait(POLL_INTERVAL_S):
+            if self._error is not None:
+                raise self._error
+            if self._stop.is_set() or (deadline is not None and time.monotonic() >= deadline):
+                return False
+        return True
+
+    def get_stats(self):
+        return {
+            "frames_encoded": self.frames_encoded,
+            "frames_ready": self._frames.qsize(),
+            "link_stalls": self.link_stalls,
+            "link_stall_time": self.link_stall_time,
+        }
+
+    # --- Etapa do enlace ---
+
+    def next_frame(self):
+        """Próximo quadro pronto, em ordem. None no fim da mensagem ou após close()."""
+        if self._finished:
+            return None
+        try:
+            item = self._frames.get_nowait()
+        except queue.Empty:
+            item = self._wait_frame()
+            if item is None:
+                return None
+        if item is _END:
+            self._finished = True
+            return None
+        self._frames_taken += 1
+        return item
+
+    def _wait_frame(self):
+        waited_from = time.monotonic()
+        while True:
+            if self._error is not None:
+                raise self._error
+            if self._stop.is_set():
+                return None
+            try:
+                item = self._frames.get(timeout=POLL_INTERVAL_S)
+                break
+            except queue.Empty:
+                pass
+        if self._frames_taken and item is not _END:
+            # O enlace ficou parado esperando a preparação (o primeiro quadro não conta: nada podia estar pronto)
+            self.link_stalls += 1
+            self.link_stall_time += time.monotonic() - waited_from
+        return item
+
+    def get_frame(self, fragment_idx):
+        """
+        Quadro de um fragmento específico, para várias threads consumindo ao mesmo tempo (pool de envio).
+        Os fragmentos são pedidos na mesma ordem em que são codificados, então só quadros de fragmentos
+        já entregues a outra thread ficam guardados à frente. None se o fragmento não for produzido.
+        """
+        with self._lookahead_lock:
+            while fragment_idx not in self._lookahead:
+                frame = self.next_frame()
+                if frame is None:
+                    return None
+                self._lookahead[frame.fragment_idx] = frame
+            return self._lookahead.pop(fragment_idx)
+
+    # --- Etapas de preparação ---
+
+    def _start_stage(self, stage_name, target, *args):
+        thread = threading.Thread(target=self._run_stage, args=(target, args),
+                                  name=f"{self.name}-{stage_name}", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _run_stage(self, target, args):
+        try:
+            target(*args)
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+            self._stop.set() # As outras etapas param; o enlace recebe o erro
+
+    def _put(self, out_queue, item):
+        """Entrega à próxima etapa, esperando espaço na fila. False se o pipeline foi encerrado."""
+        while not self._stop.is_set():
+            try:
+                out_queue.put(item, timeout=POLL_INTERVAL_S)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _blocks(self, in_queue):
+        while not self._stop.is_set():
+            try:
+                item = in_queue.get(timeout=POLL_INTERVAL_S)
+            except queue.Empty:
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def _set_size(self, total_bytes):
+        self.total_bytes = total_bytes
+        self.fragment_size = self._fragment_size_for_size(total_bytes)
+        self.total_fragments = max(1, -(-total_bytes // self.fragment_size)) # Mensagem vazia: um fragmento vazio
+        self._sized.set()
+
+    def _read_stage(self, out_queue):
+        with open(self.source, "rb") as f:
+            if not self._transforms:
+                self._set_size(os.fstat(f.fileno()).st_size)
+            while True:
+                block = f.read(READ_BLOCK_SIZE)
+                if not block:
+                    break
+                if not self._put(out_queue, block):
+                    return
+        self._put(out_queue, _END)
+
+    def _transform_stage(self, in_queue, out_queue):
+        data = b''.join(self._blocks(in_queue)) # As transformações (ex.: zlib com Merkle) precisam do conteúdo inteiro
+        if self._stop.is_set():
+            return
+        for transform in self._transforms:
+            data = transform(data)
+        self._set_size(len(data))
+        if self._put(out_queue, data):
+            self._put(out_queue, _END)
+
+    def _encode_stage(self, in_queue):
+        pending = bytearray()
+        fragment_idx = 0
+        for block in self._blocks(in_queue):
+            pending += block
+            while len(pending) >= self.fragment_size:
+                if not self._emit(fragment_idx, bytes(pending[:self.fragment_size])):
+                    return
+                del pending[:self.fragment_size]
+                fragment_idx += 1
+        if self._stop.is_set():
+            return
+        if pending or fragment_idx == 0:
+            if not self._emit(fragment_idx, bytes(pending)):
+                return
+            fragment_idx += 1
+        if fragment_idx != self.total_fragments:
+            raise self._changed_error(fragment_idx)
+        self._put(self._frames, _END)
+
+    def _changed_error(self, fragments_read):
+        # Só acontece lendo do disco: o arquivo mudou de tamanho depois de aberto
+        return OSError(f"'{self.source}' mudou durante a leitura ({self.total_fragments} fragmentos previstos, "
+                       f"{fragments_read} ou mais lidos).")
+
+    def _emit(self, fragment_idx, segment):
+        if fragment_idx >= self.total_fragments:
+            raise self._changed_error(fragment_idx + 1)
+        if self._fragment_indices is not None and fragment_idx not in self._fragment_indices:
+            return True
+        frame = EncodedFrame(fragment_idx, segment, self._encode_frame(fragment_idx, self.total_fragments, segment))
+        if not self._put(self._frames, frame):
+            return False
+        self.frames_encoded += 1
+        return True
+
+
+class CallbackRelay:
+    """Executa callbacks (progresso da GUI) numa thread própria, em ordem, fora do caminho do enlace."""
+
+    def __init__(self, name="CallbackRelay", log_callback=None):
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _default_log_callback(self, message):
+        print(f"[CallbackRelay] {message}")
+
+    def call(self, callback, *args):
+        if callback:
+            self._queue.put((callback, args))
+
+    def close(self, timeout=2.0):
+        """Executa o que já foi enfileirado e encerra a thread."""
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            callback, args = item
+            try:
+                callback(*args)
+            except Exception as e:
+                self.log_callback(f"Erro no callback: {e}")
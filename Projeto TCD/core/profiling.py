@@ -0,0 +1,346 @@
+# core/profiling.py
+
+import cProfile
+import io
+import json
+import linecache
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+# --- Perfil de execução em campo (sem profiler externo) ---
+# Dois modos, ligados e desligados em tempo de execução:
+#   sampling: uma thread lê as pilhas de todas as threads (sys._current_frames) a cada intervalo. Serve para
+#             qualquer thread, inclusive as bloqueadas em sleep/wait, e exporta pilhas (flamegraph/speedscope).
+#   cprofile: cada thread instrumentada (leitura serial, escalonador de TX, workers de envio) liga o seu
+#             próprio cProfile no próximo checkpoint() do laço. Exporta .pstats (snakeviz, gprof2dot).
+# Desligado, não há thread nem hook de profile: as threads instrumentadas só leem o atributo `hooked`.
+# Com trace_memory, o tracemalloc tira fotos no início, em cada mark() (ex.: início/fim de uma transferência)
+# e no fim, e o relatório mostra o que cresceu entre elas.
+PROFILE_MODE_SAMPLING = "sampling"
+PROFILE_MODE_CPROFILE = "cprofile"
+PROFILE_MODES = (PROFILE_MODE_SAMPLING, PROFILE_MODE_CPROFILE)
+
+DEFAULT_SAMPLE_INTERVAL_S = 0.005
+MAX_STACK_DEPTH = 64
+TRACEMALLOC_FRAMES = 10
+MEMORY_TOP_LINES = 25
+
+# Onde o tempo foi parar. O frame mais interno que casar decide a categoria da amostra (ou da função no cProfile)
+CATEGORY_SLEEPING = "sleeping"
+CATEGORY_CRC = "crc"
+CATEGORY_LOGGING = "logging"
+CATEGORY_GUI = "gui"
+CATEGORY_PARSING = "parsing"
+CATEGORY_SERIAL_IO = "serial_io"
+CATEGORY_DISK_IO = "disk_io"
+CATEGORY_OTHER = "other"
+
+WAIT_FUNCTIONS = {"wait", "sleep", "_wait_for_tstate_lock", "select", "get"}
+PARSING_FUNCTIONS = {"_process_incoming_bytes", "_process_packet", "decode_packet", "decode_telemetry",
+                     "on_frame", "unpack", "unpack_from"}
+LOGGING_FUNCTIONS = {"log_callback", "log", "log_message", "_default_log_callback", "emit"}
+GUI_FUNCTIONS = {"evaluate_js", "update_status_callback"}
+DISK_FUNCTIONS = {"write_file", "sync_fragment", "fsync", "_execute"}
+
+
+def _frame_category(filename, function, line_text=""):
+    """Categoria de um frame (amostragem) ou de uma função (cProfile: funções em C vêm como '<built-in ...>')."""
+    base = os.path.basename(filename)
+    lowered = function.lower()
+    if (function in WAIT_FUNCTIONS and base in ("threading.py", "queue.py", "selectors.py")) \
+            or ".sleep(" in line_text or ".wait(" in line_text \
+            or "time.sleep" in function or ("acquire" in lowered and "lock" in lowered):
+        return CATEGORY_SLEEPING
+    if "crc" in lowered:
+        return CATEGORY_CRC
+    if function in LOGGING_FUNCTIONS or (base == "__init__.py" and "logging" in filename):
+        return CATEGORY_LOGGING
+    if function in GUI_FUNCTIONS or base == "gui.py" or "webview" in filename:
+        return CATEGORY_GUI
+    if function in PARSING_FUNCTIONS:
+        return CATEGORY_PARSING
+    if function in DISK_FUNCTIONS or base == "writer.py":
+        return CATEGORY_DISK_IO
+    if ("serial" in filename and base != "serial_link.py") or function in ("read", "write", "in_waiting"):
+        return CATEGORY_SERIAL_IO
+    return None
+
+
+def classify_stack(stack):
+    """Categoria de uma pilha [(arquivo, função, linha), ...] da raiz para a folha."""
+    for depth, (filename, function, lineno) in enumerate(reversed(stack)):
+        # O texto da linha só importa na folha: é onde aparece um sleep()/wait() chamado em C
+        line_text = linecache.getline(filename, lineno) if depth == 0 else ""
+        category = _frame_category(filename, function, line_text)
+        if category:
+            return category
+    return CATEGORY_OTHER
+
+
+def _frame_label(filename, function, lineno):
+    return f"{function} ({os.path.basename(filename)}:{lineno})"
+
+
+class RuntimeProfiler:
+    """Perfil por thread (amostragem ou cProfile) e fotos do tracemalloc, controlados pelo ArduinoController."""
+
+    def __init__(self, log_callback=None):
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self.active = False
+        self.hooked = False          # Há threads com cProfile ligado (ou a ligar): checkpoint() precisa rodar
+        self.mode = None
+        self.trace_memory = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_at = 0.0
+        self._stopped_at = 0.0
+        self._thread_filter = None
+        self._interval_s = DEFAULT_SAMPLE_INTERVAL_S
+        self._sampler = None
+        self._stop_event = threading.Event()
+        self._samples = {}           # {(nome da thread, pilha): quantidade}
+        self._sample_count = 0
+        self._profiles = {}          # {nome da thread: cProfile.Profile}
+        self._live_profiles = 0
+        self._generation = 0         # Muda a cada start(): threads com cProfile de um perfil anterior o trocam
+        self._memory_marks = []      # [(rótulo, instante, snapshot)]
+        self._started_tracemalloc = False
+
+    def _default_log_callback(self, message):
+        print(f"[RuntimeProfiler] {message}")
+
+    # --- Controle ---
+
+    def start(self, mode=PROFILE_MODE_SAMPLING, interval_s=DEFAULT_SAMPLE_INTERVAL_S, threads=None, trace_memory=False):
+        """Começa um perfil. threads: prefixos de nomes de thread a incluir (None = todas)."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Modo de perfil desconhecido: {mode}")
+        with self._lock:
+            if self.active:
+                return False
+            self.mode = mode
+            self.trace_memory = trace_memory
+            self._thread_filter = tuple(threads) if threads else None
+            self._interval_s = max(0.001, interval_s)
+            self._samples = {}
+            self._sample_count = 0
+            self._profiles = {}
+            self._memory_marks = []
+            self._started_at = time.time()
+            self._generation += 1
+            self.active = True
+            if mode == PROFILE_MODE_CPROFILE:
+                self.hooked = True
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self.mark("start")
+        if mode == PROFILE_MODE_SAMPLING:
+            self._stop_event.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name="ProfilerSampler", daemon=True)
+            self._sampler.start()
+        self.log_callback(f"Perfil iniciado (modo {mode}{', com memória' if trace_memory else ''}).")
+        return True
+
+    def stop(self):
+        """Encerra o perfil e retorna o resumo (None se não havia perfil ativo). Os dados ficam para export()."""
+        with self._lock:
+            if not self.active:
+                return None
+            self.active = False
+            self._stopped_at = time.time()
+            if self._live_profiles == 0:
+                self.hooked = False # Nenhuma thread chegou a ligar o cProfile
+        if self._sampler:
+            self._stop_event.set()
+            self._sampler.join(timeout=2)
+            self._sampler = None
+        if self.trace_memory:
+            self.mark("stop")
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        summary = self.get_summary()
+        self.log_callback(f"Perfil encerrado: {summary['duration_s']} s, categorias {summary['categories']}.")
+        return summary
+
+    def checkpoint(self):
+        """Chamado no laço das threads instrumentadas enquanto `hooked`: liga ou desliga o cProfile desta thread."""
+        local = self._local
+        profile = getattr(local, "profile", None)
+        wanted = self.active and self.mode == PROFILE_MODE_CPROFILE
+        if profile is not None and (not wanted or local.generation != self._generation):
+            profile.disable()
+            local.profile = profile = None
+            with self._lock:
+                self._live_profiles -= 1
+                if self._live_profiles <= 0 and not self.active:
+                    self._live_profiles = 0
+                    self.hooked = False
+        if wanted and profile is None and getattr(local, "generation", None) != self._generation:
+            local.generation = self._generation # Uma tentativa por thread e por perfil
+            name = threading.current_thread().name
+            if not self._wants_thread(name):
+                return
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # Python 3.12+: o cProfile usa sys.monitoring e só admite um profile ativo no processo
+                self.log_callback(f"AVISO: cProfile indisponível na thread {name} ({e}); use o modo sampling.")
+                return
+            local.profile = profile
+            with self._lock:
+                self._profiles[name] = profile
+                self._live_profiles += 1
+
+    def mark(self, label):
+        """Foto do tracemalloc com um rótulo (ex.: início/fim de transferência). Sem trace_memory, não faz nada."""
+        if not self.trace_memory or not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        with self._lock:
+            self._memory_marks.append((label, time.time(), snapshot))
+
+    def _wants_thread(self, name):
+        return self._thread_filter is None or name.startswith(self._thread_filter)
+
+    # --- Amostragem ---
+
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self._interval_s):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            batch = []
+            for ident, frame in frames.items():
+                name = names.get(ident)
+                if ident == own_ident or name is None or not self._wants_thread(name):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_name, frame.f_lineno))
+                    frame = frame.f_back
+                stack.reverse()
+                batch.append((name, tuple(stack)))
+            del frames
+            with self._lock:
+                self._sample_count += 1
+                for key in batch:
+                    self._samples[key] = self._samples.get(key, 0) + 1
+
+    # --- Resultados ---
+
+    def get_summary(self):
+        """Categorias de tempo (segundos estimados) por thread e totais."""
+        with self._lock:
+            samples = dict(self._samples)
+            profiles = dict(self._profiles)
+            marks = list(self._memory_marks)
+            end = self._stopped_at if not self.active else time.time()
+        per_thread = {}
+        if self.mode == PROFILE_MODE_SAMPLING:
+            for (thread_name, stack), count in samples.items():
+                categories = per_thread.setdefault(thread_name, {})
+                category = classify_stack(stack)
+                categories[category] = categories.get(category, 0.0) + count * self._interval_s
+        else:
+            for thread_name, profile in profiles.items():
+                categories = per_thread.setdefault(thread_name, {})
+                for (filename, _, function), row in self._profile_stats(profile).stats.items():
+                    category = _frame_category(filename, function) or CATEGORY_OTHER
+                    categories[category] = categories.get(category, 0.0) + row[2] # tottime
+        totals = {}
+        for categories in per_thread.values():
+            for category, seconds in categories.items():
+                totals[category] = totals.get(category, 0.0) + seconds
+        rounded = lambda values: {k: round(v, 3) for k, v in sorted(values.items(), key=lambda item: -item[1])}
+        summary = {"mode": self.mode, "active": self.active, "duration_s": round(end - self._started_at, 3),
+                   "categories": rounded(totals),
+                   "threads": {name: rounded(categories) for name, categories in per_thread.items()}}
+        if self.mode == PROFILE_MODE_SAMPLING:
+            summary["samples"] = self._sample_count
+        if marks:
+            summary["memory_marks"] = [label for label, _, _ in marks]
+        return summary
+
+    def _profile_stats(self, profile):
+        # pstats.Stats(profile) desligaria o profile a partir desta thread; snapshot_stats só copia os números,
+        # e a thread dona continua medindo até o próximo checkpoint()
+        profile.snapshot_stats()
+        stats = pstats.Stats()
+        stats.stats = profile.stats
+        stats.get_top_level_stats()
+        return stats
+
+    def export(self, directory, prefix=None):
+        """Grava os arquivos do último perfil e retorna {formato: caminho}."""
+        os.makedirs(directory, exist_ok=True)
+        prefix = prefix or time.strftime("profile_%Y%m%d_%H%M%S", time.localtime(self._started_at or time.time()))
+        base = os.path.join(directory, prefix)
+        paths = {}
+        with self._lock:
+            samples = dict(self._samples)
+            profiles = dict(self._profiles)
+            marks = list(self._memory_marks)
+        if self.mode == PROFILE_MODE_SAMPLING and samples:
+            paths["folded"] = base + ".folded"
+            with open(paths["folded"], "w", encoding="utf-8") as f:
+                for (thread_name, stack), count in sorted(samples.items()):
+                    labels = [thread_name] + [_frame_label(*frame).replace(";", ",") for frame in stack]
+                    f.write(";".join(labels) + f" {count}\n")
+            paths["speedscope"] = base + ".speedscope.json"
+            with open(paths["speedscope"], "w", encoding="utf-8") as f:
+                json.dump(self._speedscope_document(samples, prefix), f)
+        for thread_name, profile in profiles.items():
+            path = f"{base}_{thread_name}.pstats"
+            self._profile_stats(profile).dump_stats(path)
+            paths[f"pstats:{thread_name}"] = path
+        if len(marks) >= 2:
+            paths["memory"] = base + "_memory.txt"
+            with open(paths["memory"], "w", encoding="utf-8") as f:
+                f.write(self._memory_report(marks))
+        return paths
+
+    def _speedscope_document(self, samples, name):
+        """Formato de arquivo do speedscope (https://www.speedscope.app): um perfil amostrado por thread."""
+        frame_index = {}
+        frames = []
+        by_thread = {}
+        for (thread_name, stack), count in samples.items():
+            indexes = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[1], "file": frame[0], "line": frame[2]})
+                indexes.append(frame_index[frame])
+            by_thread.setdefault(thread_name, []).append((indexes, count * self._interval_s))
+        profiles = []
+        for thread_name, entries in sorted(by_thread.items()):
+            total = sum(weight for _, weight in entries)
+            profiles.append({"type": "sampled", "name": thread_name, "unit": "seconds", "startValue": 0,
+                             "endValue": total, "samples": [indexes for indexes, _ in entries],
+                             "weights": [weight for _, weight in entries]})
+        return {"$schema": "https://www.speedscope.app/file-format-schema.json", "name": name,
+                "exporter": "tcd-profiling", "shared": {"frames": frames}, "profiles": profiles}
+
+    def _memory_report(self, marks):
+        out = io.StringIO()
+        for (previous_label, _, previous), (label, at, snapshot) in zip(marks, marks[1:]):
+            stats = snapshot.compare_to(previous, "lineno")
+            growth = sum(stat.size_diff for stat in stats)
+            out.write(f"=== {previous_label} -> {label} ({time.strftime('%H:%M:%S', time.localtime(at))}): "
+                      f"{growth / 1024:+.1f} KiB ===\n")
+            for stat in stats[:MEMORY_TOP_LINES]:
+                out.write(f"{stat}\n")
+            out.write("\n")
+        return out.getvalue()
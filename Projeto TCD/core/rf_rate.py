@@ -0,0 +1,232 @@
+# core/rf_rate.py
+
+import math
+import struct
+import threading
+import time
+from collections import deque
+
+# --- Adaptação da taxa do rádio (VirtualWire) e do tamanho de fragmento ---
+# O Python observa o resultado de cada fragmento enviado (ACK ou não) e os quadros RF ruins que o
+# firmware conta (status), e manda o NOSSO Arduino trocar a taxa com um quadro LINK. O firmware anuncia
+# a nova taxa por RF ao outro Arduino algumas vezes na taxa antiga e só então troca; se deixar de ouvir o
+# outro lado por RF_LINK_WATCHDOG_TIMEOUT, os dois voltam sozinhos a RF_DEFAULT_BITRATE.
+# Passo de taxa no estilo AARF: sobe depois de uma sequência de sucessos, desce com falhas seguidas, e
+# uma subida que falha logo no primeiro fragmento dobra a sequência exigida para a próxima tentativa.
+LINK_RF_BITRATE = 0x07 # Comando LINK (mesmo tipo de quadro de serial_link.py). Payload: taxa (u16). Sem resposta
+RF_BITRATE_FORMAT = "<H"
+
+RF_BITRATES = (1000, 2000, 3000, 4000) # Taxas aceitas pelo firmware (bps), da menor para a maior
+RF_DEFAULT_BITRATE = 2000               # Taxa do boot do firmware (vw_setup)
+
+STEP_UP_SUCCESSES = 20       # Fragmentos seguidos sem perda para tentar a taxa de cima
+MAX_STEP_UP_SUCCESSES = 160  # Teto da sequência exigida depois de subidas que falharam
+STEP_DOWN_FAILURES = 2       # Falhas seguidas que derrubam para a taxa de baixo
+STEP_UP_MAX_LOSS = 0.05      # Perda máxima na janela para permitir subir
+STEP_DOWN_LOSS = 0.3         # Perda na janela (cheia até a metade, pelo menos) que derruba mesmo sem falhas seguidas
+LOSS_WINDOW = 32             # Resultados recentes usados na estimativa de perda
+MIN_RATE_HOLD_S = 5.0        # Tempo mínimo entre duas trocas de taxa
+PENDING_CONFIRM_S = 12.0     # Espera pelo nosso slot + status do firmware confirmando a taxa pedida
+RX_ERRORS_PER_FAILURE = 4    # Quadros RF ruins (contador do firmware) que contam como uma perda na janela
+
+# --- Custo no ar de um quadro VirtualWire (para escolher o tamanho de fragmento) ---
+# Preâmbulo + início (8 símbolos de 6 bits) e, por byte, 2 símbolos de 6 bits: contagem + mensagem + FCS (2).
+VW_PREAMBLE_BITS = 48
+VW_BITS_PER_BYTE = 12
+VW_FRAME_OVERHEAD_BYTES = 3
+RF_HEADER_BYTES = 8          # Cabeçalho do Packet (7) + CRC-4 (1): o firmware só transmite os bytes usados
+FRAGMENT_SIZE_CHOICES = (19, 16, 12, 8, 5)
+FRAGMENT_TURNAROUND_S = 0.05 # Tempo fixo por fragmento além do ar (serial, processamento, troca TX/RX)
+
+
+def frame_air_bits(payload_size):
+    """Bits no ar de um quadro com payload_size bytes de dados (ACK/NACK: 0)."""
+    return VW_PREAMBLE_BITS + VW_BITS_PER_BYTE * (VW_FRAME_OVERHEAD_BYTES + RF_HEADER_BYTES + payload_size)
+
+
+def best_fragment_size(bit_error_rate, bitrate, choices=FRAGMENT_SIZE_CHOICES):
+    """Tamanho de fragmento com maior vazão útil esperada: bytes * P(dado e ACK chegarem) / tempo por fragmento."""
+    ack_bits = frame_air_bits(0)
+
+    def goodput(size):
+        bits = frame_air_bits(size) + ack_bits
+        success = (1.0 - bit_error_rate) ** bits
+        return size * success / (bits / bitrate + FRAGMENT_TURNAROUND_S)
+
+    return max(choices, key=goodput)
+
+
+class RfRateController:
+    """
+    Escolhe a taxa do rádio e o tamanho de fragmento a partir das estatísticas do enlace. O
+    ArduinoController entrega o resultado de cada tentativa de fragmento (on_fragment_result), o contador
+    de quadros RF ruins e a taxa em uso vindos do status do firmware (on_firmware_status).
+    """
+
+    def __init__(self, controller, base_ack_timeout, log_callback=None):
+        self.controller = controller
+        self.base_ack_timeout = base_ack_timeout # Espera por ACK na taxa padrão
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self.enabled = True
+        self.current_bitrate = RF_DEFAULT_BITRATE
+        self.rate_changes = 0
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=LOSS_WINDOW) # (tamanho do payload, sucesso)
+        self._consecutive_successes = 0
+        self._consecutive_failures = 0
+        self._step_up_threshold = STEP_UP_SUCCESSES
+        self._probing = False      # Acabou de subir: a primeira falha desfaz a subida
+        self._last_change = 0.0
+        self._pending_bitrate = None # Pedida ao firmware, ainda não confirmada pelo status
+        self._pending_since = 0.0
+        self._last_rx_bad = None
+        self._rx_error_credit = 0
+
+    def _default_log_callback(self, message):
+        print(f"[RfRateController] {message}")
+
+    def reset(self):
+        """Porta reaberta: o Arduino reiniciou na taxa padrão."""
+        with self._lock:
+            self.current_bitrate = RF_DEFAULT_BITRATE
+            self._outcomes.clear()
+            self._consecutive_successes = self._consecutive_failures = 0
+            self._step_up_threshold = STEP_UP_SUCCESSES
+            self._probing = False
+            self._pending_bitrate = None
+            self._last_rx_bad = None
+            self._rx_error_credit = 0
+
+    def get_state(self):
+        with self._lock:
+            loss = self._loss_rate_locked()
+            return {"bitrate": self.current_bitrate, "fragment_size": self._fragment_size_locked(),
+                    "loss": round(loss, 3), "bit_error_rate": self._bit_error_rate_locked(),
+                    "step_up_after": self._step_up_threshold, "changes": self.rate_changes}
+
+    # --- Parâmetros derivados da taxa atual ---
+
+    def fragment_size(self):
+        """Tamanho de fragmento para novas mensagens."""
+        with self._lock:
+            return self._fragment_size_locked()
+
+    def ack_timeout(self):
+        """Espera por ACK proporcional ao tempo no ar: abaixo da taxa padrão, um quadro leva mais."""
+        return self.base_ack_timeout * max(1.0, RF_DEFAULT_BITRATE / self.current_bitrate)
+
+    def _loss_rate_locked(self):
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, ok in self._outcomes if not ok) / len(self._outcomes)
+
+    def _bit_error_rate_locked(self):
+        """BER estimada da perda observada: P(perda) = 1 - (1 - BER)^bits do quadro de dados + ACK."""
+        if not self._outcomes:
+            return 0.0
+        loss = min(self._loss_rate_locked(), 0.99)
+        mean_size = sum(size for size, _ in self._outcomes) / len(self._outcomes)
+        bits = frame_air_bits(mean_size) + frame_air_bits(0)
+        return 1.0 - math.exp(math.log(1.0 - loss) / bits)
+
+    def _fragment_size_locked(self):
+        if not self.enabled:
+            return FRAGMENT_SIZE_CHOICES[0]
+        return best_fragment_size(self._bit_error_rate_locked(), self.current_bitrate)
+
+    # --- Eventos ---
+
+    def on_fragment_result(self, payload_size, success):
+        """Resultado de uma tentativa de envio (ACK = sucesso; NACK ou timeout = falha)."""
+        with self._lock:
+            self._outcomes.append((payload_size, success))
+            target = self._record_locked(success)
+        if target:
+            self._request_bitrate(target)
+
+    def on_firmware_status(self, bitrate, rx_bad):
+        """Status do firmware: taxa em uso (pode ter mudado pelo outro lado ou pelo watchdog) e quadros RF ruins."""
+        with self._lock:
+            if self._pending_bitrate is not None:
+                if bitrate == self._pending_bitrate or time.monotonic() - self._pending_since > PENDING_CONFIRM_S:
+                    self._pending_bitrate = None
+            if self._pending_bitrate is None and bitrate in RF_BITRATES and bitrate != self.current_bitrate:
+                self.log_callback(f"RF: firmware em {bitrate} bps (esperado {self.current_bitrate} bps).")
+                if bitrate < self.current_bitrate and self._probing:
+                    self._step_up_threshold = min(self._step_up_threshold * 2, MAX_STEP_UP_SUCCESSES)
+                self._set_bitrate_locked(bitrate)
+            if self._last_rx_bad is not None:
+                # Quadros ruins entram só na estimativa de perda (que também trava a subida). Quem decide
+                # descer é o lado que envia, pelas falhas de ACK: um receptor ASK ocioso gera lixo que o
+                # VirtualWire também conta como quadro ruim.
+                self._rx_error_credit += (rx_bad - self._last_rx_bad) & 0xFF # Contador de 8 bits do firmware
+                while self._rx_error_credit >= RX_ERRORS_PER_FAILURE:
+                    self._rx_error_credit -= RX_ERRORS_PER_FAILURE
+                    self._outcomes.append((FRAGMENT_SIZE_CHOICES[0], False))
+            self._last_rx_bad = rx_bad
+
+    # --- Decisão ---
+
+    def _record_locked(self, success):
+        """Atualiza as sequências e retorna a taxa a pedir (ou None)."""
+        if success:
+            self._consecutive_failures = 0
+            self._consecutive_successes += 1
+            if self._probing:
+                self._probing = False
+                self._step_up_threshold = STEP_UP_SUCCESSES # A subida se confirmou
+            if (self._consecutive_successes >= self._step_up_threshold
+                    and self._loss_rate_locked() <= STEP_UP_MAX_LOSS):
+                return self._neighbour_locked(+1)
+            return None
+
+        self._consecutive_successes = 0
+        self._consecutive_failures += 1
+        if self._probing:
+            # A taxa nova falhou logo no primeiro fragmento: volta e exige uma sequência maior da próxima vez
+            self._step_up_threshold = min(self._step_up_threshold * 2, MAX_STEP_UP_SUCCESSES)
+            return self._neighbour_locked(-1, ignore_hold=True)
+        if self._consecutive_failures >= STEP_DOWN_FAILURES or \
+                (len(self._outcomes) >= LOSS_WINDOW // 2 and self._loss_rate_locked() >= STEP_DOWN_LOSS):
+            self._step_up_threshold = STEP_UP_SUCCESSES
+            return self._neighbour_locked(-1)
+        return None
+
+    def _neighbour_locked(self, step, ignore_hold=False):
+        if not self.enabled or self._pending_bitrate is not None:
+            return None
+        if not ignore_hold and time.monotonic() - self._last_change < MIN_RATE_HOLD_S:
+            return None
+        idx = RF_BITRATES.index(self.current_bitrate) + step
+        if not 0 <= idx < len(RF_BITRATES):
+            return None
+        self._pending_bitrate = RF_BITRATES[idx]
+        self._pending_since = time.monotonic()
+        return self._pending_bitrate
+
+    def _set_bitrate_locked(self, bitrate):
+        self._probing = bitrate > self.current_bitrate
+        self.current_bitrate = bitrate
+        self._outcomes.clear() # A perda medida na taxa anterior não vale para a nova
+        self._consecutive_successes = self._consecutive_failures = 0
+        self._last_change = time.monotonic()
+        self.rate_changes += 1
+
+    def _request_bitrate(self, bitrate):
+        """Manda o nosso Arduino trocar a taxa no nosso slot TDMA (ele anuncia ao outro lado por RF antes de trocar)."""
+        threading.Thread(target=self._send_bitrate_command, args=(bitrate,), name="RfRateCommand", daemon=True).start()
+
+    def _send_bitrate_command(self, bitrate):
+        sent = self.controller.tdma.wait_for_my_slot(max_wait=PENDING_CONFIRM_S) and \
+            self.controller.send_link_frame(LINK_RF_BITRATE, 0, struct.pack(RF_BITRATE_FORMAT, bitrate)).get("status") == "success"
+        with self._lock:
+            if self._pending_bitrate != bitrate:
+                return
+            if not sent:
+                self._pending_bitrate = None
+                return
+            previous = self.current_bitrate
+            self._set_bitrate_locked(bitrate)
+            fragment_size = self._fragment_size_locked()
+        self.log_callback(f"RF: taxa {previous} -> {bitrate} bps, fragmentos de {fragment_size} bytes.")
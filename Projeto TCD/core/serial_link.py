@@ -0,0 +1,233 @@
+# core/serial_link.py
+
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+# --- Negociação da taxa da porta serial (PC <-> Arduino) ---
+# A porta abre sempre na taxa base (9600, a do boot do firmware). Depois do primeiro status, o PC propõe
+# taxas maiores com quadros PACKET_TYPE_LINK, que só existem no enlace serial (o firmware nunca os repassa
+# por RF). message_id = comando; o CRC cobre os mesmos bytes de um quadro DATA.
+#   PROPOSE -> ACCEPT (ainda na taxa antiga) -> os dois lados trocam -> rajada de TEST com eco -> COMMIT
+# Sem COMMIT a tempo, o firmware volta sozinho à taxa anterior; sem quadros válidos do PC por um tempo
+# (KEEPALIVE), volta à taxa base. Do lado do PC, erros de CRC ou silêncio também derrubam para a base.
+LINK_BAUD_PROPOSE = 0x01  # Payload: taxa (u32). Resposta: ACCEPT ou REJECT, na taxa atual
+LINK_BAUD_ACCEPT = 0x02   # O firmware troca de taxa logo depois de enviar e entra em período de teste
+LINK_BAUD_REJECT = 0x03   # Taxa não suportada pelo firmware
+LINK_TEST = 0x04          # Quadro de teste; o firmware devolve exatamente como recebeu
+LINK_BAUD_COMMIT = 0x05   # PC confirma a nova taxa; o firmware responde com o mesmo comando
+LINK_KEEPALIVE = 0x06     # Mantém a taxa negociada (sem resposta)
+
+BASE_BAUD_RATE = 9600
+BAUD_CANDIDATES = (250000, 115200, 57600) # Tentadas da maior para a menor
+BAUD_FORMAT = "<I"
+
+LINK_REPLY_TIMEOUT_S = 1.0      # Folga ampla: a resposta são 27 bytes (~28 ms a 9600 bps) e o laço do firmware não bloqueia no RF
+TEST_BURST_FRAMES = 16
+TEST_WINDOW_FRAMES = 2          # O buffer serial do Arduino tem 64 bytes: no máximo 2 quadros sem eco
+FIRMWARE_TRIAL_TIMEOUT_S = 1.5  # BAUD_TRIAL_TIMEOUT do firmware: depois disso ele já voltou à taxa anterior
+KEEPALIVE_INTERVAL_S = 1.0      # Bem abaixo do LINK_WATCHDOG_TIMEOUT (4 s) do firmware
+SILENCE_FALLBACK_S = 7.0        # O firmware manda status ao mudar e, parado, a cada 3 s; sem nada válido nisso, a taxa não serve
+ERROR_FALLBACK_COUNT = 5        # Erros de CRC na janela abaixo que derrubam para a taxa base
+ERROR_FALLBACK_WINDOW_S = 10.0
+RENEGOTIATE_DELAY_S = 60.0      # Depois de uma queda, tenta de novo (sem a taxa que falhou)
+
+
+class SerialLinkManager:
+    """
+    Negocia e vigia a taxa da porta serial. O ArduinoController entrega os quadros LINK recebidos
+    (on_link_frame), cada quadro válido (on_valid_frame) e cada erro de CRC (on_crc_error).
+    """
+
+    def __init__(self, controller, base_baud_rate=BASE_BAUD_RATE, log_callback=None):
+        self.controller = controller
+        self.base_baud_rate = base_baud_rate
+        self.current_baud_rate = base_baud_rate
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+
+        self._negotiation_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._expected_replies = ()
+        self._reply = None
+        self._test_echoes = {}      # {seq: payload devolvido}
+        self._test_crc_errors = 0
+        self._testing = False
+        self._error_times = deque()
+        self._last_valid_frame = time.monotonic()
+        self._failed_rates = set()  # Taxas que falharam no teste ou caíram por erros nesta conexão
+        self._monitor_thread = None
+        self._stop_event = threading.Event()
+        self.fallbacks = 0
+
+    def _default_log_callback(self, message):
+        print(f"[SerialLinkManager] {message}")
+
+    def reset(self):
+        """Porta reaberta: o Arduino reiniciou na taxa base."""
+        self.stop()
+        self.current_baud_rate = self.base_baud_rate
+        self._failed_rates.clear()
+        self._error_times.clear()
+        self._stop_event.clear()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._monitor_thread and self._monitor_thread is not threading.current_thread():
+            self._monitor_thread.join(timeout=2)
+        self._monitor_thread = None
+
+    def get_state(self):
+        return {"baud_rate": self.current_baud_rate, "base_baud_rate": self.base_baud_rate,
+                "failed_rates": sorted(self._failed_rates), "fallbacks": self.fallbacks}
+
+    # --- Eventos vindos da thread de leitura ---
+
+    def on_link_frame(self, command, index, payload):
+        with self._cond:
+            if command == LINK_TEST and self._testing:
+                self._test_echoes[index] = payload
+                self._cond.notify_all()
+            elif command in self._expected_replies and self._reply is None:
+                self._reply = (command, payload)
+                self._cond.notify_all()
+
+    def on_valid_frame(self):
+        self._last_valid_frame = time.monotonic()
+
+    def on_crc_error(self):
+        now = time.monotonic()
+        with self._cond:
+            if self._testing:
+                self._test_crc_errors += 1
+            self._error_times.append(now)
+            while self._error_times and now - self._error_times[0] > ERROR_FALLBACK_WINDOW_S:
+                self._error_times.popleft()
+
+    # --- Negociação ---
+
+    def negotiate(self, candidates=BAUD_CANDIDATES):
+        """Tenta as taxas da maior para a menor e fica na primeira que passar no teste. Retorna a taxa em uso."""
+        with self._negotiation_lock:
+            for rate in sorted(candidates, reverse=True):
+                if rate <= self.current_baud_rate or rate in self._failed_rates:
+                    continue
+                reply = self._request(LINK_BAUD_PROPOSE, struct.pack(BAUD_FORMAT, rate),
+                                      (LINK_BAUD_ACCEPT, LINK_BAUD_REJECT))
+                if reply is None:
+                    self.log_callback(f"Serial: firmware não respondeu à negociação de taxa; mantendo {self.current_baud_rate} bps.")
+                    return self.current_baud_rate
+                if reply[0] == LINK_BAUD_REJECT:
+                    continue
+
+                previous = self.current_baud_rate
+                started = time.monotonic()
+                self.controller.set_port_baud_rate(rate)
+                ok, detail = self._run_test_burst()
+                if ok and self._request(LINK_BAUD_COMMIT, b'', (LINK_BAUD_COMMIT,)) is not None:
+                    self.current_baud_rate = rate
+                    self._last_valid_frame = time.monotonic()
+                    self._error_times.clear()
+                    self.log_callback(f"Serial: taxa negociada {rate} bps ({detail}, "
+                                      f"{(time.monotonic() - started) * 1000:.0f} ms).")
+                    self._start_monitor()
+                    return rate
+
+                self._failed_rates.add(rate)
+                self.controller.set_port_baud_rate(previous)
+                self.log_callback(f"Serial: {rate} bps reprovado ({detail or 'sem COMMIT'}); voltando a {previous} bps.")
+                # O firmware volta sozinho quando o período de teste acaba sem COMMIT
+                self._stop_event.wait(FIRMWARE_TRIAL_TIMEOUT_S)
+            return self.current_baud_rate
+
+    def _request(self, command, payload, expected_replies):
+        with self._cond:
+            self._expected_replies = expected_replies
+            self._reply = None
+        try:
+            result = self.controller.send_link_frame(command, 0, payload)
+            if result.get("status") != "success":
+                return None
+            deadline = time.monotonic() + LINK_REPLY_TIMEOUT_S
+            with self._cond:
+                while self._reply is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+                return self._reply
+        finally:
+            with self._cond:
+                self._expected_replies = ()
+
+    def _run_test_burst(self):
+        """Envia TEST_BURST_FRAMES quadros aleatórios (no máximo TEST_WINDOW_FRAMES sem eco) e confere os ecos."""
+        payloads = [os.urandom(19) for _ in range(TEST_BURST_FRAMES)]
+        with self._cond:
+            self._test_echoes = {}
+            self._test_crc_errors = 0
+            self._testing = True
+        try:
+            for seq, payload in enumerate(payloads):
+                deadline = time.monotonic() + LINK_REPLY_TIMEOUT_S
+                with self._cond:
+                    while seq - len(self._test_echoes) >= TEST_WINDOW_FRAMES:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False, f"{len(self._test_echoes)}/{seq} ecos"
+                        self._cond.wait(remaining)
+                if self.controller.send_link_frame(LINK_TEST, seq, payload).get("status") != "success":
+                    return False, "falha ao escrever na porta"
+            deadline = time.monotonic() + LINK_REPLY_TIMEOUT_S
+            with self._cond:
+                while len(self._test_echoes) < len(payloads) and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                echoes, crc_errors = dict(self._test_echoes), self._test_crc_errors
+        finally:
+            with self._cond:
+                self._testing = False
+        matched = sum(1 for seq, payload in enumerate(payloads) if echoes.get(seq) == payload)
+        detail = f"{matched}/{len(payloads)} ecos, {crc_errors} erro(s) de CRC"
+        return matched == len(payloads) and crc_errors == 0, detail
+
+    # --- Vigilância da taxa negociada ---
+
+    def _start_monitor(self):
+        if self._monitor_thread and self._monitor_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._monitor_thread = threading.Thread(target=self._monitor_loop, name="SerialLinkMonitor", daemon=True)
+        self._monitor_thread.start()
+
+    def _monitor_loop(self):
+        renegotiate_at = None
+        while not self._stop_event.wait(KEEPALIVE_INTERVAL_S):
+            if not self.controller.running:
+                return
+            if self.current_baud_rate == self.base_baud_rate:
+                if renegotiate_at and time.monotonic() >= renegotiate_at:
+                    renegotiate_at = None
+                    self.negotiate()
+                continue
+            self.controller.send_link_frame(LINK_KEEPALIVE, 0, b'', wait=False)
+            with self._cond:
+                errors = len(self._error_times)
+            silence = time.monotonic() - self._last_valid_frame
+            if errors >= ERROR_FALLBACK_COUNT or silence > SILENCE_FALLBACK_S:
+                reason = f"{errors} erros de CRC" if errors >= ERROR_FALLBACK_COUNT else f"{silence:.1f} s sem quadros válidos"
+                self._fall_back(reason)
+                renegotiate_at = time.monotonic() + RENEGOTIATE_DELAY_S
+
+    def _fall_back(self, reason):
+        with self._negotiation_lock:
+            failed = self.current_baud_rate
+            self._failed_rates.add(failed)
+            self.current_baud_rate = self.base_baud_rate
+            self.controller.set_port_baud_rate(self.base_baud_rate)
+            self._last_valid_frame = time.monotonic()
+            with self._cond:
+                self._error_times.clear()
+            self.fallbacks += 1
+        # O firmware também volta à base pelo watchdog (sem KEEPALIVE válido)
+        self.log_callback(f"Serial: {reason} a {failed} bps; voltando a {self.base_baud_rate} bps.")
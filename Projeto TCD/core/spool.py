@@ -0,0 +1,332 @@
+# core/spool.py
+
+import os
+import threading
+import time
+from collections import deque
+
+import envelope
+from arduino import MAX_MESSAGE_SIZE
+from jobs import PRIORITY_BULK, JOB_SUCCESS, JOB_ERROR, JOB_CANCELLED
+
+# --- Pasta de saída (spool) vigiada ---
+# Arquivos colocados em outbox/ são enviados sozinhos. A própria pasta é a fila persistente:
+#   outbox/            arquivos esperando (só entram depois de duas varreduras com tamanho/mtime iguais)
+#   outbox/.sending/   arquivos e pacotes já entregues ao TransferJobManager; apagados ao confirmar o envio
+#   outbox/.failed/    envios cancelados pelo usuário ou que nunca caberiam numa mensagem (MAX_MESSAGE_SIZE)
+# Ao reiniciar, tudo o que estiver em .sending/ volta para a fila (o diário retoma do ponto onde parou).
+# Arquivos pequenos são juntados num pacote (envelope.KIND_ARCHIVE) e enviados como uma única mensagem:
+# para arquivos de poucas centenas de bytes o custo fixo de cada mensagem (metadados, árvore de Merkle,
+# espera pelo ACK do último fragmento) é maior que o próprio conteúdo.
+OUTBOX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox")
+SENDING_DIR_NAME = ".sending"
+FAILED_DIR_NAME = ".failed"
+IGNORED_SUFFIXES = (".tmp", ".part", ".crdownload", "~") # Arquivos ainda sendo escritos por outro programa
+
+POLL_INTERVAL_S = 1.0
+SMALL_FILE_MAX_BYTES = 4096      # Até este tamanho o arquivo vai num pacote
+PACK_MAX_BYTES = 64 * 1024       # Limite do conteúdo de um pacote (antes da compressão)
+# Além disso, o pacote já codificado precisa caber numa mensagem (MAX_MESSAGE_SIZE); se não couber, leva menos arquivos
+PACK_LINGER_S = 2.0              # Quanto um arquivo pequeno espera por companheiros antes de o pacote sair
+MAX_IN_FLIGHT = 2                # Envios do spool ao mesmo tempo; enquanto ocupado, os pequenos se acumulam
+RETRY_DELAY_S = 30.0             # Espera antes de reenviar após erro (dobra a cada falha)
+MAX_RETRY_DELAY_S = 600.0
+
+
+class OutboxSpool:
+    """Vigia a pasta de saída (por varredura, sem dependências) e entrega os arquivos ao TransferJobManager."""
+
+    def __init__(self, job_manager, directory=OUTBOX_DIR, log_callback=None, on_sent_callback=None,
+                 small_file_max_bytes=SMALL_FILE_MAX_BYTES, pack_max_bytes=PACK_MAX_BYTES,
+                 pack_linger_s=PACK_LINGER_S, max_in_flight=MAX_IN_FLIGHT, poll_interval_s=POLL_INTERVAL_S):
+        self.job_manager = job_manager
+        self.directory = os.path.abspath(directory)
+        self.sending_dir = os.path.join(self.directory, SENDING_DIR_NAME)
+        self.failed_dir = os.path.join(self.directory, FAILED_DIR_NAME)
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self.on_sent_callback = on_sent_callback # (status, caminho no spool, nomes dos arquivos, mensagem)
+        self.small_file_max_bytes = small_file_max_bytes
+        self.pack_max_bytes = pack_max_bytes
+        self.pack_linger_s = pack_linger_s
+        self.max_in_flight = max(1, max_in_flight)
+        self.poll_interval_s = poll_interval_s
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._seen = {}            # {nome: (tamanho, mtime_ns)} da varredura anterior
+        self._ready_since = {}     # {nome: instante em que ficou estável} (arquivos pequenos esperando pacote)
+        self._queue = deque()      # Caminhos em .sending/ prontos para submeter: (caminho, nomes, não antes de)
+        self._in_flight = {}       # {caminho: {'job_id', 'names'}}
+        self._failures = {}        # {caminho: falhas seguidas}
+        self._pack_seq = 0
+        self.stats = {"files_sent": 0, "packs_sent": 0, "bytes_sent": 0, "errors": 0}
+        self.running = False
+
+    def _default_log_callback(self, message):
+        print(f"[OutboxSpool] {message}")
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        if self.running:
+            return
+        os.makedirs(self.sending_dir, exist_ok=True)
+        self._recover_sending()
+        self.running = True
+        self._submit_queued() # Antes de resume_interrupted(), para o spool saber quando os seus envios terminam
+        self._thread = threading.Thread(target=self._run, name="OutboxSpool", daemon=True)
+        self._thread.start()
+        self.log_callback(f"Spool de saída vigiando '{self.directory}'.")
+
+    def stop(self):
+        """Para de vigiar. O que estiver em .sending/ continua lá e é retomado no próximo start()."""
+        self.running = False
+        self._wake.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def get_status(self):
+        with self._lock:
+            return dict(self.stats, directory=self.directory, waiting=len(self._seen),
+                        queued=len(self._queue), in_flight=len(self._in_flight))
+
+    def _recover_sending(self):
+        """Reenfileira o que ficou em .sending/ na execução anterior, do mais antigo para o mais novo."""
+        entries = []
+        for entry in os.scandir(self.sending_dir):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path) # Pacote que não chegou a ser fechado: os originais ainda estão em outbox/
+                continue
+            entries.append((entry.stat().st_mtime_ns, entry.path))
+        with self._lock:
+            for _, path in sorted(entries):
+                self._queue.append((path, None, 0.0))
+        if entries:
+            self.log_callback(f"Spool: {len(entries)} envio(s) pendente(s) da execução anterior.")
+
+    # --- Varredura ---
+
+    def _run(self):
+        while self.running:
+            try:
+                self._scan()
+                self._submit_queued()
+            except OSError as e:
+                self.log_callback(f"ERRO no spool de saída: {e}")
+            self._wake.wait(self.poll_interval_s)
+            self._wake.clear()
+
+    def _scan(self):
+        now = time.monotonic()
+        current = {}
+        stable = []
+        for entry in os.scandir(self.directory):
+            name = entry.name
+            if name.startswith('.') or name.endswith(IGNORED_SUFFIXES) or not entry.is_file():
+                continue
+            st = entry.stat()
+            current[name] = (st.st_size, st.st_mtime_ns)
+            if self._seen.get(name) == current[name]:
+                stable.append((st.st_mtime_ns, name, st.st_size))
+        self._seen = current
+        for name in list(self._ready_since):
+            if name not in current:
+                del self._ready_since[name]
+
+        small = []
+        for _, name, size in sorted(stable):
+            if size > self.small_file_max_bytes:
+                self._claim_large(name)
+            else:
+                self._ready_since.setdefault(name, now)
+                small.append((name, size))
+        self._pack_small(small, now)
+
+    def _claim_large(self, name):
+        source = os.path.join(self.directory, name)
+        target = os.path.join(self.sending_dir, name)
+        if os.path.exists(target):
+            return # Uma versão anterior com o mesmo nome ainda está saindo; espera ela terminar
+        encoded_size = self._encoded_size(source)
+        self._seen.pop(name, None)
+        if encoded_size > MAX_MESSAGE_SIZE:
+            message = f"não cabe numa mensagem ({encoded_size} bytes codificados, máximo {MAX_MESSAGE_SIZE})"
+            self._move_to_failed(source, message)
+            if self.on_sent_callback:
+                self._notify(JOB_ERROR, source, [name], message)
+            return
+        os.replace(source, target)
+        with self._lock:
+            self._queue.append((target, [name], 0.0))
+
+    def _pack_small(self, small, now):
+        """Junta os arquivos pequenos estáveis em pacotes de até pack_max_bytes."""
+        if not small:
+            return
+        with self._lock:
+            busy = len(self._in_flight) + len(self._queue) >= self.max_in_flight
+        total = sum(size for _, size in small)
+        oldest = min(self._ready_since[name] for name, _ in small)
+        if busy or (total < self.pack_max_bytes and now - oldest < self.pack_linger_s):
+            return # Ainda cabe mais no pacote: espera companheiros (ou uma vaga)
+
+        batch, batch_size = [], 0
+        for name, size in small:
+            if batch and batch_size + size > self.pack_max_bytes:
+                break
+            batch.append(name)
+            batch_size += size
+        self._write_pack(batch)
+
+    def _write_pack(self, names):
+        entries = []
+        for name in names:
+            try:
+                with open(os.path.join(self.directory, name), "rb") as f:
+                    entries.append((name, envelope.pack_archive_entry(name, f.read(), os.fstat(f.fileno()).st_mtime_ns)))
+            except OSError:
+                continue # Removido entre a varredura e o empacotamento
+        # Tira arquivos do fim até a mensagem codificada caber; os que saírem vão no próximo pacote
+        while len(entries) > 1 and len(envelope.encode_archive('', b''.join(e for _, e in entries))) > MAX_MESSAGE_SIZE:
+            entries = entries[:max(1, len(entries) * 3 // 4)]
+        if len(entries) <= 1:
+            for name, _ in entries:
+                self._claim_large(name) # Sozinho não compensa empacotar
+                self._ready_since.pop(name, None)
+            return
+
+        self._pack_seq += 1
+        pack_name = f"spool_{time.strftime('%Y%m%d_%H%M%S')}_{self._pack_seq}{envelope.ARCHIVE_FILE_EXTENSION}"
+        pack_path = os.path.join(self.sending_dir, pack_name)
+        tmp_path = pack_path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            for _, entry in entries:
+                out.write(entry)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, pack_path)
+        # Só apaga os originais depois que o pacote está no disco: uma queda aqui reenvia, mas não perde nada
+        packed = [name for name, _ in entries]
+        for name in packed:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            self._seen.pop(name, None)
+            self._ready_since.pop(name, None)
+        with self._lock:
+            self._queue.append((pack_path, packed, 0.0))
+        self.log_callback(f"Spool: {len(packed)} arquivo(s) pequeno(s) empacotado(s) em '{pack_name}'.")
+
+    # --- Envio ---
+
+    def _submit_queued(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if len(self._in_flight) >= self.max_in_flight:
+                    return
+                ready = next((item for item in self._queue if item[2] <= now), None)
+                if ready is None:
+                    return
+                self._queue.remove(ready)
+                path, names, _ = ready
+            if not os.path.isfile(path):
+                continue
+            if names is None:
+                names = self._names_in(path)
+            if self.job_manager.has_active_source(path):
+                with self._lock: # Já retomado por resume_interrupted(); confere de novo mais tarde
+                    self._queue.append((path, names, now + RETRY_DELAY_S))
+                continue
+            with self._lock:
+                self._in_flight[path] = {'names': names}
+            try:
+                job_id = self.job_manager.submit_file(
+                    path, PRIORITY_BULK, on_finished_callback=lambda status, message, p=path: self._on_finished(p, status, message))
+            except OSError as e:
+                with self._lock:
+                    self._in_flight.pop(path, None)
+                self.log_callback(f"Spool: não foi possível enviar '{path}': {e}")
+                continue
+            except ValueError as e:
+                self._on_finished(path, JOB_ERROR, str(e), permanent=True) # Não cabe numa mensagem: tentar de novo não muda nada
+                continue
+            with self._lock:
+                if path in self._in_flight:
+                    self._in_flight[path]['job_id'] = job_id
+
+    @staticmethod
+    def _encoded_size(path):
+        """Tamanho da mensagem que submit_file montaria para o arquivo (o conteúdo vai comprimido)."""
+        name = os.path.basename(path)
+        with open(path, "rb") as f:
+            data = f.read()
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        if name.endswith(envelope.ARCHIVE_FILE_EXTENSION):
+            return len(envelope.encode_archive(name, data, mtime_ns))
+        return len(envelope.encode_file(name, data, mtime_ns))
+
+    def _move_to_failed(self, path, reason):
+        os.makedirs(self.failed_dir, exist_ok=True)
+        os.replace(path, os.path.join(self.failed_dir, os.path.basename(path)))
+        self.log_callback(f"Spool: envio de '{os.path.basename(path)}' {reason}; movido para {FAILED_DIR_NAME}/.")
+
+    def _notify(self, status, path, names, message):
+        try:
+            self.on_sent_callback(status, path, names, message)
+        except Exception as e:
+            self.log_callback(f"Erro no callback do spool: {e}")
+
+    @staticmethod
+    def _names_in(path):
+        if not path.endswith(envelope.ARCHIVE_FILE_EXTENSION):
+            return [os.path.basename(path)]
+        try:
+            with open(path, "rb") as f:
+                return [name for name, _, _ in envelope.unpack_archive(f.read())]
+        except (OSError, ValueError):
+            return []
+
+    def _on_finished(self, path, status, message, permanent=False):
+        """Fim de um envio do spool. 'permanent': erro que nenhuma nova tentativa resolve (vai para .failed/)."""
+        with self._lock:
+            info = self._in_flight.pop(path, None)
+            if permanent:
+                self._failures.pop(path, None)
+                self.stats["errors"] += 1
+        names = info['names'] if info else []
+        if permanent:
+            if os.path.exists(path):
+                self._move_to_failed(path, f"falhou sem volta ({message})")
+        elif status == JOB_SUCCESS:
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            with self._lock:
+                self._failures.pop(path, None)
+                self.stats["files_sent"] += len(names)
+                self.stats["bytes_sent"] += size
+                if path.endswith(envelope.ARCHIVE_FILE_EXTENSION):
+                    self.stats["packs_sent"] += 1
+        elif not self.running or not self.job_manager.running:
+            return # Encerramento do app: fica em .sending/ para a próxima execução
+        elif status == JOB_CANCELLED:
+            self._move_to_failed(path, "cancelado")
+        else:
+            with self._lock:
+                failures = self._failures.get(path, 0) + 1
+                self._failures[path] = failures
+                self.stats["errors"] += 1
+                delay = min(RETRY_DELAY_S * 2 ** (failures - 1), MAX_RETRY_DELAY_S)
+                self._queue.append((path, names, time.monotonic() + delay))
+            self.log_callback(f"Spool: falha ao enviar '{os.path.basename(path)}' ({message}); nova tentativa em {delay:.0f} s.")
+        if self.on_sent_callback:
+            self._notify(status, path, names, message)
+        self._wake.set()
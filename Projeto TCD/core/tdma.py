@@ -0,0 +1,222 @@
+# core/tdma.py
+
+import threading
+import time
+
+# --- Valores padrão do escalonador de slots TDMA ---
+DEFAULT_MIN_SLOT_MS = 500          # Slot mínimo garantido a cada lado (mesmo ocioso, para anunciar seu status)
+DEFAULT_GUARD_MS = 50              # Intervalo de guarda no fim de cada slot (absorve pequenas diferenças de relógio)
+PEER_STATUS_TIMEOUT_S = 15.0       # Sem status do outro lado por este tempo: volta à divisão igualitária
+
+
+class TdmaSlotScheduler:
+    """
+    Escalonador de slots TDMA com fronteiras exatas e tamanho adaptado à demanda.
+
+    - O ciclo é ancorado num instante fixo (epoch) e avança somando a duração do ciclo,
+      nunca "reiniciando" no instante atual; assim as fronteiras dos slots não derivam.
+    - O dispositivo de menor ID transmite primeiro em cada ciclo.
+    - O tamanho dos slots é recalculado apenas nas fronteiras de ciclo, proporcional à
+      profundidade de fila de cada lado. Um lado ocioso fica só com o slot mínimo e cede o resto.
+    - A divisão usa só profundidades anunciadas, nunca a fila ao vivo: o segundo a transmitir fecha
+      o par do ciclo (a profundidade do primeiro que ele ouviu + a sua) e o anuncia. Os dois lados
+      aplicam esse par na mesma fronteira, a do fim do ciclo em que ele foi anunciado. Se o par não
+      chegou, o primeiro lado fica só com o slot mínimo: o segundo ocupa no máximo o resto do ciclo.
+    - wait_for_my_slot() dorme até a próxima fronteira em vez de ficar em busy loop.
+    """
+
+    def __init__(self, this_device_id, peer_device_id, slot_duration_ms,
+                 min_slot_ms=DEFAULT_MIN_SLOT_MS, guard_ms=DEFAULT_GUARD_MS, clock=time.monotonic, epoch=None):
+        self.this_device_id = this_device_id
+        self.peer_device_id = peer_device_id
+        self.base_slot_s = slot_duration_ms / 1000.0
+        self.min_slot_s = min(min_slot_ms, slot_duration_ms) / 1000.0
+        self.guard_s = guard_ms / 1000.0
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._layout_changed = threading.Event() # Acorda quem dorme esperando o slot quando a divisão muda
+        self._local_queue_depth = 0
+        self._peer_queue_depth = None # None = ainda não recebemos status do outro lado
+        self._peer_status_time = 0.0
+        self._agreed_depths = None # (fila do primeiro, fila do segundo) fechado neste ciclo; vale a partir do próximo
+
+        self._cycle_start = clock() if epoch is None else epoch
+        self._slots = self._compute_slots_locked(None) # {device_id: duração do slot em segundos} do ciclo atual
+
+    # --- Entradas de demanda ---
+
+    def set_local_queue_depth(self, depth):
+        """Fila ao vivo; só entra na divisão dos slots depois de anunciada (advertise_local_depth)."""
+        with self._lock:
+            self._local_queue_depth = max(0, int(depth))
+
+    def advertise_local_depth(self):
+        """
+        Chamado ao anunciar nosso status ao outro lado (uma vez por ciclo, no nosso slot).
+        Retorna (nossa fila, fila do outro lado que ouvimos ou None) para ir no pacote de status.
+        """
+        now = self._clock()
+        with self._lock:
+            self._advance_locked(now) # O anúncio pertence ao ciclo que contém 'now'
+            depth = self._local_queue_depth
+            peer_depth = self._peer_depth_locked()
+            if not self._is_first():
+                self._agreed_depths = (peer_depth, depth)
+            return depth, peer_depth
+
+    def update_peer_status(self, queue_depth, echoed_depth=None):
+        """
+        Chamado quando chega um pacote de status do outro lado anunciando a fila dele e, em
+        'echoed_depth', a nossa fila que ele ouviu (None se ele ainda não ouviu nenhuma).
+        """
+        now = self._clock()
+        with self._lock:
+            self._advance_locked(now)
+            self._peer_queue_depth = max(0, int(queue_depth))
+            self._peer_status_time = now
+            # O par do segundo lado só vale se chegou dentro do slot dele neste ciclo; atrasado demais, ele já
+            # pode ter aplicado o par numa fronteira que nós cruzamos sem ele
+            if self._is_first() and now >= self._cycle_start + self._slots[self.this_device_id]:
+                self._agreed_depths = (None if echoed_depth is None else max(0, int(echoed_depth)),
+                                       self._peer_queue_depth)
+
+    def align(self, epoch, tolerance_s):
+        """
+        Alinha a grade de ciclos a 'epoch' (início de ciclo no relógio local, vindo da sincronização
+        com o outro lado). Só mexe se a fase atual diferir mais que tolerance_s. Retorna True se realinhou.
+        """
+        with self._lock:
+            cycle_s = self.base_slot_s * 2 # A divisão muda, mas a duração do ciclo é sempre a mesma
+            phase_error = (self._cycle_start - epoch) % cycle_s
+            phase_error = min(phase_error, cycle_s - phase_error)
+            if phase_error <= tolerance_s:
+                return False
+            now = self._clock()
+            self._cycle_start = epoch + ((now - epoch) // cycle_s) * cycle_s
+            self._agreed_depths = None # O par fechado na grade antiga não vale para a nova
+        self._layout_changed.set()
+        return True
+
+    # --- Cálculo dos slots ---
+
+    def _peer_depth_locked(self):
+        if self._peer_queue_depth is None or self._clock() - self._peer_status_time > PEER_STATUS_TIMEOUT_S:
+            return None
+        return self._peer_queue_depth
+
+    def _compute_slots_locked(self, agreed_depths):
+        """Divisão do ciclo que começa agora, a partir do par fechado no ciclo que terminou."""
+        cycle_s = self.base_slot_s * 2
+        if agreed_depths is None:
+            if self._is_first() and self._peer_depth_locked() is not None:
+                # O outro lado está ativo e pode ter fechado um par que não chegou até nós: o slot mínimo
+                # é o único que nunca invade o dele
+                local_s = self.min_slot_s
+            else:
+                local_s = self.base_slot_s
+        else:
+            first_depth, second_depth = agreed_depths
+            if first_depth is None or first_depth + second_depth == 0:
+                # Sem informação (ou ambos ociosos): divisão igualitária, igual ao comportamento original
+                local_s = self.base_slot_s
+            else:
+                first_s = cycle_s * first_depth / (first_depth + second_depth)
+                first_s = min(max(first_s, self.min_slot_s), cycle_s - self.min_slot_s)
+                local_s = first_s if self._is_first() else cycle_s - first_s
+
+        return {self.this_device_id: local_s, self.peer_device_id: cycle_s - local_s}
+
+    def _order(self):
+        return sorted((self.this_device_id, self.peer_device_id))
+
+    def _is_first(self):
+        return self._order()[0] == self.this_device_id
+
+    def _advance_locked(self, now):
+        """Avança o ciclo atual até conter 'now', recalculando a divisão em cada fronteira."""
+        changed = False
+        cycle_s = sum(self._slots.values())
+        while now >= self._cycle_start + cycle_s:
+            self._cycle_start += cycle_s
+            self._slots = self._compute_slots_locked(self._agreed_depths)
+            self._agreed_depths = None
+            cycle_s = sum(self._slots.values())
+            changed = True
+        if now < self._cycle_start:
+            # Início de ciclo no futuro (epoch informado): considera o ciclo anterior com a mesma divisão
+            self._cycle_start -= cycle_s * ((self._cycle_start - now) // cycle_s + 1)
+        return changed
+
+    def _my_slot_window_locked(self, now):
+        """Retorna (início, fim) do slot deste dispositivo no ciclo que contém 'now'."""
+        self._advance_locked(now)
+        offset = self._cycle_start
+        for device_id in self._order():
+            if device_id == self.this_device_id:
+                return offset, offset + self._slots[device_id]
+            offset += self._slots[device_id]
+        return offset, offset # Não alcançável
+
+    # --- Consultas ---
+
+    def is_my_turn(self, now=None):
+        now = self._clock() if now is None else now
+        with self._lock:
+            start, end = self._my_slot_window_locked(now)
+        return start <= now < end - self.guard_s
+
+    def time_until_my_slot(self, now=None):
+        """Segundos até o início do próximo slot deste dispositivo (0 se já estamos nele)."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            start, end = self._my_slot_window_locked(now)
+            if start <= now < end - self.guard_s:
+                return 0.0
+            if now < start:
+                return start - now
+            # Já passamos do nosso slot neste ciclo: próximo ciclo (a divisão pode mudar na fronteira,
+            # mas como o nosso slot começa logo após o slot anterior, estimamos com a divisão atual)
+            cycle_s = sum(self._slots.values())
+            return (start + cycle_s) - now
+
+    def remaining_in_my_slot(self, now=None):
+        now = self._clock() if now is None else now
+        with self._lock:
+            start, end = self._my_slot_window_locked(now)
+        if start <= now < end - self.guard_s:
+            return end - self.guard_s - now
+        return 0.0
+
+    def wait_for_my_slot(self, cancel_flag=None, max_wait=None):
+        """
+        Dorme até a fronteira exata do próximo slot deste dispositivo.
+        Retorna True quando o slot começa; False se cancelado ou se max_wait expirar antes.
+        """
+        deadline = None if max_wait is None else self._clock() + max_wait
+        while True:
+            if cancel_flag is not None and cancel_flag.is_set():
+                return False
+            delay = self.time_until_my_slot()
+            if delay <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            # Acorda no máximo a cada 0,2 s para verificar cancelamento
+            self._layout_changed.wait(timeout=min(delay, 0.2))
+            self._layout_changed.clear()
+
+    def get_state(self):
+        now = self._clock()
+        with self._lock:
+            start, end = self._my_slot_window_locked(now)
+            return {
+                "my_slot_ms": int(self._slots[self.this_device_id] * 1000),
+                "peer_slot_ms": int(self._slots[self.peer_device_id] * 1000),
+                "local_queue_depth": self._local_queue_depth,
+                "peer_queue_depth": self._peer_depth_locked(),
+                "in_my_slot": start <= now < end - self.guard_s,
+            }
@@ -0,0 +1,140 @@
+# core/telemetry.py
+
+import struct
+import threading
+
+# --- Telemetria binária do firmware ---
+# No modo binário o firmware não imprime texto de debug: cada evento do rádio vira um registro de 5 bytes,
+# agrupados em quadros PACKET_TYPE_TELEMETRY de 27 bytes (o texto equivalente tinha 80 a 120 bytes por evento).
+# Quadro: message_id = registros descartados pelo firmware (contador de 8 bits, buffer serial cheio),
+# fragment_idx = quantidade de registros, total_fragments = sequência do quadro (16 bits).
+# Payload: millis() do primeiro registro (u32) + registros [evento, msg_id, frag_idx, arg, ms desde a base].
+LINK_TELEMETRY_MODE = 0x08 # Comando LINK (mesmo tipo de quadro de serial_link.py). Payload: modo (u8). Sem resposta
+TELEMETRY_TEXT = 0         # Texto de debug legível (boot do firmware, útil no Monitor Serial)
+TELEMETRY_BINARY = 1
+
+TELEMETRY_BASE_FORMAT = "<I"
+TELEMETRY_RECORD_FORMAT = "<BBBBB"
+TELEMETRY_RECORD_SIZE = struct.calcsize(TELEMETRY_RECORD_FORMAT)
+
+# Eventos (iguais ao firmware)
+TEL_DATA_TX = 1         # arg: payload_len
+TEL_DATA_RETX = 2       # arg: payload_len
+TEL_ACK_TX = 3
+TEL_NACK_TX = 4
+TEL_DATA_RX = 5         # arg: payload_len
+TEL_ACK_RX = 6
+TEL_NACK_RX = 7
+TEL_RF_CRC_FAIL = 8     # arg: packet_type
+TEL_RF_BAD_FRAME = 9    # arg: tamanho do quadro
+TEL_ARQ_GIVE_UP = 10    # arg: tentativas
+TEL_SERIAL_CRC_FAIL = 11
+TEL_SERIAL_BUSY = 12    # Quadro do Python recusado (backoff ou buffer ARQ cheio). arg: unacked_count
+TEL_RF_BITRATE = 13     # arg: taxa nova / 100
+
+TELEMETRY_EVENT_NAMES = {
+    TEL_DATA_TX: "data_tx",
+    TEL_DATA_RETX: "data_retx",
+    TEL_ACK_TX: "ack_tx",
+    TEL_NACK_TX: "nack_tx",
+    TEL_DATA_RX: "data_rx",
+    TEL_ACK_RX: "ack_rx",
+    TEL_NACK_RX: "nack_rx",
+    TEL_RF_CRC_FAIL: "rf_crc_fail",
+    TEL_RF_BAD_FRAME: "rf_bad_frame",
+    TEL_ARQ_GIVE_UP: "arq_give_up",
+    TEL_SERIAL_CRC_FAIL: "serial_crc_fail",
+    TEL_SERIAL_BUSY: "serial_busy",
+    TEL_RF_BITRATE: "rf_bitrate",
+}
+
+
+def decode_telemetry(record_count, payload):
+    """Lista de (millis, evento, message_id, fragment_idx, arg) de um quadro de telemetria."""
+    base_size = struct.calcsize(TELEMETRY_BASE_FORMAT)
+    if len(payload) < base_size + record_count * TELEMETRY_RECORD_SIZE:
+        raise ValueError("Quadro de telemetria truncado.")
+    base = struct.unpack_from(TELEMETRY_BASE_FORMAT, payload)[0]
+    records = []
+    for i in range(record_count):
+        event, message_id, fragment_idx, arg, offset = struct.unpack_from(
+            TELEMETRY_RECORD_FORMAT, payload, base_size + i * TELEMETRY_RECORD_SIZE)
+        records.append(((base + offset) & 0xFFFFFFFF, event, message_id, fragment_idx, arg))
+    return records
+
+
+def describe_record(millis, event, message_id, fragment_idx, arg):
+    """Linha de log equivalente ao texto de debug do firmware."""
+    name = TELEMETRY_EVENT_NAMES.get(event, f"evento_{event}")
+    if event == TEL_RF_CRC_FAIL:
+        detail = f"tipo 0x{arg:02X}"
+    elif event == TEL_RF_BAD_FRAME:
+        detail = f"{arg} bytes"
+    elif event == TEL_ARQ_GIVE_UP:
+        detail = f"{arg} tentativas"
+    elif event == TEL_SERIAL_BUSY:
+        detail = f"{arg} fragmentos pendentes"
+    elif event == TEL_RF_BITRATE:
+        detail = f"{arg * 100} bps"
+    elif event in (TEL_DATA_TX, TEL_DATA_RETX, TEL_DATA_RX):
+        detail = f"{arg} bytes"
+    else:
+        detail = ""
+    return f"Firmware @{millis} ms: {name} MsgID {message_id}, Frag {fragment_idx}" + (f" ({detail})" if detail else "")
+
+
+class FirmwareTelemetry:
+    """Decodifica os quadros de telemetria do NOSSO Arduino em linhas de log e contadores por evento."""
+
+    def __init__(self, log_callback=None, log_records=True):
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self.log_records = log_records
+        self.mode = TELEMETRY_TEXT # Modo informado pelo último status do firmware
+        self._lock = threading.Lock()
+        self._counters = {name: 0 for name in TELEMETRY_EVENT_NAMES.values()}
+        self._frames = 0
+        self._lost_frames = 0       # Lacunas na sequência (quadro corrompido na serial)
+        self._dropped_records = 0   # Descartados no firmware com o buffer serial cheio
+        self._last_seq = None
+        self._last_dropped = None
+
+    def _default_log_callback(self, message):
+        print(f"[FirmwareTelemetry] {message}")
+
+    def reset(self):
+        """Porta reaberta: o firmware reiniciou (sequência e contadores dele voltam a zero)."""
+        with self._lock:
+            self.mode = TELEMETRY_TEXT
+            self._last_seq = None
+            self._last_dropped = None
+
+    def on_status(self, mode):
+        self.mode = mode
+
+    def on_frame(self, dropped_counter, record_count, seq, payload):
+        try:
+            records = decode_telemetry(record_count, payload)
+        except ValueError as e:
+            self.log_callback(f"AVISO: {e}")
+            return
+        with self._lock:
+            self._frames += 1
+            if self._last_seq is not None:
+                self._lost_frames += (seq - self._last_seq - 1) & 0xFFFF
+            self._last_seq = seq
+            if self._last_dropped is not None:
+                self._dropped_records += (dropped_counter - self._last_dropped) & 0xFF
+            self._last_dropped = dropped_counter
+            for record in records:
+                name = TELEMETRY_EVENT_NAMES.get(record[1])
+                if name:
+                    self._counters[name] += 1
+        if self.log_records:
+            for record in records:
+                self.log_callback(describe_record(*record))
+
+    def get_stats(self):
+        with self._lock:
+            return {"mode": "binary" if self.mode == TELEMETRY_BINARY else "text", "frames": self._frames,
+                    "lost_frames": self._lost_frames, "dropped_records": self._dropped_records,
+                    "events": dict(self._counters)}
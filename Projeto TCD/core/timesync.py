@@ -0,0 +1,94 @@
+# core/timesync.py
+
+import threading
+from collections import deque
+
+MILLIS_WRAP = 2 ** 32            # millis() do Arduino é um uint32 e dá a volta a cada ~49,7 dias
+DEFAULT_SYNC_WINDOW = 32         # Quantidade de beacons usados na estimativa
+MIN_SAMPLES_FOR_SYNC = 4         # Antes disso, consideramos o relógio "não sincronizado"
+MIN_SPAN_FOR_DRIFT_S = 10.0      # Intervalo mínimo entre amostras para estimar deriva (abaixo disso, deriva = 0)
+
+
+class ClockSync:
+    """
+    Estima a relação entre o relógio local (time.monotonic, em segundos) e o relógio de
+    referência (millis() do Arduino mestre, recebido em beacons).
+
+    Modelo: remote_ms = offset_ms + (1 + drift) * local_s * 1000 - atraso
+    - A deriva é estimada por mínimos quadrados sobre a janela de amostras.
+    - O atraso de entrega é sempre positivo e variável, então o offset é ajustado pela amostra
+      de MENOR atraso (envelope inferior), que é a mais próxima do instante real.
+    """
+
+    def __init__(self, window=DEFAULT_SYNC_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window) # (local_s, remote_ms desembrulhado)
+        self._last_raw_millis = None
+        self._wrap_offset = 0
+        self._offset_ms = 0.0
+        self._drift = 0.0
+        self._jitter_ms = 0.0
+
+    def add_sample(self, remote_millis, local_s):
+        """Registra um beacon: remote_millis (uint32 do Arduino) recebido no instante local_s."""
+        with self._lock:
+            if self._last_raw_millis is not None and remote_millis < self._last_raw_millis \
+                    and self._last_raw_millis - remote_millis > MILLIS_WRAP // 2:
+                self._wrap_offset += MILLIS_WRAP # millis() deu a volta
+            elif self._last_raw_millis is not None and remote_millis < self._last_raw_millis:
+                # Voltou no tempo sem ser wrap (os beacons chegam em ordem pela serial): o Arduino mestre
+                # reiniciou, mesmo que tenha sido logo após a partida anterior. Recomeça a estimativa.
+                self._samples.clear()
+                self._wrap_offset = 0
+            self._last_raw_millis = remote_millis
+            self._samples.append((local_s, remote_millis + self._wrap_offset))
+            self._estimate_locked()
+
+    def _estimate_locked(self):
+        n = len(self._samples)
+        if n == 0:
+            return
+        local0 = self._samples[0][0]
+        xs = [(local - local0) * 1000.0 for local, _ in self._samples]
+        ys = [remote for _, remote in self._samples]
+
+        span_ms = xs[-1] - xs[0]
+        drift = 0.0
+        if n >= 2 and span_ms >= MIN_SPAN_FOR_DRIFT_S * 1000.0:
+            mean_x = sum(xs) / n
+            mean_y = sum(ys) / n
+            var_x = sum((x - mean_x) ** 2 for x in xs)
+            if var_x > 0:
+                slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+                drift = slope - 1.0
+
+        # Envelope inferior do atraso: a amostra com maior (remote - previsto) teve o menor atraso
+        residuals = [y - (1.0 + drift) * x for x, y in zip(xs, ys)]
+        best = max(residuals)
+        self._drift = drift
+        self._offset_ms = best - (1.0 + drift) * local0 * 1000.0
+        self._jitter_ms = best - min(residuals)
+
+    def is_synchronized(self):
+        with self._lock:
+            return len(self._samples) >= MIN_SAMPLES_FOR_SYNC
+
+    def to_remote_ms(self, local_s):
+        """Converte um instante local (time.monotonic) para o tempo de referência em ms."""
+        with self._lock:
+            return self._offset_ms + (1.0 + self._drift) * local_s * 1000.0
+
+    def to_local_s(self, remote_ms):
+        """Converte um tempo de referência (ms, já desembrulhado) para time.monotonic local."""
+        with self._lock:
+            return (remote_ms - self._offset_ms) / ((1.0 + self._drift) * 1000.0)
+
+    def get_state(self):
+        with self._lock:
+            return {
+                "synchronized": len(self._samples) >= MIN_SAMPLES_FOR_SYNC,
+                "samples": len(self._samples),
+                "offset_ms": round(self._offset_ms, 3),
+                "drift_ppm": round(self._drift * 1e6, 3),
+                "jitter_ms": round(self._jitter_ms, 3),
+            }
@@ -0,0 +1,367 @@
+# core/trace_analysis.py
+
+import argparse
+import csv
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+from arduino import (PACKET_FORMAT, TOTAL_PACKET_SIZE, MAX_PACKET_PAYLOAD_SIZE, PACKET_FIXED_OVERHEAD, CRC4_TABLE,
+                     PACKET_TYPE_DATA, PACKET_TYPE_ACK, PACKET_TYPE_NACK, PACKET_TYPE_LINK, PACKET_TYPE_TELEMETRY,
+                     MAX_FILE_MESSAGE_ID, THIS_DEVICE_ID, TRANSMISSION_SLOT_DURATION_MS, CYCLE_DURATION_MS)
+from capture import TraceReader, TRACE_MAGIC, DIRECTION_RX, DIRECTION_TX
+from rf_rate import RF_DEFAULT_BITRATE, frame_air_bits
+
+# --- Análise offline de traces (capture.py) ou dumps de quadros brutos ---
+# Todos os quadros são carregados num array estruturado do NumPy com o mesmo layout de PACKET_FORMAT
+# e as estatísticas são calculadas em operações vetorizadas (CRC inclusive), sem struct.unpack por quadro.
+FRAME_DTYPE = np.dtype([
+    ('packet_type', 'u1'),
+    ('device_id', 'u1'),
+    ('message_id', 'u1'),
+    ('fragment_idx', 'u1'),
+    ('total_fragments', '<u2'),
+    ('payload_len', 'u1'),
+    ('payload', 'u1', (MAX_PACKET_PAYLOAD_SIZE,)),
+    ('crc_value', 'u1'),
+])
+assert FRAME_DTYPE.itemsize == struct.calcsize(PACKET_FORMAT) == TOTAL_PACKET_SIZE
+
+# Tempo de ar: o firmware só transmite os bytes usados de cada quadro (rf_rate.frame_air_bits) e a taxa
+# do rádio muda com a adaptação (rf_rate); a análise usa a taxa informada (--rf-bitrate), padrão a do boot.
+
+DEFAULT_BIN_S = 1.0
+RTT_HISTOGRAM_EDGES_MS = (0, 50, 100, 200, 300, 400, 500, 700, 1000, 1500, 2000, 3000, 5000)
+_TIME_KEY_BITS = 47 # (chave << 47) | t_ns: até ~39 h de trace numa única ordenação int64
+
+_CRC4 = np.array(CRC4_TABLE, dtype=np.uint8)
+
+
+class FrameSet:
+    """Quadros de uma direção do trace: array estruturado, bytes crus (N x 27), instantes (ns) e CRC válido."""
+
+    def __init__(self, raw, t_ns):
+        self.raw = raw
+        self.frames = raw.view(FRAME_DTYPE).reshape(-1)
+        self.t_ns = t_ns
+        self.crc_ok = crc4_valid(raw)
+
+    def __len__(self):
+        return len(self.frames)
+
+
+def crc4_valid(raw):
+    """CRC-4 de todos os quadros de uma vez (mesma cobertura do Arduino e de arduino.encode_packet)."""
+    packet_type = raw[:, 0]
+    payload_len = np.minimum(raw[:, PACKET_FIXED_OVERHEAD - 1], MAX_PACKET_PAYLOAD_SIZE).astype(np.int16)
+    # DATA (e NACK com lista de faltantes, ver gaps.py): campos fixos + payload_len bytes do payload;
+    # ACK/NACK simples: type, dev_id, msg_id, frag_idx
+    data_like = (packet_type == PACKET_TYPE_DATA) | (packet_type == PACKET_TYPE_LINK) | (packet_type == PACKET_TYPE_TELEMETRY) \
+        | ((packet_type == PACKET_TYPE_NACK) & (payload_len > 0))
+    covered = np.where(data_like, PACKET_FIXED_OVERHEAD + payload_len,
+                       np.where((packet_type == PACKET_TYPE_ACK) | (packet_type == PACKET_TYPE_NACK), 4, 0))
+    crc = np.zeros(len(raw), dtype=np.uint8)
+    for col in range(TOTAL_PACKET_SIZE - 1):
+        active = col < covered
+        if not active.any():
+            break
+        byte = raw[:, col]
+        updated = _CRC4[crc ^ (byte >> 4)]
+        updated = _CRC4[updated ^ (byte & 0x0F)]
+        crc = np.where(active, updated, crc)
+    return (covered > 0) & (crc == raw[:, TOTAL_PACKET_SIZE - 1])
+
+
+def _frames_from_stream(chunks, chunk_t_ns):
+    """
+    Remonta quadros de 27 bytes a partir dos blocos lidos/escritos, exatamente como o parser
+    (_process_incoming_bytes: blocos consecutivos a partir do primeiro byte). O instante de cada quadro
+    é o do bloco em que chegou o seu último byte.
+    """
+    stream = np.frombuffer(b''.join(chunks), dtype=np.uint8)
+    count = len(stream) // TOTAL_PACKET_SIZE
+    raw = stream[:count * TOTAL_PACKET_SIZE].reshape(count, TOTAL_PACKET_SIZE)
+    chunk_ends = np.cumsum([len(c) for c in chunks])
+    last_byte = np.arange(1, count + 1) * TOTAL_PACKET_SIZE - 1
+    t_ns = np.asarray(chunk_t_ns, dtype=np.int64)[np.searchsorted(chunk_ends, last_byte, side='right')] \
+        if count else np.zeros(0, dtype=np.int64)
+    return FrameSet(raw, t_ns)
+
+
+def load_frames(path):
+    """
+    Retorna {DIRECTION_RX: FrameSet, DIRECTION_TX: FrameSet}.
+    Aceita traces .tcdtrace ou um dump de quadros de 27 bytes concatenados (tratados como RX, sem instante:
+    o índice do quadro vira o "tempo" em ms e as métricas temporais perdem o sentido).
+    """
+    with open(path, "rb") as f:
+        is_trace = f.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+
+    if not is_trace:
+        with open(path, "rb") as f:
+            data = f.read()
+        count = len(data) // TOTAL_PACKET_SIZE
+        raw = np.frombuffer(data, dtype=np.uint8)[:count * TOTAL_PACKET_SIZE].reshape(count, TOTAL_PACKET_SIZE)
+        return {DIRECTION_RX: FrameSet(raw, np.arange(count, dtype=np.int64) * 10**6),
+                DIRECTION_TX: _frames_from_stream([], [])}
+
+    chunks = {DIRECTION_RX: [], DIRECTION_TX: []}
+    times = {DIRECTION_RX: [], DIRECTION_TX: []}
+    with TraceReader(path) as reader:
+        for t_ns, direction, data in reader.records():
+            chunks[direction].append(bytes(data))
+            times[direction].append(t_ns)
+    return {direction: _frames_from_stream(chunks[direction], times[direction]) for direction in chunks}
+
+
+# --- Estatísticas ---
+
+def _rate(numerator, denominator):
+    return round(float(numerator) / denominator, 6) if denominator else None
+
+
+def _unique_frames(raw):
+    """Índice de quadro único para cada quadro (retransmissões são idênticas byte a byte) e a quantidade de únicos."""
+    if not len(raw):
+        return np.zeros(0, dtype=np.int64), 0
+    rows = np.ascontiguousarray(raw).view(np.dtype((np.void, TOTAL_PACKET_SIZE))).reshape(-1)
+    _, inverse = np.unique(rows, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return inverse, int(inverse.max()) + 1
+
+
+def _first_occurrence(inverse, unique_count):
+    """Máscara dos quadros que são a primeira ocorrência do seu conteúdo."""
+    first = np.full(unique_count, len(inverse), dtype=np.int64)
+    np.minimum.at(first, inverse, np.arange(len(inverse)))
+    mask = np.zeros(len(inverse), dtype=bool)
+    mask[first] = True
+    return mask
+
+
+def _fragment_key(frames):
+    return (frames['message_id'].astype(np.int64) << 8) | frames['fragment_idx']
+
+
+def _is_file_data(frames, crc_ok):
+    return crc_ok & (frames['packet_type'] == PACKET_TYPE_DATA) & (frames['message_id'] < MAX_FILE_MESSAGE_ID)
+
+
+def _match_acks(tx_key, tx_t, ack_key, ack_t):
+    """
+    Para cada ACK, o índice do último envio do mesmo (MsgID, fragmento) antes dele, ou -1
+    (MsgIDs são reutilizados, então vale o mais recente).
+    """
+    if not len(tx_key) or not len(ack_key):
+        return np.full(len(ack_key), -1, dtype=np.int64)
+    origin = min(int(tx_t.min()), int(ack_t.min()))
+    tx_combined = (tx_key << _TIME_KEY_BITS) | (tx_t - origin)
+    order = np.argsort(tx_combined, kind='stable')
+    tx_sorted = tx_combined[order]
+    pos = np.searchsorted(tx_sorted, (ack_key << _TIME_KEY_BITS) | (ack_t - origin), side='right') - 1
+    key_start = np.searchsorted(tx_sorted, ack_key << _TIME_KEY_BITS, side='left')
+    return np.where(pos >= key_start, order[np.clip(pos, 0, None)], -1)
+
+
+def _airtime_s(frames, rf_bitrate_bps):
+    """Tempo no ar de cada quadro: cabeçalho + payload_len bytes (ACK/NACK simples: só o cabeçalho)."""
+    payload_len = np.minimum(frames['payload_len'], MAX_PACKET_PAYLOAD_SIZE).astype(np.int64)
+    return frame_air_bits(payload_len) / float(rf_bitrate_bps)
+
+
+def _distribution(values_ms, edges_ms=RTT_HISTOGRAM_EDGES_MS):
+    if not len(values_ms):
+        return {"samples": 0}
+    p50, p90, p99 = np.percentile(values_ms, [50, 90, 99])
+    edges = np.array(list(edges_ms) + [max(float(values_ms.max()), edges_ms[-1]) + 1])
+    counts, _ = np.histogram(values_ms, bins=edges)
+    return {"samples": int(len(values_ms)), "min": round(float(values_ms.min()), 3),
+            "mean": round(float(values_ms.mean()), 3), "p50": round(float(p50), 3), "p90": round(float(p90), 3),
+            "p99": round(float(p99), 3), "max": round(float(values_ms.max()), 3),
+            "histogram": {"edges_ms": [round(float(e), 3) for e in edges], "counts": counts.tolist()}}
+
+
+def _binned_sum(t_ns, weights, origin_ns, bin_ns, bins):
+    if not len(t_ns):
+        return np.zeros(bins)
+    idx = np.clip((t_ns - origin_ns) // bin_ns, 0, bins - 1)
+    return np.bincount(idx, weights=weights, minlength=bins)[:bins]
+
+
+def analyse(frame_sets, bin_s=DEFAULT_BIN_S, this_device_id=None, rf_bitrate_bps=RF_DEFAULT_BITRATE):
+    """
+    Calcula as estatísticas do link a partir de load_frames(). Retorna (resumo em dict, série temporal em lista
+    de dicts por intervalo de bin_s segundos).
+
+    Lado "out": DATA que este PC escreveu na serial e os ACK/NACK que voltaram do outro lado.
+    Lado "in": DATA do outro PC que chegaram pela serial e os ACK/NACK que respondemos.
+    rf_bitrate_bps: taxa do rádio durante o trace, para o tempo de ar dos quadros (utilização dos slots).
+    """
+    rx, tx = frame_sets[DIRECTION_RX], frame_sets[DIRECTION_TX]
+    rxf, txf = rx.frames, tx.frames
+
+    tx_data = _is_file_data(txf, tx.crc_ok)
+    if this_device_id is None:
+        this_device_id = int(np.bincount(txf['device_id'][tx_data]).argmax()) if tx_data.any() else THIS_DEVICE_ID
+
+    from_peer = rxf['device_id'] != this_device_id
+    rx_data = _is_file_data(rxf, rx.crc_ok) & from_peer
+    rx_acks = rx.crc_ok & from_peer & (rxf['packet_type'] == PACKET_TYPE_ACK)
+    rx_nacks = rx.crc_ok & from_peer & (rxf['packet_type'] == PACKET_TYPE_NACK)
+    tx_acks = tx.crc_ok & (txf['packet_type'] == PACKET_TYPE_ACK)
+    tx_nacks = tx.crc_ok & (txf['packet_type'] == PACKET_TYPE_NACK)
+    rx_crc_errors = ~rx.crc_ok
+
+    # --- Lado out: retransmissões, perdas e RTT de ACK ---
+    out_raw, out_t = tx.raw[tx_data], tx.t_ns[tx_data]
+    out_inverse, out_unique = _unique_frames(out_raw)
+    out_key = _fragment_key(txf[tx_data])
+    ack_t = rx.t_ns[rx_acks]
+    match = _match_acks(out_key, out_t, _fragment_key(rxf[rx_acks]), ack_t)
+    matched = match >= 0
+    acked_unique = np.unique(out_inverse[match[matched]]) if matched.any() else np.zeros(0, dtype=np.int64)
+    rtt_ms = (ack_t[matched] - out_t[match[matched]]) / 1e6
+    out_first = _first_occurrence(out_inverse, out_unique) if out_unique else np.zeros(0, dtype=bool)
+    karn = out_first[match[matched]] # ACK de um quadro nunca retransmitido: amostra sem ambiguidade (algoritmo de Karn)
+
+    out_payload = txf['payload_len'][tx_data].astype(np.int64)
+    if matched.any():
+        acked_frames = match[matched]
+        order = np.argsort(ack_t[matched], kind='stable')
+        _, first_idx = np.unique(out_inverse[acked_frames[order]], return_index=True)
+        goodput_ack_t = ack_t[matched][order][first_idx]
+        goodput_ack_bytes = out_payload[acked_frames[order][first_idx]]
+    else:
+        goodput_ack_t = np.zeros(0, dtype=np.int64)
+        goodput_ack_bytes = np.zeros(0, dtype=np.int64)
+
+    # --- Lado in: duplicatas (ACK perdido ou atrasado) e CRC ---
+    in_raw, in_t = rx.raw[rx_data], rx.t_ns[rx_data]
+    in_inverse, in_unique = _unique_frames(in_raw)
+    in_first = _first_occurrence(in_inverse, in_unique) if in_unique else np.zeros(0, dtype=bool)
+    in_payload = rxf['payload_len'][rx_data].astype(np.int64)
+
+    # --- Linha do tempo ---
+    all_t = np.concatenate([rx.t_ns, tx.t_ns])
+    origin = int(all_t.min()) if len(all_t) else 0
+    duration_s = (int(all_t.max()) - origin) / 1e9 if len(all_t) else 0.0
+    bin_ns = max(1, int(bin_s * 1e9))
+    bins = max(1, int((int(all_t.max()) - origin) // bin_ns) + 1) if len(all_t) else 1
+
+    series = {
+        "tx_data_frames": _binned_sum(out_t, None, origin, bin_ns, bins),
+        "tx_retransmissions": _binned_sum(out_t[~out_first], None, origin, bin_ns, bins),
+        "rx_acks": _binned_sum(ack_t, None, origin, bin_ns, bins),
+        "rx_nacks": _binned_sum(rx.t_ns[rx_nacks], None, origin, bin_ns, bins),
+        "rx_data_frames": _binned_sum(in_t, None, origin, bin_ns, bins),
+        "rx_duplicates": _binned_sum(in_t[~in_first], None, origin, bin_ns, bins),
+        "rx_crc_errors": _binned_sum(rx.t_ns[rx_crc_errors], None, origin, bin_ns, bins),
+        "out_goodput_bps": _binned_sum(goodput_ack_t, goodput_ack_bytes * 8, origin, bin_ns, bins) / bin_s,
+        "in_goodput_bps": _binned_sum(in_t[in_first], in_payload[in_first] * 8, origin, bin_ns, bins) / bin_s,
+    }
+
+    # --- Utilização dos slots TDMA: tempo de ar dos quadros de cada lado por ciclo / duração do slot ---
+    cycle_ns = CYCLE_DURATION_MS * 10**6
+    cycles = max(1, int(duration_s * 1e9 // cycle_ns) + 1)
+    slot_s = TRANSMISSION_SLOT_DURATION_MS / 1000.0
+    ours = tx_data | tx_acks | tx_nacks
+    peer = rx_data | rx_acks | rx_nacks
+    ours_util = _binned_sum(tx.t_ns[ours], _airtime_s(txf[ours], rf_bitrate_bps), origin, cycle_ns, cycles) / slot_s
+    peer_util = _binned_sum(rx.t_ns[peer], _airtime_s(rxf[peer], rf_bitrate_bps), origin, cycle_ns, cycles) / slot_s
+
+    tx_data_frames = int(tx_data.sum())
+    rx_data_frames = int(rx_data.sum())
+    rx_frames = len(rx)
+    summary = {
+        "this_device_id": this_device_id,
+        "duration_s": round(duration_s, 6),
+        "frames": {"rx": rx_frames, "tx": len(tx)},
+        "links": {
+            "out": {
+                "data_frames": tx_data_frames,
+                "unique_fragments": out_unique,
+                "retransmissions": tx_data_frames - out_unique,
+                "retransmission_ratio": _rate(tx_data_frames - out_unique, tx_data_frames),
+                "acked_fragments": int(len(acked_unique)),
+                "fragment_loss_rate": _rate(out_unique - len(acked_unique), out_unique),
+                "frame_loss_rate": _rate(tx_data_frames - len(acked_unique), tx_data_frames),
+                "nacks_received": int(rx_nacks.sum()),
+                "goodput_bps": _rate(int(goodput_ack_bytes.sum()) * 8, duration_s),
+            },
+            "in": {
+                "data_frames": rx_data_frames,
+                "unique_fragments": in_unique,
+                "duplicates": rx_data_frames - in_unique,
+                "retransmission_ratio": _rate(rx_data_frames - in_unique, rx_data_frames),
+                "crc_errors": int(rx_crc_errors.sum()),
+                "crc_error_rate": _rate(int(rx_crc_errors.sum()), rx_frames),
+                "acks_sent": int(tx_acks.sum()),
+                "nacks_sent": int(tx_nacks.sum()),
+                "goodput_bps": _rate(int(in_payload[in_first].sum()) * 8, duration_s),
+            },
+        },
+        "ack_rtt_ms": dict(_distribution(rtt_ms[karn]), all_samples=_distribution(rtt_ms)),
+        "slot_utilisation": {
+            "cycle_s": CYCLE_DURATION_MS / 1000.0, "rf_bitrate_bps": rf_bitrate_bps,
+            "frame_airtime_s": round(frame_air_bits(MAX_PACKET_PAYLOAD_SIZE) / float(rf_bitrate_bps), 6),
+            "this_side": {"mean": round(float(ours_util.mean()), 6), "max": round(float(ours_util.max()), 6)},
+            "peer": {"mean": round(float(peer_util.mean()), 6), "max": round(float(peer_util.max()), 6)},
+        },
+    }
+
+    timeseries = []
+    for i in range(bins):
+        row = {"t_s": round(i * bin_s, 6)}
+        for name, values in series.items():
+            value = float(values[i])
+            row[name] = round(value, 3) if name.endswith("_bps") else int(value)
+        timeseries.append(row)
+    return summary, timeseries
+
+
+# --- Exportação ---
+
+def export_json(path, summary):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+def export_csv(path, timeseries):
+    if not timeseries:
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(timeseries[0].keys()))
+        writer.writeheader()
+        writer.writerows(timeseries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estatísticas do link a partir de traces da serial (capture.py).")
+    parser.add_argument("trace", help="arquivo .tcdtrace ou dump de quadros de 27 bytes")
+    parser.add_argument("--bin", type=float, default=DEFAULT_BIN_S, help="intervalo da série temporal, em segundos")
+    parser.add_argument("--device-id", type=lambda v: int(v, 0), default=None,
+                        help="device_id deste PC no trace (padrão: inferido dos quadros enviados)")
+    parser.add_argument("--rf-bitrate", type=int, default=RF_DEFAULT_BITRATE,
+                        help="taxa do rádio durante o trace, em bps (padrão: %(default)s)")
+    parser.add_argument("--json", help="salva o resumo em JSON")
+    parser.add_argument("--csv", help="salva a série temporal em CSV")
+    args = parser.parse_args(argv)
+
+    summary, timeseries = analyse(load_frames(args.trace), bin_s=args.bin, this_device_id=args.device_id,
+                                  rf_bitrate_bps=args.rf_bitrate)
+    summary["source"] = os.path.abspath(args.trace)
+    if args.json:
+        export_json(args.json, summary)
+    if args.csv:
+        export_csv(args.csv, timeseries)
+    if not args.json:
+        json.dump(summary, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# core/tx_scheduler.py
+
+import threading
+import time
+from collections import deque
+
+from latency import STAGE_QUEUE, STAGE_WRITE
+
+# --- Canais virtuais de transmissão ---
+# CONTROL tem prioridade estrita (ACK/NACK): um ACK atrasado atrás de dados infla o RTT
+# do outro lado e provoca retransmissões desnecessárias.
+# Os demais canais dividem a porta com Deficit Round Robin (DRR), proporcional ao quantum.
+CHANNEL_CONTROL = 'control'
+CHANNEL_INTERACTIVE = 'interactive'
+CHANNEL_BULK = 'bulk'
+CHANNEL_TELEMETRY = 'telemetry'
+ALL_CHANNELS = (CHANNEL_CONTROL, CHANNEL_INTERACTIVE, CHANNEL_BULK, CHANNEL_TELEMETRY)
+DRR_CHANNELS = (CHANNEL_INTERACTIVE, CHANNEL_BULK, CHANNEL_TELEMETRY)
+
+# Quantum (em bytes) que cada canal DRR ganha por rodada. 27 bytes = um pacote completo.
+DEFAULT_QUANTUMS = {
+    CHANNEL_INTERACTIVE: 27 * 4,
+    CHANNEL_BULK: 27 * 2,
+    CHANNEL_TELEMETRY: 27,
+}
+
+# Máximo de bytes agrupados numa única chamada a serial.write (escritas coalescidas).
+# Mantido pequeno para que um ACK que chega no meio não espere muito pela próxima escrita.
+MAX_COALESCED_WRITE_BYTES = 27 * 4
+FRAME_SIZE = 27
+
+# --- Contrapressão do buffer de saída ---
+# Bytes já entregues ao sistema operacional (out_waiting) mais o próximo lote nunca passam disto.
+# Sem limite, rajadas de ACKs e retransmissões formam uma fila invisível no driver: o quadro "escrito"
+# ainda leva centenas de ms para sair, o RTT medido incha e um ACK novo não consegue passar na frente.
+# Com o limite, a fila fica aqui, onde CONTROL ainda tem prioridade.
+MAX_IN_FLIGHT_BYTES = 27 * 4
+COALESCE_WINDOW_S = 0.002      # Com a porta ociosa, espera isto por mais quadros antes de escrever um lote incompleto
+BITS_PER_SERIAL_BYTE = 10      # 8N1: start + 8 dados + stop
+DEFAULT_BAUD_RATE = 9600       # Usado para estimar o escoamento se a porta não informar a taxa
+STATS_EWMA_ALPHA = 0.1
+
+
+class TxRequest:
+    """Um quadro já codificado aguardando na fila de um canal."""
+
+    __slots__ = ('data', 'channel', 'trace', 'enqueued_at', 'written_at', 'done', 'result')
+
+    def __init__(self, data, channel, trace=None):
+        self.data = data
+        self.channel = channel
+        self.trace = trace # Registro do ReceiveLatencyTracer (ACK de um DATA recebido), se houver
+        self.enqueued_at = time.perf_counter()
+        self.written_at = None
+        self.done = threading.Event()
+        self.result = None
+
+    def wait(self, timeout=None):
+        """Espera o quadro ser escrito na porta. Retorna o dicionário de resultado (ou erro de timeout)."""
+        if not self.done.wait(timeout):
+            return {"status": "error", "message": "Timeout aguardando escrita na porta serial."}
+        return self.result
+
+
+class SerialTxScheduler:
+    """
+    Thread única dona da escrita na porta serial.
+
+    Todas as threads (leitura enviando ACK/NACK, workers enviando DATA, telemetria...) apenas
+    enfileiram quadros prontos com submit(); só esta thread chama serial_connection.write.
+    """
+
+    def __init__(self, serial_connection, log_callback=None, quantums=None,
+                 max_in_flight_bytes=MAX_IN_FLIGHT_BYTES, coalesce_window_s=COALESCE_WINDOW_S, profiler=None,
+                 latency_tracer=None):
+        self.serial_connection = serial_connection
+        self.profiler = profiler # RuntimeProfiler (profiling.py) do controller, se houver
+        self.latency_tracer = latency_tracer # ReceiveLatencyTracer (latency.py): etapas "queue" e "write" dos ACKs
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self.quantums = dict(DEFAULT_QUANTUMS)
+        if quantums:
+            self.quantums.update(quantums)
+        self.max_in_flight_bytes = max(FRAME_SIZE, max_in_flight_bytes)
+        self.coalesce_window_s = coalesce_window_s
+
+        self._queues = {channel: deque() for channel in ALL_CHANNELS}
+        self._deficits = {channel: 0 for channel in DRR_CHANNELS}
+        self._drr_index = 0 # Canal DRR onde a próxima rodada começa
+        self._drr_resume = False # True se o lote anterior encheu no meio do canal atual (já recebeu o quantum)
+        self._cond = threading.Condition()
+        self._thread = None
+        self.running = False
+
+        # Estatísticas simples (expostas por get_stats)
+        self.frames_written = {channel: 0 for channel in ALL_CHANNELS}
+        self.bytes_written = 0
+        self.write_calls = 0
+        self.out_waiting = 0              # Última leitura do buffer de saída do SO
+        self.out_waiting_max = 0
+        self.backpressure_waits = 0       # Vezes que a escrita esperou o buffer de saída escoar
+        self.backpressure_wait_s = 0.0
+        self.queue_delay_ms = 0.0         # Média móvel do tempo entre submit() e a escrita
+
+    def _default_log_callback(self, message):
+        print(f"[SerialTxScheduler] {message}")
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+        self._thread = threading.Thread(target=self._run, name="SerialTxScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        # Quem ainda estiver esperando recebe erro em vez de ficar preso
+        with self._cond:
+            for channel_queue in self._queues.values():
+                while channel_queue:
+                    self._complete(channel_queue.popleft(), {"status": "error", "message": "Escalonador de TX parado."})
+
+    def submit(self, data, channel=CHANNEL_BULK, trace=None):
+        """
+        Enfileira um quadro codificado no canal indicado. Não bloqueia; use .wait() no retorno se precisar.
+        trace: registro do latency_tracer a completar com os instantes de enfileiramento e de escrita.
+        """
+        if channel not in self._queues:
+            raise ValueError(f"Canal de TX desconhecido: {channel}")
+        request = TxRequest(data, channel, trace if self.latency_tracer is not None else None)
+        with self._cond:
+            if not self.running:
+                self._complete(request, {"status": "error", "message": "Escalonador de TX parado."})
+                return request
+            self._queues[channel].append(request)
+            if request.trace is not None:
+                # Ainda com o lock: a escrita (e a etapa "write") não pode acontecer antes desta marca
+                self.latency_tracer.mark(request.trace, STAGE_QUEUE, time.perf_counter_ns())
+            self._cond.notify()
+        return request
+
+    def queue_depths(self):
+        with self._cond:
+            return {channel: len(channel_queue) for channel, channel_queue in self._queues.items()}
+
+    def get_stats(self):
+        with self._cond:
+            frames = sum(self.frames_written.values())
+            return {
+                "queue_depths": {channel: len(q) for channel, q in self._queues.items()},
+                "queued_bytes": sum(len(request.data) for q in self._queues.values() for request in q),
+                "frames_written": dict(self.frames_written),
+                "bytes_written": self.bytes_written,
+                "write_calls": self.write_calls,
+                "frames_per_write": round(frames / self.write_calls, 2) if self.write_calls else 0.0,
+                "out_waiting": self.out_waiting,
+                "out_waiting_max": self.out_waiting_max,
+                "backpressure_waits": self.backpressure_waits,
+                "backpressure_wait_s": round(self.backpressure_wait_s, 3),
+                "queue_delay_ms": round(self.queue_delay_ms, 2),
+            }
+
+    # --- Escalonamento ---
+
+    def _has_pending_locked(self):
+        return any(self._queues[channel] for channel in ALL_CHANNELS)
+
+    def _pending_bytes_locked(self):
+        return sum(len(request.data) for q in self._queues.values() for request in q)
+
+    def _next_batch_locked(self, max_bytes=MAX_COALESCED_WRITE_BYTES):
+        """Monta o próximo lote: CONTROL primeiro (prioridade estrita), depois DRR entre os outros canais."""
+        batch = []
+        batch_bytes = 0
+
+        control_queue = self._queues[CHANNEL_CONTROL]
+        while control_queue and (not batch or batch_bytes + len(control_queue[0].data) <= max_bytes):
+            request = control_queue.popleft()
+            batch.append(request)
+            batch_bytes += len(request.data)
+
+        # Deficit Round Robin: cada canal com fila ganha seu quantum e envia enquanto houver saldo.
+        idle_rounds = 0
+        while batch_bytes < max_bytes and idle_rounds < len(DRR_CHANNELS):
+            channel = DRR_CHANNELS[self._drr_index]
+            channel_queue = self._queues[channel]
+            if not channel_queue:
+                self._deficits[channel] = 0 # Canal vazio não acumula saldo
+                self._drr_index = (self._drr_index + 1) % len(DRR_CHANNELS)
+                idle_rounds += 1
+                continue
+
+            idle_rounds = 0
+            if self._drr_resume:
+                self._drr_resume = False
+            else:
+                self._deficits[channel] += self.quantums[channel]
+            while channel_queue and len(channel_queue[0].data) <= self._deficits[channel]:
+                if batch and batch_bytes + len(channel_queue[0].data) > max_bytes:
+                    self._drr_resume = True
+                    return batch # Lote cheio; o saldo restante fica para a próxima escrita
+                request = channel_queue.popleft()
+                self._deficits[channel] -= len(request.data)
+                batch.append(request)
+                batch_bytes += len(request.data)
+            if not channel_queue:
+                self._deficits[channel] = 0
+            self._drr_index = (self._drr_index + 1) % len(DRR_CHANNELS)
+        return batch
+
+    def _run(self):
+        while True:
+            if self.profiler is not None and self.profiler.hooked:
+                self.profiler.checkpoint()
+            with self._cond:
+                while self.running and not self._has_pending_locked():
+                    self._cond.wait(timeout=0.5)
+                if not self.running:
+                    return
+                if (self.coalesce_window_s and not self._queues[CHANNEL_CONTROL]
+                        and self._pending_bytes_locked() < MAX_COALESCED_WRITE_BYTES):
+                    self._cond.wait(timeout=self.coalesce_window_s) # Junta quadros que chegam quase juntos
+
+            # Fora do lock: enquanto o buffer do SO escoa, novos quadros (e ACKs) continuam entrando nas filas
+            backlog = self._wait_for_output_room()
+            if backlog is None:
+                return
+            with self._cond:
+                batch = self._next_batch_locked(min(MAX_COALESCED_WRITE_BYTES, self.max_in_flight_bytes - backlog))
+
+            if not batch:
+                continue
+
+            payload = b''.join(request.data for request in batch)
+            try:
+                self.serial_connection.write(payload)
+                written_ns = time.perf_counter_ns()
+                written_at = written_ns / 1e9
+                for request in batch:
+                    if request.trace is not None:
+                        self.latency_tracer.mark(request.trace, STAGE_WRITE, written_ns)
+                result = {"status": "success", "message": "Pacote enviado."}
+                with self._cond:
+                    self.write_calls += 1
+                    self.bytes_written += len(payload)
+                    for request in batch:
+                        request.written_at = written_at
+                        self.frames_written[request.channel] += 1
+                        delay_ms = (written_at - request.enqueued_at) * 1000
+                        self.queue_delay_ms += STATS_EWMA_ALPHA * (delay_ms - self.queue_delay_ms)
+            except Exception as e:
+                self.log_callback(f"ERRO ao enviar pacote serial: {e}")
+                result = {"status": "error", "message": str(e)}
+
+            for request in batch:
+                self._complete(request, result)
+
+    def _read_out_waiting(self):
+        """Bytes ainda no buffer de saída do SO; 0 se a porta não informar (ex.: NullSerial antiga, alguns drivers)."""
+        try:
+            return int(getattr(self.serial_connection, 'out_waiting', 0) or 0)
+        except (OSError, ValueError, TypeError):
+            return 0
+
+    def _wait_for_output_room(self):
+        """
+        Espera até caber pelo menos um quadro em max_in_flight_bytes. Dorme o tempo estimado de escoamento
+        pela taxa da porta, em vez de girar. Retorna o out_waiting atual, ou None se o escalonador parou.
+        """
+        backlog = self._read_out_waiting()
+        waited = 0.0
+        while backlog + FRAME_SIZE > self.max_in_flight_bytes:
+            if not self.running:
+                return None
+            baud = getattr(self.serial_connection, 'baudrate', None) or DEFAULT_BAUD_RATE
+            delay = (backlog + FRAME_SIZE - self.max_in_flight_bytes) * BITS_PER_SERIAL_BYTE / baud
+            time.sleep(max(delay, 0.001))
+            waited += max(delay, 0.001)
+            backlog = self._read_out_waiting()
+        with self._cond:
+            self.out_waiting = backlog
+            self.out_waiting_max = max(self.out_waiting_max, backlog)
+            if waited:
+                self.backpressure_waits += 1
+                self.backpressure_wait_s += waited
+        return backlog
+
+    @staticmethod
+    def _complete(request, result):
+        request.result = result
+        request.done.set()
@@ -0,0 +1,117 @@
+# core/writer.py
+
+import os
+import queue
+import threading
+
+# --- Política de fsync dos arquivos recebidos ---
+FSYNC_NEVER = 'never'              # Só o sistema operacional decide quando gravar (mais rápido, menos seguro)
+FSYNC_ON_COMPLETE = 'on_complete'  # fsync do arquivo final ao concluir (padrão)
+FSYNC_ALWAYS = 'always'            # fsync também a cada fragmento gravado no .part
+FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_ON_COMPLETE, FSYNC_ALWAYS)
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+def preallocate(f, size):
+    """Reserva 'size' bytes para o arquivo aberto (evita fragmentação e falta de espaço no meio da escrita)."""
+    if size <= 0:
+        return
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+    except OSError:
+        pass # Sistema de arquivos sem suporte: cai no truncate
+    current = f.seek(0, os.SEEK_END)
+    if current < size:
+        f.truncate(size)
+
+
+class DiskWriter:
+    """
+    Thread dedicada a toda a E/S de disco da recepção (.part, diário, arquivos finais).
+
+    A thread de leitura serial só enfileira trabalho com submit() e volta a ler a porta:
+    enquanto ela está parada esperando o disco, quadros se acumulam e os ACKs saem atrasados.
+    """
+
+    def __init__(self, fsync_policy=FSYNC_ON_COMPLETE, log_callback=None):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync desconhecida: {fsync_policy}")
+        self.fsync_policy = fsync_policy
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self._queue = queue.Queue()
+        self._thread = None
+        self.running = False
+
+    def _default_log_callback(self, message):
+        print(f"[DiskWriter] {message}")
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="DiskWriter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Para a thread depois de executar tudo o que já estava na fila."""
+        if not self.running:
+            return
+        self.running = False
+        self._queue.put(None)
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=10)
+
+    def submit(self, func, *args):
+        """Executa func(*args) na thread de escrita. Sem a thread rodando, executa na hora (ex.: testes, sem conexão)."""
+        if not self.running:
+            self._execute(func, args)
+            return
+        self._queue.put((func, args))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._execute(*item)
+
+    def _execute(self, func, args):
+        try:
+            func(*args)
+        except Exception as e:
+            self.log_callback(f"ERRO na escrita em disco ({getattr(func, '__name__', func)}): {e}")
+
+    # --- Auxiliares usados pelas tarefas ---
+
+    def sync_fragment(self, f):
+        """fsync após gravar um fragmento, conforme a política."""
+        if self.fsync_policy == FSYNC_ALWAYS:
+            os.fsync(f.fileno())
+
+    def write_file(self, path, data, mtime_ns=None):
+        """
+        Grava o arquivo final de forma atômica: .tmp pré-alocado com o tamanho final, escrita em blocos,
+        fsync conforme a política e rename sobre a versão anterior.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            preallocate(f, len(data))
+            view = memoryview(data)
+            for start in range(0, len(data), COPY_CHUNK_SIZE):
+                f.write(view[start:start + COPY_CHUNK_SIZE])
+            f.truncate(len(data))
+            f.flush()
+            if self.fsync_policy != FSYNC_NEVER:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if mtime_ns:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
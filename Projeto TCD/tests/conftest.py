@@ -0,0 +1,81 @@
+# tests/conftest.py
+
+import os
+import sys
+import threading
+
+import pytest
+
+# Os módulos de core/ se importam pelo nome (como quando main.py roda de dentro de core/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import arduino
+from arduino import ArduinoController, encode_packet, PACKET_TYPE_DATA, PACKET_TYPE_ACK, \
+    PEER_DEVICE_ID, THIS_DEVICE_ID, TOTAL_PACKET_SIZE, MAX_FILE_MESSAGE_ID
+from tdma import TdmaSlotScheduler
+
+
+class FakeFirmwareSerial:
+    """
+    Porta serial no lugar do Arduino: guarda os quadros escritos e responde aos fragmentos DATA como o
+    firmware faz com o que chega do outro lado por RF. replies(pacote) decide a resposta de cada fragmento;
+    o padrão é o ACK repassado pelo firmware seguido do ACK enviado pelo PC do outro lado.
+    """
+
+    def __init__(self, replies=None):
+        self.is_open = True
+        self.baudrate = 9600
+        self.out_waiting = 0
+        self.frames_written = []
+        self._replies = replies if replies else self.ack_twice
+        self._rx = bytearray()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def ack_twice(packet):
+        ack = encode_packet(PACKET_TYPE_ACK, PEER_DEVICE_ID, packet[2], packet[3], 0, b'')
+        return [ack, ack]
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            return len(self._rx)
+
+    def read(self, size=1):
+        with self._lock:
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+            return data
+
+    def write(self, data):
+        for pos in range(0, len(data), TOTAL_PACKET_SIZE):
+            packet = bytes(data[pos:pos + TOTAL_PACKET_SIZE])
+            self.frames_written.append(packet)
+            if packet[0] == PACKET_TYPE_DATA and packet[2] < MAX_FILE_MESSAGE_ID:
+                self.inject(*self._replies(packet))
+        return len(data)
+
+    def inject(self, *frames):
+        with self._lock:
+            for frame in frames:
+                self._rx += frame
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+@pytest.fixture
+def controller(tmp_path, monkeypatch):
+    """ArduinoController sem hardware, com diário e arquivos recebidos em tmp_path e o slot TDMA sempre aberto."""
+    monkeypatch.setattr(arduino, "TRANSFERS_DIR", str(tmp_path / "transfers"))
+    monkeypatch.setattr(arduino, "TRANSFER_JOURNAL_PATH", str(tmp_path / "transfers" / "transfers.journal"))
+    monkeypatch.setattr(arduino, "RECEIVED_FILES_DIR", str(tmp_path / "received_files"))
+    logs = []
+    ctrl = ArduinoController("FAKE", 9600, log_callback=logs.append)
+    ctrl.logs = logs
+    ctrl.tdma = TdmaSlotScheduler(THIS_DEVICE_ID, PEER_DEVICE_ID, 10 ** 9) # O menor ID transmite primeiro
+    yield ctrl
+    ctrl.disconnect()
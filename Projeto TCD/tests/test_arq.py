@@ -0,0 +1,61 @@
+# tests/test_arq.py
+
+from arduino import encode_packet, PACKET_TYPE_ACK, PACKET_TYPE_DATA, PACKET_TYPE_NACK, PEER_DEVICE_ID, \
+    MAX_RETRANSMISSION_ATTEMPTS
+from conftest import FakeFirmwareSerial
+
+
+def _data_frames(fake, message_id):
+    return [frame for frame in fake.frames_written if frame[0] == PACKET_TYPE_DATA and frame[2] == message_id]
+
+
+def test_fragment_confirmed_by_forwarded_ack(controller):
+    fake = FakeFirmwareSerial()
+    controller.attach_serial(fake)
+
+    result = controller.send_fragment_with_arq(10, 0, 3, b"abc")
+
+    assert result == {"status": "success", "message": "Fragmento confirmado.", "attempts": 1}
+    assert len(_data_frames(fake, 10)) == 1
+    assert controller._ack_waiters == {}
+    assert controller.rf_rate.get_state()["loss"] == 0.0
+
+
+def test_consecutive_fragments_with_duplicate_acks(controller):
+    # Cada fragmento recebe dois ACKs; o segundo chega sem espera registrada e não confirma o fragmento seguinte
+    fake = FakeFirmwareSerial()
+    controller.attach_serial(fake)
+
+    results = [controller.send_fragment_with_arq(11, idx, 4, bytes([idx]) * 19) for idx in range(4)]
+
+    assert [r["status"] for r in results] == ["success"] * 4
+    assert [frame[3] for frame in _data_frames(fake, 11)] == [0, 1, 2, 3]
+
+
+def test_nack_retransmits_then_ack(controller):
+    replies = []
+
+    def nack_first(packet):
+        replies.append(packet[3])
+        packet_type = PACKET_TYPE_NACK if len(replies) == 1 else PACKET_TYPE_ACK
+        return [encode_packet(packet_type, PEER_DEVICE_ID, packet[2], packet[3], 0, b'')]
+
+    fake = FakeFirmwareSerial(nack_first)
+    controller.attach_serial(fake)
+
+    result = controller.send_fragment_with_arq(12, 2, 3, b"xyz")
+
+    assert result["status"] == "success"
+    assert result["attempts"] == 2
+    assert len(_data_frames(fake, 12)) == 2
+
+
+def test_fragment_fails_without_ack(controller):
+    fake = FakeFirmwareSerial(lambda packet: [])
+    controller.attach_serial(fake)
+    controller.rf_rate.ack_timeout = lambda: 0.05
+
+    result = controller.send_fragment_with_arq(13, 0, 1, b"lost")
+
+    assert result == {"status": "error", "message": "Timeout aguardando ACK.", "attempts": MAX_RETRANSMISSION_ATTEMPTS}
+    assert len(_data_frames(fake, 13)) == MAX_RETRANSMISSION_ATTEMPTS
@@ -0,0 +1,99 @@
+# tests/test_capture.py
+
+import os
+import struct
+
+import pytest
+
+from arduino import encode_packet, PACKET_TYPE_DATA, PEER_DEVICE_ID, TOTAL_PACKET_SIZE
+from capture import (TraceWriter, TraceReader, CapturingSerial, NullSerial, replay_trace, DIRECTION_RX,
+                     DIRECTION_TX, FILE_HEADER_SIZE, RECORD_HEADER_SIZE, RECORD_ALIGNMENT)
+from conftest import FakeFirmwareSerial
+
+RECORDS = [(100, DIRECTION_RX, b"abc"), (250, DIRECTION_TX, b"12345678"), (900, DIRECTION_RX, b"x" * 27)]
+
+
+def write_trace(path, records=RECORDS):
+    writer = TraceWriter(str(path))
+    for t_ns, direction, data in records:
+        writer.record(direction, data, t_ns=writer._start_ns + t_ns)
+    writer.record(DIRECTION_RX, b"") # Leitura vazia não vira registro
+    writer.close()
+    return writer
+
+
+def read_all(path, direction=None):
+    with TraceReader(str(path)) as reader:
+        return [(t_ns, d, bytes(data)) for t_ns, d, data in reader.records(direction)]
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "sub" / "trace.tcdtrace"
+    writer = write_trace(path)
+    assert read_all(path) == RECORDS
+    assert read_all(path, DIRECTION_TX) == [RECORDS[1]]
+    stats = writer.stats()
+    assert (stats["records"], stats["rx_bytes"], stats["tx_bytes"]) == (3, 30, 8)
+    writer.record(DIRECTION_RX, b"depois de fechar") # Ignorado sem erro
+    assert writer.stats()["records"] == 3
+
+
+def test_records_are_aligned(tmp_path):
+    path = tmp_path / "trace.tcdtrace"
+    write_trace(path)
+    expected = FILE_HEADER_SIZE + sum(RECORD_HEADER_SIZE + -(-len(data) // RECORD_ALIGNMENT) * RECORD_ALIGNMENT
+                                      for _, _, data in RECORDS)
+    assert os.path.getsize(path) == expected
+
+
+@pytest.mark.parametrize("cut", [6, 20, 27 + 5 + RECORD_HEADER_SIZE])
+def test_truncated_tail_is_ignored(tmp_path, cut):
+    path = tmp_path / "trace.tcdtrace"
+    write_trace(path)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - cut)
+    assert read_all(path) == RECORDS[:2]
+
+
+def test_rejects_short_or_foreign_files(tmp_path):
+    short = tmp_path / "curto.tcdtrace"
+    short.write_bytes(b"TCDTRACE")
+    with pytest.raises(ValueError, match="curto"):
+        TraceReader(str(short))
+    foreign = tmp_path / "outro.tcdtrace"
+    foreign.write_bytes(b"X" * FILE_HEADER_SIZE)
+    with pytest.raises(ValueError, match="suportado"):
+        TraceReader(str(foreign))
+    path = tmp_path / "versao.tcdtrace"
+    write_trace(path)
+    with open(path, "r+b") as f:
+        f.seek(8)
+        f.write(struct.pack("<H", 99))
+    with pytest.raises(ValueError):
+        TraceReader(str(path))
+
+
+def test_capturing_serial_records_both_directions(tmp_path):
+    path = tmp_path / "trace.tcdtrace"
+    port = FakeFirmwareSerial()
+    writer = TraceWriter(str(path))
+    capturing = CapturingSerial(port, writer)
+    frame = b"comando"
+    capturing.write(frame)
+    port.inject(b"resposta")
+    assert capturing.in_waiting == 8 # Atributos não interceptados vão para a porta
+    capturing.read(8)
+    writer.close()
+    assert [(d, data) for _, d, data in read_all(path)] == [(DIRECTION_TX, frame), (DIRECTION_RX, b"resposta")]
+
+
+def test_replay_feeds_parser(tmp_path, controller):
+    frame = encode_packet(PACKET_TYPE_DATA, PEER_DEVICE_ID, 1, 0, 1, b"ola")
+    # Quadro partido em duas leituras, como acontece na porta real
+    records = [(0, DIRECTION_RX, frame[:10]), (1000, DIRECTION_TX, b"ignorado"), (2000, DIRECTION_RX, frame[10:])]
+    path = tmp_path / "trace.tcdtrace"
+    write_trace(path, records)
+    stats = replay_trace(str(path), controller)
+    assert (stats["records"], stats["bytes"], stats["leftover_bytes"]) == (2, TOTAL_PACKET_SIZE, 0)
+    assert isinstance(controller.serial_connection, NullSerial)
+    assert any("COMPLETO RECEBIDO (MsgID: 1)" in line and "3 bytes" in line for line in controller.logs)
@@ -0,0 +1,102 @@
+# tests/test_cli.py
+
+import json
+import os
+
+import pytest
+
+import arduino
+import cli
+from arduino import ArduinoController, MAX_MESSAGE_SIZE, PEER_DEVICE_ID, THIS_DEVICE_ID
+from cli import EXIT_OK, EXIT_FAILED, EXIT_NO_CONNECTION, build_parser
+from conftest import FakeFirmwareSerial
+from jobs import JOB_SUCCESS
+from tdma import TdmaSlotScheduler
+
+
+@pytest.fixture
+def fake_link(tmp_path, monkeypatch):
+    """Troca o ArduinoController da CLI por um ligado a FakeFirmwareSerial (ou sem porta, com opens=False)."""
+    monkeypatch.setattr(arduino, "TRANSFERS_DIR", str(tmp_path / "transfers"))
+    monkeypatch.setattr(arduino, "TRANSFER_JOURNAL_PATH", str(tmp_path / "transfers" / "transfers.journal"))
+    monkeypatch.setattr(arduino, "RECEIVED_FILES_DIR", str(tmp_path / "received_files"))
+    link = {"opens": True, "controllers": []}
+
+    class FakeLinkController(ArduinoController):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.tdma = TdmaSlotScheduler(THIS_DEVICE_ID, PEER_DEVICE_ID, 10 ** 9) # Slot sempre aberto
+            link["controllers"].append(self)
+
+        def connect(self):
+            if not link["opens"]:
+                return False
+            self.attach_serial(FakeFirmwareSerial())
+            return True
+
+    monkeypatch.setattr(cli, "ArduinoController", FakeLinkController)
+    return link
+
+
+def events(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_parse_send_and_global_options(monkeypatch):
+    monkeypatch.setenv("TCD_SERIAL_PORT", "/dev/ttyACM1")
+    args = build_parser().parse_args(["-v", "send", "a.bin", "b.bin", "--text", "oi", "--text", "tchau", "--no-delta"])
+    assert (args.command, args.port, args.verbose) == ("send", "/dev/ttyACM1", True)
+    assert args.files == ["a.bin", "b.bin"] and args.text == ["oi", "tchau"]
+    assert args.no_delta and args.timeout == 0
+
+
+def test_parse_subcommand_options():
+    parser = build_parser()
+    ping = parser.parse_args(["--port", "COM7", "--baud", "115200", "ping", "-c", "2", "--size", "10"])
+    assert (ping.port, ping.baud, ping.count, ping.size, ping.interval) == ("COM7", 115200, 2, 10, 1.0)
+    receive = parser.parse_args(["receive", "--duration", "1.5", "--outbox", "saida"])
+    assert (receive.duration, receive.outbox, receive.status_interval) == (1.5, "saida", 0)
+    assert parser.parse_args(["bench"]).size == cli.DEFAULT_BENCH_SIZE
+    with pytest.raises(SystemExit):
+        parser.parse_args([]) # Comando obrigatório
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--profile", "nenhum", "status"])
+
+
+def test_send_without_payload_is_a_usage_error(fake_link):
+    with pytest.raises(SystemExit):
+        cli.main(["send"])
+    assert fake_link["controllers"] == [] # Nem chega a abrir a porta
+
+
+def test_send_dispatches_over_the_link(fake_link, tmp_path, capsys):
+    path = tmp_path / "leituras.txt"
+    path.write_bytes(b"25.0\n" * 50)
+    exit_code = cli.main(["--status-timeout", "0", "send", str(path), "--text", "oi", "--no-delta"])
+    assert exit_code == EXIT_OK
+    lines = events(capsys)
+    assert lines[0]["event"] == "connected" and lines[0]["arduino_ready"] is False
+    assert [line["event"] for line in lines].count("queued") == 2
+    finished = [line for line in lines if line["event"] == "finished"]
+    assert sorted(line["status"] for line in finished) == [JOB_SUCCESS, JOB_SUCCESS]
+    controller, = fake_link["controllers"]
+    assert not controller.is_serial_port_open() # close() sempre desconecta
+
+
+def test_oversize_payloads_fail_cleanly(fake_link, tmp_path, capsys):
+    path = tmp_path / "grande.bin"
+    path.write_bytes(os.urandom(MAX_MESSAGE_SIZE + 1)) # Incompressível
+    assert cli.main(["--status-timeout", "0", "send", str(path), "--no-delta"]) == EXIT_FAILED
+    assert cli.main(["--status-timeout", "0", "bench", "--size", str(MAX_MESSAGE_SIZE + 1)]) == EXIT_FAILED
+    errors = [line for line in events(capsys) if line["event"] == "error"]
+    assert len(errors) == 2 and all("não cabe" in line["message"] for line in errors)
+
+
+def test_status_and_connection_failure(fake_link, capsys):
+    assert cli.main(["--status-timeout", "0", "status"]) == EXIT_FAILED # Firmware não mandou status
+    status = events(capsys)[-1]
+    assert status["event"] == "status" and status["port"] == build_parser().parse_args(["status"]).port
+    fake_link["opens"] = False
+    assert cli.main(["--port", "COM9", "ping"]) == EXIT_NO_CONNECTION
+    error, = events(capsys)
+    assert (error["event"], error["message"]) == ("error", "Não foi possível abrir a porta serial COM9.")
@@ -0,0 +1,116 @@
+# tests/test_delta.py
+
+import os
+import random
+import struct
+
+import pytest
+
+import delta
+from delta import (compute_signature, compute_delta, apply_delta, parse_signature, choose_block_size, weak_checksum,
+                   sanitize_file_name, SignatureIndex, MIN_BLOCK_SIZE, MAX_BLOCK_SIZE, OP_COPY, OP_COPY_FORMAT, DELTA_HEADER_SIZE)
+
+
+def _mutate(rng, data):
+    data = bytearray(data)
+    for _ in range(rng.randint(0, 6)):
+        kind = rng.choice(("insert", "delete", "replace"))
+        pos = rng.randint(0, len(data))
+        size = rng.randint(1, 300)
+        if kind == "insert":
+            data[pos:pos] = rng.randbytes(size)
+        elif kind == "delete":
+            del data[pos:pos + size]
+        else:
+            data[pos:pos + size] = rng.randbytes(size)
+    return bytes(data)
+
+
+def test_fuzz_round_trip():
+    rng = random.Random(1234)
+    for _ in range(60):
+        base = rng.randbytes(rng.randint(0, 6000))
+        if rng.random() < 0.3:
+            base = bytes(rng.choice(b"ab") for _ in range(len(base))) # Muitos blocos repetidos
+        target = _mutate(rng, base)
+        block_size = rng.choice((MIN_BLOCK_SIZE, 100, choose_block_size(len(base))))
+        signature = compute_signature(base, block_size)
+        assert apply_delta(base, compute_delta(signature, target)) == target
+
+
+def test_unchanged_file_is_all_copies():
+    base = os.urandom(10000)
+    block_size = choose_block_size(len(base))
+    out = compute_delta(compute_signature(base, block_size), base)
+    blocks = -(-len(base) // block_size)
+    assert out[DELTA_HEADER_SIZE:] == bytes([OP_COPY]) + struct.pack(OP_COPY_FORMAT, 0, blocks)
+
+
+def test_insertion_sends_roughly_the_inserted_bytes():
+    base = os.urandom(20000)
+    target = base[:7000] + b"X" * 50 + base[7000:]
+    out = compute_delta(compute_signature(base, choose_block_size(len(base))), target)
+    assert len(out) < 50 + 2 * choose_block_size(len(base)) + 200
+
+
+def test_rolling_checksum_matches_direct():
+    data = os.urandom(500)
+    window = 64
+    a = weak_checksum(data[:window]) & 0xFFFF
+    b = weak_checksum(data[:window]) >> 16
+    for pos in range(1, len(data) - window + 1):
+        out_byte, in_byte = data[pos - 1], data[pos + window - 1]
+        a = (a - out_byte + in_byte) & 0xFFFF
+        b = (b - window * out_byte + a) & 0xFFFF
+        assert ((b << 16) | a) == weak_checksum(data[pos:pos + window])
+
+
+def test_apply_rejects_other_base_and_unknown_op():
+    base = b"base" * 100
+    out = compute_delta(compute_signature(base, MIN_BLOCK_SIZE), b"novo" + base)
+    with pytest.raises(ValueError, match="base"):
+        apply_delta(b"outro" * 80, out)
+    with pytest.raises(ValueError, match="desconhecida"):
+        apply_delta(base, out + b"Z")
+    with pytest.raises(ValueError):
+        parse_signature(b"curta")
+
+
+def test_block_size_bounds():
+    assert choose_block_size(0) == MIN_BLOCK_SIZE
+    assert choose_block_size(10 ** 9) == MAX_BLOCK_SIZE
+    assert MIN_BLOCK_SIZE < choose_block_size(100000) < MAX_BLOCK_SIZE
+
+
+def test_sanitize_file_name():
+    assert sanitize_file_name("../../etc/passwd") == "passwd"
+    assert sanitize_file_name("C:\\Users\\x\\relat:rio?.txt") == "relatrio.txt"
+    assert sanitize_file_name(".bashrc") == "arquivo.bashrc"
+    assert sanitize_file_name("..") == "arquivo.."
+
+
+def test_signature_index_caches_until_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "dados.bin"
+    path.write_bytes(b"a" * 1000)
+    index = SignatureIndex(str(tmp_path))
+    first = index.get_signature("dados.bin")
+    assert first == compute_signature(b"a" * 1000, choose_block_size(1000))
+    assert (tmp_path / delta.SIGNATURE_INDEX_DIR_NAME / "dados.bin.sig").exists()
+
+    calls = []
+    real = delta.compute_signature
+    monkeypatch.setattr(delta, "compute_signature", lambda *args: calls.append(args) or real(*args))
+    assert index.get_signature("dados.bin") == first
+    assert calls == [] # Veio do cache
+
+    path.write_bytes(b"b" * 1200) # Tamanho novo invalida o cache
+    assert index.get_signature("dados.bin") == real(b"b" * 1200, choose_block_size(1200))
+    assert len(calls) == 1
+
+    stat = os.stat(path)
+    path.write_bytes(b"c" * 1200)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9)) # Mesmo tamanho, mtime novo
+    assert index.get_signature("dados.bin") == real(b"c" * 1200, choose_block_size(1200))
+    assert len(calls) == 2
+
+    assert index.get_signature("nao_existe.bin") is None
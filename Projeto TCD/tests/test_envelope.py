@@ -0,0 +1,102 @@
+# tests/test_envelope.py
+
+import os
+
+import pytest
+
+import envelope
+from envelope import (FileMetadata, CODEC_RAW, CODEC_ZLIB, KIND_FILE, KIND_DELTA, KIND_ARCHIVE, METADATA_SIZE,
+                      ENVELOPE_HEADER_SIZE)
+from merkle import MERKLE_BLOCK_SIZE, HASH_SIZE
+
+
+def test_metadata_pack_unpack():
+    metadata = FileMetadata("relatório.csv", 1234, 1700000000123456789, CODEC_ZLIB, b"\x11" * 32,
+                            body_len=99, merkle_root=b"\x22" * HASH_SIZE, block_size=512)
+    packed = metadata.pack() + b"corpo"
+    unpacked, offset = FileMetadata.unpack(packed)
+    assert packed[offset:] == b"corpo"
+    assert offset == 1 + len("relatório.csv".encode("utf-8")) + METADATA_SIZE
+    for field in FileMetadata.__slots__:
+        assert getattr(unpacked, field) == getattr(metadata, field)
+    assert unpacked.to_dict()["codec"] == "zlib"
+
+
+def test_metadata_unpack_rejects_truncated_and_zero_block():
+    packed = FileMetadata("a", 1, 0, CODEC_RAW, b"\0" * 32).pack()
+    with pytest.raises(ValueError):
+        FileMetadata.unpack(packed[:-1])
+    with pytest.raises(ValueError):
+        FileMetadata.unpack(FileMetadata("a", 1, 0, CODEC_RAW, b"\0" * 32, block_size=0).pack())
+
+
+def test_long_names_are_cut_to_255_bytes():
+    name, _ = envelope.unpack_name(envelope.pack_name("x" * 400))
+    assert name == "x" * 255
+
+
+def test_codec_choice():
+    assert envelope.encode_body(b"a" * 1000)[0] == CODEC_ZLIB
+    random_bytes = os.urandom(1000)
+    assert envelope.encode_body(random_bytes) == (CODEC_RAW, random_bytes)
+    assert envelope.decode_body(CODEC_ZLIB, envelope.encode_body(b"a" * 1000)[1]) == b"a" * 1000
+    with pytest.raises(ValueError, match="Codec"):
+        envelope.decode_body(0x7F, b"")
+    with pytest.raises(ValueError, match="zlib"):
+        envelope.decode_body(CODEC_ZLIB, b"nao e zlib")
+
+
+@pytest.mark.parametrize("data", [b"", b"texto " * 500, os.urandom(3000)])
+def test_file_round_trip(data):
+    message = envelope.encode_file("dados.bin", data, mtime_ns=42)
+    kind, body = envelope.unwrap(message)
+    assert kind == KIND_FILE
+    metadata, decoded = envelope.decode_file(body)
+    assert decoded == data
+    assert (metadata.name, metadata.size, metadata.mtime_ns) == ("dados.bin", len(data), 42)
+    start, body_len, block_size = envelope.parse_merkle_layout(message)
+    assert (body_len, block_size) == (metadata.body_len, MERKLE_BLOCK_SIZE)
+    assert start == ENVELOPE_HEADER_SIZE + 1 + len("dados.bin") + METADATA_SIZE
+
+
+def test_decode_file_detects_hash_mismatch():
+    kind, body = envelope.unwrap(envelope.encode_file("a.txt", os.urandom(100)))
+    metadata, offset, _, _ = envelope.split_file_message(body)
+    assert metadata.codec == CODEC_RAW
+    tampered = bytearray(body)
+    tampered[offset] ^= 0xFF
+    with pytest.raises(ValueError, match="não confere"):
+        envelope.decode_file(bytes(tampered))
+
+
+def test_parse_merkle_layout_waits_for_header():
+    message = envelope.encode_file("a.txt", b"x" * 100)
+    assert envelope.parse_merkle_layout(message[:2]) is None
+    assert envelope.parse_merkle_layout(message[:ENVELOPE_HEADER_SIZE + 5]) is None
+    with pytest.raises(ValueError):
+        envelope.parse_merkle_layout(envelope.encode_ping(1))
+
+
+def test_unwrap_without_magic_is_raw_message():
+    assert envelope.unwrap(b"ola") == (None, b"ola")
+
+
+def test_archive_round_trip():
+    content = envelope.pack_archive_entry("a.csv", b"1,2\n", 10) + envelope.pack_archive_entry("b.log", b"", 20)
+    kind, body = envelope.unwrap(envelope.encode_archive("pacote.tcdpack", content))
+    assert kind == KIND_ARCHIVE
+    _, decoded = envelope.decode_archive(body)
+    assert list(envelope.unpack_archive(decoded)) == [("a.csv", 10, b"1,2\n"), ("b.log", 20, b"")]
+    with pytest.raises(ValueError, match="truncad"):
+        list(envelope.unpack_archive(content[:-3]))
+
+
+def test_delta_and_control_bodies():
+    kind, body = envelope.unwrap(envelope.encode_delta("a.bin", b"delta" * 10, b"resultado", mtime_ns=5))
+    assert kind == KIND_DELTA
+    metadata, delta = envelope.decode_delta(body)
+    assert delta == b"delta" * 10 and metadata.size == len(b"resultado")
+
+    assert envelope.decode_sig_request(envelope.unwrap(envelope.encode_sig_request(7, "a.bin"))[1]) == (7, "a.bin")
+    assert envelope.decode_sig_response(envelope.unwrap(envelope.encode_sig_response(7, None))[1]) == (7, None)
+    assert envelope.decode_ping_token(envelope.unwrap(envelope.encode_ping(9, b"xx"))[1]) == 9
@@ -0,0 +1,83 @@
+# tests/test_gaps.py
+
+from gaps import ReceptionGaps, NACK_REORDER_TOLERANCE, NACK_LIST_MAX_RANGES, to_ranges, encode_nack_list, \
+    decode_nack_list, format_ranges
+
+REPEAT_S = 0.5 # Valores exatos em ponto flutuante: a espera vence exatamente no limite
+
+
+def _receive(indices, total_fragments, received=None):
+    received = {} if received is None else received
+    gaps = ReceptionGaps(received, total_fragments)
+    for idx in indices:
+        received[idx] = b''
+        gaps.on_fragment(idx)
+    return gaps
+
+
+def test_gap_waits_for_reorder_tolerance():
+    gaps = _receive([0, 2], 10)
+    assert gaps.missing == {1}
+    assert gaps.due_ranges(10.0, REPEAT_S) == [] # Só 1 mais novo: pode ser apenas reordenação
+    gaps = _receive([0, 2, 3], 10)
+    assert 3 - 1 >= NACK_REORDER_TOLERANCE
+    assert gaps.due_ranges(10.0, REPEAT_S) == [(1, 1)]
+
+
+def test_late_fragment_closes_gap():
+    gaps = _receive([0, 2, 1, 3, 4], 10)
+    assert gaps.missing == set()
+    assert gaps.due_ranges(10.0, REPEAT_S) == []
+
+
+def test_last_fragment_makes_every_gap_due():
+    gaps = _receive([0, 1, 9], 10)
+    assert gaps.due_ranges(10.0, REPEAT_S) == [(2, 8)]
+
+
+def test_ranges_repeat_only_after_interval():
+    gaps = _receive([0, 2, 3, 4], 10)
+    assert gaps.due_ranges(10.0, REPEAT_S) == [(1, 1)]
+    assert gaps.due_ranges(10.0 + REPEAT_S / 2, REPEAT_S) == []
+    assert gaps.due_ranges(10.0 + REPEAT_S, REPEAT_S) == [(1, 1)]
+
+
+def test_new_gap_is_requested_while_old_one_waits():
+    gaps = _receive([0, 2, 3, 4], 10)
+    assert gaps.due_ranges(10.0, REPEAT_S) == [(1, 1)]
+    for idx in (6, 7, 8):
+        gaps._received[idx] = b''
+        gaps.on_fragment(idx)
+    assert gaps.due_ranges(10.1, REPEAT_S) == [(5, 5)]
+
+
+def test_ranges_capped_oldest_first():
+    gaps = _receive(range(0, 20, 2), 30) # Faltam 1, 3, 5, ..., 17
+    first = gaps.due_ranges(10.0, REPEAT_S)
+    assert len(first) == NACK_LIST_MAX_RANGES
+    assert first == [(1, 1), (3, 3), (5, 5), (7, 7)]
+    assert gaps.due_ranges(10.0, REPEAT_S) == [(9, 9), (11, 11), (13, 13), (15, 15)]
+
+
+def test_resumed_reception_ignores_fragments_already_on_disk():
+    received = {0: b'', 1: b'', 2: b'', 3: b''} # Recepção retomada do diário
+    gaps = _receive([5, 6, 7], 10, received)
+    assert gaps.missing == {4}
+    assert gaps.due_ranges(10.0, REPEAT_S) == [(4, 4)]
+
+
+def test_to_ranges_and_format():
+    assert to_ranges([1, 2, 3, 7, 9, 10]) == [(1, 3), (7, 7), (9, 10)]
+    assert format_ranges([(1, 3), (7, 7)]) == "1-3, 7"
+
+
+def test_nack_list_round_trip():
+    ranges = [(0, 0), (3, 9), (200, 255)]
+    payload = encode_nack_list(ranges)
+    assert payload == bytes([0, 0, 3, 9, 200, 255])
+    assert decode_nack_list(payload) == ranges
+
+
+def test_decode_ignores_inverted_ranges_and_odd_byte():
+    assert decode_nack_list(bytes([5, 2, 7, 8, 9])) == [(7, 8)]
+    assert decode_nack_list(b'') == []
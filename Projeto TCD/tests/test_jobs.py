@@ -0,0 +1,77 @@
+# tests/test_jobs.py
+
+import os
+import threading
+import time
+
+import pytest
+
+from arduino import MAX_MESSAGE_SIZE, PEER_DEVICE_ID
+from conftest import FakeFirmwareSerial
+from jobs import TransferJobManager, JOB_SUCCESS, JOB_FINAL_STATES
+from journal import ROLE_SEND
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def manager(controller):
+    job_manager = TransferJobManager(controller, log_callback=controller.logs.append)
+    yield job_manager
+    job_manager.stop()
+
+
+def test_oversize_file_is_rejected_before_the_journal(manager, controller, tmp_path):
+    path = tmp_path / "grande.bin"
+    path.write_bytes(os.urandom(MAX_MESSAGE_SIZE + 1))
+    with pytest.raises(ValueError, match="não cabe"):
+        manager.submit_file(str(path), use_delta=False)
+    with pytest.raises(ValueError):
+        manager.submit_text("x" * (MAX_MESSAGE_SIZE + 1))
+    assert manager.list_jobs() == []
+    assert controller.journal.active_entries(ROLE_SEND) == []
+
+
+def test_oversize_interrupted_send_is_discarded(manager, controller, tmp_path):
+    path = tmp_path / "grande.bin"
+    path.write_bytes(os.urandom(MAX_MESSAGE_SIZE + 1))
+    controller.journal.begin(ROLE_SEND, 7, PEER_DEVICE_ID, 256, 19, b"\0" * 32, str(path))
+    assert manager.resume_interrupted() == []
+    assert controller.journal.active_entries(ROLE_SEND) == [] # Não volta a cada partida
+
+
+def test_journal_write_does_not_hold_the_manager_lock(manager, controller, tmp_path):
+    controller.attach_serial(FakeFirmwareSerial())
+    release = threading.Event()
+    begun = threading.Event()
+    real_begin = controller.journal.begin
+
+    def slow_begin(*args):
+        begun.set()
+        release.wait(5) # fsync lento
+        return real_begin(*args)
+
+    controller.journal.begin = slow_begin
+    path = tmp_path / "pequeno.txt"
+    path.write_bytes(b"leitura 25.0\n" * 10)
+    manager.start()
+    job_id = manager.submit_file(str(path), use_delta=False)
+    assert begun.wait(2)
+
+    # Com o diário bloqueado, o gerenciador continua respondendo e enviando texto
+    started = time.monotonic()
+    assert manager.get_status(job_id)["acked_fragments"] == 0
+    text_id = manager.submit_text("oi")
+    assert time.monotonic() - started < 0.5
+    assert wait_for(lambda: manager.get_status(text_id)["status"] == JOB_SUCCESS)
+    assert manager.get_status(job_id)["acked_fragments"] == 0 # Nenhum fragmento do arquivo sai antes do registro
+
+    release.set()
+    assert wait_for(lambda: manager.get_status(job_id)["status"] in JOB_FINAL_STATES)
+    assert manager.get_status(job_id)["status"] == JOB_SUCCESS
+    assert controller.journal.active_entries(ROLE_SEND) == []
@@ -0,0 +1,145 @@
+# tests/test_journal.py
+
+import hashlib
+import os
+
+import pytest
+
+from journal import TransferJournal, ROLE_SEND, ROLE_RECV, END_STATUS_DISCARDED, RECORD_HEADER_SIZE
+
+FILE_HASH = hashlib.sha256(b"conteudo").digest()
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "transfers" / "transfers.journal")
+
+
+def _open(path, logs=None):
+    return TransferJournal(path, log_callback=(logs.append if logs is not None else lambda m: None))
+
+
+def test_bitmap_survives_reopen(path):
+    journal = _open(path)
+    entry = journal.begin(ROLE_SEND, 7, 0x02, 20, 19, FILE_HASH, "/tmp/arquivo.bin")
+    for idx in (0, 3, 19):
+        journal.mark_fragment(entry, idx, 19 if idx < 19 else 5)
+    journal.mark_fragment(entry, 3, 19) # Repetido: não conta duas vezes
+    journal.close()
+
+    reopened = _open(path)
+    restored = reopened.find_send(FILE_HASH)
+    assert restored.transfer_id == entry.transfer_id
+    assert restored.acked_fragments() == [0, 3, 19]
+    assert restored.acked_count == 3
+    assert restored.fragment_length(19) == 5
+    assert restored.fragment_length(4) == 19
+    assert (restored.message_id, restored.peer_device_id, restored.path) == (7, 0x02, "/tmp/arquivo.bin")
+    reopened.close()
+
+
+def test_torn_tail_is_truncated(path):
+    journal = _open(path)
+    entry = journal.begin(ROLE_RECV, 9, 0x02, 10, 19, b"", "recv")
+    journal.mark_fragment(entry, 1, 19)
+    journal.mark_fragment(entry, 2, 19)
+    journal.close()
+    with open(path, "ab") as f:
+        f.write(b"\x09\x00\x01\x02") # Registro cortado no meio do cabeçalho
+
+    logs = []
+    reopened = _open(path, logs)
+    assert reopened.find_recv(0x02, 9, 10, 19).acked_fragments() == [1, 2]
+    assert any("bytes finais inválidos descartados" in message for message in logs)
+    reopened.close()
+    # A compactação regravou o arquivo sem a cauda: a próxima abertura não reclama
+    logs = []
+    _open(path, logs).close()
+    assert logs == []
+
+
+def test_corrupted_record_stops_replay(path):
+    journal = _open(path)
+    entry = journal.begin(ROLE_SEND, 1, 0x02, 8, 19, FILE_HASH, "a")
+    journal.mark_fragment(entry, 0, 19)
+    size_before = os.path.getsize(path)
+    journal.mark_fragment(entry, 1, 19)
+    journal.close()
+    with open(path, "r+b") as f:
+        f.seek(size_before + RECORD_HEADER_SIZE) # Corpo do último registro
+        f.write(b"\xff")
+
+    reopened = _open(path)
+    assert reopened.find_send(FILE_HASH).acked_fragments() == [0]
+    reopened.close()
+
+
+def test_compaction_drops_finished_transfers(path):
+    journal = _open(path)
+    done = journal.begin(ROLE_SEND, 1, 0x02, 4, 19, hashlib.sha256(b"a").digest(), "a")
+    kept = journal.begin(ROLE_SEND, 2, 0x02, 300, 19, FILE_HASH, "b")
+    for idx in range(4):
+        journal.mark_fragment(done, idx, 19)
+    for idx in range(0, 300, 3):
+        journal.mark_fragment(kept, idx, 19)
+    journal.finish(done)
+    journal.mark_fragment(done, 0, 19) # Depois do fim: ignorado
+    journal.close()
+    size_before = os.path.getsize(path)
+
+    reopened = _open(path)
+    assert os.path.getsize(path) < size_before # BEGIN + um BITMAP por transferência ativa
+    assert [e.message_id for e in reopened.active_entries()] == [2]
+    assert reopened.find_send(hashlib.sha256(b"a").digest()) is None
+    assert reopened.find_send(FILE_HASH).acked_fragments() == list(range(0, 300, 3))
+    reopened.close()
+
+    # O bitmap compactado é relido igual na abertura seguinte
+    again = _open(path)
+    assert again.find_send(FILE_HASH).acked_count == 100
+    again.close()
+
+
+def test_bitmap_replay_keeps_last_fragment_length(path):
+    journal = _open(path)
+    entry = journal.begin(ROLE_RECV, 3, 0x02, 9, 16, b"", "recv")
+    journal.mark_fragment(entry, 8, 7)
+    journal.close()
+    _open(path).close() # Compacta em BITMAP
+    reopened = _open(path)
+    assert reopened.find_recv(0x02, 3, 9, 16).fragment_length(8) == 7
+    reopened.close()
+
+
+def test_find_recv_matches_all_fields(path):
+    journal = _open(path)
+    journal.begin(ROLE_RECV, 5, 0x02, 10, 19, b"", "recv")
+    journal.begin(ROLE_SEND, 5, 0x02, 10, 19, FILE_HASH, "send")
+    assert journal.find_recv(0x02, 5, 10, 19).role == ROLE_RECV
+    assert journal.find_recv(0x02, 5, 10, 16) is None # Outra fragmentação: outra mensagem
+    assert journal.find_recv(0x02, 5, 11, 19) is None
+    assert journal.find_recv(0x01, 5, 10, 19) is None
+    assert journal.find_recv(0x02, 6, 10, 19) is None
+    assert len(journal.active_entries(ROLE_RECV)) == 1
+    journal.close()
+
+
+def test_discarded_transfer_is_not_resumed(path):
+    journal = _open(path)
+    entry = journal.begin(ROLE_SEND, 4, 0x02, 10, 19, FILE_HASH, "a")
+    journal.finish(entry, END_STATUS_DISCARDED)
+    journal.close()
+    reopened = _open(path)
+    assert reopened.find_send(FILE_HASH) is None
+    reopened.close()
+
+
+def test_before_sync_runs_before_journal_fsync(path):
+    journal = TransferJournal(path, fsync_every=2, log_callback=lambda m: None)
+    entry = journal.begin(ROLE_RECV, 1, 0x02, 10, 19, b"", "recv")
+    calls = []
+    journal.mark_fragment(entry, 0, 19, before_sync=lambda: calls.append(0))
+    assert calls == []
+    journal.mark_fragment(entry, 1, 19, before_sync=lambda: calls.append(1))
+    assert calls == [1]
+    journal.close()
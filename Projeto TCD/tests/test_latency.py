@@ -0,0 +1,53 @@
+# tests/test_latency.py
+
+from latency import ReceiveLatencyTracer, RX_LATENCY_STAGES, STAGE_QUEUE, STAGE_WRITE, ACK_TURNAROUND_TARGET_US
+
+US = 1000
+
+
+def record(tracer, t0_ns, write_us):
+    """Registro completo: 1 µs em cada etapa até 'queue' e write_us de 'queue' até 'write'."""
+    timestamps = [t0_ns + stage * US for stage in range(STAGE_QUEUE + 1)]
+    return tracer.begin(*timestamps, timestamps[-1] + write_us * US)
+
+
+def test_summary_percentiles_from_known_samples():
+    tracer = ReceiveLatencyTracer(capacity=256)
+    for k in range(1, 101):
+        record(tracer, k * 10 ** 9, k)
+    summary = tracer.get_summary()
+    assert summary["samples"] == 100
+    assert summary["stages"]["write"] == {"p50_us": 50.0, "p90_us": 90.0, "p99_us": 99.0, "max_us": 100.0}
+    assert summary["stages"]["crc"] == {"p50_us": 1.0, "p90_us": 1.0, "p99_us": 1.0, "max_us": 1.0}
+    assert set(summary["stages"]) == set(RX_LATENCY_STAGES[1:])
+    assert summary["total"] == {"p50_us": 56.0, "p90_us": 96.0, "p99_us": 105.0, "max_us": 106.0}
+    assert summary["within_target"] == 1.0
+
+
+def test_incomplete_records_and_target_fraction():
+    tracer = ReceiveLatencyTracer(capacity=16)
+    record(tracer, 10 ** 9, 10)
+    record(tracer, 2 * 10 ** 9, ACK_TURNAROUND_TARGET_US * 2) # Fora da meta
+    seq = tracer.begin(*[3 * 10 ** 9 + stage * US for stage in range(STAGE_QUEUE + 1)]) # ACK ainda não escrito
+    summary = tracer.get_summary()
+    assert summary["samples"] == 2
+    assert summary["within_target"] == 0.5
+    tracer.mark(seq, STAGE_WRITE, 3 * 10 ** 9 + (STAGE_QUEUE + 3) * US)
+    assert tracer.get_summary()["samples"] == 3
+    tracer.reset()
+    assert tracer.get_summary() == {"samples": 0, "target_us": ACK_TURNAROUND_TARGET_US}
+
+
+def test_ring_keeps_only_the_newest_records():
+    tracer = ReceiveLatencyTracer(capacity=8)
+    seqs = [record(tracer, k * 10 ** 9, k) for k in range(1, 21)]
+    summary = tracer.get_summary()
+    assert summary["samples"] == 8 # Só k = 13..20 sobrevivem
+    assert summary["stages"]["write"]["p50_us"] == 16.0
+    assert summary["stages"]["write"]["max_us"] == 20.0
+
+    # Etapa marcada num registro já sobrescrito pelo anel: não toca no registro novo da mesma posição
+    tracer.mark(seqs[4], STAGE_WRITE, 0)
+    assert tracer.get_summary() == summary
+    tracer.mark(seqs[-1], STAGE_WRITE, 20 * 10 ** 9 + (STAGE_QUEUE + 50) * US)
+    assert tracer.get_summary()["stages"]["write"]["max_us"] == 50.0
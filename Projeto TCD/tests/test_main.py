@@ -0,0 +1,44 @@
+# tests/test_main.py
+
+import time
+
+import main
+from main import StartupTimer, connect_in_background
+
+
+class FlakyController:
+    """Porta que só abre na tentativa 'opens_at'; o resto do handshake sempre dá certo."""
+
+    def __init__(self, opens_at):
+        self.serial_port = "COM9"
+        self.opens_at = opens_at
+        self.attempts = 0
+        self.calls = []
+
+    def connect(self):
+        self.attempts += 1
+        return self.attempts >= self.opens_at
+
+    def wait_for_first_status(self):
+        return True
+
+    def set_telemetry_mode(self, mode):
+        self.calls.append("telemetry")
+
+    def negotiate_baud_rate(self):
+        self.calls.append("negotiate")
+
+
+def test_failed_connect_is_logged_and_retried_until_resume(monkeypatch):
+    monkeypatch.setattr(main, "BINARY_TELEMETRY", False)
+    monkeypatch.setattr(main, "NEGOTIATE_BAUD_RATE", True)
+    controller = FlakyController(opens_at=3)
+    timer = StartupTimer(time.perf_counter())
+    logs = []
+    resumed = []
+    connect_in_background(controller, timer, logs.append, lambda: resumed.append(controller.attempts), retry_delay_s=0)
+    failures = [message for message in logs if "não foi possível abrir a porta serial COM9" in message]
+    assert len(failures) == 2
+    assert resumed == [3] # Diário retomado uma vez, depois da conexão que deu certo
+    assert controller.calls == ["negotiate"]
+    assert {"serial_failed", "serial_open", "arduino_ready"} <= set(timer.report())
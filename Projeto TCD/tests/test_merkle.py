@@ -0,0 +1,130 @@
+# tests/test_merkle.py
+
+import os
+import random
+
+import envelope
+from merkle import (MerkleStreamVerifier, HASH_SIZE, compute_leaves, merkle_root, pack_leaves, unpack_leaves,
+                    block_count)
+
+FRAGMENT_SIZE = 19
+
+
+def make_message(size=3000):
+    return envelope.encode_file("dados.bin", os.urandom(size))
+
+
+def split(message):
+    return [message[i:i + FRAGMENT_SIZE] for i in range(0, len(message), FRAGMENT_SIZE)]
+
+
+def expected_leaves(message):
+    start, body_len, block_size = envelope.parse_merkle_layout(message)
+    return compute_leaves(message[start:start + body_len], block_size)
+
+
+def new_verifier(fragments):
+    return MerkleStreamVerifier(len(fragments), FRAGMENT_SIZE, envelope.parse_merkle_layout)
+
+
+def test_tree_helpers():
+    leaves = compute_leaves(b"a" * 1000, 512)
+    assert len(leaves) == block_count(1000, 512) == 2
+    assert unpack_leaves(pack_leaves(leaves), 2) == leaves
+    assert unpack_leaves(pack_leaves(leaves)[:-1], 2) is None
+    assert merkle_root(leaves) != merkle_root(leaves[::-1])
+    assert len(merkle_root(compute_leaves(b"", 512))) == HASH_SIZE
+    odd = compute_leaves(b"b" * 1500, 512) # Nível ímpar duplica o último nó
+    assert merkle_root(odd) == merkle_root(odd + odd[-1:])
+
+
+def test_in_order_fragments_hash_every_block_before_finish():
+    message = make_message()
+    fragments = split(message)
+    verifier = new_verifier(fragments)
+    for idx, payload in enumerate(fragments):
+        verifier.add_fragment(idx, payload)
+    assert verifier.leaves == expected_leaves(message)
+    assert verifier.finish(message) == expected_leaves(message)
+
+
+def test_out_of_order_fragments():
+    message = make_message()
+    fragments = split(message)
+    order = list(range(len(fragments)))
+    random.Random(7).shuffle(order)
+    verifier = new_verifier(fragments)
+    for idx in order:
+        verifier.add_fragment(idx, fragments[idx])
+    assert verifier.leaves == expected_leaves(message)
+
+
+def test_header_split_across_fragments_waits_for_contiguous_prefix():
+    message = make_message()
+    fragments = split(message)
+    header_fragments = -(-envelope.parse_merkle_layout(message)[0] // FRAGMENT_SIZE)
+    assert header_fragments > 1 # O cabeçalho não cabe num fragmento só
+    verifier = new_verifier(fragments)
+    for idx in range(len(fragments) - 1, 0, -1): # Tudo menos o fragmento 0
+        verifier.add_fragment(idx, fragments[idx])
+    assert verifier.body_start is None and verifier.leaves is None
+    verifier.add_fragment(0, fragments[0])
+    assert verifier.body_start is not None
+    assert verifier.leaves == expected_leaves(message)
+
+
+def test_partial_header_then_missing_blocks_completed_by_finish():
+    message = make_message()
+    fragments = split(message)
+    verifier = new_verifier(fragments)
+    missing = len(fragments) // 2
+    for idx, payload in enumerate(fragments):
+        if idx != missing:
+            verifier.add_fragment(idx, payload)
+    assert None in verifier.leaves # Bloco que contém o fragmento faltante ainda não foi hasheado
+    assert verifier.finish(message) == expected_leaves(message)
+
+
+def test_duplicate_fragment_rehashes_block():
+    message = make_message()
+    fragments = split(message)
+    target = len(fragments) // 2
+    verifier = new_verifier(fragments)
+    for idx, payload in enumerate(fragments):
+        verifier.add_fragment(idx, bytes(b ^ 0xFF for b in payload) if idx == target else payload)
+    corrupted = verifier.leaves
+    assert corrupted != expected_leaves(message)
+    verifier.add_fragment(target, fragments[target]) # Retransmissão com o conteúdo certo
+    assert verifier.leaves == expected_leaves(message)
+    verifier.add_fragment(target, fragments[target]) # Duplicata idêntica não muda nada
+    assert verifier.leaves == expected_leaves(message)
+
+
+def test_message_without_merkle_deactivates():
+    fragments = split(envelope.encode_ping(3, b"x" * 40))
+    verifier = new_verifier(fragments)
+    verifier.add_fragment(0, fragments[0])
+    assert not verifier.active
+    verifier.add_fragment(1, fragments[1]) # Ignorado
+    assert verifier.finish(b"".join(fragments)) is None
+
+
+def test_out_of_range_fragment_is_ignored():
+    message = make_message(100)
+    fragments = split(message)
+    verifier = new_verifier(fragments)
+    verifier.add_fragment(len(fragments), b"x" * FRAGMENT_SIZE)
+    assert verifier.body_start is None and verifier.active
+
+
+def test_repair_codecs():
+    root = b"\x5A" * HASH_SIZE
+    kind, body = envelope.unwrap(envelope.encode_repair_request(root, [0, 7, 300]))
+    assert kind == envelope.KIND_REPAIR_REQUEST
+    assert envelope.decode_repair_request(body) == (root, [0, 7, 300])
+    assert envelope.decode_repair_request(envelope.unwrap(envelope.encode_repair_request(root, []))[1]) == (root, [])
+
+    blocks = [(2, b"bloco dois"), (9, b""), (65535, os.urandom(512))]
+    kind, body = envelope.unwrap(envelope.encode_repair_data(root, blocks))
+    assert kind == envelope.KIND_REPAIR_DATA
+    assert envelope.decode_repair_data(body) == (root, blocks)
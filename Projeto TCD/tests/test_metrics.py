@@ -0,0 +1,122 @@
+# tests/test_metrics.py
+
+import json
+import urllib.request
+
+import pytest
+
+import metrics
+from metrics import MetricsRegistry, TimeSeries, RESOLUTION_RAW
+
+
+def test_same_name_and_labels_return_same_metric():
+    registry = MetricsRegistry()
+    a = registry.counter("tcd_frames_total", "Quadros.", direction="tx")
+    assert registry.counter("tcd_frames_total", "Quadros.", direction="tx") is a
+    assert registry.counter("tcd_frames_total", "Quadros.", direction="rx") is not a
+    with pytest.raises(ValueError, match="counter"):
+        registry.gauge("tcd_frames_total", "Outro tipo.")
+
+
+def test_values_and_snapshot():
+    registry = MetricsRegistry()
+    registry.counter("tcd_acks_total", "ACKs.").inc(3)
+    gauge = registry.gauge("tcd_queue", "Fila.", channel="data")
+    gauge.set(5)
+    gauge.dec(2)
+    registry.gauge("tcd_fn", "Lida na hora.", fn=lambda: 42)
+    registry.gauge("tcd_broken", "Fonte indisponível.", fn=lambda: 1 / 0)
+    registry.histogram("tcd_rtt_seconds", "RTT.").observe(0.3)
+    assert registry.snapshot() == {"tcd_acks_total": 3, "tcd_queue": {"channel=data": 3}, "tcd_fn": 42,
+                                   "tcd_broken": None, "tcd_rtt_seconds": 1}
+
+
+def test_prometheus_exposition():
+    registry = MetricsRegistry()
+    registry.counter("tcd_frames_total", "Quadros enviados.", direction="tx").inc(7)
+    registry.gauge("tcd_port", "Porta.", fn=lambda: 0.5, port='COM"3\\')
+    registry.gauge("tcd_broken", "Indisponível.", fn=lambda: 1 / 0)
+    histogram = registry.histogram("tcd_rtt_seconds", "RTT de ACK.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert registry.render_prometheus().splitlines() == [
+        "# HELP tcd_frames_total Quadros enviados.",
+        "# TYPE tcd_frames_total counter",
+        'tcd_frames_total{direction="tx"} 7',
+        "# HELP tcd_port Porta.",
+        "# TYPE tcd_port gauge",
+        'tcd_port{port="COM\\"3\\\\"} 0.5',
+        "# HELP tcd_broken Indisponível.",
+        "# TYPE tcd_broken gauge",
+        "# HELP tcd_rtt_seconds RTT de ACK.",
+        "# TYPE tcd_rtt_seconds histogram",
+        'tcd_rtt_seconds_bucket{le="0.1"} 2', # Limite inclusivo, como no Prometheus
+        'tcd_rtt_seconds_bucket{le="1"} 3',
+        'tcd_rtt_seconds_bucket{le="+Inf"} 4',
+        "tcd_rtt_seconds_sum 3.65",
+        "tcd_rtt_seconds_count 4",
+    ]
+
+
+def test_raw_history_is_bounded():
+    registry = MetricsRegistry(raw_samples=3)
+    counter = registry.counter("tcd_total", "Total.")
+    for ts in range(5):
+        counter.inc()
+        registry.sample(now=float(ts))
+    assert registry.get_history("tcd_total") == [{"ts": 2.0, "value": 3}, {"ts": 3.0, "value": 4},
+                                                 {"ts": 4.0, "value": 5}]
+    assert registry.get_history("tcd_total", other="x") == []
+
+
+def test_rollups():
+    series = TimeSeries(raw_samples=10, rollups=(("10s", 10, 2),))
+    for ts, value in [(0, 4), (5, 2), (9, 6), (10, 1), (25, 8), (31, 3)]:
+        series.add(ts, value)
+    # A janela de 0 s saiu do buffer (2 pontos fechados + a janela em andamento)
+    assert series.get("10s") == [
+        {"ts": 10, "min": 1, "max": 1, "avg": 1.0, "last": 1},
+        {"ts": 20, "min": 8, "max": 8, "avg": 8.0, "last": 8},
+        {"ts": 30, "min": 3, "max": 3, "avg": 3.0, "last": 3},
+    ]
+    with pytest.raises(ValueError, match="Resolução"):
+        series.get("1d")
+
+
+def test_rollup_window_summary():
+    series = TimeSeries(rollups=(("1m", 60, 10),))
+    for ts, value in [(60, 4), (70, 2), (119, 6)]:
+        series.add(ts, value)
+    assert series.get("1m") == [{"ts": 60, "min": 2, "max": 6, "avg": 4.0, "last": 6}]
+
+
+def test_histograms_are_sampled_as_count_and_sum():
+    registry = MetricsRegistry()
+    registry.histogram("tcd_rtt_seconds", "RTT.").observe(0.25)
+    registry.gauge("tcd_broken", "Indisponível.", fn=lambda: 1 / 0)
+    registry.sample(now=100.0)
+    assert registry.get_history("tcd_rtt_seconds_count") == [{"ts": 100.0, "value": 1}]
+    assert registry.get_history("tcd_rtt_seconds_sum") == [{"ts": 100.0, "value": 0.25}]
+    assert {s["name"] for s in registry.list_series()} == {"tcd_rtt_seconds_count", "tcd_rtt_seconds_sum"}
+
+
+def test_http_endpoint():
+    pytest.importorskip("bottle")
+    registry = MetricsRegistry(log_callback=lambda message: None)
+    registry.counter("tcd_total", "Total.").inc(2)
+    registry.sample(now=1.0)
+    url = registry.start_http(port=0)
+    try:
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"] == metrics.PROMETHEUS_CONTENT_TYPE
+            assert "tcd_total 2" in response.read().decode()
+        with urllib.request.urlopen(url + "/history?name=tcd_total") as response:
+            assert json.load(response)["points"] == [{"ts": 1.0, "value": 2}]
+    finally:
+        registry.stop_http()
+
+
+def test_http_without_bottle(monkeypatch):
+    monkeypatch.setattr(metrics, "bottle", None)
+    with pytest.raises(RuntimeError, match="bottle"):
+        MetricsRegistry().start_http(port=0)
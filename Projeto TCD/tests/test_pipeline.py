@@ -0,0 +1,184 @@
+# tests/test_pipeline.py
+
+import os
+import threading
+import zlib
+
+import pytest
+
+import pipeline
+from pipeline import SendPipeline, CallbackRelay
+
+
+def encode(fragment_idx, total_fragments, segment):
+    return bytes([fragment_idx & 0xFF, total_fragments & 0xFF]) + segment
+
+
+def fixed_size(size):
+    return lambda total_bytes: size
+
+
+def drain(send_pipeline):
+    frames = []
+    while True:
+        frame = send_pipeline.next_frame()
+        if frame is None:
+            return frames
+        frames.append(frame)
+
+
+def join_stages(send_pipeline):
+    for thread in send_pipeline._threads:
+        thread.join(timeout=2)
+        assert not thread.is_alive()
+
+
+def test_bytes_source_in_order():
+    data = os.urandom(100)
+    send_pipeline = SendPipeline(data, encode, fixed_size(19)).start()
+    assert send_pipeline.wait_sized(1)
+    assert (send_pipeline.total_bytes, send_pipeline.total_fragments) == (100, 6)
+    frames = drain(send_pipeline)
+    assert [f.fragment_idx for f in frames] == list(range(6))
+    assert b"".join(f.segment for f in frames) == data
+    assert frames[5].data == bytes([5, 6]) + data[95:]
+    assert send_pipeline.next_frame() is None # Depois do fim continua None
+    assert send_pipeline.get_stats()["frames_encoded"] == 6
+
+
+def test_empty_message_is_one_empty_fragment():
+    frames = drain(SendPipeline(b"", encode, fixed_size(19)).start())
+    assert [(f.fragment_idx, f.segment) for f in frames] == [(0, b"")]
+
+
+def test_file_source_across_read_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "READ_BLOCK_SIZE", 50) # Fragmentos atravessam os blocos lidos
+    path = tmp_path / "arquivo.bin"
+    data = os.urandom(1000)
+    path.write_bytes(data)
+    send_pipeline = SendPipeline(str(path), encode, fixed_size(19), queue_size=2).start()
+    frames = drain(send_pipeline)
+    assert len(frames) == send_pipeline.total_fragments == 53
+    assert b"".join(f.segment for f in frames) == data
+    join_stages(send_pipeline)
+
+
+def test_transforms_run_before_sizing(tmp_path):
+    path = tmp_path / "texto.txt"
+    path.write_bytes(b"leitura 25.0\n" * 500)
+    sizes = []
+
+    def size_for(total_bytes):
+        sizes.append(total_bytes)
+        return 19
+
+    send_pipeline = SendPipeline(str(path), encode, size_for, transforms=[zlib.compress, lambda d: b"H" + d]).start()
+    frames = drain(send_pipeline)
+    expected = b"H" + zlib.compress(b"leitura 25.0\n" * 500)
+    assert sizes == [len(expected)]
+    assert b"".join(f.segment for f in frames) == expected
+
+
+def test_fragment_indices_only_encodes_missing():
+    encoded = []
+
+    def encode_recording(fragment_idx, total_fragments, segment):
+        encoded.append(fragment_idx)
+        return encode(fragment_idx, total_fragments, segment)
+
+    data = os.urandom(190)
+    send_pipeline = SendPipeline(data, encode_recording, fixed_size(19), fragment_indices=[1, 4, 9]).start()
+    frames = drain(send_pipeline)
+    assert [f.fragment_idx for f in frames] == encoded == [1, 4, 9]
+    assert frames[1].segment == data[76:95]
+    assert send_pipeline.total_fragments == 10 # O total continua o da mensagem inteira
+
+
+def test_get_frame_lookahead():
+    data = os.urandom(19 * 8)
+    send_pipeline = SendPipeline(data, encode, fixed_size(19), fragment_indices=range(1, 8)).start()
+    assert send_pipeline.get_frame(3).segment == data[57:76]
+    assert sorted(send_pipeline._lookahead) == [1, 2] # Retirados da fila antes de serem pedidos
+    assert send_pipeline.get_frame(1).fragment_idx == 1
+    assert send_pipeline.get_frame(0) is None # Não produzido: consome o resto da fila até o fim
+    assert [send_pipeline.get_frame(i).fragment_idx for i in (7, 2, 5, 4, 6)] == [7, 2, 5, 4, 6]
+    assert send_pipeline._lookahead == {}
+
+
+def test_get_frame_from_concurrent_senders():
+    data = os.urandom(19 * 200)
+    send_pipeline = SendPipeline(data, encode, fixed_size(19), queue_size=4).start()
+    results = {}
+    next_idx = iter(range(200))
+    lock = threading.Lock()
+
+    def sender():
+        while True:
+            with lock: # Fragmentos distribuídos na ordem, como o pool de envio faz
+                fragment_idx = next(next_idx, None)
+            if fragment_idx is None:
+                return
+            results[fragment_idx] = send_pipeline.get_frame(fragment_idx).segment
+
+    threads = [threading.Thread(target=sender) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert b"".join(results[i] for i in range(200)) == data
+    assert send_pipeline._lookahead == {}
+
+
+@pytest.mark.parametrize("change", [b"mais dados", None])
+def test_file_changing_size_is_an_error(tmp_path, monkeypatch, change):
+    monkeypatch.setattr(pipeline, "READ_BLOCK_SIZE", 19)
+    path = tmp_path / "log.txt"
+    path.write_bytes(b"x" * 190)
+
+    def size_then_change(total_bytes):
+        # Chamado logo depois do fstat, antes da leitura: o arquivo muda "enquanto" é enviado
+        if change:
+            with open(path, "ab") as f:
+                f.write(change)
+        else:
+            os.truncate(path, 100)
+        return 19
+
+    send_pipeline = SendPipeline(str(path), encode, size_then_change).start()
+    with pytest.raises(OSError, match="mudou durante a leitura"):
+        drain(send_pipeline)
+    join_stages(send_pipeline)
+
+
+def test_stage_error_reaches_wait_sized():
+    def broken(data):
+        raise ValueError("falha na compressão")
+
+    send_pipeline = SendPipeline(b"abc", encode, fixed_size(19), transforms=[broken]).start()
+    with pytest.raises(ValueError, match="compressão"):
+        send_pipeline.wait_sized(2)
+
+
+def test_close_stops_blocked_stages(tmp_path):
+    path = tmp_path / "grande.bin"
+    path.write_bytes(os.urandom(19 * 500))
+    send_pipeline = SendPipeline(str(path), encode, fixed_size(19), queue_size=1).start()
+    assert send_pipeline.next_frame().fragment_idx == 0
+    send_pipeline.close() # Cancelamento: as etapas estão paradas nas filas cheias
+    join_stages(send_pipeline)
+    while send_pipeline.next_frame() is not None: # Só o que já estava na fila
+        pass
+    assert send_pipeline.frames_encoded < 500
+
+
+def test_callback_relay_runs_in_order():
+    logs = []
+    relay = CallbackRelay(log_callback=logs.append)
+    calls = []
+    relay.call(calls.append, 1)
+    relay.call(lambda: 1 / 0)
+    relay.call(None) # Sem callback: ignorado
+    relay.call(calls.append, 2)
+    relay.close()
+    assert calls == [1, 2]
+    assert len(logs) == 1 and logs[0].startswith("Erro no callback")
@@ -0,0 +1,126 @@
+# tests/test_profiling.py
+
+import json
+import pstats
+import threading
+import time
+
+import pytest
+
+from profiling import (RuntimeProfiler, classify_stack, PROFILE_MODE_SAMPLING, PROFILE_MODE_CPROFILE,
+                       CATEGORY_SLEEPING, CATEGORY_CRC, CATEGORY_PARSING, CATEGORY_OTHER)
+
+
+def crc4_busy(stop):
+    while not stop.is_set():
+        sum(range(200))
+
+
+class InstrumentedWorker:
+    """Thread com checkpoint() no laço, como a leitura serial e o escalonador de TX."""
+
+    def __init__(self, profiler, name="SerialReader"):
+        self.profiler = profiler
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            if self.profiler.hooked:
+                self.profiler.checkpoint()
+            calculate_crc(bytes(range(64)))
+            time.sleep(0.001)
+        if self.profiler.hooked:
+            self.profiler.checkpoint() # Último checkpoint: desliga o cProfile desta thread
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join(timeout=2)
+
+
+def calculate_crc(data):
+    crc = 0
+    for byte in data:
+        crc = (crc + byte) & 0x0F
+    return crc
+
+
+def test_classify_stack():
+    assert classify_stack([("main.py", "run", 1), ("/usr/lib/python3/threading.py", "wait", 1)]) == CATEGORY_SLEEPING
+    assert classify_stack([("arduino.py", "_process_packet", 1), ("arduino.py", "calculate_crc4", 1)]) == CATEGORY_CRC
+    assert classify_stack([("arduino.py", "_process_packet", 1), ("x.py", "helper", 1)]) == CATEGORY_PARSING
+    assert classify_stack([("x.py", "helper", 1)]) == CATEGORY_OTHER
+
+
+def test_start_stop_rules():
+    profiler = RuntimeProfiler(log_callback=lambda message: None)
+    with pytest.raises(ValueError):
+        profiler.start(mode="perf")
+    assert profiler.stop() is None
+    assert profiler.start(interval_s=0.01)
+    assert not profiler.start() # Já ativo
+    profiler.stop()
+    assert not profiler.active and not profiler.hooked
+
+
+def test_sampling_start_stop_export(tmp_path):
+    profiler = RuntimeProfiler(log_callback=lambda message: None)
+    stop = threading.Event()
+    busy = threading.Thread(target=crc4_busy, args=(stop,), name="SerialReader", daemon=True)
+    other = threading.Thread(target=stop.wait, name="Outra", daemon=True)
+    busy.start()
+    other.start()
+    try:
+        profiler.start(PROFILE_MODE_SAMPLING, interval_s=0.002, threads=["Serial"], trace_memory=True)
+        time.sleep(0.15)
+        profiler.mark("meio")
+        summary = profiler.stop()
+    finally:
+        stop.set()
+        busy.join()
+        other.join()
+    assert summary["samples"] > 0
+    assert set(summary["threads"]) == {"SerialReader"} # Filtro por prefixo do nome
+    assert summary["threads"]["SerialReader"].get(CATEGORY_CRC, 0) > 0
+    assert summary["memory_marks"] == ["start", "meio", "stop"]
+
+    paths = profiler.export(str(tmp_path / "profiles"), prefix="teste")
+    assert set(paths) == {"folded", "speedscope", "memory"}
+    lines = open(paths["folded"], encoding="utf-8").read().splitlines()
+    assert lines and all(line.startswith("SerialReader;") and line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    document = json.load(open(paths["speedscope"], encoding="utf-8"))
+    assert [profile["name"] for profile in document["profiles"]] == ["SerialReader"]
+    assert len(document["profiles"][0]["samples"]) == len(document["profiles"][0]["weights"])
+    assert "start -> meio" in open(paths["memory"], encoding="utf-8").read()
+
+
+def test_cprofile_start_stop_export(tmp_path):
+    logs = []
+    profiler = RuntimeProfiler(log_callback=logs.append)
+    with InstrumentedWorker(profiler):
+        profiler.start(PROFILE_MODE_CPROFILE)
+        assert profiler.hooked
+        time.sleep(0.1)
+        summary = profiler.stop()
+    if any("cProfile indisponível" in line for line in logs):
+        pytest.skip("cProfile de outra ferramenta já ativo neste processo")
+    assert not profiler.hooked
+    assert summary["mode"] == PROFILE_MODE_CPROFILE and "SerialReader" in summary["threads"]
+
+    paths = profiler.export(str(tmp_path), prefix="teste")
+    assert list(paths) == ["pstats:SerialReader"]
+    stats = pstats.Stats(paths["pstats:SerialReader"])
+    assert any(function == "calculate_crc" for _, _, function in stats.stats)
+
+
+def test_sampling_without_threads_exports_nothing(tmp_path):
+    profiler = RuntimeProfiler(log_callback=lambda message: None)
+    profiler.start(interval_s=0.002, threads=["NenhumaThread"])
+    time.sleep(0.02)
+    summary = profiler.stop()
+    assert summary["threads"] == {} and summary["categories"] == {}
+    assert profiler.export(str(tmp_path)) == {}
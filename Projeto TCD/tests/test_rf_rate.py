@@ -0,0 +1,148 @@
+# tests/test_rf_rate.py
+
+import struct
+
+import pytest
+
+import rf_rate
+from rf_rate import RfRateController, best_fragment_size, frame_air_bits, LINK_RF_BITRATE, RF_DEFAULT_BITRATE, \
+    STEP_UP_SUCCESSES, STEP_DOWN_FAILURES, MAX_STEP_UP_SUCCESSES, FRAGMENT_SIZE_CHOICES
+from tdma import TdmaSlotScheduler
+
+
+class FakeController:
+    def __init__(self):
+        self.tdma = TdmaSlotScheduler(0x01, 0x02, 10 ** 9)
+        self.link_frames = []
+
+    def send_link_frame(self, command, index, payload, wait=True):
+        self.link_frames.append((command, struct.unpack("<H", payload)[0]))
+        return {"status": "success"}
+
+
+@pytest.fixture
+def rate(monkeypatch):
+    monkeypatch.setattr(rf_rate, "MIN_RATE_HOLD_S", 0.0)
+    controller = RfRateController(FakeController(), 0.7, log_callback=lambda m: None)
+    controller._request_bitrate = controller._send_bitrate_command # Síncrono: sem thread para esperar
+    return controller
+
+
+def _results(rate, success, count, size=19):
+    for _ in range(count):
+        rate.on_fragment_result(size, success)
+
+
+def _confirm(rate):
+    """Status do firmware já na taxa pedida (libera a próxima troca)."""
+    rate.on_firmware_status(rate.current_bitrate, 0)
+
+
+def test_steps_up_after_success_streak(rate):
+    _results(rate, True, STEP_UP_SUCCESSES - 1)
+    assert rate.current_bitrate == RF_DEFAULT_BITRATE
+    _results(rate, True, 1)
+    assert rate.current_bitrate == 3000
+    assert rate.controller.link_frames == [(LINK_RF_BITRATE, 3000)]
+
+
+def test_steps_down_after_consecutive_failures(rate):
+    _results(rate, False, STEP_DOWN_FAILURES - 1)
+    assert rate.current_bitrate == RF_DEFAULT_BITRATE
+    _results(rate, False, 1)
+    assert rate.current_bitrate == 1000
+    assert rate.ack_timeout() == pytest.approx(1.4)
+
+
+def test_single_failures_between_successes_do_not_step_down(rate):
+    for _ in range(8):
+        _results(rate, True, 3)
+        _results(rate, False, 1)
+    assert rate.current_bitrate == RF_DEFAULT_BITRATE
+
+
+def test_failed_probe_reverts_and_doubles_streak(rate):
+    _results(rate, True, STEP_UP_SUCCESSES)
+    assert rate.current_bitrate == 3000
+    _confirm(rate)
+    _results(rate, False, 1) # A primeira falha na taxa nova desfaz a subida na hora
+    assert rate.current_bitrate == RF_DEFAULT_BITRATE
+    assert rate.get_state()["step_up_after"] == STEP_UP_SUCCESSES * 2
+
+    _confirm(rate)
+    _results(rate, True, STEP_UP_SUCCESSES * 2 - 1)
+    assert rate.current_bitrate == RF_DEFAULT_BITRATE
+    _results(rate, True, 1)
+    assert rate.current_bitrate == 3000
+
+
+def test_confirmed_probe_resets_streak(rate):
+    _results(rate, True, STEP_UP_SUCCESSES)
+    _confirm(rate)
+    _results(rate, False, 1)
+    _confirm(rate)
+    _results(rate, True, STEP_UP_SUCCESSES * 2)
+    assert rate.current_bitrate == 3000
+    _confirm(rate)
+    _results(rate, True, 1) # Primeiro sucesso na taxa nova confirma a subida
+    assert rate.get_state()["step_up_after"] == STEP_UP_SUCCESSES
+
+
+def test_probe_streak_is_capped(rate):
+    for _ in range(6):
+        _results(rate, True, rate.get_state()["step_up_after"])
+        _confirm(rate)
+        _results(rate, False, 1)
+        _confirm(rate)
+    assert rate.get_state()["step_up_after"] == MAX_STEP_UP_SUCCESSES
+
+
+def test_no_step_beyond_supported_rates(rate):
+    _results(rate, False, STEP_DOWN_FAILURES)
+    assert rate.current_bitrate == 1000
+    _confirm(rate)
+    _results(rate, False, STEP_DOWN_FAILURES)
+    assert rate.current_bitrate == 1000
+    assert len(rate.controller.link_frames) == 1
+
+
+def test_no_new_request_until_firmware_confirms(rate):
+    _results(rate, False, STEP_DOWN_FAILURES)
+    _results(rate, False, STEP_DOWN_FAILURES)
+    assert rate.controller.link_frames == [(LINK_RF_BITRATE, 1000)]
+
+
+def test_firmware_status_follows_peer_rate_and_counts_rx_errors(rate):
+    rate.on_firmware_status(RF_DEFAULT_BITRATE, 250)
+    rate.on_firmware_status(3000, 2) # Contador de 8 bits deu a volta: 8 quadros ruins = 2 perdas
+    assert rate.current_bitrate == 3000
+    assert rate.get_state()["loss"] == 1.0
+    assert rate.controller.link_frames == []
+
+
+def test_disabled_controller_keeps_rate_and_full_fragments(rate):
+    rate.enabled = False
+    _results(rate, False, 10)
+    assert rate.current_bitrate == RF_DEFAULT_BITRATE
+    assert rate.fragment_size() == FRAGMENT_SIZE_CHOICES[0]
+
+
+def test_frame_air_bits_counts_only_used_bytes():
+    assert frame_air_bits(0) == 48 + 12 * (3 + 8)
+    assert frame_air_bits(19) - frame_air_bits(0) == 19 * 12
+
+
+def test_best_fragment_size_shrinks_with_bit_errors():
+    assert best_fragment_size(0.0, RF_DEFAULT_BITRATE) == 19
+    sizes = [best_fragment_size(ber, RF_DEFAULT_BITRATE) for ber in (0.0, 1e-3, 3e-3, 1e-2, 3e-2)]
+    assert sizes == sorted(sizes, reverse=True)
+    assert sizes[-1] == FRAGMENT_SIZE_CHOICES[-1]
+
+
+def test_fragment_size_follows_observed_loss(rate):
+    rate.enabled = True
+    rate._neighbour_locked = lambda step, ignore_hold=False: None # Só a escolha do tamanho, sem trocar a taxa
+    _results(rate, True, 4)
+    assert rate.fragment_size() == 19
+    _results(rate, False, 28) # 87,5% de perda
+    assert rate.fragment_size() == 16
@@ -0,0 +1,159 @@
+# tests/test_serial_link.py
+
+import struct
+import time
+
+import pytest
+
+import serial_link
+from serial_link import (SerialLinkManager, LINK_BAUD_PROPOSE, LINK_BAUD_ACCEPT, LINK_BAUD_REJECT, LINK_TEST,
+                         LINK_BAUD_COMMIT, LINK_KEEPALIVE, BASE_BAUD_RATE, BAUD_FORMAT, TEST_BURST_FRAMES)
+
+
+class FakeLinkController:
+    """
+    Faz o papel do ArduinoController e do firmware: responde aos quadros LINK na hora, chamando
+    on_link_frame como a thread de leitura faria. bad_rates: taxas em que o eco volta corrompido.
+    """
+
+    def __init__(self, supported=(250000, 115200, 57600), bad_rates=(), crc_error_rates=(), silent_commands=()):
+        self.running = True
+        self.manager = None
+        self.supported = supported
+        self.bad_rates = bad_rates
+        self.crc_error_rates = crc_error_rates
+        self.silent_commands = silent_commands
+        self.port_rate = BASE_BAUD_RATE
+        self.port_rates = []   # Trocas de taxa da porta, em ordem
+        self.sent = []         # (comando, índice)
+
+    def set_port_baud_rate(self, rate):
+        self.port_rate = rate
+        self.port_rates.append(rate)
+
+    def send_link_frame(self, command, index, payload, wait=True):
+        self.sent.append((command, index))
+        if command in self.silent_commands:
+            return {"status": "success"}
+        if command == LINK_BAUD_PROPOSE:
+            (rate,) = struct.unpack(BAUD_FORMAT, payload)
+            self.manager.on_link_frame(LINK_BAUD_ACCEPT if rate in self.supported else LINK_BAUD_REJECT, 0, b'')
+        elif command == LINK_TEST:
+            if self.port_rate in self.crc_error_rates:
+                self.manager.on_crc_error()
+            echo = bytes(b ^ 0x01 for b in payload) if self.port_rate in self.bad_rates else payload
+            self.manager.on_link_frame(LINK_TEST, index, echo)
+        elif command == LINK_BAUD_COMMIT:
+            self.manager.on_link_frame(LINK_BAUD_COMMIT, 0, b'')
+        return {"status": "success"}
+
+    def commands(self):
+        return [command for command, _ in self.sent if command != LINK_KEEPALIVE]
+
+
+@pytest.fixture(autouse=True)
+def fast_timeouts(monkeypatch):
+    monkeypatch.setattr(serial_link, "LINK_REPLY_TIMEOUT_S", 0.05)
+    monkeypatch.setattr(serial_link, "FIRMWARE_TRIAL_TIMEOUT_S", 0)
+
+
+def make_manager(**kwargs):
+    fake = FakeLinkController(**kwargs)
+    logs = []
+    manager = SerialLinkManager(fake, log_callback=logs.append)
+    fake.manager = manager
+    manager.logs = logs
+    return fake, manager
+
+
+def test_propose_accept_test_commit():
+    fake, manager = make_manager(supported=(115200, 57600))
+    try:
+        assert manager.negotiate() == 115200
+    finally:
+        manager.stop()
+    # 250000 é recusada pelo firmware, 115200 passa no teste
+    assert fake.commands() == [LINK_BAUD_PROPOSE, LINK_BAUD_PROPOSE] + [LINK_TEST] * TEST_BURST_FRAMES + [LINK_BAUD_COMMIT]
+    assert [index for command, index in fake.sent if command == LINK_TEST] == list(range(TEST_BURST_FRAMES))
+    assert fake.port_rates == [115200]
+    assert manager.get_state()["baud_rate"] == 115200 and manager.get_state()["failed_rates"] == []
+
+
+@pytest.mark.parametrize("failure", [{"bad_rates": (250000,)}, {"crc_error_rates": (250000,)}])
+def test_failed_test_burst_falls_back_to_next_rate(failure):
+    fake, manager = make_manager(**failure)
+    try:
+        assert manager.negotiate() == 115200
+    finally:
+        manager.stop()
+    assert fake.port_rates == [250000, BASE_BAUD_RATE, 115200]
+    assert manager.get_state()["failed_rates"] == [250000]
+    assert any("250000 bps reprovado" in line for line in manager.logs)
+
+
+def test_missing_commit_reverts_rate():
+    fake, manager = make_manager(silent_commands=(LINK_BAUD_COMMIT,))
+    assert manager.negotiate() == BASE_BAUD_RATE
+    assert fake.port_rates == [250000, BASE_BAUD_RATE, 115200, BASE_BAUD_RATE, 57600, BASE_BAUD_RATE]
+    assert manager.get_state()["failed_rates"] == [57600, 115200, 250000]
+
+
+def test_silent_firmware_keeps_base_rate():
+    fake, manager = make_manager(silent_commands=(LINK_BAUD_PROPOSE,))
+    assert manager.negotiate() == BASE_BAUD_RATE
+    assert fake.commands() == [LINK_BAUD_PROPOSE] # Não insiste nas outras taxas
+    assert fake.port_rates == []
+
+
+def test_failed_rates_are_skipped_until_reset():
+    fake, manager = make_manager(bad_rates=(250000, 115200, 57600))
+    assert manager.negotiate() == BASE_BAUD_RATE
+    proposals = fake.commands().count(LINK_BAUD_PROPOSE)
+    assert manager.negotiate() == BASE_BAUD_RATE
+    assert fake.commands().count(LINK_BAUD_PROPOSE) == proposals
+    manager.reset()
+    assert manager.get_state()["failed_rates"] == []
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.fixture
+def fast_monitor(monkeypatch):
+    monkeypatch.setattr(serial_link, "KEEPALIVE_INTERVAL_S", 0.01)
+    monkeypatch.setattr(serial_link, "RENEGOTIATE_DELAY_S", 3600)
+
+
+def test_monitor_falls_back_on_silence(fast_monitor, monkeypatch):
+    monkeypatch.setattr(serial_link, "SILENCE_FALLBACK_S", 0.1)
+    fake, manager = make_manager()
+    try:
+        assert manager.negotiate() == 250000
+        assert wait_for(lambda: LINK_KEEPALIVE in [command for command, _ in fake.sent])
+        assert wait_for(lambda: manager.fallbacks == 1)
+        assert fake.port_rates[-1] == BASE_BAUD_RATE
+        assert manager.get_state()["failed_rates"] == [250000]
+        assert any("sem quadros válidos" in line for line in manager.logs)
+    finally:
+        manager.stop()
+
+
+def test_monitor_falls_back_on_crc_errors(fast_monitor, monkeypatch):
+    monkeypatch.setattr(serial_link, "SILENCE_FALLBACK_S", 3600)
+    fake, manager = make_manager()
+    try:
+        assert manager.negotiate() == 250000
+        for _ in range(serial_link.ERROR_FALLBACK_COUNT - 1):
+            manager.on_crc_error()
+        time.sleep(0.05)
+        assert manager.fallbacks == 0 # Abaixo do limite
+        manager.on_crc_error()
+        assert wait_for(lambda: manager.fallbacks == 1)
+        assert manager.get_state()["baud_rate"] == BASE_BAUD_RATE
+        assert any("erros de CRC" in line for line in manager.logs)
+    finally:
+        manager.stop()
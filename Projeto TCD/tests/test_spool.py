@@ -0,0 +1,227 @@
+# tests/test_spool.py
+
+import os
+import time
+
+import pytest
+
+import envelope
+import spool
+from jobs import JOB_SUCCESS, JOB_ERROR, JOB_CANCELLED
+from spool import OutboxSpool, SENDING_DIR_NAME, FAILED_DIR_NAME, RETRY_DELAY_S, MAX_RETRY_DELAY_S
+
+
+class FakeJobManager:
+    """Aceita os envios do spool e deixa o teste decidir quando e como cada um termina."""
+
+    def __init__(self):
+        self.running = True
+        self.submitted = [] # (caminho, callback)
+        self.active_sources = set()
+
+    def has_active_source(self, path):
+        return path in self.active_sources
+
+    def submit_file(self, path, priority, on_finished_callback=None):
+        self.submitted.append((path, on_finished_callback))
+        return len(self.submitted)
+
+    def finish(self, index, status, message=""):
+        path, callback = self.submitted[index]
+        callback(status, message)
+        return path
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    directory = tmp_path / "outbox"
+    (directory / SENDING_DIR_NAME).mkdir(parents=True)
+    return directory
+
+
+def make_spool(outbox, jobs, **kwargs):
+    """Spool sem a thread de varredura: o teste chama scan() (varredura + envio) quando quer."""
+    logs = []
+    outbox_spool = OutboxSpool(jobs, directory=str(outbox), log_callback=logs.append, **kwargs)
+    outbox_spool.running = True
+    outbox_spool.logs = logs
+    return outbox_spool
+
+
+def scan(outbox_spool, times=1):
+    for _ in range(times):
+        outbox_spool._scan()
+        outbox_spool._submit_queued()
+
+
+def test_files_wait_until_stable(outbox):
+    jobs = FakeJobManager()
+    outbox_spool = make_spool(outbox, jobs, small_file_max_bytes=10)
+    (outbox / "grande.bin").write_bytes(b"x" * 100)
+    (outbox / "baixando.part").write_bytes(b"x" * 100)
+    scan(outbox_spool)
+    assert jobs.submitted == []
+    scan(outbox_spool)
+    assert [os.path.basename(path) for path, _ in jobs.submitted] == ["grande.bin"]
+    assert (outbox / SENDING_DIR_NAME / "grande.bin").exists()
+    assert (outbox / "baixando.part").exists()
+
+
+def test_small_files_linger_then_go_in_one_pack(outbox):
+    jobs = FakeJobManager()
+    outbox_spool = make_spool(outbox, jobs, pack_linger_s=3600)
+    for i in range(3):
+        (outbox / f"leitura{i}.csv").write_bytes(b"%d,22.5\n" % i)
+    scan(outbox_spool, 3)
+    assert jobs.submitted == [] # Ainda esperando companheiros
+    outbox_spool.pack_linger_s = 0
+    scan(outbox_spool)
+    assert len(jobs.submitted) == 1
+    pack_path = jobs.submitted[0][0]
+    assert pack_path.endswith(envelope.ARCHIVE_FILE_EXTENSION)
+    with open(pack_path, "rb") as f:
+        names = [name for name, _, _ in envelope.unpack_archive(f.read())]
+    assert names == ["leitura0.csv", "leitura1.csv", "leitura2.csv"]
+    assert not any(name.endswith(".csv") for name in os.listdir(outbox))
+
+
+def test_pack_full_goes_without_waiting(outbox):
+    jobs = FakeJobManager()
+    outbox_spool = make_spool(outbox, jobs, pack_linger_s=3600, pack_max_bytes=100)
+    for i in range(3):
+        (outbox / f"a{i}.txt").write_bytes(b"y" * 40)
+    scan(outbox_spool, 2)
+    assert len(jobs.submitted) == 1 # Dois arquivos (80 B) no pacote; o terceiro fica esperando
+    assert sorted(os.listdir(outbox)) == sorted([SENDING_DIR_NAME, "a2.txt"])
+
+
+def test_pack_shrinks_to_fit_message(outbox, monkeypatch):
+    monkeypatch.setattr(spool, "MAX_MESSAGE_SIZE", 700)
+    jobs = FakeJobManager()
+    outbox_spool = make_spool(outbox, jobs, pack_linger_s=0, max_in_flight=5)
+    for i in range(8):
+        (outbox / f"r{i}.bin").write_bytes(os.urandom(200)) # Incompressível
+    scan(outbox_spool, 2)
+    with open(jobs.submitted[0][0], "rb") as f:
+        content = f.read()
+    assert len(envelope.encode_archive('', content)) <= 700
+    packed = [name for name, _, _ in envelope.unpack_archive(content)]
+    assert 1 < len(packed) < 8
+    left = sorted(name for name in os.listdir(outbox) if name.endswith(".bin"))
+    assert sorted(packed + left) == [f"r{i}.bin" for i in range(8)]
+
+
+def test_max_in_flight_holds_queue(outbox):
+    jobs = FakeJobManager()
+    outbox_spool = make_spool(outbox, jobs, small_file_max_bytes=0, max_in_flight=1)
+    for name in ("a.bin", "b.bin"):
+        (outbox / name).write_bytes(b"z" * 10)
+    scan(outbox_spool, 2)
+    assert len(jobs.submitted) == 1
+    jobs.finish(0, JOB_SUCCESS)
+    scan(outbox_spool)
+    assert len(jobs.submitted) == 2
+
+
+def test_success_and_cancel(outbox):
+    jobs = FakeJobManager()
+    sent = []
+    outbox_spool = make_spool(outbox, jobs, small_file_max_bytes=0,
+                              on_sent_callback=lambda *args: sent.append(args))
+    (outbox / "ok.bin").write_bytes(b"1" * 10)
+    (outbox / "cancelado.bin").write_bytes(b"2" * 10)
+    scan(outbox_spool, 2)
+    by_name = {os.path.basename(path): i for i, (path, _) in enumerate(jobs.submitted)}
+    ok_path = jobs.finish(by_name["ok.bin"], JOB_SUCCESS)
+    jobs.finish(by_name["cancelado.bin"], JOB_CANCELLED)
+    assert not os.path.exists(ok_path)
+    assert (outbox / FAILED_DIR_NAME / "cancelado.bin").exists()
+    status = outbox_spool.get_status()
+    assert (status["files_sent"], status["bytes_sent"], status["in_flight"]) == (1, 10, 0)
+    assert [(s, names) for s, _, names, _ in sent] == [(JOB_SUCCESS, ["ok.bin"]), (JOB_CANCELLED, ["cancelado.bin"])]
+
+
+def test_retry_backoff_doubles_up_to_limit(outbox):
+    jobs = FakeJobManager()
+    outbox_spool = make_spool(outbox, jobs, small_file_max_bytes=0)
+    (outbox / "falha.bin").write_bytes(b"e" * 10)
+    scan(outbox_spool, 2)
+    delays = []
+    for attempt in range(7):
+        before = time.monotonic()
+        jobs.finish(attempt, JOB_ERROR, "sem ACK")
+        (path, names, not_before), = outbox_spool._queue
+        delays.append(not_before - before)
+        assert names == ["falha.bin"]
+        outbox_spool._queue[0] = (path, names, 0.0) # "Passa" o tempo de espera
+        outbox_spool._submit_queued()
+    expected = [min(RETRY_DELAY_S * 2 ** i, MAX_RETRY_DELAY_S) for i in range(7)]
+    assert delays == pytest.approx(expected, abs=1.0)
+    assert outbox_spool.get_status()["errors"] == 7
+    jobs.finish(7, JOB_SUCCESS)
+    assert outbox_spool._failures == {}
+
+
+def test_oversize_file_goes_to_failed_without_submit(outbox, monkeypatch):
+    monkeypatch.setattr(spool, "MAX_MESSAGE_SIZE", 700)
+    jobs = FakeJobManager()
+    sent = []
+    outbox_spool = make_spool(outbox, jobs, small_file_max_bytes=0, on_sent_callback=lambda *args: sent.append(args))
+    (outbox / "grande.bin").write_bytes(os.urandom(800)) # Incompressível
+    (outbox / "comprime.txt").write_bytes(b"25.0\n" * 400) # 2000 bytes, mas a mensagem comprimida cabe
+    scan(outbox_spool, 2)
+    assert (outbox / FAILED_DIR_NAME / "grande.bin").exists()
+    assert [os.path.basename(path) for path, _ in jobs.submitted] == ["comprime.txt"]
+    assert [(status, names) for status, _, names, _ in sent] == [(JOB_ERROR, ["grande.bin"])]
+    scan(outbox_spool, 2)
+    assert len(jobs.submitted) == 1 and not outbox_spool._queue
+
+
+def test_encode_error_at_submit_is_terminal(outbox):
+    class RejectingJobManager(FakeJobManager):
+        def submit_file(self, path, priority, on_finished_callback=None):
+            raise ValueError("não cabe numa mensagem")
+
+    jobs = RejectingJobManager()
+    sent = []
+    outbox_spool = make_spool(outbox, jobs, small_file_max_bytes=0, on_sent_callback=lambda *args: sent.append(args))
+    (outbox / "a.bin").write_bytes(b"a" * 10)
+    scan(outbox_spool, 2)
+    assert (outbox / FAILED_DIR_NAME / "a.bin").exists()
+    assert not os.listdir(outbox / SENDING_DIR_NAME)
+    status = outbox_spool.get_status()
+    assert (status["queued"], status["in_flight"], status["errors"]) == (0, 0, 1) # Sem nova tentativa
+    assert [(status, names) for status, _, names, _ in sent] == [(JOB_ERROR, ["a.bin"])]
+
+
+def test_failure_during_shutdown_stays_in_sending(outbox):
+    jobs = FakeJobManager()
+    outbox_spool = make_spool(outbox, jobs, small_file_max_bytes=0)
+    (outbox / "a.bin").write_bytes(b"a")
+    scan(outbox_spool, 2)
+    jobs.running = False
+    path = jobs.finish(0, JOB_ERROR, "porta fechada")
+    assert os.path.exists(path) and not outbox_spool._queue
+
+
+def test_start_recovers_sending_dir(outbox):
+    sending = outbox / SENDING_DIR_NAME
+    (sending / "antigo.bin").write_bytes(b"1")
+    os.utime(sending / "antigo.bin", ns=(1, 1))
+    (sending / "novo.bin").write_bytes(b"2")
+    content = envelope.pack_archive_entry("x.csv", b"1", 0) + envelope.pack_archive_entry("y.csv", b"2", 0)
+    (sending / ("pacote" + envelope.ARCHIVE_FILE_EXTENSION)).write_bytes(content)
+    os.utime(sending / ("pacote" + envelope.ARCHIVE_FILE_EXTENSION), ns=(2, 2))
+    (sending / "meio_escrito.tcdpack.tmp").write_bytes(b"lixo")
+    jobs = FakeJobManager()
+    jobs.active_sources.add(str(sending / "novo.bin")) # Já retomado pelo diário
+    outbox_spool = OutboxSpool(jobs, directory=str(outbox), log_callback=lambda message: None,
+                               max_in_flight=5, poll_interval_s=3600)
+    outbox_spool.start()
+    try:
+        assert [os.path.basename(path) for path, _ in jobs.submitted] == ["antigo.bin", "pacote.tcdpack"]
+        assert outbox_spool._in_flight[str(sending / ("pacote" + envelope.ARCHIVE_FILE_EXTENSION))]['names'] == ["x.csv", "y.csv"]
+        assert not (sending / "meio_escrito.tcdpack.tmp").exists()
+        assert [os.path.basename(path) for path, _, _ in outbox_spool._queue] == ["novo.bin"]
+    finally:
+        outbox_spool.stop()
@@ -0,0 +1,179 @@
+# tests/test_tdma.py
+
+import threading
+
+import pytest
+
+from tdma import TdmaSlotScheduler, DEFAULT_GUARD_MS, DEFAULT_MIN_SLOT_MS, PEER_STATUS_TIMEOUT_S
+
+SLOT_MS = 5000
+GUARD_S = DEFAULT_GUARD_MS / 1000.0
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _scheduler(this_id, peer_id, clock, **kwargs):
+    return TdmaSlotScheduler(this_id, peer_id, SLOT_MS, clock=clock, epoch=clock.now, **kwargs)
+
+
+def test_lower_id_transmits_first_with_guard():
+    clock = FakeClock()
+    first, second = _scheduler(0x01, 0x02, clock), _scheduler(0x02, 0x01, clock)
+    assert first.is_my_turn(1000.0) and not second.is_my_turn(1000.0)
+    assert first.is_my_turn(1005.0 - GUARD_S - 1e-6)
+    assert not first.is_my_turn(1005.0 - GUARD_S) # Guarda no fim do slot
+    assert not second.is_my_turn(1005.0 - GUARD_S)
+    assert second.is_my_turn(1005.0) and not first.is_my_turn(1005.0)
+    assert first.is_my_turn(1010.0) # Ciclo seguinte, sem deriva das fronteiras
+    assert first.is_my_turn(1000.0 + 10.0 * 1000)
+
+
+def test_time_until_and_remaining_in_slot():
+    clock = FakeClock()
+    second = _scheduler(0x02, 0x01, clock)
+    assert second.time_until_my_slot(1001.0) == pytest.approx(4.0)
+    assert second.time_until_my_slot(1006.0) == 0.0
+    assert second.remaining_in_my_slot(1006.0) == pytest.approx(4.0 - GUARD_S)
+    assert second.time_until_my_slot(1009.99) == pytest.approx(5.01) # Na guarda: espera o próximo ciclo
+    assert second.remaining_in_my_slot(1002.0) == 0.0
+
+
+def _exchange(first, second, clock):
+    """Um ciclo de anúncios: cada lado anuncia no início do seu slot e o outro ouve na hora."""
+    clock.now += first.time_until_my_slot()
+    second.update_peer_status(*first.advertise_local_depth())
+    clock.now += second.time_until_my_slot()
+    first.update_peer_status(*second.advertise_local_depth())
+
+
+def _windows(sched, start, end, step=0.01):
+    """Instantes (em passos de 'step') em que o escalonador se considera no próprio slot."""
+    return {i for i in range(int(round((end - start) / step))) if sched.is_my_turn(start + i * step)}
+
+
+def test_adaptive_split_follows_advertised_depths():
+    clock = FakeClock()
+    first, second = _scheduler(0x01, 0x02, clock), _scheduler(0x02, 0x01, clock)
+    first.set_local_queue_depth(30)
+    second.set_local_queue_depth(10)
+    _exchange(first, second, clock)
+    assert first.get_state()["my_slot_ms"] == SLOT_MS # Só muda na próxima fronteira de ciclo
+    assert second.get_state()["my_slot_ms"] == SLOT_MS
+    first.set_local_queue_depth(1000) # Fila ao vivo não mexe na divisão antes de ser anunciada
+    clock.now = 1010.0
+    assert first.get_state()["my_slot_ms"] == 7500 and first.get_state()["peer_slot_ms"] == 2500
+    assert second.get_state()["my_slot_ms"] == 2500 and second.get_state()["peer_slot_ms"] == 7500
+
+
+def test_adaptive_split_clamped_to_min_slot():
+    clock = FakeClock()
+    first, second = _scheduler(0x01, 0x02, clock), _scheduler(0x02, 0x01, clock)
+    second.set_local_queue_depth(1000)
+    _exchange(first, second, clock)
+    clock.now = 1010.0
+    assert first.get_state()["my_slot_ms"] == DEFAULT_MIN_SLOT_MS
+    assert second.get_state()["my_slot_ms"] + DEFAULT_MIN_SLOT_MS == 2 * SLOT_MS # Ciclo sempre com a mesma duração
+    first.set_local_queue_depth(1000)
+    second.set_local_queue_depth(0)
+    _exchange(first, second, clock)
+    clock.now = 1020.0
+    assert second.get_state()["my_slot_ms"] == DEFAULT_MIN_SLOT_MS
+
+
+def test_both_idle_split_equally():
+    clock = FakeClock()
+    first, second = _scheduler(0x01, 0x02, clock), _scheduler(0x02, 0x01, clock)
+    _exchange(first, second, clock)
+    clock.now = 1010.0
+    assert first.get_state()["my_slot_ms"] == SLOT_MS
+    assert second.get_state()["my_slot_ms"] == SLOT_MS
+
+
+def test_first_side_yields_when_pair_is_lost():
+    clock = FakeClock()
+    first, second = _scheduler(0x01, 0x02, clock), _scheduler(0x02, 0x01, clock)
+    second.set_local_queue_depth(10)
+    _exchange(first, second, clock)
+    clock.now = 1005.0
+    second.advertise_local_depth() # Anúncio do segundo perdido no ar
+    clock.now = 1010.0
+    assert first.get_state()["my_slot_ms"] == DEFAULT_MIN_SLOT_MS
+    clock.now = 1016.0
+    first.update_peer_status(10, 0) # Chegou depois da fronteira: não vale para o ciclo que começou
+    assert first.get_state()["my_slot_ms"] == DEFAULT_MIN_SLOT_MS
+
+
+def test_peer_status_expires():
+    clock = FakeClock()
+    first, second = _scheduler(0x01, 0x02, clock), _scheduler(0x02, 0x01, clock)
+    first.set_local_queue_depth(5)
+    second.set_local_queue_depth(20)
+    _exchange(first, second, clock)
+    clock.now = 1010.0
+    assert first.get_state()["my_slot_ms"] == 2000
+    clock.now = 1010.0 + PEER_STATUS_TIMEOUT_S + 10.0 # Sem status do outro lado: divisão igualitária
+    state = first.get_state()
+    assert state["peer_queue_depth"] is None
+    assert state["my_slot_ms"] == SLOT_MS
+
+
+def test_schedulers_never_overlap_on_the_same_exchange():
+    clock = FakeClock()
+    first, second = _scheduler(0x01, 0x02, clock), _scheduler(0x02, 0x01, clock)
+    depths = [(0, 0), (30, 10), (30, 10), (1, 500), (1, 500), (200, 0), (7, 7), (0, 40)]
+    lost = {3, 6} # Ciclos em que o anúncio do segundo lado se perde
+    for cycle, (first_depth, second_depth) in enumerate(depths):
+        cycle_start = 1000.0 + cycle * 2 * SLOT_MS / 1000.0
+        # A fila ao vivo muda no meio do ciclo, depois dos anúncios ou entre eles
+        first.set_local_queue_depth(first_depth)
+        clock.now = cycle_start
+        second.update_peer_status(*first.advertise_local_depth())
+        second.set_local_queue_depth(second_depth)
+        clock.now = cycle_start + first.get_state()["my_slot_ms"] / 1000.0 + 0.5
+        advert = second.advertise_local_depth()
+        if cycle not in lost:
+            first.update_peer_status(*advert)
+        first.set_local_queue_depth(first_depth * 3 + 1)
+        second.set_local_queue_depth(second_depth * 5 + 2)
+
+        clock.now = cycle_start + 2 * SLOT_MS / 1000.0
+        next_end = clock.now + 2 * SLOT_MS / 1000.0
+        overlap = _windows(first, clock.now, next_end) & _windows(second, clock.now, next_end)
+        assert not overlap, f"ciclo {cycle + 1}: slots se sobrepõem"
+    assert first.get_state()["my_slot_ms"] + second.get_state()["my_slot_ms"] <= 2 * SLOT_MS
+
+
+def test_align_moves_grid_only_beyond_tolerance():
+    clock = FakeClock(1003.0)
+    sched = TdmaSlotScheduler(0x02, 0x01, SLOT_MS, clock=clock, epoch=1000.0)
+    assert not sched.align(1000.015, 0.02)
+    assert sched.time_until_my_slot() == pytest.approx(2.0)
+    assert sched.align(1000.5, 0.02)
+    assert sched.time_until_my_slot() == pytest.approx(2.5)
+    assert sched.align(990.25, 0.02) # Época antiga: a fase é o que conta
+    assert sched.time_until_my_slot() == pytest.approx(2.25)
+
+
+def test_align_with_future_epoch():
+    clock = FakeClock(1003.0)
+    sched = TdmaSlotScheduler(0x01, 0x02, SLOT_MS, clock=clock, epoch=1000.0)
+    assert sched.align(1004.0, 0.02) # Ciclo começa daqui a 1 s: agora é o fim do ciclo anterior
+    assert not sched.is_my_turn()
+    assert sched.time_until_my_slot() == pytest.approx(1.0)
+
+
+def test_wait_for_my_slot_respects_cancel_and_max_wait():
+    clock = FakeClock()
+    second = _scheduler(0x02, 0x01, clock)
+    cancel = threading.Event()
+    cancel.set()
+    assert not second.wait_for_my_slot(cancel)
+    assert not second.wait_for_my_slot(max_wait=0)
+    clock.now = 1005.0
+    assert second.wait_for_my_slot()
@@ -0,0 +1,82 @@
+# tests/test_telemetry.py
+
+import struct
+
+import pytest
+
+from telemetry import (FirmwareTelemetry, decode_telemetry, describe_record, TELEMETRY_BASE_FORMAT,
+                       TELEMETRY_RECORD_FORMAT, TELEMETRY_BINARY, TEL_DATA_TX, TEL_ACK_RX, TEL_RF_CRC_FAIL,
+                       TEL_RF_BITRATE)
+
+
+def payload(base, *records):
+    return struct.pack(TELEMETRY_BASE_FORMAT, base) + b"".join(struct.pack(TELEMETRY_RECORD_FORMAT, *r) for r in records)
+
+
+def test_decode_records():
+    data = payload(1000, (TEL_DATA_TX, 3, 0, 19, 0), (TEL_ACK_RX, 3, 0, 0, 120))
+    assert decode_telemetry(2, data) == [(1000, TEL_DATA_TX, 3, 0, 19), (1120, TEL_ACK_RX, 3, 0, 0)]
+    assert decode_telemetry(0, data) == [] # Registros além da contagem são ignorados
+
+
+def test_millis_wraps_at_32_bits():
+    assert decode_telemetry(1, payload(0xFFFFFFF0, (TEL_DATA_TX, 1, 0, 5, 0x20)))[0][0] == 0x10
+
+
+def test_truncated_frame():
+    data = payload(0, (TEL_DATA_TX, 1, 0, 5, 0))
+    with pytest.raises(ValueError, match="truncado"):
+        decode_telemetry(2, data)
+    with pytest.raises(ValueError):
+        decode_telemetry(0, b"\x00\x01")
+
+
+def test_describe_record():
+    assert describe_record(5, TEL_RF_CRC_FAIL, 1, 2, 0x02) == "Firmware @5 ms: rf_crc_fail MsgID 1, Frag 2 (tipo 0x02)"
+    assert describe_record(5, TEL_RF_BITRATE, 249, 0, 40).endswith("(4000 bps)")
+    assert describe_record(5, TEL_ACK_RX, 1, 2, 0) == "Firmware @5 ms: ack_rx MsgID 1, Frag 2"
+    assert "evento_99" in describe_record(5, 99, 1, 2, 0)
+
+
+def test_counters_and_logs():
+    logs = []
+    telemetry = FirmwareTelemetry(log_callback=logs.append)
+    telemetry.on_status(TELEMETRY_BINARY)
+    telemetry.on_frame(0, 3, 0, payload(0, (TEL_DATA_TX, 1, 0, 19, 0), (TEL_DATA_TX, 1, 1, 19, 1),
+                                        (99, 0, 0, 0, 2)))
+    stats = telemetry.get_stats()
+    assert (stats["mode"], stats["frames"], stats["events"]["data_tx"]) == ("binary", 1, 2)
+    assert len(logs) == 3
+
+
+def test_truncated_frame_is_logged_not_counted():
+    logs = []
+    telemetry = FirmwareTelemetry(log_callback=logs.append)
+    telemetry.on_frame(0, 4, 0, payload(0, (TEL_DATA_TX, 1, 0, 19, 0)))
+    assert telemetry.get_stats()["frames"] == 0
+    assert logs == ["AVISO: Quadro de telemetria truncado."]
+
+
+def test_sequence_gaps_wrap_at_16_bits():
+    telemetry = FirmwareTelemetry(log_callback=lambda message: None, log_records=False)
+    for seq in (0xFFFD, 0xFFFE, 0x0001, 0x0002): # 0xFFFF e 0x0000 perdidos
+        telemetry.on_frame(0, 0, seq, payload(0))
+    assert telemetry.get_stats()["lost_frames"] == 2
+
+
+def test_dropped_counter_wraps_at_8_bits():
+    telemetry = FirmwareTelemetry(log_callback=lambda message: None, log_records=False)
+    for seq, dropped in enumerate((250, 254, 3, 3)):
+        telemetry.on_frame(dropped, 0, seq, payload(0))
+    stats = telemetry.get_stats()
+    assert stats["dropped_records"] == 4 + 5 # 250 -> 254 -> (256 + 3)
+    assert stats["lost_frames"] == 0
+
+
+def test_reset_forgets_firmware_counters():
+    telemetry = FirmwareTelemetry(log_callback=lambda message: None, log_records=False)
+    telemetry.on_frame(200, 0, 500, payload(0))
+    telemetry.reset()
+    telemetry.on_frame(0, 0, 0, payload(0)) # Firmware reiniciado: sequência volta a zero sem "perdas"
+    stats = telemetry.get_stats()
+    assert (stats["frames"], stats["lost_frames"], stats["dropped_records"], stats["mode"]) == (2, 0, 0, "text")
@@ -0,0 +1,82 @@
+# tests/test_timesync.py
+
+import pytest
+
+import arduino
+from arduino import BEACON_PAYLOAD_SIZE, TIME_MASTER_DEVICE_ID
+from rf_rate import frame_air_bits
+from timesync import ClockSync, MILLIS_WRAP, MIN_SAMPLES_FOR_SYNC
+
+
+def _feed(sync, samples):
+    for remote_millis, local_s in samples:
+        sync.add_sample(remote_millis, local_s)
+
+
+def test_needs_minimum_samples():
+    sync = ClockSync()
+    _feed(sync, [(1000 * i, float(i)) for i in range(MIN_SAMPLES_FOR_SYNC - 1)])
+    assert not sync.is_synchronized()
+    sync.add_sample(1000 * MIN_SAMPLES_FOR_SYNC, float(MIN_SAMPLES_FOR_SYNC))
+    assert sync.is_synchronized()
+
+
+def test_offset_follows_lowest_delay_sample():
+    # remote = 5000 + local * 1000 - atraso; o beacon de menor atraso (5 ms) define o offset
+    sync = ClockSync()
+    _feed(sync, [(5000 + 1000 * i - delay, float(i)) for i, delay in enumerate((30, 5, 12, 8))])
+    state = sync.get_state()
+    assert state["drift_ppm"] == 0.0 # Intervalo curto demais para estimar deriva
+    assert state["jitter_ms"] == pytest.approx(25.0)
+    assert sync.to_remote_ms(10.0) == pytest.approx(5000 + 10000 - 5)
+    assert sync.to_local_s(sync.to_remote_ms(7.25)) == pytest.approx(7.25)
+
+
+def test_estimates_drift_over_long_span():
+    sync = ClockSync()
+    drift = 100e-6
+    _feed(sync, [(int(round(200 + 1000 * t * (1 + drift))), float(t)) for t in range(0, 600, 20)]) # millis() inteiro
+    assert sync.get_state()["drift_ppm"] == pytest.approx(100.0, abs=2.0)
+    assert sync.to_remote_ms(900.0) == pytest.approx(200 + 900000 * (1 + drift), abs=2.0)
+
+
+def test_millis_wraparound_is_unwrapped():
+    sync = ClockSync()
+    _feed(sync, [(MILLIS_WRAP - 1500, 0.0), (MILLIS_WRAP - 500, 1.0), (500, 2.0), (1500, 3.0)])
+    assert sync.get_state()["samples"] == 4
+    assert sync.to_remote_ms(3.0) == pytest.approx(MILLIS_WRAP + 1500)
+
+
+def test_master_reboot_restarts_estimate():
+    sync = ClockSync()
+    _feed(sync, [(1000000 + 1000 * i, float(i)) for i in range(5)])
+    assert sync.is_synchronized()
+    sync.add_sample(150, 5.0) # millis() voltou ao início sem dar a volta: o mestre reiniciou
+    state = sync.get_state()
+    assert state["samples"] == 1
+    assert not state["synchronized"]
+    assert sync.to_remote_ms(6.0) == pytest.approx(1150)
+
+
+def test_master_reboot_within_a_minute_restarts_estimate():
+    sync = ClockSync()
+    _feed(sync, [(1000 * i, 100.0 + i) for i in range(1, 6)]) # Mestre ligado há poucos segundos
+    assert sync.is_synchronized()
+    sync.add_sample(400, 106.0) # Reiniciou: millis() só recuou 4,6 s
+    state = sync.get_state()
+    assert state["samples"] == 1
+    assert not state["synchronized"]
+    assert sync.to_remote_ms(107.0) == pytest.approx(1400)
+
+
+@pytest.mark.parametrize("this_device_id, compensated", [(TIME_MASTER_DEVICE_ID, False), (0x02, True)])
+def test_beacon_airtime_removed_on_non_master(controller, monkeypatch, this_device_id, compensated):
+    # O beacon chega ao PC do outro lado um tempo de ar depois de chegar ao PC do mestre
+    monkeypatch.setattr(arduino, "THIS_DEVICE_ID", this_device_id)
+    airtime_s = frame_air_bits(BEACON_PAYLOAD_SIZE) / controller.rf_rate.current_bitrate
+    lag_s = airtime_s if compensated else 0.0
+    for i in range(MIN_SAMPLES_FOR_SYNC):
+        controller._on_beacon(1000 * i, 100.0 + i + lag_s)
+    assert controller.clock_sync.is_synchronized()
+    # Os dois lados passam a ver o mesmo tempo de referência no mesmo instante real
+    assert controller.clock_sync.to_remote_ms(110.0) == pytest.approx(10000, abs=0.01)
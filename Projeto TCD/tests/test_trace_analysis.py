@@ -0,0 +1,147 @@
+# tests/test_trace_analysis.py
+
+import csv
+import json
+
+import numpy as np
+import pytest
+
+import trace_analysis
+from arduino import (encode_packet, PACKET_TYPE_DATA, PACKET_TYPE_ACK, PACKET_TYPE_NACK, THIS_DEVICE_ID,
+                     PEER_DEVICE_ID, TRANSMISSION_SLOT_DURATION_MS)
+from capture import TraceWriter, DIRECTION_RX, DIRECTION_TX
+from gaps import encode_nack_list
+from rf_rate import RF_DEFAULT_BITRATE, frame_air_bits
+
+MS = 10 ** 6
+
+
+def data(device_id, message_id, fragment_idx, payload=b"p" * 19):
+    return encode_packet(PACKET_TYPE_DATA, device_id, message_id, fragment_idx, 3, payload)
+
+
+def ack(device_id, message_id, fragment_idx, packet_type=PACKET_TYPE_ACK):
+    return encode_packet(packet_type, device_id, message_id, fragment_idx, 0, b'')
+
+
+def corrupted(frame):
+    return frame[:-1] + bytes([frame[-1] ^ 0x0F])
+
+
+# (instante em ms, direção, bytes)
+SCENARIO = [
+    (0, DIRECTION_TX, data(THIS_DEVICE_ID, 1, 0)),
+    (10, DIRECTION_TX, data(THIS_DEVICE_ID, 1, 1)),
+    (20, DIRECTION_TX, data(THIS_DEVICE_ID, 1, 2)),           # Nunca confirmado
+    (100, DIRECTION_RX, ack(PEER_DEVICE_ID, 1, 0)),           # RTT 100 ms, sem ambiguidade
+    (500, DIRECTION_TX, data(THIS_DEVICE_ID, 1, 1)),          # Retransmissão idêntica
+    (650, DIRECTION_RX, ack(PEER_DEVICE_ID, 1, 1)),           # RTT 150 ms, ambíguo (Karn descarta)
+    (700, DIRECTION_RX, corrupted(data(PEER_DEVICE_ID, 2, 0))),
+    (800, DIRECTION_RX, data(PEER_DEVICE_ID, 2, 0, b"abc")),
+    (810, DIRECTION_TX, ack(THIS_DEVICE_ID, 2, 0)),
+    (900, DIRECTION_RX, data(PEER_DEVICE_ID, 2, 0, b"abc")),  # Duplicata (nosso ACK se perdeu)
+    (950, DIRECTION_RX, ack(PEER_DEVICE_ID, 1, 2, PACKET_TYPE_NACK)),
+]
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+    path = tmp_path / "link.tcdtrace"
+    writer = TraceWriter(str(path))
+    for t_ms, direction, frame in SCENARIO:
+        # RX chega partido em dois blocos, como na porta real
+        pieces = [frame[:7], frame[7:]] if direction == DIRECTION_RX else [frame]
+        for piece in pieces:
+            writer.record(direction, piece, t_ns=writer._start_ns + t_ms * MS)
+    writer.close()
+    return str(path)
+
+
+def test_load_frames_reassembles_split_reads(trace_path):
+    frame_sets = trace_analysis.load_frames(trace_path)
+    rx, tx = frame_sets[DIRECTION_RX], frame_sets[DIRECTION_TX]
+    assert (len(rx), len(tx)) == (6, 5)
+    assert rx.crc_ok.tolist() == [True, True, False, True, True, True]
+    assert tx.crc_ok.all()
+    assert (rx.t_ns // MS).tolist() == [100, 650, 700, 800, 900, 950]
+
+
+def test_crc_covers_nack_list_payload():
+    nack_list = encode_packet(PACKET_TYPE_NACK, PEER_DEVICE_ID, 1, 0, 0, encode_nack_list([(2, 4), (7, 7)]))
+    tampered = bytearray(nack_list)
+    tampered[8] ^= 0x01 # Muda a primeira faixa pedida: só o CRC sobre o payload acusa
+    frames = [ack(PEER_DEVICE_ID, 1, 2, PACKET_TYPE_NACK), nack_list, bytes(tampered)]
+    raw = np.frombuffer(b"".join(frames), dtype=np.uint8).reshape(len(frames), -1)
+    assert trace_analysis.crc4_valid(raw).tolist() == [True, True, False]
+
+
+def test_out_link(trace_path):
+    summary, _ = trace_analysis.analyse(trace_analysis.load_frames(trace_path))
+    assert summary["this_device_id"] == THIS_DEVICE_ID # Inferido dos DATA enviados
+    out = summary["links"]["out"]
+    assert (out["data_frames"], out["unique_fragments"], out["retransmissions"]) == (4, 3, 1)
+    assert out["acked_fragments"] == 2
+    assert out["fragment_loss_rate"] == pytest.approx(1 / 3, abs=1e-6)
+    assert out["frame_loss_rate"] == 0.5
+    assert out["nacks_received"] == 1
+    assert out["goodput_bps"] == pytest.approx(2 * 19 * 8 / 0.95, abs=1e-3)
+
+
+def test_ack_rtt_uses_latest_send_and_karn(trace_path):
+    summary, _ = trace_analysis.analyse(trace_analysis.load_frames(trace_path))
+    rtt = summary["ack_rtt_ms"]
+    assert (rtt["samples"], rtt["min"], rtt["max"]) == (1, 100.0, 100.0)
+    assert rtt["all_samples"]["samples"] == 2
+    assert (rtt["all_samples"]["min"], rtt["all_samples"]["max"]) == (100.0, 150.0)
+    assert sum(rtt["all_samples"]["histogram"]["counts"]) == 2
+
+
+def test_in_link(trace_path):
+    summary, _ = trace_analysis.analyse(trace_analysis.load_frames(trace_path))
+    incoming = summary["links"]["in"]
+    assert (incoming["data_frames"], incoming["unique_fragments"], incoming["duplicates"]) == (2, 1, 1)
+    assert incoming["crc_errors"] == 1
+    assert incoming["crc_error_rate"] == pytest.approx(1 / 6, abs=1e-6)
+    assert (incoming["acks_sent"], incoming["nacks_sent"]) == (1, 0)
+
+
+def test_timeseries_bins(trace_path):
+    _, timeseries = trace_analysis.analyse(trace_analysis.load_frames(trace_path), bin_s=0.5)
+    assert [row["t_s"] for row in timeseries] == [0.0, 0.5]
+    assert [row["tx_data_frames"] for row in timeseries] == [3, 1]
+    assert [row["tx_retransmissions"] for row in timeseries] == [0, 1]
+    assert [row["rx_duplicates"] for row in timeseries] == [0, 1]
+    assert [row["rx_crc_errors"] for row in timeseries] == [0, 1]
+
+
+def test_slot_utilisation_follows_payload_and_bitrate(trace_path):
+    frame_sets = trace_analysis.load_frames(trace_path)
+    summary, _ = trace_analysis.analyse(frame_sets)
+    slot_s = TRANSMISSION_SLOT_DURATION_MS / 1000.0
+    ours = (4 * frame_air_bits(19) + frame_air_bits(0)) / RF_DEFAULT_BITRATE / slot_s
+    peer = (2 * frame_air_bits(0) + 2 * frame_air_bits(3) + frame_air_bits(0)) / RF_DEFAULT_BITRATE / slot_s
+    utilisation = summary["slot_utilisation"]
+    assert utilisation["this_side"]["max"] == pytest.approx(ours, abs=1e-6)
+    assert utilisation["peer"]["max"] == pytest.approx(peer, abs=1e-6)
+    assert utilisation["frame_airtime_s"] == pytest.approx(frame_air_bits(19) / RF_DEFAULT_BITRATE, abs=1e-6)
+
+    faster, _ = trace_analysis.analyse(frame_sets, rf_bitrate_bps=2 * RF_DEFAULT_BITRATE)
+    assert faster["slot_utilisation"]["this_side"]["max"] == pytest.approx(ours / 2, abs=1e-6)
+
+
+def test_raw_dump_is_read_as_rx(tmp_path):
+    path = tmp_path / "quadros.bin"
+    path.write_bytes(data(PEER_DEVICE_ID, 3, 0) + data(PEER_DEVICE_ID, 3, 1) + b"resto")
+    frame_sets = trace_analysis.load_frames(str(path))
+    assert len(frame_sets[DIRECTION_RX]) == 2 and len(frame_sets[DIRECTION_TX]) == 0
+    summary, _ = trace_analysis.analyse(frame_sets)
+    assert summary["links"]["in"]["unique_fragments"] == 2
+
+
+def test_cli_exports(trace_path, tmp_path):
+    json_path, csv_path = tmp_path / "resumo.json", tmp_path / "serie.csv"
+    assert trace_analysis.main([trace_path, "--json", str(json_path), "--csv", str(csv_path), "--bin", "0.5"]) == 0
+    summary = json.loads(json_path.read_text(encoding="utf-8"))
+    assert summary["links"]["out"]["retransmissions"] == 1
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        assert len(list(csv.DictReader(f))) == 2
@@ -0,0 +1,147 @@
+# tests/test_tx_scheduler.py
+
+import threading
+
+import pytest
+
+from tx_scheduler import (SerialTxScheduler, CHANNEL_CONTROL, CHANNEL_INTERACTIVE, CHANNEL_BULK, CHANNEL_TELEMETRY,
+                          DEFAULT_QUANTUMS, FRAME_SIZE, MAX_COALESCED_WRITE_BYTES)
+
+
+class RecordingSerial:
+    """Porta que guarda cada write; out_waiting segue a lista dada (o último valor se repete)."""
+
+    def __init__(self, out_waiting=(0,), baudrate=9600):
+        self.baudrate = baudrate
+        self.writes = []
+        self.written = threading.Event()
+        self._out_waiting = list(out_waiting)
+
+    @property
+    def out_waiting(self):
+        return self._out_waiting.pop(0) if len(self._out_waiting) > 1 else self._out_waiting[0]
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        self.written.set()
+        return len(data)
+
+
+def frame(channel, seq):
+    return bytes([ord(channel[0]), seq]) + b"\0" * (FRAME_SIZE - 2)
+
+
+def fill(scheduler, channel, count):
+    """Enfileira direto (sem a thread de escrita), para montar os lotes à mão com _next_batch_locked."""
+    for seq in range(count):
+        scheduler._queues[channel].append(_Request(frame(channel, seq), channel))
+
+
+class _Request:
+    def __init__(self, data, channel):
+        self.data = data
+        self.channel = channel
+
+
+def batches(scheduler, count, max_bytes=MAX_COALESCED_WRITE_BYTES):
+    return [[request.channel for request in scheduler._next_batch_locked(max_bytes)] for _ in range(count)]
+
+
+def test_drr_shares_follow_quantums():
+    scheduler = SerialTxScheduler(RecordingSerial())
+    for channel in (CHANNEL_INTERACTIVE, CHANNEL_BULK, CHANNEL_TELEMETRY):
+        fill(scheduler, channel, 200)
+    sent = [channel for batch in batches(scheduler, 35) for channel in batch]
+    assert len(sent) == 35 * MAX_COALESCED_WRITE_BYTES // FRAME_SIZE
+    shares = {channel: sent.count(channel) for channel in (CHANNEL_INTERACTIVE, CHANNEL_BULK, CHANNEL_TELEMETRY)}
+    # 140 quadros = 20 rodadas completas de 4 + 2 + 1
+    assert shares == {channel: 20 * DEFAULT_QUANTUMS[channel] // FRAME_SIZE for channel in shares}
+
+
+def test_drr_gives_idle_share_to_busy_channel():
+    scheduler = SerialTxScheduler(RecordingSerial())
+    fill(scheduler, CHANNEL_BULK, 10)
+    assert batches(scheduler, 2) == [[CHANNEL_BULK] * 4] * 2 # Sozinho, BULK usa a porta inteira
+    assert scheduler._deficits[CHANNEL_INTERACTIVE] == 0
+    fill(scheduler, CHANNEL_INTERACTIVE, 10)
+    sent = [channel for batch in batches(scheduler, 3) for channel in batch]
+    assert sent.count(CHANNEL_BULK) == 2 # Os 2 restantes; o saldo de quando estava sozinho não vira crédito
+
+
+def test_control_has_strict_priority():
+    scheduler = SerialTxScheduler(RecordingSerial())
+    fill(scheduler, CHANNEL_BULK, 20)
+    fill(scheduler, CHANNEL_INTERACTIVE, 20)
+    scheduler._next_batch_locked()
+    fill(scheduler, CHANNEL_CONTROL, 2)
+    assert batches(scheduler, 1)[0][:2] == [CHANNEL_CONTROL] * 2
+    fill(scheduler, CHANNEL_CONTROL, 6) # Mais ACKs que cabem num lote: o lote inteiro é CONTROL
+    first, second = batches(scheduler, 2)
+    assert first == [CHANNEL_CONTROL] * 4
+    assert second[:2] == [CHANNEL_CONTROL] * 2 and CHANNEL_CONTROL not in second[2:]
+
+
+def test_batch_respects_room_left():
+    scheduler = SerialTxScheduler(RecordingSerial())
+    fill(scheduler, CHANNEL_BULK, 10)
+    assert batches(scheduler, 1, max_bytes=2 * FRAME_SIZE) == [[CHANNEL_BULK] * 2]
+    assert batches(scheduler, 1, max_bytes=FRAME_SIZE - 1) == [[CHANNEL_BULK]] # Pelo menos um quadro por lote
+
+
+def test_writes_coalesce_and_complete_requests():
+    port = RecordingSerial()
+    scheduler = SerialTxScheduler(port, coalesce_window_s=0.2)
+    scheduler.start()
+    try:
+        requests = [scheduler.submit(frame(CHANNEL_BULK, i)) for i in range(4)]
+        results = [request.wait(2) for request in requests]
+    finally:
+        scheduler.stop()
+    assert all(result["status"] == "success" for result in results)
+    assert port.writes == [b"".join(frame(CHANNEL_BULK, i) for i in range(4))]
+    stats = scheduler.get_stats()
+    assert (stats["write_calls"], stats["frames_per_write"], stats["bytes_written"]) == (1, 4.0, 4 * FRAME_SIZE)
+
+
+def test_out_waiting_backpressure():
+    # Buffer do SO cheio nas duas primeiras leituras; depois com 54 bytes (cabem 2 quadros), depois vazio
+    port = RecordingSerial(out_waiting=[108, 108, 54, 0])
+    scheduler = SerialTxScheduler(port, coalesce_window_s=0.1)
+    scheduler.start()
+    try:
+        requests = [scheduler.submit(frame(CHANNEL_BULK, i)) for i in range(4)]
+        for request in requests:
+            assert request.wait(2)["status"] == "success"
+    finally:
+        scheduler.stop()
+    assert [len(data) for data in port.writes] == [2 * FRAME_SIZE, 2 * FRAME_SIZE]
+    stats = scheduler.get_stats()
+    assert stats["backpressure_waits"] == 1 and stats["backpressure_wait_s"] > 0
+    assert stats["out_waiting_max"] == 54
+
+
+def test_stop_fails_pending_and_new_requests():
+    scheduler = SerialTxScheduler(RecordingSerial())
+    with pytest.raises(ValueError):
+        scheduler.submit(b"x", channel="urgente")
+    assert scheduler.submit(b"x").wait(0)["status"] == "error" # Ainda não iniciado
+    scheduler.running = True # Fila sem a thread de escrita
+    pending = scheduler.submit(frame(CHANNEL_BULK, 0))
+    scheduler.stop()
+    assert pending.wait(0) == {"status": "error", "message": "Escalonador de TX parado."}
+
+
+def test_write_error_is_reported():
+    class BrokenSerial(RecordingSerial):
+        def write(self, data):
+            raise OSError("porta removida")
+
+    logs = []
+    scheduler = SerialTxScheduler(BrokenSerial(), log_callback=logs.append, coalesce_window_s=0)
+    scheduler.start()
+    try:
+        result = scheduler.submit(frame(CHANNEL_CONTROL, 0), CHANNEL_CONTROL).wait(2)
+    finally:
+        scheduler.stop()
+    assert result == {"status": "error", "message": "porta removida"}
+    assert logs == ["ERRO ao enviar pacote serial: porta removida"]
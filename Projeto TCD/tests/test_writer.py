@@ -0,0 +1,81 @@
+# tests/test_writer.py
+
+import os
+import threading
+
+import pytest
+
+import writer
+from writer import DiskWriter, FSYNC_NEVER, FSYNC_ON_COMPLETE, FSYNC_ALWAYS, COPY_CHUNK_SIZE
+
+
+@pytest.fixture
+def fsync_calls(monkeypatch):
+    calls = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(writer.os, "fsync", lambda fd: calls.append(fd) or real_fsync(fd))
+    return calls
+
+
+def test_write_file_creates_directory_and_sets_mtime(tmp_path):
+    path = tmp_path / "sub" / "arquivo.bin"
+    data = os.urandom(COPY_CHUNK_SIZE * 2 + 17) # Vários blocos de escrita
+    DiskWriter().write_file(str(path), data, mtime_ns=1600000000000000000)
+    assert path.read_bytes() == data
+    assert os.stat(path).st_mtime_ns == 1600000000000000000
+    assert not (tmp_path / "sub" / "arquivo.bin.tmp").exists()
+
+
+def test_write_file_replaces_shorter(tmp_path):
+    path = tmp_path / "arquivo.bin"
+    path.write_bytes(b"x" * 1000)
+    DiskWriter().write_file(str(path), b"novo")
+    assert path.read_bytes() == b"novo"
+
+
+def test_failed_write_keeps_previous_version(tmp_path, monkeypatch):
+    path = tmp_path / "arquivo.bin"
+    path.write_bytes(b"versao antiga")
+
+    def fail(fd):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(writer.os, "fsync", fail)
+    with pytest.raises(OSError):
+        DiskWriter(FSYNC_ON_COMPLETE).write_file(str(path), b"versao nova que nao chegou ao disco")
+    assert path.read_bytes() == b"versao antiga"
+
+
+@pytest.mark.parametrize("policy, file_syncs, fragment_syncs", [
+    (FSYNC_NEVER, 0, 0), (FSYNC_ON_COMPLETE, 1, 0), (FSYNC_ALWAYS, 1, 1)])
+def test_fsync_policy(tmp_path, fsync_calls, policy, file_syncs, fragment_syncs):
+    disk_writer = DiskWriter(policy)
+    disk_writer.write_file(str(tmp_path / "a.bin"), b"dados")
+    assert len(fsync_calls) == file_syncs
+    with open(tmp_path / "b.part", "wb") as f:
+        f.write(b"fragmento")
+        disk_writer.sync_fragment(f)
+    assert len(fsync_calls) == file_syncs + fragment_syncs
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        DiskWriter("sempre")
+
+
+def test_tasks_run_in_order_on_writer_thread():
+    logs = []
+    disk_writer = DiskWriter(log_callback=logs.append)
+    ran = []
+    disk_writer.submit(lambda: ran.append(("sem thread", threading.current_thread().name)))
+    disk_writer.start()
+    for i in range(50):
+        disk_writer.submit(lambda i=i: ran.append((i, threading.current_thread().name)))
+    disk_writer.submit(lambda: 1 / 0) # Erro numa tarefa não derruba a thread
+    disk_writer.submit(lambda: ran.append(("depois do erro", threading.current_thread().name)))
+    disk_writer.stop()
+    assert ran[0] == ("sem thread", threading.current_thread().name)
+    assert [item for item, _ in ran[1:51]] == list(range(50))
+    assert {name for _, name in ran[1:]} == {"DiskWriter"}
+    assert ran[-1][0] == "depois do erro"
+    assert len(logs) == 1 and "ZeroDivisionError" not in logs[0] and "division" in logs[0]
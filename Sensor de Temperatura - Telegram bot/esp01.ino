@@ -1,8 +1,7 @@
 #include <Wire.h>
 #include <LiquidCrystal_I2C.h>
 #include <ESP8266WiFi.h>
-#include <MySQL_Connection.h>
-#include <MySQL_Cursor.h>
+#include <WiFiUdp.h>
 #include <WiFiClientSecure.h>
 #include <UniversalTelegramBot.h>
 #include <ArduinoJson.h>
@@ -12,9 +11,11 @@
 DHT dht(DHTPIN, DHTTYPE);            // Criação objeto DHT
 LiquidCrystal_I2C lcd(0x27, 16, 2);  // set the LCD address to 0x27 for a 16 chars and 2 line display
 
-IPAddress server_addr(0, 0, 0, 0);  // O IP DO SERVIDOR DA CLEVER CLOUD
-char user[] = "usuario";            // Usuario MySQL
-char password[] = "senha";            //   Senha MySQL
+IPAddress gateway_addr(0, 0, 0, 0);  // IP do PC com o gateway (gateway/gateway.py), que grava no MySQL
+#define GATEWAY_PORT 5005            // UDP_PORT do gateway
+#define LOCAL_UDP_PORT 5006          // Porta deste nó, onde chegam as respostas "OK <seq>"
+#define GATEWAY_TENTATIVAS 3         // Envios da mesma leitura sem resposta antes de desistir dela
+#define GATEWAY_TIMEOUT_MS 300       // Espera pela resposta de cada envio
 
 char ssid[] = "nome_do_wifi";         //  Nome de rede Wifi
 char pass[] = "senha";  //  Senha Wi-Fi
@@ -26,11 +27,8 @@ X509List cert(TELEGRAM_CERTIFICATE_ROOT);
 WiFiClientSecure secured_client;
 UniversalTelegramBot bot(BOT_TOKEN, secured_client);
 
-char INSERT_DATA[] = "INSERT INTO databese.name_table (colum1, colum2) VALUES (%d,%d)";
-
-WiFiClient client;
-MySQL_Connection conn(&client);
-MySQL_Cursor* cursor;
+WiFiUDP udp;
+uint16_t seq = 0;  // Numera as leituras: o gateway ignora a repetição de uma leitura já gravada
 
 int tatual = 0;
 int t;
@@ -49,6 +47,7 @@ void setup() {
   pinMode(1, OUTPUT);
   dht.begin();  // Inicializa o sensor
   VerificaWiFi();
+  udp.begin(LOCAL_UDP_PORT);
   delay(1000);
 }
 
@@ -95,24 +94,31 @@ void loop() {
   }
 }
 void EnviaDados(int id, int temp) {
-  char query[128];
-  char temperatura[10];
+  // Uma leitura = um datagrama "id,temperatura,seq" para o gateway, que junta as leituras de todos os nós
+  // e grava em lote. Antes, cada leitura abria uma conexão MySQL (segundos de rádio ligado) e, sem
+  // servidor, a recursão sem limite travava o nó.
+  char linha[32];
+  char resposta[16];
+  seq++;
+  snprintf(linha, sizeof(linha), "%d,%d,%u", id, temp, seq);
   //VerificaWiFi();
-  if (conn.connect(server_addr, 3306, user, password)) {
-    delay(1000);
-    MySQL_Cursor* cur_mem = new MySQL_Cursor(&conn);
-    // Save
-    dtostrf(temp, 1, 1, temperatura);
-    sprintf(query, INSERT_DATA, id, temp);
-    // Execute the query
-    cur_mem->execute(query);
-    // Note: since there are no results, we do not need to read any data
-    // Deleting the cursor also frees up memory used
-    delete cur_mem;
-  } else {
-    EnviaDados(id, t);
+  for (int tentativa = 0; tentativa < GATEWAY_TENTATIVAS; tentativa++) {
+    udp.beginPacket(gateway_addr, GATEWAY_PORT);
+    udp.write(linha);
+    udp.endPacket();
+    unsigned long inicio = millis();
+    while (millis() - inicio < GATEWAY_TIMEOUT_MS) {
+      if (udp.parsePacket() > 0) {
+        int n = udp.read(resposta, sizeof(resposta) - 1);
+        resposta[n > 0 ? n : 0] = 0;
+        if (strncmp(resposta, "OK ", 3) == 0 && (uint16_t)atoi(resposta + 3) == seq) {
+          return;
+        }
+      }
+      delay(10);
+    }
   }
-  conn.close();
+  // Sem resposta do gateway: esta leitura se perde, mas o nó segue medindo
 }
 
 void VerificaWiFi() {
@@ -0,0 +1,57 @@
+# gateway/cache.py
+
+import threading
+from collections import deque
+
+# --- Cache do painel ---
+# Última leitura de cada sensor e as mais recentes (no geral e por sensor), em memória. Atualizado depois
+# de cada lote gravado e carregado do banco na partida: o painel responde sem consultar o banco.
+RECENT_READINGS = 10 # O index.php mostra as 10 últimas
+
+
+class LatestReadingsCache:
+    """Leituras já gravadas mais recentes; consultas em tempo constante."""
+
+    def __init__(self, size=RECENT_READINGS):
+        self.size = size
+        self._lock = threading.Lock()
+        self._latest = {}                # {id do sensor: Reading}
+        self._recent = deque(maxlen=size)
+        self._recent_by_sensor = {}      # {id do sensor: deque de Reading}
+
+    def load(self, latest, recent):
+        """Estado inicial vindo do banco: última de cada sensor e as mais recentes (da mais antiga para a mais nova)."""
+        with self._lock:
+            for reading in latest:
+                self._latest[reading.sensor_id] = reading
+        self.on_batch_written(recent, update_latest=False)
+
+    def on_batch_written(self, batch, update_latest=True):
+        with self._lock:
+            for reading in batch:
+                if update_latest:
+                    self._latest[reading.sensor_id] = reading
+                self._recent.append(reading)
+                per_sensor = self._recent_by_sensor.get(reading.sensor_id)
+                if per_sensor is None:
+                    per_sensor = self._recent_by_sensor[reading.sensor_id] = deque(maxlen=self.size)
+                per_sensor.append(reading)
+
+    def latest(self, sensor_id=None):
+        """Última leitura do sensor (ou a mais recente de todas). None se ainda não houver."""
+        with self._lock:
+            if sensor_id is not None:
+                return self._latest.get(sensor_id)
+            return max(self._latest.values(), key=lambda r: r.timestamp, default=None)
+
+    def latest_by_sensor(self):
+        with self._lock:
+            return dict(self._latest)
+
+    def recent(self, sensor_id=None, limit=None):
+        """Até limit leituras mais recentes (da mais nova para a mais antiga)."""
+        with self._lock:
+            source = self._recent if sensor_id is None else self._recent_by_sensor.get(sensor_id, ())
+            readings = list(source)
+        readings.reverse()
+        return readings[:limit] if limit else readings
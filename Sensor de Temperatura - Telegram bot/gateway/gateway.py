@@ -0,0 +1,281 @@
+# gateway/gateway.py
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from storage import (SqliteBackend, MysqlBackend, ConnectionPool, BatchWriter, Reading, format_timestamp,
+                     load_latest, load_recent, query_rollups, BATCH_MAX_READINGS, BATCH_MAX_DELAY_S, POOL_SIZE)
+from cache import LatestReadingsCache, RECENT_READINGS
+
+# --- Gateway de leituras dos sensores (ESP01) ---
+# Os nós não falam mais com o MySQL: mandam cada leitura ao gateway, que junta as de todos os nós e grava
+# em lote por conexões reaproveitadas (storage.py).
+# UDP (o que o esp01.ino usa): um datagrama com uma ou mais linhas "id,temperatura[,seq]". Para cada linha
+# com seq o gateway responde "OK <seq>" (também para repetições, que não são gravadas de novo); o nó
+# reenvia algumas vezes se a resposta não vier. Linhas inválidas recebem "ERR <motivo>".
+# HTTP: POST /leituras com {"id": 1, "temperatura": 25.0, "seq": 7} ou uma lista desses objetos.
+# Painel: GET /atual[?id=1] (última leitura e as mais recentes, do cache em memória) e
+# GET /historico?resolucao=minuto|hora|dia[&id=1][&limite=60] (tabelas pré-agregadas, por índice).
+# GET /status devolve os contadores do gateway.
+BIND_HOST = "0.0.0.0"
+UDP_PORT = 5005
+HTTP_PORT = 8080
+MAX_DATAGRAM_SIZE = 1024
+MAX_HTTP_BODY = 64 * 1024
+MIN_TEMPERATURE = -40.0 # Faixa do DHT22 (o DHT11 mede de 0 a 50)
+MAX_TEMPERATURE = 125.0
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "leituras.db")
+MAX_HISTORY_LIMIT = 1440
+
+
+def parse_reading_line(line):
+    """'id,temperatura[,seq]' -> (id, temperatura, seq ou None). ValueError se a linha for inválida."""
+    fields = [field.strip() for field in line.split(",")]
+    if len(fields) not in (2, 3):
+        raise ValueError("formato esperado: id,temperatura[,seq]")
+    return validate_reading(fields[0], fields[1], fields[2] if len(fields) == 3 else None)
+
+
+def validate_reading(sensor_id, temperature, seq=None):
+    sensor_id = int(sensor_id)
+    temperature = float(temperature)
+    if sensor_id <= 0:
+        raise ValueError("id do sensor deve ser positivo")
+    if not MIN_TEMPERATURE <= temperature <= MAX_TEMPERATURE:
+        raise ValueError(f"temperatura fora da faixa: {temperature}")
+    return sensor_id, temperature, (int(seq) & 0xFFFF) if seq is not None else None
+
+
+def reading_to_dict(reading):
+    return {"id": reading.sensor_id, "temperatura": reading.temperature, "data_hora": format_timestamp(reading.timestamp)}
+
+
+class IngestionGateway:
+    """Recebe leituras por UDP e HTTP e entrega ao BatchWriter, descartando repetições (mesmo seq do nó)."""
+
+    def __init__(self, writer, cache=None, log_callback=None):
+        self.writer = writer
+        self.cache = cache if cache else LatestReadingsCache()
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self._lock = threading.Lock()
+        self._last_seq = {} # {id do sensor: último seq aceito}
+        self._last_seen = {} # {id do sensor: time.time() da última leitura}
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self._stop_event = threading.Event()
+        self._udp_socket = None
+        self._http_server = None
+        self._threads = []
+
+    def _default_log_callback(self, message):
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}", flush=True)
+
+    def ingest(self, sensor_id, temperature, seq=None):
+        """Enfileira uma leitura já validada. False se for a repetição de uma leitura aceita."""
+        now = time.time()
+        with self._lock:
+            if seq is not None and self._last_seq.get(sensor_id) == seq:
+                self.duplicates += 1
+                return False
+            if seq is not None:
+                self._last_seq[sensor_id] = seq
+            self._last_seen[sensor_id] = now
+            self.accepted += 1
+        self.writer.submit(Reading(sensor_id, temperature, now))
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            stats = {"accepted": self.accepted, "duplicates": self.duplicates, "rejected": self.rejected,
+                     "sensors": {str(sensor_id): round(time.time() - seen, 1) for sensor_id, seen in self._last_seen.items()}}
+        stats["storage"] = self.writer.get_stats()
+        return stats
+
+    def get_current(self, sensor_id=None):
+        """Última leitura gravada e as mais recentes, direto do cache."""
+        latest = self.cache.latest(sensor_id)
+        return {"atual": reading_to_dict(latest) if latest else None,
+                "sensores": {str(s): reading_to_dict(r) for s, r in self.cache.latest_by_sensor().items()},
+                "recentes": [reading_to_dict(r) for r in self.cache.recent(sensor_id)]}
+
+    def _reject(self, reason, source):
+        with self._lock:
+            self.rejected += 1
+        self.log_callback(f"AVISO: leitura recusada de {source}: {reason}")
+
+    # --- UDP ---
+
+    def start_udp(self, host=BIND_HOST, port=UDP_PORT):
+        self._udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._udp_socket.bind((host, port))
+        self._udp_socket.settimeout(0.5)
+        self._start_thread(self._udp_loop, "GatewayUdp")
+        self.log_callback(f"Recebendo leituras por UDP em {host}:{self._udp_socket.getsockname()[1]}.")
+
+    def _udp_loop(self):
+        sock = self._udp_socket
+        while not self._stop_event.is_set():
+            try:
+                data, address = sock.recvfrom(MAX_DATAGRAM_SIZE)
+            except socket.timeout:
+                continue
+            except OSError:
+                return # Socket fechado em stop()
+            replies = []
+            for line in data.decode("ascii", errors="replace").splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    sensor_id, temperature, seq = parse_reading_line(line)
+                except ValueError as e:
+                    self._reject(str(e), address[0])
+                    replies.append(f"ERR {e}")
+                    continue
+                self.ingest(sensor_id, temperature, seq)
+                if seq is not None:
+                    replies.append(f"OK {seq}")
+            if replies:
+                try:
+                    sock.sendto("\n".join(replies).encode("ascii", errors="replace"), address)
+                except OSError:
+                    pass
+
+    # --- HTTP ---
+
+    def start_http(self, host=BIND_HOST, port=HTTP_PORT):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass # Uma linha por requisição polui o log com dezenas de nós
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    sensor_id = int(query["id"]) if "id" in query else None
+                    if url.path == "/status":
+                        return self._reply(200, gateway.get_stats())
+                    if url.path == "/atual":
+                        return self._reply(200, gateway.get_current(sensor_id))
+                    if url.path == "/historico":
+                        limit = min(int(query.get("limite", 60)), MAX_HISTORY_LIMIT)
+                        return self._reply(200, {"resolucao": query.get("resolucao", "hora"), "janelas": query_rollups(
+                            gateway.writer.pool, query.get("resolucao", "hora"), sensor_id, limit)})
+                except ValueError as e:
+                    return self._reply(400, {"error": str(e)})
+                except Exception as e:
+                    return self._reply(503, {"error": f"banco indisponível: {e}"})
+                self._reply(404, {"error": "não encontrado"})
+
+            def do_POST(self):
+                if self.path != "/leituras":
+                    return self._reply(404, {"error": "não encontrado"})
+                length = int(self.headers.get("Content-Length") or 0)
+                if length <= 0 or length > MAX_HTTP_BODY:
+                    return self._reply(413 if length > 0 else 400, {"error": "corpo ausente ou grande demais"})
+                try:
+                    body = json.loads(self.rfile.read(length))
+                    items = body if isinstance(body, list) else [body]
+                    readings = [validate_reading(item["id"], item["temperatura"], item.get("seq")) for item in items]
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    gateway._reject(str(e), self.client_address[0])
+                    return self._reply(400, {"error": str(e)})
+                accepted = sum(1 for reading in readings if gateway.ingest(*reading))
+                self._reply(200, {"accepted": accepted, "duplicates": len(readings) - accepted})
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._http_server = ThreadingHTTPServer((host, port), Handler)
+        self._http_server.daemon_threads = True
+        self._start_thread(self._http_server.serve_forever, "GatewayHttp")
+        self.log_callback(f"Recebendo leituras por HTTP em http://{host}:{self._http_server.server_address[1]}/leituras.")
+
+    # --- Ciclo de vida ---
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        """Para de receber e grava o que ainda estiver na fila."""
+        self._stop_event.set()
+        if self._http_server:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+        if self._udp_socket:
+            self._udp_socket.close()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self.writer.stop()
+        self.log_callback(f"Gateway encerrado. {self.get_stats()['storage']}")
+
+
+def build_backend(args):
+    if args.mysql_host:
+        return MysqlBackend(args.mysql_host, args.mysql_user, os.environ.get("GATEWAY_MYSQL_PASSWORD", ""),
+                            args.mysql_database, args.mysql_port)
+    return SqliteBackend(args.sqlite)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Recebe leituras dos ESP01 (UDP/HTTP) e grava em lote no banco.")
+    parser.add_argument("--sqlite", default=DEFAULT_SQLITE_PATH, help="arquivo SQLite (usado se não houver --mysql-host)")
+    parser.add_argument("--mysql-host", help="servidor MySQL (senha na variável GATEWAY_MYSQL_PASSWORD)")
+    parser.add_argument("--mysql-port", type=int, default=3306)
+    parser.add_argument("--mysql-user", default="usuario")
+    parser.add_argument("--mysql-database", default="database")
+    parser.add_argument("--bind", default=BIND_HOST)
+    parser.add_argument("--udp-port", type=int, default=UDP_PORT, help="0 desliga o UDP")
+    parser.add_argument("--http-port", type=int, default=HTTP_PORT, help="0 desliga o HTTP")
+    parser.add_argument("--batch-size", type=int, default=BATCH_MAX_READINGS)
+    parser.add_argument("--batch-delay", type=float, default=BATCH_MAX_DELAY_S, help="espera máxima por um lote (s)")
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE)
+    parser.add_argument("--recent", type=int, default=RECENT_READINGS, help="leituras recentes mantidas no cache do painel")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    backend = build_backend(args)
+    pool = ConnectionPool(backend, args.pool_size)
+    cache = LatestReadingsCache(args.recent)
+    writer = BatchWriter(pool, args.batch_size, args.batch_delay, on_batch_written=cache.on_batch_written)
+    gateway = IngestionGateway(writer, cache)
+    writer.log_callback = gateway.log_callback
+    writer.start()
+    cache.load(load_latest(pool), load_recent(pool, cache.size))
+    gateway.log_callback(f"Gravando em {backend.describe()}.")
+    if args.udp_port:
+        gateway.start_udp(args.bind, args.udp_port)
+    if args.http_port:
+        gateway.start_http(args.bind, args.http_port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
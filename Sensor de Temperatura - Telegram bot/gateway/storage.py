@@ -0,0 +1,429 @@
+# gateway/storage.py
+
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+try:
+    import pymysql # Só para o MySQL de produção; o SQLite (local/testes) já vem com o Python
+except ImportError:
+    pymysql = None
+
+# --- Tabela das leituras (a mesma que o index.php consulta) ---
+TABLE_NAME = "Temperatura"
+SENSOR_COLUMN = "ID_SENSOR"
+TEMPERATURE_COLUMN = "Temperatura"
+TIMESTAMP_COLUMN = "DATA_HORA"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S" # DATETIME do MySQL, no horário local (o index.php compara com NOW())
+
+# --- Tabelas pré-agregadas (atualizadas na mesma transação de cada lote) ---
+# O painel lê a última leitura de cada sensor e médias por minuto/hora/dia sem varrer o histórico:
+# cada consulta toca poucas linhas, por índice, não importa quantas leituras já se acumularam.
+LATEST_TABLE = "Temperatura_Atual" # Uma linha por sensor
+ROLLUP_START_COLUMN = "INICIO"
+# (resolução, tabela, início da janela em strftime)
+ROLLUP_LEVELS = (
+    ("minuto", "Temperatura_Minuto", "%Y-%m-%d %H:%M:00"),
+    ("hora", "Temperatura_Hora", "%Y-%m-%d %H:00:00"),
+    ("dia", "Temperatura_Dia", "%Y-%m-%d 00:00:00"),
+)
+
+# --- Gravação em lote ---
+# As leituras de todos os nós entram numa fila; uma thread grava de uma vez, numa transação, até
+# BATCH_MAX_READINGS leituras ou o que tiver chegado em BATCH_MAX_DELAY_S. Com o banco fora do ar a fila
+# segura as leituras (até MAX_PENDING_READINGS, descartando as mais antigas) e a gravação é tentada de novo.
+POOL_SIZE = 4
+BATCH_MAX_READINGS = 200
+BATCH_MAX_DELAY_S = 1.0
+MAX_PENDING_READINGS = 10000
+RETRY_BACKOFF_S = (1, 2, 5, 10, 30)
+
+Reading = namedtuple("Reading", "sensor_id temperature timestamp") # timestamp: time.time() da chegada
+
+
+def format_timestamp(timestamp):
+    return time.strftime(TIMESTAMP_FORMAT, time.localtime(timestamp))
+
+
+def parse_timestamp(value):
+    """DATA_HORA lido do banco (texto no SQLite, datetime no MySQL) -> time.time()."""
+    if isinstance(value, str):
+        return time.mktime(time.strptime(value, TIMESTAMP_FORMAT))
+    return value.timestamp()
+
+
+def aggregate_batch(batch):
+    """
+    Resume um lote para as tabelas pré-agregadas: {tabela: [(sensor, início, n, soma, mín, máx)]} e a
+    última leitura de cada sensor no lote.
+    """
+    rollups = {table: {} for _, table, _ in ROLLUP_LEVELS}
+    latest = {}
+    for reading in batch:
+        local = time.localtime(reading.timestamp)
+        value = reading.temperature
+        for _, table, start_format in ROLLUP_LEVELS:
+            key = (reading.sensor_id, time.strftime(start_format, local))
+            agg = rollups[table].get(key)
+            if agg is None:
+                rollups[table][key] = [1, value, value, value]
+            else:
+                agg[0] += 1
+                agg[1] += value
+                agg[2] = min(agg[2], value)
+                agg[3] = max(agg[3], value)
+        latest[reading.sensor_id] = reading
+    rows = {table: [key + tuple(agg) for key, agg in groups.items()] for table, groups in rollups.items()}
+    latest_rows = [(r.sensor_id, r.temperature, format_timestamp(r.timestamp)) for r in latest.values()]
+    return rows, latest_rows
+
+
+class SqliteBackend:
+    """Banco local num arquivo (ou ':memory:'): substitui o MySQL em testes e instalações sem servidor."""
+
+    placeholder = "?"
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path):
+        self.path = path
+
+    def describe(self):
+        return f"SQLite {self.path}"
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL") # Leituras do painel não bloqueiam a gravação dos lotes
+        return conn
+
+    def create_schema(self, conn):
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} ("
+                     f"ID INTEGER PRIMARY KEY AUTOINCREMENT, {SENSOR_COLUMN} INTEGER NOT NULL, "
+                     f"{TEMPERATURE_COLUMN} REAL NOT NULL, {TIMESTAMP_COLUMN} TEXT NOT NULL)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_{TIMESTAMP_COLUMN} ON {TABLE_NAME} ({TIMESTAMP_COLUMN})")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {LATEST_TABLE} ({SENSOR_COLUMN} INTEGER PRIMARY KEY, "
+                     f"{TEMPERATURE_COLUMN} REAL NOT NULL, {TIMESTAMP_COLUMN} TEXT NOT NULL)")
+        for _, table, _ in ROLLUP_LEVELS:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({SENSOR_COLUMN} INTEGER NOT NULL, "
+                         f"{ROLLUP_START_COLUMN} TEXT NOT NULL, N INTEGER NOT NULL, SOMA REAL NOT NULL, "
+                         f"MINIMO REAL NOT NULL, MAXIMO REAL NOT NULL, PRIMARY KEY ({SENSOR_COLUMN}, {ROLLUP_START_COLUMN}))")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{ROLLUP_START_COLUMN} ON {table} ({ROLLUP_START_COLUMN})")
+        conn.commit()
+
+    def bucket_expression(self, start_format):
+        return f"strftime('{start_format}', {TIMESTAMP_COLUMN})"
+
+    def upsert_rollup_sql(self, table):
+        return (f"INSERT INTO {table} ({SENSOR_COLUMN}, {ROLLUP_START_COLUMN}, N, SOMA, MINIMO, MAXIMO) "
+                f"VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT ({SENSOR_COLUMN}, {ROLLUP_START_COLUMN}) DO UPDATE SET "
+                "N = N + excluded.N, SOMA = SOMA + excluded.SOMA, "
+                "MINIMO = MIN(MINIMO, excluded.MINIMO), MAXIMO = MAX(MAXIMO, excluded.MAXIMO)")
+
+    def upsert_latest_sql(self):
+        return (f"INSERT INTO {LATEST_TABLE} ({SENSOR_COLUMN}, {TEMPERATURE_COLUMN}, {TIMESTAMP_COLUMN}) "
+                f"VALUES (?, ?, ?) ON CONFLICT ({SENSOR_COLUMN}) DO UPDATE SET "
+                f"{TEMPERATURE_COLUMN} = excluded.{TEMPERATURE_COLUMN}, {TIMESTAMP_COLUMN} = excluded.{TIMESTAMP_COLUMN} "
+                f"WHERE excluded.{TIMESTAMP_COLUMN} >= {LATEST_TABLE}.{TIMESTAMP_COLUMN}")
+
+
+class MysqlBackend:
+    """O MySQL do index.php (precisa do pymysql: pip install pymysql)."""
+
+    placeholder = "%s"
+    errors = (pymysql.Error,) if pymysql else ()
+
+    def __init__(self, host, user, password, database, port=3306):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.database = database
+        self.port = port
+
+    def describe(self):
+        return f"MySQL {self.user}@{self.host}:{self.port}/{self.database}"
+
+    def connect(self):
+        if pymysql is None:
+            raise RuntimeError("Para usar o MySQL instale o pymysql (pip install pymysql).")
+        return pymysql.connect(host=self.host, port=self.port, user=self.user, password=self.password,
+                               database=self.database, autocommit=False, connect_timeout=5)
+
+    def create_schema(self, conn):
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} ("
+                        f"ID INT AUTO_INCREMENT PRIMARY KEY, {SENSOR_COLUMN} INT NOT NULL, "
+                        f"{TEMPERATURE_COLUMN} DECIMAL(5,1) NOT NULL, {TIMESTAMP_COLUMN} DATETIME NOT NULL, "
+                        f"INDEX idx_{TIMESTAMP_COLUMN} ({TIMESTAMP_COLUMN}))")
+            # Tabela criada antes do gateway (pelo index.php/ESP01): sem o índice, cada consulta varre o histórico
+            cur.execute("SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                        "AND table_name = %s AND column_name = %s", (TABLE_NAME, TIMESTAMP_COLUMN))
+            if not cur.fetchone()[0]:
+                cur.execute(f"CREATE INDEX idx_{TIMESTAMP_COLUMN} ON {TABLE_NAME} ({TIMESTAMP_COLUMN})")
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {LATEST_TABLE} ({SENSOR_COLUMN} INT PRIMARY KEY, "
+                        f"{TEMPERATURE_COLUMN} DECIMAL(5,1) NOT NULL, {TIMESTAMP_COLUMN} DATETIME NOT NULL)")
+            for _, table, _ in ROLLUP_LEVELS:
+                cur.execute(f"CREATE TABLE IF NOT EXISTS {table} ({SENSOR_COLUMN} INT NOT NULL, "
+                            f"{ROLLUP_START_COLUMN} DATETIME NOT NULL, N INT NOT NULL, SOMA DOUBLE NOT NULL, "
+                            f"MINIMO DECIMAL(5,1) NOT NULL, MAXIMO DECIMAL(5,1) NOT NULL, "
+                            f"PRIMARY KEY ({SENSOR_COLUMN}, {ROLLUP_START_COLUMN}), "
+                            f"INDEX idx_{ROLLUP_START_COLUMN} ({ROLLUP_START_COLUMN}))")
+        conn.commit()
+
+    def bucket_expression(self, start_format):
+        return f"DATE_FORMAT({TIMESTAMP_COLUMN}, '{start_format.replace('%M', '%i')}')"
+
+    def upsert_rollup_sql(self, table):
+        return (f"INSERT INTO {table} ({SENSOR_COLUMN}, {ROLLUP_START_COLUMN}, N, SOMA, MINIMO, MAXIMO) "
+                "VALUES (%s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE "
+                "N = N + VALUES(N), SOMA = SOMA + VALUES(SOMA), "
+                "MINIMO = LEAST(MINIMO, VALUES(MINIMO)), MAXIMO = GREATEST(MAXIMO, VALUES(MAXIMO))")
+
+    def upsert_latest_sql(self):
+        # Atribuições avaliadas em ordem: a temperatura é comparada com o DATA_HORA antigo
+        return (f"INSERT INTO {LATEST_TABLE} ({SENSOR_COLUMN}, {TEMPERATURE_COLUMN}, {TIMESTAMP_COLUMN}) "
+                f"VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE "
+                f"{TEMPERATURE_COLUMN} = IF(VALUES({TIMESTAMP_COLUMN}) >= {TIMESTAMP_COLUMN}, "
+                f"VALUES({TEMPERATURE_COLUMN}), {TEMPERATURE_COLUMN}), "
+                f"{TIMESTAMP_COLUMN} = GREATEST({TIMESTAMP_COLUMN}, VALUES({TIMESTAMP_COLUMN}))")
+
+
+class ConnectionPool:
+    """
+    Até size conexões abertas, reutilizadas entre os lotes (o ESP01 abria e fechava uma por leitura).
+    Uma conexão que deu erro é descartada; a próxima é aberta sob demanda.
+    """
+
+    def __init__(self, backend, size=POOL_SIZE):
+        self.backend = backend
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.opened = 0
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self.backend.connect()
+                self.opened += 1
+            try:
+                yield conn
+            except BaseException:
+                self._discard(conn)
+                raise
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class BatchWriter:
+    """Fila das leituras recebidas e thread que as grava em lote pelo pool."""
+
+    def __init__(self, pool, max_batch=BATCH_MAX_READINGS, max_delay_s=BATCH_MAX_DELAY_S,
+                 max_pending=MAX_PENDING_READINGS, log_callback=None, on_batch_written=None):
+        self.pool = pool
+        self.on_batch_written = on_batch_written # (lote): chamado depois do commit (ex.: cache do painel)
+        self.max_batch = max_batch
+        self.max_delay_s = max_delay_s
+        self.max_pending = max_pending
+        self.log_callback = log_callback if log_callback else self._default_log_callback
+        self._insert_sql = (f"INSERT INTO {TABLE_NAME} ({SENSOR_COLUMN}, {TEMPERATURE_COLUMN}, {TIMESTAMP_COLUMN}) "
+                            f"VALUES ({', '.join([pool.backend.placeholder] * 3)})")
+        self._rollup_sql = {table: pool.backend.upsert_rollup_sql(table) for _, table, _ in ROLLUP_LEVELS}
+        self._latest_sql = pool.backend.upsert_latest_sql()
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._first_pending_at = None
+        self._running = False
+        self._thread = None
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def _default_log_callback(self, message):
+        print(f"[BatchWriter] {message}")
+
+    def start(self):
+        with self.pool.connection() as conn:
+            self.pool.backend.create_schema(conn)
+            self._backfill_aggregates(conn)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="BatchWriter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Para a thread depois de gravar o que estiver na fila (se o banco deixar, dentro de timeout)."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.pool.close()
+
+    def submit(self, reading):
+        with self._cond:
+            if not self._pending:
+                self._first_pending_at = time.monotonic()
+                self._cond.notify_all() # Começa a contar BATCH_MAX_DELAY_S
+            self._pending.append(reading)
+            if len(self._pending) > self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+
+    def get_stats(self):
+        with self._cond:
+            return {"pending": len(self._pending), "written": self.written, "batches": self.batches,
+                    "dropped": self.dropped, "failures": self.failures, "connections_opened": self.pool.opened}
+
+    def _run(self):
+        retry = 0
+        while True:
+            with self._cond:
+                while self._running:
+                    if len(self._pending) >= self.max_batch:
+                        break
+                    if self._pending:
+                        remaining = self._first_pending_at + self.max_delay_s - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if not self._pending:
+                    return # Parado e sem nada pendente
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                self._first_pending_at = time.monotonic() if self._pending else None
+                stopping = not self._running
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                with self._cond:
+                    self._pending.extendleft(reversed(batch)) # Volta para a frente da fila, na ordem
+                    while len(self._pending) > self.max_pending:
+                        self._pending.popleft()
+                        self.dropped += 1
+                    self.failures += 1
+                    self._first_pending_at = time.monotonic()
+                delay = RETRY_BACKOFF_S[min(retry, len(RETRY_BACKOFF_S) - 1)]
+                retry += 1
+                self.log_callback(f"ERRO ao gravar lote de {len(batch)} leitura(s): {e}. Nova tentativa em {delay} s.")
+                if stopping:
+                    return # Encerrando com o banco fora do ar: não adianta insistir
+                with self._cond:
+                    self._cond.wait_for(lambda: not self._running, delay)
+                continue
+            retry = 0
+            with self._cond:
+                self.written += len(batch)
+                self.batches += 1
+            if self.on_batch_written:
+                self.on_batch_written(batch)
+
+    def _write(self, batch):
+        rows = [(r.sensor_id, r.temperature, format_timestamp(r.timestamp)) for r in batch]
+        rollup_rows, latest_rows = aggregate_batch(batch)
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.executemany(self._insert_sql, rows)
+                for table, table_rows in rollup_rows.items():
+                    cur.executemany(self._rollup_sql[table], table_rows)
+                cur.executemany(self._latest_sql, latest_rows)
+                conn.commit()
+            finally:
+                cur.close()
+
+    def _backfill_aggregates(self, conn):
+        """Tabelas pré-agregadas vazias e histórico já existente (banco de antes do gateway): calcula uma vez."""
+        backend = self.pool.backend
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}")
+            if not cur.fetchone()[0]:
+                return
+            for _, table, start_format in ROLLUP_LEVELS:
+                cur.execute(f"SELECT COUNT(*) FROM {table}")
+                if cur.fetchone()[0]:
+                    continue
+                bucket = backend.bucket_expression(start_format)
+                cur.execute(f"INSERT INTO {table} ({SENSOR_COLUMN}, {ROLLUP_START_COLUMN}, N, SOMA, MINIMO, MAXIMO) "
+                            f"SELECT {SENSOR_COLUMN}, {bucket}, COUNT(*), SUM({TEMPERATURE_COLUMN}), "
+                            f"MIN({TEMPERATURE_COLUMN}), MAX({TEMPERATURE_COLUMN}) FROM {TABLE_NAME} "
+                            f"GROUP BY {SENSOR_COLUMN}, {bucket}")
+                self.log_callback(f"Tabela {table} calculada a partir do histórico.")
+            cur.execute(f"SELECT COUNT(*) FROM {LATEST_TABLE}")
+            if not cur.fetchone()[0]:
+                cur.execute(f"SELECT t.{SENSOR_COLUMN}, t.{TEMPERATURE_COLUMN}, t.{TIMESTAMP_COLUMN} FROM {TABLE_NAME} t "
+                            f"WHERE t.{TIMESTAMP_COLUMN} = (SELECT MAX({TIMESTAMP_COLUMN}) FROM {TABLE_NAME} "
+                            f"WHERE {SENSOR_COLUMN} = t.{SENSOR_COLUMN})")
+                cur.executemany(self._latest_sql, [tuple(row) for row in cur.fetchall()])
+            conn.commit()
+        finally:
+            cur.close()
+
+
+# --- Consultas do painel (por índice, com LIMIT) ---
+
+def load_latest(pool):
+    """Última leitura de cada sensor (tabela Temperatura_Atual)."""
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT {SENSOR_COLUMN}, {TEMPERATURE_COLUMN}, {TIMESTAMP_COLUMN} FROM {LATEST_TABLE}")
+            return [Reading(int(s), float(t), parse_timestamp(ts)) for s, t, ts in cur.fetchall()]
+        finally:
+            cur.close()
+
+
+def load_recent(pool, limit):
+    """As limit leituras mais recentes (todas os sensores), da mais antiga para a mais nova."""
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT {SENSOR_COLUMN}, {TEMPERATURE_COLUMN}, {TIMESTAMP_COLUMN} FROM {TABLE_NAME} "
+                        f"ORDER BY {TIMESTAMP_COLUMN} DESC LIMIT {int(limit)}")
+            return [Reading(int(s), float(t), parse_timestamp(ts)) for s, t, ts in reversed(cur.fetchall())]
+        finally:
+            cur.close()
+
+
+def query_rollups(pool, resolution, sensor_id=None, limit=60):
+    """Janelas mais recentes de uma resolução ('minuto', 'hora' ou 'dia'), da mais nova para a mais antiga."""
+    tables = {name: table for name, table, _ in ROLLUP_LEVELS}
+    if resolution not in tables:
+        raise ValueError(f"resolução desconhecida: {resolution} (use {', '.join(tables)})")
+    where, params = "", ()
+    if sensor_id is not None:
+        where, params = f"WHERE {SENSOR_COLUMN} = {pool.backend.placeholder} ", (int(sensor_id),)
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT {SENSOR_COLUMN}, {ROLLUP_START_COLUMN}, N, SOMA, MINIMO, MAXIMO FROM {tables[resolution]} "
+                        f"{where}ORDER BY {ROLLUP_START_COLUMN} DESC LIMIT {int(limit)}", params)
+            return [{"id": int(s), "inicio": str(start), "leituras": int(n), "media": round(float(total) / n, 2),
+                     "minima": float(low), "maxima": float(high)} for s, start, n, total, low, high in cur.fetchall()]
+        finally:
+            cur.close()
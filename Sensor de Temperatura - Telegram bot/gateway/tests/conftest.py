@@ -0,0 +1,32 @@
+# gateway/tests/conftest.py
+
+import os
+import sys
+import time
+
+import pytest
+
+# Os módulos do gateway se importam pelo nome (como quando gateway.py roda de dentro de gateway/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from storage import SqliteBackend, ConnectionPool
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    """Arquivo SQLite em tmp_path: o substituto local do MySQL do index.php."""
+    return str(tmp_path / "leituras.db")
+
+
+@pytest.fixture
+def pool(sqlite_path):
+    pool = ConnectionPool(SqliteBackend(sqlite_path), 2)
+    yield pool
+    pool.close()
@@ -0,0 +1,29 @@
+# gateway/tests/test_cache.py
+
+from cache import LatestReadingsCache
+from storage import Reading
+
+
+def test_latest_and_recent():
+    cache = LatestReadingsCache(size=3)
+    assert cache.latest() is None and cache.recent() == []
+    cache.on_batch_written([Reading(1, 20.0, 100), Reading(2, 30.0, 105), Reading(1, 21.0, 110)])
+    cache.on_batch_written([Reading(1, 22.0, 120), Reading(2, 31.0, 125)])
+    assert cache.latest(1) == Reading(1, 22.0, 120)
+    assert cache.latest() == Reading(2, 31.0, 125)
+    assert cache.latest(9) is None
+    assert [r.temperature for r in cache.recent()] == [31.0, 22.0, 21.0] # Limitado a size, do mais novo
+    assert [r.temperature for r in cache.recent(1)] == [22.0, 21.0, 20.0]
+    assert [r.temperature for r in cache.recent(2, limit=1)] == [31.0]
+    assert cache.recent(9) == []
+    assert set(cache.latest_by_sensor()) == {1, 2}
+
+
+def test_load_keeps_latest_from_database():
+    cache = LatestReadingsCache(size=5)
+    # Temperatura_Atual tem a última de cada sensor; as recentes (só sensor 1) não a substituem
+    cache.load([Reading(1, 25.0, 200), Reading(2, 15.0, 50)], [Reading(1, 24.0, 190), Reading(1, 25.0, 200)])
+    assert cache.latest(2) == Reading(2, 15.0, 50)
+    assert cache.latest(1) == Reading(1, 25.0, 200)
+    assert [r.timestamp for r in cache.recent()] == [200, 190]
+    assert cache.recent(2) == []
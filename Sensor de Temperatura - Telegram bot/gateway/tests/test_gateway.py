@@ -0,0 +1,221 @@
+# gateway/tests/test_gateway.py
+
+import json
+import socket
+import sqlite3
+import urllib.error
+import urllib.request
+
+import pytest
+
+import storage
+from cache import LatestReadingsCache
+from conftest import wait_for
+from gateway import IngestionGateway, parse_reading_line, validate_reading, build_parser, build_backend
+from storage import BatchWriter, ConnectionPool, SqliteBackend, Reading, TABLE_NAME
+
+
+class RecordingWriter:
+    """BatchWriter de mentira: só guarda o que o gateway entregou."""
+
+    pool = None
+
+    def __init__(self):
+        self.readings = []
+
+    def submit(self, reading):
+        self.readings.append(reading)
+
+    def get_stats(self):
+        return {"pending": 0}
+
+    def stop(self):
+        pass
+
+
+def quiet(message):
+    pass
+
+
+def test_parse_reading_line():
+    assert parse_reading_line(" 3 , 24.5 ") == (3, 24.5, None)
+    assert parse_reading_line("3,24.5,65537") == (3, 24.5, 1) # seq de 16 bits, como no nó
+    for line in ("3", "3,24.5,1,2", "x,24.5", "0,20", "1,200", "1,-41"):
+        with pytest.raises(ValueError):
+            parse_reading_line(line)
+    assert validate_reading("2", "-40", "7") == (2, -40.0, 7)
+
+
+def test_duplicate_seq_is_not_written_twice():
+    writer = RecordingWriter()
+    gateway = IngestionGateway(writer, log_callback=quiet)
+    assert gateway.ingest(1, 25.0, 7)
+    assert not gateway.ingest(1, 25.0, 7)  # Resposta "OK" perdida: o nó reenviou
+    assert gateway.ingest(2, 25.0, 7)      # Outro sensor, mesmo seq
+    assert gateway.ingest(1, 25.5, 8)
+    assert gateway.ingest(1, 25.5, 7)      # Só a repetição imediata é descartada
+    assert gateway.ingest(1, 26.0) and gateway.ingest(1, 26.0) # Sem seq nunca é repetição
+    assert [(r.sensor_id, r.temperature) for r in writer.readings] == [
+        (1, 25.0), (2, 25.0), (1, 25.5), (1, 25.5), (1, 26.0), (1, 26.0)]
+    stats = gateway.get_stats()
+    assert (stats["accepted"], stats["duplicates"], stats["rejected"]) == (6, 1, 0)
+    assert set(stats["sensors"]) == {"1", "2"}
+
+
+def udp_exchange(port, payload):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(2)
+        sock.sendto(payload, ("127.0.0.1", port))
+        return sock.recv(1024).decode("ascii")
+
+
+def test_udp_replies_per_line():
+    writer = RecordingWriter()
+    gateway = IngestionGateway(writer, log_callback=quiet)
+    gateway.start_udp("127.0.0.1", 0)
+    try:
+        port = gateway._udp_socket.getsockname()[1]
+        reply = udp_exchange(port, b"1,25.0,7\n\n2,abc,1\n3,21.5\n1,25.0,7\n")
+        lines = reply.splitlines()
+        assert lines[0] == "OK 7" and lines[1].startswith("ERR ") and lines[2] == "OK 7"
+        assert len(lines) == 3 # Linha sem seq não recebe resposta
+        assert [(r.sensor_id, r.temperature) for r in writer.readings] == [(1, 25.0), (3, 21.5)]
+        assert gateway.get_stats()["rejected"] == 1
+    finally:
+        gateway.stop()
+
+
+def http_request(base, path, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(base + path, data=data, method="POST" if data is not None else "GET")
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_http_ingest():
+    writer = RecordingWriter()
+    gateway = IngestionGateway(writer, log_callback=quiet)
+    gateway.start_http("127.0.0.1", 0)
+    base = f"http://127.0.0.1:{gateway._http_server.server_address[1]}"
+    try:
+        assert http_request(base, "/leituras", {"id": 1, "temperatura": 22.0, "seq": 3}) == \
+            (200, {"accepted": 1, "duplicates": 0})
+        assert http_request(base, "/leituras", [{"id": 1, "temperatura": 22.0, "seq": 3},
+                                                {"id": 2, "temperatura": 23.0}]) == (200, {"accepted": 1, "duplicates": 1})
+        status, body = http_request(base, "/leituras", [{"id": 1, "temperatura": 500}])
+        assert status == 400 and "faixa" in body["error"]
+        assert http_request(base, "/leituras", {"temperatura": 1})[0] == 400
+        assert http_request(base, "/outra", {"id": 1, "temperatura": 1})[0] == 404
+        assert http_request(base, "/nada")[0] == 404
+        status, body = http_request(base, "/status")
+        assert status == 200 and (body["accepted"], body["duplicates"], body["rejected"]) == (2, 1, 2)
+        assert len(writer.readings) == 2
+    finally:
+        gateway.stop()
+
+
+def test_batch_writer_groups_readings(pool):
+    writer = BatchWriter(pool, max_batch=3, max_delay_s=60, log_callback=quiet)
+    written = []
+    writer.on_batch_written = written.append
+    writer.start()
+    try:
+        for i in range(3):
+            writer.submit(Reading(1, 20.0 + i, 1700000000 + i))
+        assert wait_for(lambda: writer.get_stats()["written"] == 3) # Lote cheio sai sem esperar max_delay_s
+        assert [len(batch) for batch in written] == [3]
+    finally:
+        writer.stop()
+    with sqlite3.connect(pool.backend.path) as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0] == 3
+
+
+def test_stop_flushes_pending(pool):
+    writer = BatchWriter(pool, max_batch=100, max_delay_s=60, log_callback=quiet)
+    writer.start()
+    writer.submit(Reading(1, 20.0, 1700000000))
+    writer.stop()
+    assert writer.get_stats()["written"] == 1
+
+
+class FlakyBackend(SqliteBackend):
+    """SQLite que recusa as primeiras conexões depois do esquema criado (banco fora do ar)."""
+
+    def __init__(self, path, failures):
+        super().__init__(path)
+        self.failures = failures
+        self.schema_ready = False
+
+    def connect(self):
+        if self.schema_ready and self.failures > 0:
+            self.failures -= 1
+            raise sqlite3.OperationalError("banco fora do ar")
+        return super().connect()
+
+
+def test_batch_retry_keeps_order(sqlite_path, monkeypatch):
+    monkeypatch.setattr(storage, "RETRY_BACKOFF_S", (0.01,))
+    backend = FlakyBackend(sqlite_path, failures=3)
+    pool = ConnectionPool(backend, 1)
+    logs = []
+    writer = BatchWriter(pool, max_batch=2, max_delay_s=0.01, log_callback=logs.append)
+    writer.start()
+    pool.close() # A conexão do esquema não é reaproveitada: o lote precisa abrir outra
+    backend.schema_ready = True
+    try:
+        for i in range(5):
+            writer.submit(Reading(1, 20.0 + i, 1700000000 + i))
+        assert wait_for(lambda: writer.get_stats()["written"] == 5)
+    finally:
+        writer.stop()
+    stats = writer.get_stats()
+    assert (stats["failures"], stats["dropped"], stats["pending"]) == (3, 0, 0)
+    assert sum("ERRO ao gravar lote" in line for line in logs) == 3
+    with sqlite3.connect(sqlite_path) as conn:
+        rows = conn.execute(f"SELECT Temperatura FROM {TABLE_NAME} ORDER BY ID").fetchall()
+    assert [row[0] for row in rows] == [20.0, 21.0, 22.0, 23.0, 24.0]
+
+
+def test_pending_queue_drops_oldest(pool):
+    writer = BatchWriter(pool, max_pending=3, log_callback=quiet) # Sem start(): nada é gravado
+    for i in range(5):
+        writer.submit(Reading(1, 20.0 + i, 1700000000 + i))
+    assert writer.get_stats()["dropped"] == 2
+    assert [r.temperature for r in writer._pending] == [22.0, 23.0, 24.0]
+
+
+def test_end_to_end(sqlite_path):
+    args = build_parser().parse_args(["--sqlite", sqlite_path, "--batch-delay", "0.05"])
+    pool = ConnectionPool(build_backend(args), args.pool_size)
+    cache = LatestReadingsCache(args.recent)
+    writer = BatchWriter(pool, args.batch_size, args.batch_delay, log_callback=quiet,
+                         on_batch_written=cache.on_batch_written)
+    gateway = IngestionGateway(writer, cache, log_callback=quiet)
+    writer.start()
+    gateway.start_udp("127.0.0.1", 0)
+    gateway.start_http("127.0.0.1", 0)
+    base = f"http://127.0.0.1:{gateway._http_server.server_address[1]}"
+    try:
+        port = gateway._udp_socket.getsockname()[1]
+        assert udp_exchange(port, b"1,20.0,1\n2,30.0,1") == "OK 1\nOK 1"
+        assert udp_exchange(port, b"1,22.0,2") == "OK 2"
+        assert udp_exchange(port, b"1,22.0,2") == "OK 2" # Repetição: confirmada, não gravada
+        assert http_request(base, "/leituras", {"id": 2, "temperatura": 31.0})[0] == 200
+        assert wait_for(lambda: writer.get_stats()["written"] == 4)
+
+        status, current = http_request(base, "/atual?id=1")
+        assert status == 200 and current["atual"]["temperatura"] == 22.0
+        assert [r["temperatura"] for r in current["recentes"]] == [22.0, 20.0]
+        assert set(current["sensores"]) == {"1", "2"}
+
+        status, history = http_request(base, "/historico?resolucao=dia&id=2")
+        assert status == 200 and len(history["janelas"]) == 1
+        assert (history["janelas"][0]["leituras"], history["janelas"][0]["media"]) == (2, 30.5)
+        assert http_request(base, "/historico?resolucao=semana")[0] == 400
+    finally:
+        gateway.stop()
+    with sqlite3.connect(sqlite_path) as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0] == 4
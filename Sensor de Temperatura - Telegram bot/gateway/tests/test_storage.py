@@ -0,0 +1,141 @@
+# gateway/tests/test_storage.py
+
+import random
+import sqlite3
+import time
+
+import pytest
+
+from storage import (BatchWriter, Reading, aggregate_batch, format_timestamp, load_latest, load_recent,
+                     query_rollups, ROLLUP_LEVELS, LATEST_TABLE, TABLE_NAME, SENSOR_COLUMN, TEMPERATURE_COLUMN,
+                     TIMESTAMP_COLUMN, ROLLUP_START_COLUMN)
+
+T0 = time.mktime((2024, 3, 9, 23, 58, 0, 0, 0, -1)) # Perto da virada do dia: janelas de minuto, hora e dia mudam
+
+
+def quiet(message):
+    pass
+
+
+def random_readings(count, seed=1):
+    rng = random.Random(seed)
+    timestamp = T0
+    readings = []
+    for _ in range(count):
+        timestamp += rng.choice((1, 7, 40, 300))
+        readings.append(Reading(rng.randint(1, 3), round(rng.uniform(-10, 40), 1), timestamp))
+    return readings
+
+
+def full_group_by(conn, backend, start_format):
+    bucket = backend.bucket_expression(start_format)
+    return conn.execute(f"SELECT {SENSOR_COLUMN}, {bucket}, COUNT(*), SUM({TEMPERATURE_COLUMN}), "
+                        f"MIN({TEMPERATURE_COLUMN}), MAX({TEMPERATURE_COLUMN}) FROM {TABLE_NAME} "
+                        f"GROUP BY {SENSOR_COLUMN}, {bucket} ORDER BY 1, 2").fetchall()
+
+
+def rollup_rows(conn, table):
+    return conn.execute(f"SELECT {SENSOR_COLUMN}, {ROLLUP_START_COLUMN}, N, SOMA, MINIMO, MAXIMO FROM {table} "
+                        "ORDER BY 1, 2").fetchall()
+
+
+def assert_rollups_match_history(sqlite_path, backend):
+    with sqlite3.connect(sqlite_path) as conn:
+        for _, table, start_format in ROLLUP_LEVELS:
+            expected = full_group_by(conn, backend, start_format)
+            actual = rollup_rows(conn, table)
+            assert [row[:3] + row[4:] for row in actual] == [row[:3] + row[4:] for row in expected], table
+            assert [row[3] for row in actual] == pytest.approx([row[3] for row in expected])
+
+
+def make_writer(pool):
+    writer = BatchWriter(pool, log_callback=quiet)
+    with pool.connection() as conn:
+        pool.backend.create_schema(conn)
+    return writer
+
+
+def test_aggregate_batch():
+    readings = [Reading(1, 20.0, T0), Reading(1, 22.0, T0 + 30), Reading(2, 5.0, T0 + 30), Reading(1, 18.0, T0 + 60)]
+    rows, latest = aggregate_batch(readings)
+    assert rows["Temperatura_Minuto"] == [(1, "2024-03-09 23:58:00", 2, 42.0, 20.0, 22.0),
+                                          (2, "2024-03-09 23:58:00", 1, 5.0, 5.0, 5.0),
+                                          (1, "2024-03-09 23:59:00", 1, 18.0, 18.0, 18.0)]
+    assert rows["Temperatura_Dia"] == [(1, "2024-03-09 00:00:00", 3, 60.0, 18.0, 22.0),
+                                       (2, "2024-03-09 00:00:00", 1, 5.0, 5.0, 5.0)]
+    assert latest == [(1, 18.0, format_timestamp(T0 + 60)), (2, 5.0, format_timestamp(T0 + 30))]
+
+
+def test_incremental_rollups_match_full_group_by(pool, sqlite_path):
+    writer = make_writer(pool)
+    readings = random_readings(400)
+    rng = random.Random(2)
+    pos = 0
+    while pos < len(readings): # Lotes de tamanhos variados: janelas divididas entre lotes são somadas no banco
+        size = rng.randint(1, 60)
+        writer._write(readings[pos:pos + size])
+        pos += size
+    assert_rollups_match_history(sqlite_path, pool.backend)
+
+
+def test_backfill_from_existing_history(pool, sqlite_path):
+    readings = random_readings(200, seed=3)
+    with pool.connection() as conn:
+        pool.backend.create_schema(conn)
+        conn.executemany(f"INSERT INTO {TABLE_NAME} ({SENSOR_COLUMN}, {TEMPERATURE_COLUMN}, {TIMESTAMP_COLUMN}) "
+                         "VALUES (?, ?, ?)", [(r.sensor_id, r.temperature, format_timestamp(r.timestamp)) for r in readings])
+        conn.commit()
+    logs = []
+    writer = BatchWriter(pool, log_callback=logs.append)
+    writer.start()
+    writer.stop()
+    assert sum("calculada a partir do histórico" in line for line in logs) == len(ROLLUP_LEVELS)
+    assert_rollups_match_history(sqlite_path, pool.backend)
+    newest = {}
+    for r in readings:
+        newest[r.sensor_id] = r
+    assert sorted(load_latest(pool)) == sorted(newest.values())
+
+    # Segunda partida: tabelas já preenchidas não são recalculadas (nem duplicadas)
+    logs.clear()
+    writer = BatchWriter(pool, log_callback=logs.append)
+    writer.start()
+    writer._write(random_readings(50, seed=4))
+    writer.stop()
+    assert logs == []
+    assert_rollups_match_history(sqlite_path, pool.backend)
+
+
+def test_backfill_skips_empty_history(pool, sqlite_path):
+    logs = []
+    writer = BatchWriter(pool, log_callback=logs.append)
+    writer.start()
+    writer.stop()
+    assert logs == []
+    assert load_latest(pool) == []
+
+
+def test_latest_upsert_keeps_newest(pool):
+    writer = make_writer(pool)
+    writer._write([Reading(1, 25.0, T0 + 60), Reading(2, 10.0, T0)])
+    writer._write([Reading(1, 19.0, T0)])          # Lote atrasado (nova tentativa): mais antigo, não substitui
+    assert {r.sensor_id: r.temperature for r in load_latest(pool)} == {1: 25.0, 2: 10.0}
+    writer._write([Reading(1, 26.0, T0 + 60)])     # Mesmo instante: a gravada por último vale
+    writer._write([Reading(2, 11.0, T0 + 120)])
+    assert {r.sensor_id: (r.temperature, r.timestamp) for r in load_latest(pool)} == {
+        1: (26.0, T0 + 60), 2: (11.0, T0 + 120)}
+
+
+def test_dashboard_queries(pool):
+    writer = make_writer(pool)
+    readings = [Reading(1, 20.0, T0), Reading(2, 30.0, T0 + 10), Reading(1, 24.0, T0 + 70), Reading(1, 26.0, T0 + 80)]
+    writer._write(readings)
+    assert load_recent(pool, 2) == readings[2:]
+    windows = query_rollups(pool, "minuto", sensor_id=1)
+    assert windows == [
+        {"id": 1, "inicio": "2024-03-09 23:59:00", "leituras": 2, "media": 25.0, "minima": 24.0, "maxima": 26.0},
+        {"id": 1, "inicio": "2024-03-09 23:58:00", "leituras": 1, "media": 20.0, "minima": 20.0, "maxima": 20.0},
+    ]
+    assert len(query_rollups(pool, "minuto", limit=1)) == 1
+    with pytest.raises(ValueError, match="resolução"):
+        query_rollups(pool, "semana")
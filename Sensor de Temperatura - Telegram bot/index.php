@@ -12,7 +12,8 @@ if ($conn->connect_error) {
 }
 
 // Obter a temperatura atual do banco de dados
-$sql = "SELECT Temperatura FROM Temperatura ORDER BY DATA_HORA DESC LIMIT 1";
+// Temperatura_Atual tem uma linha por sensor, mantida pelo gateway (gateway/storage.py) a cada lote gravado
+$sql = "SELECT Temperatura FROM Temperatura_Atual ORDER BY DATA_HORA DESC LIMIT 1";
 $result = $conn->query($sql);
 
 if ($result->num_rows > 0) {
@@ -36,8 +37,8 @@ if ($result->num_rows > 0) {
   }
 }
 
-// Obter o histórico das temperaturas do banco de dados
-$sql = "SELECT * FROM Temperatura ORDER BY DATA_HORA DESC LIMIT 10";
+// Obter o histórico das temperaturas do banco de dados (pelo índice em DATA_HORA criado pelo gateway)
+$sql = "SELECT Temperatura, DATA_HORA FROM Temperatura ORDER BY DATA_HORA DESC LIMIT 10";
 $result = $conn->query($sql);
 
 $history_temp = array();